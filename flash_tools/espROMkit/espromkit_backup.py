@@ -0,0 +1,206 @@
+"""
+espROMkit resumable backup — read flash in checkpointed chunks.
+
+A backup is written to `<output>.part` one chunk at a time. After each
+chunk lands on disk its MD5 is appended to `<output>.journal`, so an
+interrupted backup (Cancel, Ctrl-C, USB glitch) can pick up from the last
+verified chunk instead of starting again at the first byte. Dropped
+connections are retried automatically: the session reconnects and the
+read continues where it stopped.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from espromkit_metrics import RETRIES
+from espromkit_session import DEVICE_ERRORS, DeviceSession
+
+
+DEFAULT_CHUNK_SIZE = 0x40000    # 256 KB, ~2 s per chunk at 1.5 Mbaud
+DEFAULT_RETRIES = 5
+RETRY_DELAY = 2.0               # seconds, doubled on each failed attempt
+
+
+class BackupCancelled(Exception):
+    """Raised when a backup is stopped by the user; the journal is kept."""
+
+
+def journal_path(output_path):
+    return output_path + ".journal"
+
+
+def part_path(output_path):
+    return output_path + ".part"
+
+
+class BackupJournal:
+    """Progress record for one backup: region, chunk size and chunk MD5s."""
+
+    def __init__(self, output_path, offset, size, chunk_size, mac=""):
+        self.output_path = output_path
+        self.offset = offset
+        self.size = size
+        self.chunk_size = chunk_size
+        self.mac = mac
+        self.chunks = []    # MD5 hex digests of verified chunks, in order
+
+    @property
+    def done_bytes(self):
+        return min(len(self.chunks) * self.chunk_size, self.size)
+
+    @property
+    def complete(self):
+        return self.done_bytes >= self.size
+
+    def next_chunk(self):
+        """Return (flash offset, length) of the next chunk to read."""
+        start = self.done_bytes
+        return self.offset + start, min(self.chunk_size, self.size - start)
+
+    def save(self):
+        state = {
+            "offset": self.offset,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "mac": self.mac,
+            "chunks": self.chunks,
+        }
+        path = journal_path(self.output_path)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def discard(self):
+        for path in (journal_path(self.output_path), part_path(self.output_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def load(cls, output_path):
+        """Load an existing journal, or None if there is none."""
+        try:
+            with open(journal_path(output_path)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        journal = cls(
+            output_path, state["offset"], state["size"],
+            state["chunk_size"], state.get("mac", ""),
+        )
+        journal.chunks = list(state.get("chunks", []))
+        return journal
+
+    def check_part_file(self):
+        """Re-hash chunks already on disk and drop any that do not match."""
+        path = part_path(self.output_path)
+        if not os.path.exists(path):
+            self.chunks = []
+            return
+        good = []
+        with open(path, "rb") as f:
+            for digest in self.chunks:
+                data = f.read(self.chunk_size)
+                if hashlib.md5(data).hexdigest() != digest:
+                    break
+                good.append(digest)
+        self.chunks = good
+
+
+def pending_backup(output_path, offset, size):
+    """Return the journal of an interrupted backup of this region, if any."""
+    journal = BackupJournal.load(output_path)
+    if journal is None or (journal.offset, journal.size) != (offset, size):
+        return None
+    journal.check_part_file()
+    return journal
+
+
+def backup_region(port, offset, size, output_path, baud,
+                  chunk_size=DEFAULT_CHUNK_SIZE, retries=DEFAULT_RETRIES,
+                  cancel_event=None, progress_fn=None, log=print, session=None):
+    """Read flash [offset, offset+size) into output_path, resuming if possible.
+
+    progress_fn(done_bytes, total_bytes) is called after every chunk.
+    Returns True on success and False on failure; raises BackupCancelled
+    when cancel_event is set or the user hits Ctrl-C.
+    """
+    journal = pending_backup(output_path, offset, size)
+    if journal is not None and journal.chunks:
+        log(f"  Resuming from 0x{offset + journal.done_bytes:X} "
+            f"({journal.done_bytes:,} of {size:,} bytes already saved)")
+    else:
+        journal = BackupJournal(output_path, offset, size, chunk_size)
+        journal.discard()
+
+    own_session = session is None
+    if own_session:
+        session = DeviceSession(port, baud)
+
+    part = part_path(output_path)
+    mode = "r+b" if os.path.exists(part) else "w+b"
+    attempts = 0
+    delay = RETRY_DELAY
+    try:
+        with open(part, mode) as f:
+            f.truncate(journal.done_bytes)
+            while not journal.complete:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise BackupCancelled()
+                chunk_offset, chunk_len = journal.next_chunk()
+                try:
+                    if not session.connected:
+                        session.connect()
+                        if journal.mac and session.mac and journal.mac != session.mac:
+                            log(f"  ERROR: journal belongs to {journal.mac}, "
+                                f"connected device is {session.mac}.")
+                            return False
+                        journal.mac = session.mac
+                    data = session.read_flash(chunk_offset, chunk_len)
+                except DEVICE_ERRORS as e:
+                    session.close()
+                    attempts += 1
+                    RETRIES.inc(port=port, reason="read")
+                    if attempts > retries:
+                        log(f"  ERROR: giving up at 0x{chunk_offset:X} after "
+                            f"{retries} retries: {e}")
+                        log("  Progress is saved; run the backup again to resume.")
+                        return False
+                    log(f"  Connection lost at 0x{chunk_offset:X} ({e}); "
+                        f"retry {attempts}/{retries} in {delay:.0f}s...")
+                    _wait(delay, cancel_event)
+                    delay *= 2
+                    continue
+
+                attempts = 0
+                delay = RETRY_DELAY
+                f.seek(journal.done_bytes)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                journal.chunks.append(hashlib.md5(data).hexdigest())
+                journal.save()
+                if progress_fn:
+                    progress_fn(journal.done_bytes, size)
+    except KeyboardInterrupt:
+        raise BackupCancelled()
+    finally:
+        if own_session:
+            session.close()
+
+    os.replace(part, output_path)
+    os.remove(journal_path(output_path))
+    return True
+
+
+def _wait(seconds, cancel_event):
+    """Sleep between retries, waking early if the backup is cancelled."""
+    if cancel_event is not None:
+        if cancel_event.wait(seconds):
+            raise BackupCancelled()
+    else:
+        time.sleep(seconds)
@@ -0,0 +1,177 @@
+"""
+espROMkit boot check — prove the firmware boots after a flash.
+
+The check resets the chip through RTS (as reboot does), listens on the
+console at the app's baud and feeds every chunk through a StreamMatcher:
+
+  expect   the string the firmware prints when it is up (FDT's
+           log_check_str, e.g. "1.0.0" for an AT firmware's version)
+  fail     crash signatures: Guru Meditation, abort(), brownout,
+           "invalid header" (no valid app), and a second "rst:0x"
+           (the chip reset again: a boot loop)
+
+Optionally a probe command (e.g. AT+GMR) is sent after `delay` seconds.
+The check passes on the expected string, fails on a crash signature and
+times out `timeout` seconds after the probe. Without an expected string
+it passes when no crash is seen within the timeout.
+
+Memory per port is bounded: the matcher only keeps the last
+len(longest pattern) - 1 bytes to catch a pattern split across reads,
+and the console output is kept in a fixed-size RingBuffer for the
+report. check_many() watches any number of ports at once, one thread
+each. Ports may be pyserial URLs (socket://, rfc2217://) as well.
+"""
+
+import threading
+import time
+
+import serial
+
+from espromkit_transport import port_url
+
+
+DEFAULT_BAUD = 115200
+DEFAULT_TIMEOUT = 5.0
+HISTORY_SIZE = 4096         # console bytes kept per port for the report
+READ_TIMEOUT = 0.05
+
+FAIL_PATTERNS = (
+    b"Guru Meditation Error",
+    b"abort() was called",
+    b"Brownout detector was triggered",
+    b"invalid header:",
+    b"Backtrace:",
+)
+RESET_PATTERN = b"rst:0x"
+
+
+class RingBuffer:
+    """The last `size` bytes written."""
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.buf = bytearray(size)
+        self.pos = 0
+        self.total = 0
+
+    def write(self, data):
+        data = data[-self.size:]
+        end = self.pos + len(data)
+        if end <= self.size:
+            self.buf[self.pos:end] = data
+        else:
+            split = self.size - self.pos
+            self.buf[self.pos:] = data[:split]
+            self.buf[:end - self.size] = data[split:]
+        self.pos = end % self.size
+        self.total += len(data)
+
+    def getvalue(self):
+        if self.total < self.size:
+            return bytes(self.buf[:self.pos])
+        return bytes(self.buf[self.pos:] + self.buf[:self.pos])
+
+
+class StreamMatcher:
+    """Incremental search for the expected string and crash signatures."""
+
+    def __init__(self, expect=None, fail=FAIL_PATTERNS, max_resets=1, history=HISTORY_SIZE):
+        self.expect = expect.encode() if isinstance(expect, str) else expect
+        self.fail = tuple(fail)
+        self.max_resets = max_resets
+        patterns = self.fail + (RESET_PATTERN,) + ((self.expect,) if self.expect else ())
+        self._keep = max(len(p) for p in patterns) - 1
+        self._tail = b""
+        self.resets = 0
+        self.history = RingBuffer(history)
+        self.result = None      # (ok, reason) once decided
+
+    def feed(self, data):
+        """Consume a chunk. Returns (ok, reason) once decided, else None."""
+        if self.result is not None or not data:
+            return self.result
+        self.history.write(data)
+        window = self._tail + data
+        for pattern in self.fail:
+            if pattern in window:
+                self.result = (False, pattern.decode())
+                return self.result
+        self.resets += window.count(RESET_PATTERN) - self._tail.count(RESET_PATTERN)
+        if self.resets > self.max_resets:
+            self.result = (False, f"boot loop ({self.resets} resets)")
+            return self.result
+        if self.expect and self.expect in window:
+            self.result = (True, f"found '{self.expect.decode()}'")
+            return self.result
+        self._tail = window[-self._keep:]
+        return None
+
+
+class BootResult:
+    def __init__(self, port, ok, reason, elapsed, output):
+        self.port = port
+        self.ok = ok
+        self.reason = reason
+        self.elapsed = elapsed
+        self.output = output
+
+    def last_lines(self, count=8):
+        text = self.output.decode("utf-8", "replace").replace("\r", "")
+        return [line for line in text.split("\n") if line.strip()][-count:]
+
+    def summary(self):
+        return f"{'PASS' if self.ok else 'FAIL'}: {self.reason} ({self.elapsed:.1f}s)"
+
+
+def check_boot(port, expect=None, baud=DEFAULT_BAUD, timeout=DEFAULT_TIMEOUT, delay=0.0,
+               command=None, reset=True, stop_event=None):
+    """Reset the device on `port` and watch its console. Returns a BootResult."""
+    matcher = StreamMatcher(expect)
+    ser = serial.serial_for_url(port_url(port), baud, timeout=READ_TIMEOUT, do_not_open=True)
+    ser.dtr = False             # keep IO0 high and EN released while opening
+    ser.rts = False
+    with ser:                   # opens the port
+        if reset:
+            ser.rts = True
+            time.sleep(0.1)
+            ser.rts = False
+        t_start = time.time()
+        probe_at = t_start + delay if command else None
+        deadline = t_start + delay + timeout
+        result = None
+        while result is None and time.time() < deadline:
+            if stop_event is not None and stop_event.is_set():
+                break
+            if probe_at is not None and time.time() >= probe_at:
+                ser.write(command.encode() + b"\r\n")
+                probe_at = None
+            result = matcher.feed(ser.read(ser.in_waiting or 1))
+    elapsed = time.time() - t_start
+    if result is None:
+        if expect:
+            result = (False, f"timeout: '{expect}' not seen")
+        else:
+            result = (True, f"no crash in {elapsed:.0f}s")
+    return BootResult(port, result[0], result[1], elapsed, matcher.history.getvalue())
+
+
+def check_many(ports, log=print, **kwargs):
+    """check_boot() on every port at once. Returns {port: BootResult}."""
+    results = {}
+    lock = threading.Lock()
+
+    def worker(port):
+        try:
+            result = check_boot(port, **kwargs)
+        except (serial.SerialException, OSError) as e:
+            result = BootResult(port, False, str(e), 0.0, b"")
+        with lock:
+            results[port] = result
+            log(f"  [{port}] {result.summary()}")
+
+    threads = [threading.Thread(target=worker, args=(p,), daemon=True) for p in ports]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
@@ -0,0 +1,265 @@
+"""
+espROMkit backup catalog — every backup in one searchable SQLite file.
+
+A backup is added when its post-processing finishes (espromkit_postproc).
+Each entry records the MAC, chip, features, flash size, region, SHA-256,
+every partition with its own SHA-256, and the firmware it holds. `catalog
+add` registers older backup files the same way.
+
+Firmware is identified by the ESP-IDF app descriptor (esp_app_desc_t).
+It follows the image header and the first segment header of every app
+image, so it sits at image offset 0x20:
+
+  magic 0xABCD5432 | secure_version | 8 reserved bytes | version[32] |
+  project_name[32] | time[16] | date[16] | idf_ver[32] | app_elf_sha256[32]
+
+Each app partition gets its own descriptor. The backup as a whole is
+labelled with the app that boots: the OTA slot selected by otadata, or
+else the factory app. An app-only backup (one that starts at an app
+image) is labelled with its own descriptor. Lookups by MAC, project and
+version, file SHA-256 or partition SHA-256 are indexed, so "the newest
+backup of this device running this firmware" takes milliseconds even
+with tens of thousands of backups in the catalog.
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+
+DB_PATH = os.path.join(os.path.expanduser("~"), ".espromkit", "catalog.db")
+
+IMAGE_MAGIC = 0xE9
+APP_DESC_OFFSET = 0x20
+APP_DESC_MAGIC = 0xABCD5432
+APP_DESC_FORMAT = "<II8x32s32s16s16s32s32s"
+APP_DESC_SIZE = struct.calcsize(APP_DESC_FORMAT)
+
+SCHEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS backups (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL UNIQUE,
+    created     TEXT,               -- file time, 'YYYY-MM-DD HH:MM:SS'
+    mac         TEXT,               -- 'aa:bb:cc:dd:ee:ff'
+    chip        TEXT,
+    features    TEXT,
+    flash_size  INTEGER,
+    flash_chip  TEXT,
+    port        TEXT,
+    offset      INTEGER,
+    size        INTEGER,
+    sha256      TEXT,
+    compressed  TEXT,               -- gzip copy next to the file, if any
+    boot        TEXT,               -- label of the app partition that boots
+    project     TEXT,               -- app descriptor of the booting app
+    version     TEXT,
+    idf_version TEXT,
+    app_date    TEXT,
+    elf_sha256  TEXT
+);
+CREATE TABLE IF NOT EXISTS partitions (
+    backup_id   INTEGER NOT NULL REFERENCES backups (id) ON DELETE CASCADE,
+    label       TEXT,
+    type        TEXT,
+    subtype     TEXT,
+    offset      INTEGER,
+    size        INTEGER,
+    sha256      TEXT,
+    blank       INTEGER,
+    file        TEXT,               -- split file, relative to the backup
+    project     TEXT,
+    version     TEXT,
+    idf_version TEXT,
+    PRIMARY KEY (backup_id, offset)
+);
+CREATE INDEX IF NOT EXISTS backups_mac ON backups (mac, created);
+CREATE INDEX IF NOT EXISTS backups_firmware ON backups (project, version, created);
+CREATE INDEX IF NOT EXISTS backups_sha256 ON backups (sha256);
+CREATE INDEX IF NOT EXISTS partitions_sha256 ON partitions (sha256);
+CREATE INDEX IF NOT EXISTS partitions_firmware ON partitions (project, version);
+"""
+
+
+INFO_FIELDS = ("mac", "chip", "features", "flash_bytes", "flash_chip")
+
+
+def backup_info(info, port=None):
+    """The device fields of `info` (get_chip_info, DeviceSession.info) a backup is filed under."""
+    fields = {key: info.get(key) for key in INFO_FIELDS}
+    fields["port"] = port
+    return fields
+
+
+def _text(raw):
+    return raw.split(b"\x00")[0].decode("utf-8", "replace")
+
+
+def read_app_desc(image):
+    """The app descriptor of an app image as a dict, or None if there is none."""
+    if len(image) < APP_DESC_OFFSET + APP_DESC_SIZE or image[0] != IMAGE_MAGIC:
+        return None
+    (magic, secure_version, version, project, build_time, build_date, idf_ver,
+     elf_sha256) = struct.unpack_from(APP_DESC_FORMAT, image, APP_DESC_OFFSET)
+    if magic != APP_DESC_MAGIC:
+        return None
+    return {
+        "project": _text(project), "version": _text(version), "idf_version": _text(idf_ver),
+        "date": f"{_text(build_date)} {_text(build_time)}".strip(),
+        "secure_version": secure_version, "elf_sha256": elf_sha256.hex(),
+    }
+
+
+def normalize_mac(mac):
+    """'D4D4DA9866D0', 'd4-d4-da-98-66-d0'... -> 'd4:d4:da:98:66:d0'."""
+    digits = "".join(c for c in mac.lower() if c in "0123456789abcdef")
+    if len(digits) != 12:
+        return mac.lower()
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def _pattern(column, value, where, params):
+    """Exact match, or a GLOB when `value` has * or ? in it."""
+    if any(c in value for c in "*?"):
+        where.append(f"{column} GLOB ?")
+    else:
+        where.append(f"{column} = ?")
+    params.append(value)
+
+
+class Catalog:
+    """The backup catalog. Safe to share between threads."""
+
+    def __init__(self, path=DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------- writes
+    def add(self, result):
+        """Register one post-processing result (a backup manifest). Returns its id.
+
+        A backup already in the catalog under the same path is replaced.
+        """
+        path = os.path.abspath(result["file"])
+        app = result.get("app") or {}
+        try:
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(path)))
+        except OSError:
+            created = time.strftime("%Y-%m-%d %H:%M:%S")
+        row = {
+            "path": path, "created": created,
+            "mac": normalize_mac(result["mac"]) if result.get("mac") else None,
+            "chip": result.get("chip") or None, "features": result.get("features") or None,
+            "flash_size": result.get("flash_bytes"), "flash_chip": result.get("flash_chip") or None,
+            "port": result.get("port"), "offset": result["offset"], "size": result["size"],
+            "sha256": result["sha256"], "compressed": result.get("compressed"),
+            "boot": result.get("boot"), "project": app.get("project"),
+            "version": app.get("version"), "idf_version": app.get("idf_version"),
+            "app_date": app.get("date"), "elf_sha256": app.get("elf_sha256"),
+        }
+        parts = []
+        for p in result.get("partitions", []):
+            desc = p.get("app") or {}
+            parts.append((p["label"], p["type"], p["subtype"], p["offset"], p["size"], p["sha256"],
+                          int(p["blank"]), p["file"], desc.get("project"), desc.get("version"),
+                          desc.get("idf_version")))
+        with self._lock:
+            self.db.execute("DELETE FROM backups WHERE path = ?", (path,))
+            cur = self.db.execute(
+                f"INSERT INTO backups ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                tuple(row.values()))
+            backup_id = cur.lastrowid
+            self.db.executemany(
+                "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(backup_id,) + p for p in parts])
+            self.db.commit()
+        return backup_id
+
+    def prune(self):
+        """Drop backups whose file no longer exists. Returns their paths."""
+        with self._lock:
+            gone = [r["path"] for r in self.db.execute("SELECT path FROM backups")
+                    if not os.path.exists(r["path"])]
+            self.db.executemany("DELETE FROM backups WHERE path = ?", [(p,) for p in gone])
+            self.db.commit()
+        return gone
+
+    # ------------------------------------------------------------ queries
+    def find(self, mac=None, project=None, version=None, chip=None, sha256=None,
+             partition_sha256=None, offset=None, limit=20):
+        """Backups matching every given filter, newest first.
+
+        project, version and chip take * and ? wildcards. partition_sha256
+        matches backups holding a partition with that hash.
+        """
+        where, params = [], []
+        if mac:
+            where.append("mac = ?")
+            params.append(normalize_mac(mac))
+        if project:
+            _pattern("project", project, where, params)
+        if version:
+            _pattern("version", version, where, params)
+        if chip:
+            _pattern("chip", chip, where, params)
+        if sha256:
+            where.append("sha256 = ?")
+            params.append(sha256.lower())
+        if partition_sha256:
+            where.append("id IN (SELECT backup_id FROM partitions WHERE sha256 = ?)")
+            params.append(partition_sha256.lower())
+        if offset is not None:
+            where.append("offset = ?")
+            params.append(offset)
+        sql = "SELECT * FROM backups"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC, id DESC LIMIT ?"
+        return self.db.execute(sql, params + [limit]).fetchall()
+
+    def get(self, backup_id):
+        return self.db.execute("SELECT * FROM backups WHERE id = ?", (backup_id,)).fetchone()
+
+    def partitions(self, backup_id):
+        return self.db.execute(
+            "SELECT * FROM partitions WHERE backup_id = ? ORDER BY offset", (backup_id,)).fetchall()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM backups").fetchone()[0]
+
+
+def format_backups(rows):
+    """One line per backup for `catalog find`."""
+    lines = [f"  {'id':>5s}  {'created':19s}  {'mac':17s}  {'region':21s}  {'firmware':30s}  file"]
+    for r in rows:
+        firmware = f"{r['project']} {r['version']}" if r["project"] else "-"
+        region = f"0x{r['offset']:06X}+0x{r['size']:X}"
+        lines.append(f"  {r['id']:5d}  {r['created']}  {r['mac'] or '-':17s}  {region:21s}  "
+                     f"{firmware[:30]:30s}  {r['path']}")
+    return lines
+
+
+def format_partitions(rows):
+    lines = []
+    for p in rows:
+        firmware = f"  {p['project']} {p['version']}" if p["project"] else ""
+        state = "  (blank)" if p["blank"] else ""
+        lines.append(f"         {p['label']:16s} 0x{p['offset']:06X} {p['size']:>10,}  "
+                     f"{p['sha256'][:16]}{firmware}{state}")
+    return lines
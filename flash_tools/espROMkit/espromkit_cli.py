@@ -17,6 +17,12 @@ ESP32 Flash Layout (typical):
 
 import sys
 import os
+import argparse
+import glob
+import hashlib
+import json
+import re
+import sqlite3
 import time
 from datetime import datetime
 
@@ -31,12 +37,45 @@ try:
 except ImportError:
     sys.exit("ERROR: esptool is required. Install with: pip install esptool")
 
+from espromkit_backup import BackupCancelled, backup_region, journal_path, pending_backup
+from espromkit_bootcheck import (
+    DEFAULT_BAUD as BOOT_BAUD, DEFAULT_TIMEOUT as BOOT_TIMEOUT, check_boot, check_many,
+)
+from espromkit_catalog import DB_PATH as CATALOG_PATH
+from espromkit_catalog import Catalog, backup_info, format_backups, format_partitions
+from espromkit_compress import DEFAULT_ROUND_TRIP, tune
+from espromkit_coredump import CoreDumpError, NoCoreDump, load_backup_dump, read_device_dump
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_farm import Farm, format_stage_report, parse_workers
+from espromkit_formats import (
+    FORMAT_NAMES, FORMATS, FormatError, ImageFile, convert, detect_format, restore_image, uf2_family,
+)
+from espromkit_fsimage import FS_TYPES, FsArchive, FsImageError, build_image, flash_filesystem
+from espromkit_frames import (
+    DEFAULT_KEYFRAME, DEFAULT_TILE, FramesError, convert_gif, format_bench, parse_size,
+)
+from espromkit_geometry import (
+    GeometryCache, check_fits, geometry_from_esptool, resolve_flash_size, size_name,
+)
+from espromkit_job import Job, ManifestError, patch_flash_params
+from espromkit_metrics import parse_listen, serve_metrics
+from espromkit_nvs import NvsError, build_device_nvs
+from espromkit_ota import OtaError, boot_factory, ota_flash, read_ota_layout, revert, switch_slot
+from espromkit_partitions import PartitionTableError, find_partition, read_partition_table
+from espromkit_postproc import PostProcessor, describe, manifest_path, parts_dir
+from espromkit_server import DEFAULT_HOST, DEFAULT_HTTP_PORT, JobServer
+from espromkit_session import DEFAULT_IDLE_TIMEOUT, DEVICE_ERRORS, DeviceSession
+from espromkit_stats import DB_PATH, DEFAULT_CONF, DEFAULT_LOGS, GROUPS, StationDB, format_throughput
+from espromkit_transport import TranscriptError, comports, finish, port_url, start_recording, start_replay
+from espromkit_verify import diff_region, open_verify_session, repair_images, verify_images
+
 
 # Default flash parameters (matching command.txt reference)
 DEFAULT_BAUD = 1500000
 DEFAULT_FLASH_MODE = "dio"
 DEFAULT_FLASH_FREQ = "80m"
 DEFAULT_FLASH_SIZE = "detect"
+BOOT_WATCH_SECONDS = 3
 
 # Standard ESP32 flash partition offsets
 ESP32_PARTITIONS = {
@@ -75,7 +114,7 @@ def print_banner():
 
 def detect_ports():
     """Detect serial ports that likely have an ESP32 device attached."""
-    ports = serial.tools.list_ports.comports()
+    ports = comports()
     esp_ports = []
     other_ports = []
 
@@ -154,6 +193,10 @@ def select_port():
 
 def run_esptool(args):
     """Run esptool with the given argument list. Returns exit code."""
+    args = list(args)
+    if "--port" in args:
+        i = args.index("--port") + 1
+        args[i] = port_url(args[i])
     try:
         esptool.main(args)
         return 0
@@ -202,7 +245,10 @@ def get_chip_info(port):
         "chip_id": "",
         "flash_size": "",
         "flash_id": "",
+        "flash_chip": "",
+        "flash_bytes": None,
     }
+    manufacturer = device = ""
 
     for line in output.splitlines():
         s = line.strip()
@@ -221,7 +267,20 @@ def get_chip_info(port):
         elif s.startswith("Detected flash size:"):
             info["flash_size"] = s.split(":")[-1].strip()
         elif s.startswith("Manufacturer:"):
-            info["flash_id"] = s
+            manufacturer = s.split(":")[-1].strip()
+        elif s.startswith("Device:"):
+            device = s.split(":")[-1].strip()
+
+    # Exact size from the JEDEC ID (or the per-MAC cache), never a guess
+    geometry = geometry_from_esptool(manufacturer, device) if manufacturer else None
+    if geometry is not None:
+        info["flash_id"] = f"0x{geometry.flash_id:08x}"
+        info["flash_chip"] = geometry.describe()
+    info["flash_bytes"] = resolve_flash_size(
+        info["mac"], geometry.flash_id if geometry else None
+    ) or FLASH_SIZE_BYTES.get(info["flash_size"])
+    if info["flash_bytes"] and not info["flash_size"]:
+        info["flash_size"] = size_name(info["flash_bytes"])
 
     return info
 
@@ -242,6 +301,8 @@ def confirm_device(info):
         print(f"  Chip ID   : {info['chip_id']}")
     if info["flash_size"]:
         print(f"  Flash Size: {info['flash_size']}")
+    if info["flash_chip"]:
+        print(f"  Flash Chip: {info['flash_chip']}")
 
     print()
     print("  ESP32 flash layout:")
@@ -302,6 +363,21 @@ def _make_filename(info, suffix):
     return f"{mac_slug}_{timestamp}_{suffix}.bin"
 
 
+def _pending_backups(info):
+    """Interrupted backups of this device in the current directory, by kind.
+
+    Maps the filename suffix ("full", "app", ...) to the newest backup of
+    that kind that left a journal behind, so accepting it as the default
+    filename resumes it.
+    """
+    mac_slug = info.get("mac", "unknown").replace(":", "")
+    pending = {}
+    for path in sorted(glob.glob(journal_path(f"{mac_slug}_*.bin"))):
+        name = path[:-len(journal_path(""))]
+        pending[name[:-len(".bin")].rsplit("_", 1)[-1]] = name
+    return pending
+
+
 def _ask_filename(default_name):
     """Prompt for output filename."""
     user_name = input(f"  Output filename [{default_name}]: ").strip()
@@ -312,64 +388,91 @@ def _ask_filename(default_name):
     return os.path.abspath(user_name)
 
 
-def _read_flash_region(port, offset, size, output_path):
-    """Read a region of flash to a file. Returns True on success."""
+def _print_progress(done, total):
+    pct = done * 100 // total if total else 100
+    end = "\n" if done >= total else ""
+    print(f"\r  {done:>12,} / {total:,} bytes ({pct:3d}%)", end=end, flush=True)
+
+
+def _read_flash_region(port, offset, size, output_path, post=None, info=None):
+    """Read a region of flash to a file. Returns True on success.
+
+    The read is checkpointed: Ctrl-C or a lost connection leaves a journal
+    next to the output file, and reading the same region into the same file
+    again continues from the last saved chunk. A finished file is handed to
+    `post` (a PostProcessor) with the device `info` and the next read
+    starts right away.
+    """
     print(f"  Reading 0x{offset:X}..0x{offset + size:X} ({size:,} bytes) -> {output_path}")
 
-    rc = run_esptool([
-        "--port", port,
-        "--baud", str(DEFAULT_BAUD),
-        "--before", "default_reset",
-        "--after", "no_reset",
-        "read_flash",
-        hex(offset), str(size),
-        output_path,
-    ])
+    journal = pending_backup(output_path, offset, size)
+    if journal is not None and journal.chunks:
+        confirm = input(
+            f"  Resume interrupted backup ({journal.done_bytes:,} bytes saved)? [Y/n]: "
+        ).strip().lower()
+        if confirm not in ("", "y", "yes"):
+            journal.discard()
 
-    if rc != 0:
+    try:
+        ok = backup_region(
+            port, offset, size, output_path, DEFAULT_BAUD,
+            progress_fn=_print_progress,
+        )
+    except BackupCancelled:
+        print("\n  Backup cancelled. Run the same backup again to resume.")
+        return False
+
+    if not ok:
         print(f"  ERROR: Failed to read region at 0x{offset:X}.")
         return False
 
     if os.path.exists(output_path):
         fsize = os.path.getsize(output_path)
         print(f"  OK: {output_path} ({fsize:,} bytes)")
+        if post is not None:
+            post.submit(output_path, offset, info)
         return True
 
     print(f"  ERROR: File was not created.")
     return False
 
 
-def do_backup(port, info):
-    """Back up flash ROM to one or more .bin files."""
+def do_backup(port, info, post=None):
+    """Back up flash ROM to one or more .bin files (post-processed by `post`)."""
     print("\n[5/6] Backup — reading flash ROM...")
 
-    flash_size_str = info.get("flash_size", "4MB")
-    total_bytes = FLASH_SIZE_BYTES.get(flash_size_str, 0x400000)
+    total_bytes = info.get("flash_bytes") or _ask_flash_size(info)
+    flash_size_str = size_name(total_bytes)
+    device = backup_info(info, port)
 
     mode = choose_backup_mode(info)
+    pending = _pending_backups(info)
     print()
 
     if mode == "1":
         # Full ROM
-        default_name = _make_filename(info, "full")
+        default_name = pending.get("full") or _make_filename(info, "full")
         output_path = _ask_filename(default_name)
         print(f"  Reading full ROM ({flash_size_str}, {total_bytes:,} bytes)...")
         print(f"  This may take a few minutes.\n")
-        return _read_flash_region(port, 0x0, total_bytes, output_path)
+        return _read_flash_region(port, 0x0, total_bytes, output_path, post, device)
 
     elif mode == "2":
         # Partition-aware: bootloader + partition table + app
         app_size = total_bytes - ESP32_PARTITIONS["application"]["offset"]
 
         parts = [
-            ("bootloader",     0x1000, 0x7000,   _make_filename(info, "bootloader")),
-            ("partition_table", 0x8000, 0x1000,   _make_filename(info, "partitions")),
-            ("application",    0x10000, app_size, _make_filename(info, "app")),
+            ("bootloader",     0x1000, 0x7000,   "bootloader"),
+            ("partition_table", 0x8000, 0x1000,   "partitions"),
+            ("application",    0x10000, app_size, "app"),
         ]
+        parts = [(label, off, sz, pending.get(suffix) or _make_filename(info, suffix))
+                 for label, off, sz, suffix in parts]
 
         print("  Will back up 3 partitions:")
         for label, off, sz, fname in parts:
-            print(f"    {label:20s}  0x{off:05X}  {sz:>10,} bytes  -> {fname}")
+            resume = "  (interrupted, will resume)" if fname in pending.values() else ""
+            print(f"    {label:20s}  0x{off:05X}  {sz:>10,} bytes  -> {fname}{resume}")
         print()
 
         confirm = input("  Proceed? [Y/n]: ").strip().lower()
@@ -381,7 +484,7 @@ def do_backup(port, info):
         all_ok = True
         for label, off, sz, fname in parts:
             path = _ask_filename(fname)
-            ok = _read_flash_region(port, off, sz, path)
+            ok = _read_flash_region(port, off, sz, path, post, device)
             if not ok:
                 all_ok = False
             print()
@@ -391,11 +494,25 @@ def do_backup(port, info):
         # App only
         app_offset = ESP32_PARTITIONS["application"]["offset"]
         app_size = total_bytes - app_offset
-        default_name = _make_filename(info, "app")
+        default_name = pending.get("app") or _make_filename(info, "app")
         output_path = _ask_filename(default_name)
         print(f"  Reading application firmware ({app_size:,} bytes from 0x{app_offset:X})...")
         print(f"  This may take a few minutes.\n")
-        return _read_flash_region(port, app_offset, app_size, output_path)
+        return _read_flash_region(port, app_offset, app_size, output_path, post, device)
+
+
+def _ask_flash_size(info):
+    """The flash ID was not recognised: ask once, remember it for this MAC."""
+    print("  Could not determine the flash size from the flash ID.")
+    names = list(FLASH_SIZE_BYTES)
+    while True:
+        answer = input(f"  Flash size ({'/'.join(names)}): ").strip().upper()
+        if answer in FLASH_SIZE_BYTES:
+            size = FLASH_SIZE_BYTES[answer]
+            GeometryCache().put(info["mac"], size)
+            info["flash_bytes"] = size
+            return size
+        print(f"  Please enter one of {', '.join(names)}.")
 
 
 def _get_file_path(prompt_text):
@@ -411,45 +528,121 @@ def _get_file_path(prompt_text):
 
 
 def _write_flash_region(port, offset, bin_path):
-    """Write a file to flash at the given offset. Returns True on success."""
+    """Write a file to flash at the given offset. Returns True on success.
+
+    Only sectors that differ from the device are erased and written; see
+    espromkit_erase for how the plan is built. Intel HEX and UF2 files
+    are written at their own addresses by _write_image_file.
+    """
+    if detect_format(bin_path) != "bin":
+        return _write_image_file(port, offset, bin_path)
     file_size = os.path.getsize(bin_path)
     print(f"  Writing {bin_path} ({file_size:,} bytes) -> 0x{offset:X}")
 
-    rc = run_esptool([
-        "--port", port,
-        "--baud", str(DEFAULT_BAUD),
-        "--before", "default_reset",
-        "--after", "no_reset",
-        "write_flash",
-        "-z",
-        "--flash_mode", DEFAULT_FLASH_MODE,
-        "--flash_freq", DEFAULT_FLASH_FREQ,
-        "--flash_size", DEFAULT_FLASH_SIZE,
-        hex(offset), bin_path,
-    ])
+    with open(bin_path, "rb") as f:
+        data = f.read()
 
-    if rc != 0:
-        print(f"  ERROR: Failed to write at 0x{offset:X}.")
+    session = DeviceSession(port, DEFAULT_BAUD)
+    try:
+        session.connect()
+        error = check_fits(offset, len(data), session.flash_size)
+        if error:
+            session.close()
+            print(f"  ERROR: {error}")
+            return False
+        data = patch_flash_params(
+            data, offset, session.bootloader_offset,
+            DEFAULT_FLASH_MODE, DEFAULT_FLASH_FREQ, DEFAULT_FLASH_SIZE,
+            session.flash_size,
+        )
+        print("  Comparing image with flash...")
+        plan = plan_restore(session, offset, data)
+        print(f"  Plan: {plan.summary()}")
+        execute_plan(session, plan)
+    except DEVICE_ERRORS as e:
+        session.close()
+        print(f"  ERROR: Failed to write at 0x{offset:X}: {e}")
         return False
 
     print(f"  OK: written to 0x{offset:X}")
+    return _verify_written(port, [(offset, bin_path)], session=session)
+
+
+def _write_image_file(port, offset, path):
+    """Stream an Intel HEX or UF2 file to flash (espromkit_formats). Returns True on success."""
+    try:
+        source = ImageFile(path)
+    except (FormatError, OSError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    print(f"  Writing {path}: {source.describe()}")
+    if source.start != offset:
+        print(f"  NOTE: {FORMAT_NAMES[source.format]} files carry their own addresses; "
+              f"writing from 0x{source.start:X}, not 0x{offset:X}.")
+
+    session = DeviceSession(port, DEFAULT_BAUD)
+    try:
+        session.connect()
+        result = restore_image(session, source, DEFAULT_FLASH_MODE, DEFAULT_FLASH_FREQ,
+                               DEFAULT_FLASH_SIZE)
+    except (FormatError, OSError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: Failed to write at 0x{source.start:X}: {e}")
+        return False
+    finally:
+        session.close()
+    if not result.ok:
+        print("  ERROR: Flash still differs from the file after re-writing the bad sectors.")
+        return False
+    print(f"  OK: erased {result.erased:,} and wrote {result.written:,} bytes, "
+          f"{result.skipped:,} unchanged")
     return True
 
 
+def _verify_written(port, images, session=None):
+    """Compare flash to the written files via device-side MD5.
+
+    images: list of (offset, path). On a mismatch, offer to re-write only
+    the bad sectors. Returns True if flash matches every file. An open
+    `session` is reused and closed afterwards.
+    """
+    print("\n  Verifying flash (device-side MD5)...")
+    try:
+        if session is None:
+            session = open_verify_session(port, DEFAULT_BAUD)
+        checks = verify_images(session, images)
+        if all(c.ok for c in checks):
+            return True
+        confirm = input("\n  Re-write only the mismatching sectors? [Y/n]: ").strip().lower()
+        if confirm not in ("", "y", "yes"):
+            return False
+        checks = repair_images(session, checks)
+        return all(c.ok for c in checks)
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: Verification failed: {e}")
+        return False
+    finally:
+        if session is not None:
+            session.close()
+
+
 def do_restore(port):
-    """Write one or more .bin files to flash."""
+    """Write one or more .bin (or .hex/.uf2) files to flash."""
     print("\n[5/6] Restore — writing flash ROM...")
 
     print("\n  Restore mode:")
-    print("  [1] Full ROM        — single .bin file written at 0x0")
+    print("  [1] Full ROM        — single .bin file written at 0x0 (or a .hex/.uf2 image)")
     print("  [2] Bootloader+App  — bootloader (.bin at 0x1000) + app (.bin at 0x10000)")
     print("  [3] App only        — application firmware only (.bin at 0x10000)")
     print("  [4] Custom offset   — specify a .bin file and flash offset manually")
+    print("  [5] OTA slot        — app into the inactive ota_N slot, then switch to it")
 
     while True:
         try:
-            mode = input("\n  Select restore mode [1/2/3/4]: ").strip()
-            if mode in ("1", "2", "3", "4"):
+            mode = input("\n  Select restore mode [1/2/3/4/5]: ").strip()
+            if mode in ("1", "2", "3", "4", "5"):
                 break
         except EOFError:
             sys.exit(1)
@@ -457,14 +650,14 @@ def do_restore(port):
 
     if mode == "1":
         # Full ROM restore
-        path = _get_file_path("  Path to full ROM .bin file: ")
+        path = _get_file_path("  Path to full ROM .bin/.hex/.uf2 file: ")
         if not path:
             print("  Aborted.")
             return False
 
         file_size = os.path.getsize(path)
         print(f"\n  File: {path} ({file_size:,} bytes)")
-        print(f"  This will ERASE the entire flash and write from 0x0.")
+        print(f"  This will overwrite flash from 0x0 (only sectors that differ are erased).")
         confirm = input("  Continue? [y/N]: ").strip().lower()
         if confirm not in ("y", "yes"):
             print("  Aborted.")
@@ -497,30 +690,20 @@ def do_restore(port):
             print("  Aborted.")
             return False
 
-        # Flash both in a single esptool call (multiple address+file pairs)
+        # Each image gets the same bounds check, diff-based plan and verify
+        # as a single-file restore.
         print(f"\n  Flashing... this may take a few minutes.\n")
-        rc = run_esptool([
-            "--port", port,
-            "--baud", str(DEFAULT_BAUD),
-            "--before", "default_reset",
-            "--after", "no_reset",
-            "write_flash",
-            "-z",
-            "--flash_mode", DEFAULT_FLASH_MODE,
-            "--flash_freq", DEFAULT_FLASH_FREQ,
-            "--flash_size", DEFAULT_FLASH_SIZE,
-            "0x1000", bl_path,
-            "0x10000", app_path,
-        ])
-        if rc != 0:
-            print("\n  ERROR: Restore failed.")
-            return False
-        print("\n  Restore complete.")
+        for offset, path in ((0x1000, bl_path), (0x10000, app_path)):
+            if not _write_flash_region(port, offset, path):
+                print("\n  ERROR: Restore failed.")
+                return False
+            print()
+        print("  Restore complete.")
         return True
 
     elif mode == "3":
         # App only
-        path = _get_file_path("  Path to application .bin (0x10000): ")
+        path = _get_file_path("  Path to application .bin/.hex/.uf2 (0x10000): ")
         if not path:
             print("  Aborted.")
             return False
@@ -538,7 +721,7 @@ def do_restore(port):
 
     elif mode == "4":
         # Custom offset
-        path = _get_file_path("  Path to .bin file: ")
+        path = _get_file_path("  Path to .bin/.hex/.uf2 file: ")
         if not path:
             print("  Aborted.")
             return False
@@ -561,39 +744,1023 @@ def do_restore(port):
         print(f"\n  Flashing... this may take a few minutes.\n")
         return _write_flash_region(port, offset, path)
 
+    elif mode == "5":
+        # OTA: write the inactive slot, select it only after it verifies
+        path = _get_file_path("  Path to application .bin: ")
+        if not path:
+            print("  Aborted.")
+            return False
+        return _ota_flash(port, path)
+
+
+def _ota_flash(port, path, slot=None):
+    """Write an app to an OTA slot and select it. Returns True on success."""
+    print(f"\n  Connecting to {port}...")
+    try:
+        with DeviceSession(port, DEFAULT_BAUD) as session:
+            layout = ota_flash(session, path, slot)
+            print("  OTA layout now:")
+            for line in layout.describe():
+                print(line)
+    except (OtaError, PartitionTableError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: {e}")
+        print("  otadata was not changed; the device still boots its previous app.")
+        return False
+    return True
+
 
 def reboot_device(port):
-    """Hard-reset the device via RTS pin."""
+    """Hard-reset the device via RTS pin and watch the console for a crash.
+
+    Returns False if the device crashed or boot-looped.
+    """
     print("\n[6/6] Rebooting device...")
 
     try:
-        with serial.Serial(port, 115200, timeout=1) as ser:
-            ser.dtr = False
-            ser.rts = True
-            time.sleep(0.1)
-            ser.rts = False
-            time.sleep(0.1)
-        print("  Device rebooted successfully.")
+        result = check_boot(port, timeout=BOOT_WATCH_SECONDS)
     except serial.SerialException as e:
         print(f"  Could not reboot via serial: {e}")
         print("  Please manually reset the device (press the power/reset button).")
+        return True
+    print(f"  Boot check {result.summary()}")
+    if result.ok:
+        print("  Device rebooted successfully.")
+        return True
+    for line in result.last_lines():
+        print(f"    | {line}")
+    print("  ERROR: The device did not boot cleanly.")
+    return False
 
 
-def main():
-    print_banner()
-
+def run_wizard():
+    """Interactive 6-step backup/restore. Returns True on success."""
     port = select_port()
     info = get_chip_info(port)
     confirm_device(info)
     action = choose_action()
 
     if action == "backup":
-        success = do_backup(port, info)
+        # Hashing, compression and partition splitting run in worker
+        # processes while the device is rebooted.
+        results = []
+        with PostProcessor(on_done=results.append) as post:
+            success = do_backup(port, info, post)
+            if success:
+                # The backup is already on disk: a crash after the reset is
+                # reported but does not fail it.
+                reboot_device(port)
+            if post.pending:
+                print("\n  Finishing post-processing...")
+        for result in results:
+            print(f"  {os.path.basename(result['file'])}: {describe(result)}")
+        catalog = _open_catalog() if results else None
+        if catalog is not None:
+            with catalog:
+                for result in results:
+                    catalog.add(result)
+            print(f"  Cataloged {len(results)} backup(s) in {catalog.path}")
+        return success
+
+    success = do_restore(port)
+    if success:
+        success = reboot_device(port)
+    return success
+
+
+def _preflight_job(path):
+    """Load and preflight a job manifest. Returns the Job, or None."""
+    defaults = {
+        "baud": DEFAULT_BAUD,
+        "flash_mode": DEFAULT_FLASH_MODE,
+        "flash_freq": DEFAULT_FLASH_FREQ,
+        "flash_size": DEFAULT_FLASH_SIZE,
+    }
+    print(f"Preflighting {path}...")
+    try:
+        job = Job.from_file(path, defaults).preflight()
+    except (ManifestError, OSError) as e:
+        print(f"  ERROR: {e}")
+        return None
+    print(f"  Manifest OK: {len(job.images)} image(s), "
+          f"mode={job.flash_mode} freq={job.flash_freq} size={job.flash_size}")
+    if job.fdt_conf:
+        for port, slot in sorted(job.port_slots.items(), key=lambda item: item[1]):
+            print(f"  Slot {slot}: {port} @ {job.baud_for(port)} baud")
+        print("  Pass/fail counts are written back to its [STATISTICS] section.")
+    return job
+
+
+def _open_station(path=DB_PATH):
+    """StationDB for recording job/farm results, or None if it can't be opened."""
+    try:
+        station = StationDB(path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"  WARNING: statistics disabled ({path}: {e})")
+        return None
+    esp_ports, other_ports = detect_ports()
+    station.adapters = {p["device"]: p["description"] for p in esp_ports + other_ports}
+    return station
+
+
+def _open_catalog(path=CATALOG_PATH):
+    """The backup Catalog, or None if it can't be opened."""
+    try:
+        return Catalog(path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"  WARNING: backup catalog disabled ({path}: {e})")
+        return None
+
+
+def _default_ports(job):
+    """The ports a multi_download.conf names that are present, else detected ESP32 ports."""
+    esp_ports, other_ports = detect_ports()
+    present = {p["device"] for p in esp_ports + other_ports}
+    ports = [p for p in job.port_slots if p in present]
+    return ports or [p["device"] for p in esp_ports]
+
+
+def run_job(args):
+    """Preflight a job manifest once, then run it on each device."""
+    job = _preflight_job(args.manifest)
+    if job is None:
+        return False
+    if args.check:
+        return True
+
+    ports = args.port or _default_ports(job)
+    if not ports:
+        print("  ERROR: No ESP32 serial ports found. Use --port to pick one.")
+        return False
+
+    station = _open_station()
+    passed = failed = 0
+    while True:
+        for port in ports:
+            print(f"\nRunning '{job.name}' on {port}...")
+            if job.run(port, station=station):
+                passed += 1
+                print(f"  PASS: {port}")
+            else:
+                failed += 1
+                print(f"  FAIL: {port}")
+        if not args.loop:
+            break
+        try:
+            answer = input("\n  Connect the next device(s) and press Enter (q to quit): ")
+        except EOFError:
+            break
+        if answer.strip().lower() == "q":
+            break
+
+    print(f"\n  {passed} passed, {failed} failed.")
+    return failed == 0
+
+
+def run_farm(args):
+    """Pipelined job run across many ports (see espromkit_farm)."""
+    try:
+        workers = parse_workers(args.workers)
+    except ValueError as e:
+        print(f"  ERROR: {e}")
+        return False
+    job = _preflight_job(args.manifest)
+    if job is None:
+        return False
+    metrics = None
+    if args.metrics:
+        try:
+            metrics = serve_metrics(*parse_listen(args.metrics))
+        except (ValueError, OSError) as e:
+            print(f"  ERROR: metrics endpoint: {e}")
+            return False
+        host, port = metrics.server_address[:2]
+        print(f"  Metrics on http://{host}:{port}/metrics")
+
+    try:
+        farm = Farm(job, workers, station=_open_station())
+        print("  Workers: " + ", ".join(f"{n}={c}" for n, c in farm.workers.items()))
+        if args.watch:
+            print("\n  Station mode: plug devices in; each is flashed once until unplugged.")
+            print("  Press Ctrl-C to stop.\n")
+            stats = farm.watch(lambda: args.port or _default_ports(job))
+        else:
+            ports = args.port or _default_ports(job)
+            if not ports:
+                print("  ERROR: No ESP32 serial ports found. Use --port to pick one.")
+                return False
+            print(f"\n  Flashing {len(ports)} device(s)...\n")
+            stats = farm.run(ports)
+
+        print(f"\n  {stats.summary()}")
+        print("  Time per stage:")
+        for line in format_stage_report(stats):
+            print(line)
+        return stats.failed == 0
+    finally:
+        if metrics is not None:
+            metrics.shutdown()
+
+
+def run_nvs(args):
+    """Generate a device's NVS partition from its CSV row and flash only that."""
+    if args.out:
+        if not args.mac:
+            print("  ERROR: --out needs --mac to pick the CSV row.")
+            return False
+        try:
+            data = build_device_nvs(args.csv, args.mac, args.size, args.namespace)
+        except (NvsError, OSError) as e:
+            print(f"  ERROR: {e}")
+            return False
+        with open(args.out, "wb") as f:
+            f.write(data)
+        print(f"  Wrote {args.out} ({len(data):,} bytes) for {args.mac}")
+        return True
+
+    port = args.port or select_port()
+    print(f"\nConnecting to {port}...")
+    try:
+        with DeviceSession(port, DEFAULT_BAUD) as session:
+            print(f"  MAC: {session.mac}")
+            table = read_partition_table(session)
+            part = find_partition(table, label=args.partition)
+            if part is None:
+                print(f"  ERROR: No '{args.partition}' partition on this device.")
+                return False
+            data = build_device_nvs(args.csv, session.mac, part.size, args.namespace)
+            print(f"  Writing NVS for {session.mac} -> {part.label} "
+                  f"0x{part.offset:X} ({part.size:,} bytes)")
+            t = time.time()
+            session.write_flash(part.offset, data)
+            bad = diff_region(session, part.offset, data)
+            if bad:
+                print(f"  ERROR: NVS verify failed at 0x{bad[0][0]:X}.")
+                return False
+            print(f"  OK: written and verified in {time.time() - t:.1f}s")
+            if args.reboot:
+                session.hard_reset()
+                print("  Device rebooted.")
+    except (NvsError, PartitionTableError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: {e}")
+        return False
+    return True
+
+
+def run_ota(args):
+    """Show, flash, switch or revert OTA slots."""
+    if args.action == "flash":
+        if not args.image:
+            print("  ERROR: 'ota flash' needs an app image.")
+            return False
+        port = args.port or select_port()
+        ok = _ota_flash(port, args.image, args.slot)
+        if ok and args.reboot:
+            ok = reboot_device(port)
+        return ok
+
+    port = args.port or select_port()
+    print(f"\nConnecting to {port}...")
+    try:
+        with DeviceSession(port, DEFAULT_BAUD) as session:
+            layout = read_ota_layout(session)
+            if args.action == "switch":
+                if not args.slot:
+                    print("  ERROR: 'ota switch' needs --slot (ota_N, a label, or 'factory').")
+                    return False
+                if args.slot == "factory":
+                    layout = boot_factory(session, layout)
+                else:
+                    layout = switch_slot(session, layout, layout.find_slot(args.slot))
+            elif args.action == "revert":
+                layout = revert(session)
+            for line in layout.describe():
+                print(line)
+            if args.reboot and args.action != "status":
+                session.hard_reset()
+                print("  Device rebooted.")
+    except (OtaError, PartitionTableError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: {e}")
+        return False
+    return True
+
+
+def run_fs(args):
+    """Build/flash a SPIFFS/LittleFS image, or list/extract files from backups."""
+    if args.action in ("ls", "extract"):
+        return _read_fs_backups(args)
+    if len(args.source) != 1:
+        print(f"  ERROR: 'fs {args.action}' takes one folder or image.")
+        return False
+    source = args.source[0]
+
+    if args.action == "build":
+        if not args.out:
+            print("  ERROR: 'fs build' needs --out.")
+            return False
+        try:
+            data = build_image(source, args.size, args.type)
+        except (FsImageError, OSError) as e:
+            print(f"  ERROR: {e}")
+            return False
+        with open(args.out, "wb") as f:
+            f.write(data)
+        print(f"  Wrote {args.out} ({len(data):,} bytes, {args.type})")
+        return True
+
+    port = args.port or select_port()
+    print(f"\nConnecting to {port}...")
+    t = time.time()
+    try:
+        with DeviceSession(port, DEFAULT_BAUD) as session:
+            flash_filesystem(session, source, args.type, args.partition)
+            print(f"  OK: filesystem updated in {time.time() - t:.1f}s")
+            if args.reboot:
+                session.hard_reset()
+                print("  Device rebooted.")
+    except (FsImageError, PartitionTableError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: {e}")
+        return False
+    return True
+
+
+def _read_fs_backups(args):
+    """List or extract filesystem files from full-ROM backups (no device needed)."""
+    ok = True
+    for path in args.source:
+        try:
+            with FsArchive(path, args.partition) as archive:
+                where = (f"{archive.partition.label} @ 0x{archive.partition.offset:X}"
+                         if archive.partition else "raw image")
+                files = archive.files(args.match)
+                print(f"\n{path}: {archive.fs_type}, {where}, {len(files)} file(s)")
+                if args.action == "ls":
+                    for name, size in files:
+                        print(f"  {size:>10,}  {name}")
+                else:
+                    dest = args.dest or os.path.splitext(path)[0] + "_fs"
+                    if len(args.source) > 1 and args.dest:
+                        dest = os.path.join(args.dest, os.path.splitext(os.path.basename(path))[0])
+                    count = archive.extract(dest, args.match)
+                    print(f"  Extracted {count} file(s) to {dest}")
+        except (FsImageError, OSError) as e:
+            print(f"  ERROR: {path}: {e}")
+            ok = False
+    return ok
+
+
+def run_frames(args):
+    """Convert GIFs to RGB565 frame streams, or compare them with the GIFs."""
+    paths = []
+    for source in args.gifs:
+        if os.path.isdir(source):
+            paths += sorted(glob.glob(os.path.join(source, "*.gif")))
+        else:
+            paths.append(source)
+    if not paths:
+        print("  ERROR: no GIF files given.")
+        return False
+    try:
+        size = parse_size(args.size) if args.size else None
+    except FramesError as e:
+        print(f"  ERROR: {e}")
+        return False
+
+    ok = True
+    results = []
+    for path in paths:
+        out = None
+        if args.action == "build":
+            name = os.path.splitext(os.path.basename(path))[0] + ".rgb565"
+            out = os.path.join(args.out or os.path.dirname(path), name)
+        t = time.time()
+        try:
+            stats = convert_gif(path, out, size, args.keyframe, args.tile)
+        except (FramesError, OSError) as e:
+            print(f"  ERROR: {path}: {e}")
+            ok = False
+            continue
+        results.append(stats)
+        if out:
+            print(f"  {stats.name} -> {out}: {stats.width}x{stats.height}, {stats.frames} frames, "
+                  f"{stats.stream_bytes:,} bytes ({time.time() - t:.1f}s)")
+    if results and args.action == "bench":
+        print()
+        for line in format_bench(results):
+            print(line)
+        print("\n  ms = estimated ESP32 time per frame (read + decode + SPI push), before the GIF delay.")
+    return ok
+
+
+def run_compress(args):
+    """Estimate the upload time of an image at every zlib level; time it too with --port."""
+    try:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"  ERROR: {e}")
+        return False
+    bauds = args.baud or [DEFAULT_BAUD]
+    name = os.path.basename(args.file)
+    if not args.port:
+        for baud in bauds:
+            tuning = tune(data, baud, args.rtt / 1000)
+            print(f"\n  {name}: {len(data):,} bytes at {baud} baud, "
+                  f"{args.rtt:g} ms round trip (estimated)")
+            for line in tuning.describe():
+                print(line)
+        return True
+    if args.offset is None:
+        print("  ERROR: --port needs --offset (where to write the image).")
+        return False
+
+    ok = True
+    for baud in bauds:
+        print(f"\n  Connecting to {args.port} at {baud} baud...")
+        try:
+            with DeviceSession(args.port, baud) as session:
+                error = check_fits(args.offset, len(data), session.flash_size)
+                if error:
+                    print(f"  ERROR: {error}")
+                    return False
+                tuning = session.tune_upload(data)
+                measured = {}
+                for estimate in tuning.estimates:
+                    t = time.time()
+                    session.write_flash(args.offset, data, level=estimate.level)
+                    measured[estimate.level] = time.time() - t
+                    print(f"  {estimate.label}: {measured[estimate.level]:.2f}s")
+                checks = verify_images(session, [(args.offset, args.file)])
+                ok = ok and all(c.ok for c in checks)
+                calibrated = session.tune_upload(data)
+        except DEVICE_ERRORS as e:
+            print(f"  ERROR: {e}")
+            return False
+        print(f"\n  {name}: {len(data):,} bytes at {baud} baud, "
+              f"{calibrated.round_trip * 1000:.1f} ms round trip, "
+              f"{calibrated.send_cost * 1e6:.2f} us/byte host send cost (measured)")
+        for line in calibrated.describe(measured):
+            print(line)
+        if calibrated.best.level != tuning.best.level:
+            print(f"  A fresh connection (send cost not yet known) picks {tuning.best.label}.")
+    return ok
+
+
+def run_bootcheck(args):
+    """Reset devices and check their boot output, all ports at once."""
+    ports = args.port or [p["device"] for p in detect_ports()[0]]
+    if not ports:
+        print("  ERROR: No ESP32 serial ports found. Use --port to pick one.")
+        return False
+    what = f"'{args.expect}'" if args.expect else "a crash"
+    print(f"\n  Watching {len(ports)} port(s) at {args.baud} baud for {what}...")
+    results = check_many(ports, expect=args.expect, baud=args.baud, timeout=args.timeout,
+                         delay=args.delay, command=args.command, reset=not args.no_reset)
+    failed = [r for r in results.values() if not r.ok]
+    for result in failed:
+        print(f"\n  {result.port}:")
+        for line in result.last_lines():
+            print(f"    | {line}")
+    print(f"\n  {len(results) - len(failed)} passed, {len(failed)} failed.")
+    return not failed
+
+
+def _save_coredump(dump, out):
+    data = dump.elf if dump.elf is not None else dump.raw
+    with open(out, "wb") as f:
+        f.write(data)
+    kind = "ELF core" if dump.elf is not None else "raw binary dump"
+    print(f"  Saved {kind} to {out} ({len(data):,} bytes)")
+
+
+def run_coredump(args):
+    """Decode the coredump partition of a device or of full-ROM backups."""
+    if args.backups:
+        ok = True
+        for path in args.backups:
+            try:
+                dump, partition = load_backup_dump(path)
+            except (CoreDumpError, OSError) as e:
+                print(f"  ERROR: {path}: {e}")
+                ok = False
+                continue
+            where = f"{partition.label} @ 0x{partition.offset:X}" if partition else "raw partition image"
+            print(f"\n{path}: {where}")
+            for line in dump.describe():
+                print(line)
+            if args.out:
+                out = args.out
+                if len(args.backups) > 1:
+                    name = os.path.splitext(os.path.basename(path))[0]
+                    out = os.path.join(args.out, name + ("_core.elf" if dump.elf is not None else "_core.bin"))
+                    os.makedirs(args.out, exist_ok=True)
+                _save_coredump(dump, out)
+        return ok
+
+    port = args.port or select_port()
+    print(f"\nReading the core dump on {port}...")
+    t = time.time()
+    try:
+        with DeviceSession(port, DEFAULT_BAUD) as session:
+            try:
+                dump, partition = read_device_dump(session)
+            except NoCoreDump as e:
+                print(f"  {e}")
+                return True
+            except CoreDumpError as e:
+                print(f"  ERROR: {e}")
+                return False
+            print(f"  {partition.label} @ 0x{partition.offset:X}: read {dump.data_len:,} of "
+                  f"{partition.size:,} bytes in {time.time() - t:.1f}s")
+            for line in dump.describe():
+                print(line)
+            if args.out:
+                _save_coredump(dump, args.out)
+            if args.erase:
+                session.erase_region(partition.offset, partition.size)
+                print(f"  Erased {partition.label}; the next crash starts a fresh dump.")
+    except PartitionTableError as e:
+        print(f"  ERROR: {e}")
+        return False
+    except DEVICE_ERRORS as e:
+        print(f"  ERROR: {e}")
+        return False
+    return True
+
+
+def run_serve(args):
+    """Run the local job server until Ctrl-C (see espromkit_server)."""
+    def discover():
+        if args.port:
+            return [{"device": p, "description": ""} for p in args.port]
+        return detect_ports()[0]
+
+    defaults = {
+        "baud": args.baud,
+        "flash_mode": DEFAULT_FLASH_MODE,
+        "flash_freq": DEFAULT_FLASH_FREQ,
+        "flash_size": DEFAULT_FLASH_SIZE,
+    }
+    post = PostProcessor(args.post_workers) if args.post_workers else None
+    server = JobServer(args.root, discover, defaults, idle_timeout=args.idle,
+                       station=_open_station(), post=post,
+                       catalog=_open_catalog() if post else None)
+    try:
+        host, port = server.start(args.host, args.http_port)
+    except OSError as e:
+        print(f"  ERROR: cannot listen on {args.host}:{args.http_port}: {e}")
+        server.close()
+        return False
+    print(f"  Serving http://{host}:{port}/ (files under {server.root})")
+    for entry in server.port_status():
+        print(f"  Port {entry['port']}  {entry['description']}")
+    print("  Press Ctrl-C to stop.\n")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n  Stopping: waiting for running jobs...")
+    server.close()
+    return True
+
+
+def run_stats(args):
+    """Ingest Flash Download Tool logs, or report throughput across the station."""
+    try:
+        station = StationDB(args.db)
+    except (sqlite3.Error, OSError) as e:
+        print(f"  ERROR: {args.db}: {e}")
+        return False
+    with station:
+        if args.action == "report":
+            print(f"  Throughput by {args.by} (PASS runs, uncompressed data):\n")
+            for line in format_throughput(station.throughput(args.by), args.by):
+                print(line)
+            slots = station.slot_counters()
+            if slots:
+                print("\n  Flash Download Tool slot counters:")
+                for conf, slot, port, baud, passed, failed in slots:
+                    print(f"  slot {slot}  {port or '-':8s} {baud or '-':>8}  {passed} pass, {failed} fail")
+            return True
+
+        paths = args.paths or [DEFAULT_LOGS, DEFAULT_CONF]
+        try:
+            while True:
+                counts = station.ingest(p for p in paths if os.path.exists(p))
+                added = sum(n for p, n in counts.items() if not p.lower().endswith(".conf"))
+                if added or not args.follow:
+                    print(f"  {time.strftime('%H:%M:%S')}  {added} new run(s) from "
+                          f"{len(counts)} file(s) -> {args.db}")
+                if not args.follow:
+                    return True
+                time.sleep(args.follow)
+        except KeyboardInterrupt:
+            return True
+        except (sqlite3.Error, OSError) as e:
+            print(f"  ERROR: {e}")
+            return False
+
+
+BACKUP_NAME = re.compile(r"([0-9a-f]{12})_\d{8}_\d{6}_(full|bootloader|partitions|app)\.bin$")
+BACKUP_OFFSETS = {
+    "full": 0x0,
+    "bootloader": ESP32_PARTITIONS["bootloader"]["offset"],
+    "partitions": ESP32_PARTITIONS["partition_table"]["offset"],
+    "app": ESP32_PARTITIONS["application"]["offset"],
+}
+
+
+def _backup_origin(path, offset=None):
+    """(offset, info) of an existing backup file, from its manifest or its name."""
+    try:
+        with open(manifest_path(path)) as f:
+            manifest = json.load(f)
+        info = {key: manifest.get(key) for key in ("mac", "chip", "features", "flash_bytes",
+                                                   "flash_chip", "port")}
+        return manifest.get("offset", 0) if offset is None else offset, info
+    except (OSError, ValueError):
+        pass
+    match = BACKUP_NAME.search(os.path.basename(path).lower())
+    if match is None:
+        return offset or 0, {}
+    mac = ":".join(match.group(1)[i:i + 2] for i in range(0, 12, 2))
+    return BACKUP_OFFSETS[match.group(2)] if offset is None else offset, {"mac": mac}
+
+
+def _catalog_add(catalog, args):
+    paths = []
+    for p in args.paths:
+        if os.path.isdir(p):
+            paths += sorted(glob.glob(os.path.join(p, "*.bin")))
+        else:
+            paths.append(p)
+    if not paths:
+        print("  ERROR: No backup files given.")
+        return False
+    print(f"  Cataloging {len(paths)} backup(s)...")
+    failed = []
+
+    def added(result):
+        if result is None:
+            failed.append(result)
+        else:
+            print(f"  {os.path.basename(result['file'])}: {describe(result)}")
+
+    # Hashing and app descriptor parsing run on the process pool; the
+    # backups are already on disk, so they are not compressed again.
+    with PostProcessor(compress=False, on_done=catalog.add) as post:
+        for path in paths:
+            offset, info = _backup_origin(path, args.offset)
+            if args.mac:
+                info["mac"] = args.mac
+            post.submit(path, offset, info, callback=added)
+    print(f"  {len(paths) - len(failed)} added, {len(failed)} failed -> {catalog.path}")
+    return not failed
+
+
+def _catalog_restore(catalog, args, rows):
+    if not rows:
+        print("  ERROR: No cataloged backup matches.")
+        return False
+    backup = rows[0]
+    for line in format_backups([backup]):
+        print(line)
+    path, offset = backup["path"], backup["offset"]
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"  ERROR: {e}")
+        return False
+    if hashlib.sha256(data).hexdigest() != backup["sha256"]:
+        print(f"  ERROR: {path} has changed since it was cataloged; refusing to restore it.")
+        return False
+    if args.partition:
+        part = next((p for p in catalog.partitions(backup["id"]) if p["label"] == args.partition), None)
+        if part is None:
+            print(f"  ERROR: Backup {backup['id']} has no '{args.partition}' partition.")
+            return False
+        # Rebuild the split file from the verified backup rather than trust it
+        piece = data[part["offset"] - offset:part["offset"] - offset + part["size"]]
+        path = os.path.join(os.path.dirname(path), part["file"])
+        os.makedirs(parts_dir(backup["path"]), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(piece)
+        offset = part["offset"]
+    port = args.port or select_port()
+    if not args.yes:
+        target = f"partition '{args.partition}'" if args.partition else f"0x{offset:X}"
+        confirm = input(f"  Write {os.path.basename(path)} to {target} on {port} "
+                        f"(backup of {backup['mac'] or 'unknown device'})? [y/N]: ").strip().lower()
+        if confirm not in ("y", "yes"):
+            print("  Aborted.")
+            return False
+    return _write_flash_region(port, offset, path)
+
+
+def run_catalog(args):
+    """Register backups in the catalog, look them up, or restore one from a query."""
+    try:
+        catalog = Catalog(args.db)
+    except (sqlite3.Error, OSError) as e:
+        print(f"  ERROR: {args.db}: {e}")
+        return False
+    with catalog:
+        try:
+            if args.action == "add":
+                return _catalog_add(catalog, args)
+            if args.action == "prune":
+                gone = catalog.prune()
+                for path in gone:
+                    print(f"  Removed {path}")
+                print(f"  {len(gone)} missing backup(s) removed, {catalog.count()} left")
+                return True
+            if args.id is not None:
+                row = catalog.get(args.id)
+                rows = [row] if row is not None else []
+            else:
+                t = time.perf_counter()
+                rows = catalog.find(mac=args.mac, project=args.project, version=args.version,
+                                    chip=args.chip, sha256=args.sha256,
+                                    partition_sha256=args.partition_sha256,
+                                    limit=1 if args.action == "restore" else args.limit)
+                elapsed = time.perf_counter() - t
+            if args.action == "restore":
+                return _catalog_restore(catalog, args, rows)
+        except sqlite3.Error as e:
+            print(f"  ERROR: {e}")
+            return False
+        for line in format_backups(rows):
+            print(line)
+        for row in rows if args.partitions else ():
+            print(f"\n  {row['id']}: {os.path.basename(row['path'])}")
+            for line in format_partitions(catalog.partitions(row["id"])):
+                print(line)
+        if args.id is None:
+            print(f"\n  {len(rows)} of {catalog.count()} backup(s) in {elapsed * 1000:.1f} ms")
+        return True
+
+
+def run_convert(args):
+    """Convert an image between raw .bin, Intel HEX and UF2 without loading it whole."""
+    fmt = detect_format(args.input)
+    offset, info = _backup_origin(args.input, args.offset) if fmt == "bin" else (0, {})
+    family = None
+    if args.family or info.get("chip"):
+        family = uf2_family(args.family or info["chip"])
+        if family is None:
+            print(f"  ERROR: Unknown UF2 family '{args.family or info['chip']}' "
+                  f"(use a chip name such as esp32s3, or a hex ID)")
+            return False
+    try:
+        source = ImageFile(args.input, fmt, offset, family if fmt == "uf2" and args.family else None)
+        print(f"  {args.input}: {source.describe()}")
+        t = time.time()
+        out_fmt = convert(source, args.output, args.to, family)
+    except (FormatError, OSError) as e:
+        print(f"  ERROR: {e}")
+        return False
+    print(f"  {args.output}: {FORMAT_NAMES[out_fmt]}, {os.path.getsize(args.output):,} bytes "
+          f"in {time.time() - t:.1f}s")
+    if out_fmt == "bin":
+        print(f"  Flash offset of the raw image: 0x{source.start:X}")
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="espROMkit CLI — ESP32 Flash & Backup Tool. "
+                    "Run without arguments for the interactive wizard."
+    )
+    transcript = parser.add_mutually_exclusive_group()
+    transcript.add_argument("--record", metavar="FILE",
+                            help="log every serial session to a transcript file")
+    transcript.add_argument("--replay", metavar="FILE",
+                            help="run against a recorded transcript instead of a device")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="with --replay: divide recorded device delays by this "
+                             "(0 = no delays; default: 1)")
+    sub = parser.add_subparsers(dest="command")
+
+    job = sub.add_parser("job", help="run a batch job manifest (JSON/YAML/multi_download.conf)")
+    job.add_argument("manifest", help="path to the job manifest, or a Flash Download Tool "
+                                      "multi_download.conf")
+    job.add_argument("--port", action="append",
+                     help="serial port to flash (repeatable; default: all detected ESP32 ports)")
+    job.add_argument("--check", action="store_true",
+                     help="preflight the manifest only, do not flash")
+    job.add_argument("--loop", action="store_true",
+                     help="after each run, wait for the next device(s)")
+
+    farm = sub.add_parser("farm", help="run a job on many ports with overlapping stages")
+    farm.add_argument("manifest", help="path to the job manifest, or a Flash Download Tool "
+                                       "multi_download.conf")
+    farm.add_argument("--port", action="append",
+                      help="serial port to use (repeatable; default: all detected ESP32 ports)")
+    farm.add_argument("--watch", action="store_true",
+                      help="station mode: keep flashing devices as they are plugged in")
+    farm.add_argument("--workers", action="append", metavar="STAGE=N",
+                      help="worker pool size for a stage (connect, erase, write, verify, reboot)")
+    farm.add_argument("--metrics", metavar="[HOST:]PORT",
+                      help="serve live station metrics (Prometheus text format) on /metrics")
+
+    ota = sub.add_parser("ota", help="OTA slots: status, flash the inactive slot, switch, revert")
+    ota.add_argument("action", choices=("status", "flash", "switch", "revert"))
+    ota.add_argument("image", nargs="?", help="app .bin for 'flash'")
+    ota.add_argument("--port", help="serial port (default: auto-detect)")
+    ota.add_argument("--slot", help="ota_N or partition label (default: the inactive slot)")
+    ota.add_argument("--reboot", action="store_true", help="reboot the device afterwards")
+
+    fs = sub.add_parser("fs", help="SPIFFS/LittleFS: build, flash, or ls/extract from backups")
+    fs.add_argument("action", choices=("build", "flash", "ls", "extract"))
+    fs.add_argument("source", nargs="+",
+                    help="build/flash: folder to pack (e.g. a sketch's data/) or an image; "
+                         "ls/extract: full-ROM backup(s) or filesystem images")
+    fs.add_argument("--type", choices=FS_TYPES, default="spiffs", help="filesystem (default: spiffs)")
+    fs.add_argument("--port", help="serial port (default: auto-detect)")
+    fs.add_argument("--partition", help="partition label (default: first spiffs/littlefs partition)")
+    fs.add_argument("--out", help="with 'build': image file to write")
+    fs.add_argument("--size", type=lambda v: int(v, 0), default=0x160000,
+                    help="with 'build': image size (default: 0x160000, the Arduino default)")
+    fs.add_argument("--reboot", action="store_true", help="reboot the device afterwards")
+    fs.add_argument("--match", help="ls/extract: only files matching this glob (e.g. '*.gif')")
+    fs.add_argument("--dest", help="extract: output folder (default: <backup>_fs/)")
+
+    frames = sub.add_parser("frames", help="convert GIFs to pre-decoded RGB565 frame streams")
+    frames.add_argument("action", choices=("build", "bench"))
+    frames.add_argument("gifs", nargs="+", help="GIF files or folders (e.g. assets/images/GIF_240x135)")
+    frames.add_argument("--size", help="panel WIDTHxHEIGHT (default: from the file name, "
+                                       "e.g. _240x135.gif, else the GIF's own size)")
+    frames.add_argument("--out", help="with 'build': output folder (default: next to each GIF)")
+    frames.add_argument("--keyframe", type=int, default=DEFAULT_KEYFRAME,
+                        help="full frame every N frames (default: only the first)")
+    frames.add_argument("--tile", type=int, default=DEFAULT_TILE,
+                        help=f"dirty-rectangle tile size in pixels (default: {DEFAULT_TILE})")
+
+    comp = sub.add_parser("compress", help="compare upload times at every zlib level (autotune benchmark)")
+    comp.add_argument("file", help="image to upload (.bin)")
+    comp.add_argument("--baud", type=int, action="append",
+                      help=f"link speed (repeatable; default: {DEFAULT_BAUD})")
+    comp.add_argument("--rtt", type=float, default=DEFAULT_ROUND_TRIP * 1000,
+                      help=f"per-block ACK round trip in ms for estimates "
+                           f"(default: {DEFAULT_ROUND_TRIP * 1000:g}; measured with --port)")
+    comp.add_argument("--port", help="also write the image at every level on this device and time it")
+    comp.add_argument("--offset", type=lambda v: int(v, 0),
+                      help="with --port: flash offset to write the image at")
+
+    boot = sub.add_parser("bootcheck", help="reset devices and check that the firmware boots")
+    boot.add_argument("--port", action="append",
+                      help="serial port (repeatable; default: all detected ESP32 ports)")
+    boot.add_argument("--expect", help="string the firmware prints once it is up "
+                                       "(default: pass if no crash is seen)")
+    boot.add_argument("--command", help="probe to send after --delay, e.g. AT+GMR")
+    boot.add_argument("--baud", type=int, default=BOOT_BAUD, help=f"console baud (default: {BOOT_BAUD})")
+    boot.add_argument("--delay", type=float, default=0.0, help="seconds before sending --command")
+    boot.add_argument("--timeout", type=float, default=BOOT_TIMEOUT,
+                      help=f"seconds to wait (default: {BOOT_TIMEOUT:g})")
+    boot.add_argument("--no-reset", action="store_true", help="listen without resetting the device")
+
+    core = sub.add_parser("coredump", help="decode the coredump partition (device or backups)")
+    core.add_argument("backups", nargs="*",
+                      help="full-ROM backups or coredump partition images (default: read the device)")
+    core.add_argument("--port", help="serial port (default: auto-detect)")
+    core.add_argument("--out", help="save the ELF core (or raw dump) for esp-coredump/GDB; "
+                                    "a folder with several backups")
+    core.add_argument("--erase", action="store_true",
+                      help="erase the partition on the device after reading it")
+
+    serve = sub.add_parser("serve", help="local HTTP/JSON job server with a session per port")
+    serve.add_argument("--port", action="append",
+                       help="serial port to serve (repeatable; default: detected ESP32 ports, "
+                            "rescanned as devices come and go)")
+    serve.add_argument("--host", default=DEFAULT_HOST, help=f"address to bind (default: {DEFAULT_HOST})")
+    serve.add_argument("--http-port", type=int, default=DEFAULT_HTTP_PORT,
+                       help=f"HTTP port (default: {DEFAULT_HTTP_PORT})")
+    serve.add_argument("--root", default=".",
+                       help="folder that job file paths are relative to (default: current folder)")
+    serve.add_argument("--baud", type=int, default=DEFAULT_BAUD,
+                       help=f"session baud (default: {DEFAULT_BAUD})")
+    serve.add_argument("--idle", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                       help=f"seconds before an idle session releases its port (default: {DEFAULT_IDLE_TIMEOUT:g})")
+    serve.add_argument("--post-workers", type=int, default=os.cpu_count() or 1,
+                       help="processes that hash, compress and split finished backups "
+                            "(default: one per CPU; 0 turns post-processing off)")
+
+    stats = sub.add_parser("stats", help="station statistics: ingest Flash Download Tool logs, report")
+    stats.add_argument("action", choices=("ingest", "report"))
+    stats.add_argument("paths", nargs="*",
+                       help="ingest: log files/folders and multi_download.conf "
+                            "(default: ../logs and ../configure/esp32/multi_download.conf)")
+    stats.add_argument("--follow", type=float, metavar="SECONDS",
+                       help="ingest: keep tailing the logs every SECONDS")
+    stats.add_argument("--by", choices=tuple(GROUPS), default="adapter",
+                       help="report: group by (default: adapter)")
+    stats.add_argument("--db", default=DB_PATH, help=f"database (default: {DB_PATH})")
+
+    cat = sub.add_parser("catalog", help="backup catalog: add, find, restore from a query, prune")
+    cat.add_argument("action", choices=("add", "find", "restore", "prune"))
+    cat.add_argument("paths", nargs="*", help="add: backup files or folders of them")
+    cat.add_argument("--mac", help="device MAC (add: for files whose name has none)")
+    cat.add_argument("--project", help="app project name (* and ? wildcards)")
+    cat.add_argument("--version", help="app version (* and ? wildcards)")
+    cat.add_argument("--chip", help="chip description (* and ? wildcards)")
+    cat.add_argument("--sha256", help="SHA-256 of the backup file")
+    cat.add_argument("--partition-sha256", help="SHA-256 of a partition in the backup")
+    cat.add_argument("--id", type=int, help="find/restore: the backup with this catalog id")
+    cat.add_argument("--limit", type=int, default=20, help="find: most results (default: 20)")
+    cat.add_argument("--partitions", action="store_true", help="find: list each backup's partitions")
+    cat.add_argument("--offset", type=lambda v: int(v, 0),
+                     help="add: flash offset of the files (default: from the manifest or name)")
+    cat.add_argument("--partition", help="restore: write only this partition of the backup")
+    cat.add_argument("--port", help="restore: serial port (default: auto-detect)")
+    cat.add_argument("--yes", action="store_true", help="restore: do not ask for confirmation")
+    cat.add_argument("--db", default=CATALOG_PATH, help=f"database (default: {CATALOG_PATH})")
+
+    conv = sub.add_parser("convert", help="convert images between raw .bin, Intel HEX and UF2")
+    conv.add_argument("input", help="raw backup/region .bin, .hex or .uf2")
+    conv.add_argument("output", help="output file; its extension picks the format")
+    conv.add_argument("--to", choices=FORMATS, help="output format (default: from the extension)")
+    conv.add_argument("--offset", type=lambda v: int(v, 0),
+                      help="flash offset of a raw input (default: from the manifest or name, else 0)")
+    conv.add_argument("--family",
+                      help="UF2 chip family: esp32, esp32s3, ... or a hex ID "
+                           "(default: the backup's chip; UF2 input: keep only this family)")
+
+    nvs = sub.add_parser("nvs", help="write a per-device NVS partition from a CSV row")
+    nvs.add_argument("csv", help="CSV with a 'mac' column and one column per key")
+    nvs.add_argument("--port", help="serial port (default: auto-detect)")
+    nvs.add_argument("--namespace", default="config", help="NVS namespace (default: config)")
+    nvs.add_argument("--partition", default="nvs",
+                     help="label of the NVS partition on the device (default: nvs)")
+    nvs.add_argument("--reboot", action="store_true", help="reboot the device afterwards")
+    nvs.add_argument("--mac", help="with --out: MAC of the CSV row to generate")
+    nvs.add_argument("--out", help="write the NVS image to a file instead of flashing")
+    nvs.add_argument("--size", type=lambda v: int(v, 0), default=0x5000,
+                     help="with --out: partition size (default: 0x5000)")
+
+    return parser.parse_args(argv)
+
+
+def run_command(args):
+    """Run the selected subcommand (the wizard without one). Returns True on success."""
+    if args.command == "job":
+        success = run_job(args)
+    elif args.command == "farm":
+        success = run_farm(args)
+    elif args.command == "ota":
+        success = run_ota(args)
+    elif args.command == "fs":
+        success = run_fs(args)
+    elif args.command == "frames":
+        success = run_frames(args)
+    elif args.command == "compress":
+        success = run_compress(args)
+    elif args.command == "bootcheck":
+        success = run_bootcheck(args)
+    elif args.command == "coredump":
+        success = run_coredump(args)
+    elif args.command == "serve":
+        success = run_serve(args)
+    elif args.command == "stats":
+        success = run_stats(args)
+    elif args.command == "catalog":
+        success = run_catalog(args)
+    elif args.command == "convert":
+        success = run_convert(args)
+    elif args.command == "nvs":
+        success = run_nvs(args)
     else:
-        success = do_restore(port)
+        success = run_wizard()
+    return success
 
-    if success:
-        reboot_device(port)
+
+def main():
+    args = parse_args()
+    print_banner()
+
+    try:
+        if args.record:
+            start_recording(args.record)
+        elif args.replay:
+            start_replay(args.replay, args.speed)
+    except (TranscriptError, OSError) as e:
+        sys.exit(f"ERROR: {e}")
+    try:
+        success = run_command(args)
+    finally:
+        for line in finish():
+            print(line)
 
     print()
     if success:
@@ -0,0 +1,174 @@
+"""
+espROMkit compression tuning — pick the zlib level that uploads fastest.
+
+write_flash -z deflates every image at one fixed level. Whether that pays
+off depends on two rates: how fast this host compresses the image and how
+fast the serial link carries the result. The stub must know the
+compressed size before the first block (FLASH_DEFL_BEGIN), so an image is
+compressed completely before anything is sent, and the two times add up:
+
+  total(level) = compress time + sent bytes x (1 / link rate + send cost)
+                 + blocks x round trip
+
+Level 0 means no compression at all: the image goes out raw through
+FLASH_BEGIN/FLASH_DATA, padded with 0xFF to whole blocks. Sent bytes
+include the SLIP escapes of the data (0xC0/0xDB take two bytes on the
+wire). The link rate is the negotiated baud at 10 bits per byte. The
+round trip is the time the host waits for each block's ACK, measured on
+the session with a few register reads. The send cost is what each byte
+costs on the host beyond the wire: esptool formats every packet for its
+trace log and USB adapters add their own delays. A session learns it
+from its own finished writes (DeviceSession.calibrate), so only the first
+write on a connection goes without it.
+
+tune() compresses a sample of the image at every level (up to
+SAMPLE_SIZE bytes, from evenly spaced chunks) to measure this host's
+speed and the ratio, and scales both to the whole image. Images that fit
+in the sample are compressed whole and the winner's output is reused.
+At 115200 baud the link is so slow that level 9 nearly always wins. At
+1.5-2 Mbaud on a slow host, a low level or a raw upload can win for data
+that hardly compresses, such as encrypted or already-compressed images.
+
+Erasing and programming flash on the device overlaps the transfer and
+is the same at every level, so it is left out. When the flash is slower
+than the link, the levels end up closer together than predicted.
+"""
+
+import time
+import zlib
+
+LEVELS = tuple(range(10))           # 0 = raw upload
+SAMPLE_SIZE = 0x20000
+SAMPLE_CHUNKS = 8
+FLASH_WRITE_SIZE = 0x4000           # stub block size (esptool's ESP32StubLoader)
+BLOCK_HEADER = 8 + 16 + 2           # command header, data header, SLIP delimiters
+DEFAULT_ROUND_TRIP = 0.002          # seconds, when no device is there to measure
+
+
+def link_rate(baud):
+    """Bytes per second on a UART at `baud` (8N1: 10 bits per byte)."""
+    return baud / 10
+
+
+def measure_round_trip(esp, count=3):
+    """Shortest of `count` register reads: the per-command wait on this link."""
+    best = None
+    for _ in range(count):
+        t = time.perf_counter()
+        esp.read_reg(esp.CHIP_DETECT_MAGIC_REG_ADDR)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _sample(data):
+    if len(data) <= SAMPLE_SIZE:
+        return data
+    chunk = SAMPLE_SIZE // SAMPLE_CHUNKS
+    step = (len(data) - chunk) // (SAMPLE_CHUNKS - 1)
+    return b"".join(data[i * step:i * step + chunk] for i in range(SAMPLE_CHUNKS))
+
+
+def _escapes(data):
+    return data.count(b"\xc0") + data.count(b"\xdb")
+
+
+def wire_size(payload):
+    """Bytes `payload` takes on the wire after SLIP escaping."""
+    return len(payload) + _escapes(payload)
+
+
+def wire_seconds(sent, blocks, baud, round_trip):
+    """Time `sent` bytes in `blocks` take at `baud`, with nothing else in the way."""
+    return (sent + blocks * BLOCK_HEADER) / link_rate(baud) + blocks * round_trip
+
+
+class Estimate:
+    """Predicted upload time of one image at one zlib level."""
+
+    def __init__(self, level, size, sent, blocks, compress_s, link_s, round_trip_s):
+        self.level = level
+        self.size = size                # uncompressed bytes
+        self.sent = sent                # payload bytes on the wire, escapes included
+        self.blocks = blocks
+        self.compress_s = compress_s
+        self.link_s = link_s
+        self.round_trip_s = round_trip_s
+
+    @property
+    def label(self):
+        return f"zlib {self.level}" if self.level else "raw"
+
+    @property
+    def ratio(self):
+        return self.sent / self.size if self.size else 1.0
+
+    @property
+    def total_s(self):
+        return self.compress_s + self.link_s + self.round_trip_s
+
+
+class Tuning:
+    """Estimates for every level and the fastest of them (`best`)."""
+
+    def __init__(self, size, baud, round_trip, send_cost, estimates):
+        self.size = size
+        self.baud = baud
+        self.round_trip = round_trip
+        self.send_cost = send_cost
+        self.estimates = estimates
+        self.best = min(estimates, key=lambda e: e.total_s)
+        self.compressed = None          # the image at best.level, if it was compressed whole
+
+    def estimate(self, level):
+        return next(e for e in self.estimates if e.level == level)
+
+    def describe(self, measured=None):
+        """Table lines; `measured` maps level -> seconds of a real upload."""
+        header = (f"  {'level':7s} {'sent KB':>9s} {'ratio':>6s} {'compress':>9s} "
+                  f"{'link':>7s} {'acks':>6s} {'total':>7s}")
+        if measured:
+            header += f" {'measured':>9s}"
+        lines = [header]
+        for e in self.estimates:
+            line = (f"  {e.label:7s} {e.sent / 1024:9.1f} {e.ratio:6.3f} {e.compress_s:8.3f}s "
+                    f"{e.link_s:6.3f}s {e.round_trip_s:5.3f}s {e.total_s:6.3f}s")
+            if measured:
+                line += f" {measured[e.level]:8.3f}s" if e.level in measured else " " * 10
+            if e is self.best:
+                line += "  <- chosen"
+            lines.append(line)
+        return lines
+
+
+def tune(data, baud, round_trip=DEFAULT_ROUND_TRIP, send_cost=0.0, levels=LEVELS,
+         block_size=FLASH_WRITE_SIZE):
+    """Estimate the upload of `data` at each level over a link at `baud`."""
+    size = len(data)
+    sample = _sample(data)
+    scale = size / max(len(sample), 1)
+    rate = link_rate(baud)
+    whole = len(sample) == size
+    outputs = {}
+    estimates = []
+    for level in levels:
+        if level == 0:
+            blocks = max((size + block_size - 1) // block_size, 1)
+            sent = blocks * block_size + _escapes(sample) * scale
+            compress_s = 0.0
+        else:
+            t = time.perf_counter()
+            out = zlib.compress(sample, level)
+            compress_s = (time.perf_counter() - t) * scale
+            if whole:
+                outputs[level] = out
+            comp_size = len(out) * scale
+            blocks = max(int((comp_size + block_size - 1) // block_size), 1)
+            sent = comp_size + _escapes(out) * scale
+        estimates.append(Estimate(
+            level, size, int(sent), blocks, compress_s,
+            (sent + blocks * BLOCK_HEADER) / rate + sent * send_cost, blocks * round_trip,
+        ))
+    tuning = Tuning(size, baud, round_trip, send_cost, estimates)
+    tuning.compressed = outputs.get(tuning.best.level)
+    return tuning
@@ -0,0 +1,354 @@
+"""
+espROMkit core dumps — read the `coredump` partition and decode it.
+
+ESP-IDF writes a panic's core dump into the data/coredump partition:
+
+  header     data_len, version, then (by version) task count, TCB size,
+             segment count and chip revision
+  body       binary (IDF < 4.1 style: per task a TCB and its stack, then
+             memory segments) or an ELF core file
+  checksum   CRC32 or SHA-256 over header + body
+
+The version word carries the chip ID in its upper half. An erased
+partition starts with 0xFFFFFFFF.
+
+read_device_dump() finds the partition through the partition table and
+reads only `data_len` bytes of it, usually a few KB instead of a full
+backup. load_backup_dump() does the same on a full-ROM backup file, and
+accepts a bare partition dump.
+
+CoreDump decodes without the app ELF: the crashed task and exception
+registers (EXTRA_INFO note), the panic reason (PANIC_DETAILS), the app's
+ELF SHA-256 (ESP_CORE_DUMP_INFO), and per task its TCB address, name,
+PC, SP and stack range. For symbols and backtraces, save the ELF core
+with --out and open it with esp-coredump and the app ELF.
+"""
+
+import hashlib
+import struct
+import zlib
+
+from espromkit_partitions import (
+    DATA_TYPE, PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, PartitionTableError,
+    find_partition, parse_partition_table, read_partition_table,
+)
+
+
+COREDUMP_SUBTYPE = 0x03
+EMPTY = (0xFFFFFFFF, 0)
+FIRST_READ = 0x1000
+
+# dump version (low 16 bits) -> (format, checksum, header words)
+VERSIONS = {
+    0x0001: ("bin", "crc32", 4),
+    0x0002: ("bin", "crc32", 5),
+    0x0003: ("bin", "crc32", 6),
+    0x0100: ("elf", "crc32", 5),
+    0x0101: ("elf", "sha256", 5),
+    0x0102: ("elf", "crc32", 6),
+    0x0103: ("elf", "sha256", 6),
+    0x0104: ("elf", "sha256", 3),
+}
+HEADER_FIELDS = {
+    3: ("data_len", "version", "chip_rev"),
+    4: ("data_len", "version", "tasks", "tcb_size"),
+    5: ("data_len", "version", "tasks", "tcb_size", "segments"),
+    6: ("data_len", "version", "tasks", "tcb_size", "segments", "chip_rev"),
+}
+
+CHIPS = {
+    0: "ESP32", 2: "ESP32-S2", 9: "ESP32-S3", 5: "ESP32-C3", 12: "ESP32-C2",
+    13: "ESP32-C6", 16: "ESP32-H2", 18: "ESP32-P4", 20: "ESP32-C61", 23: "ESP32-C5",
+}
+XTENSA_CHIPS = (0, 2, 9)
+
+# ELF
+PT_LOAD = 1
+PT_NOTE = 4
+EM_XTENSA = 0x5E
+EM_RISCV = 0xF3
+NOTE_PRSTATUS = b"CORE"
+NOTE_INFO = b"ESP_CORE_DUMP_INFO"
+NOTE_EXTRA = b"EXTRA_INFO"
+NOTE_TASK = b"TASK_INFO"
+NOTE_PANIC = b"ESP_PANIC_DETAILS"
+PRSTATUS_REGS = 72                  # offset of pr_reg in the prstatus note
+CRASHED_TASK_SKIPPED = 0xDEADBEEF
+
+TCB_NAME_OFFSET = 0x34              # pcTaskName in the ESP-IDF FreeRTOS TCB
+TCB_NAME_SIZE = 16
+
+# Xtensa exception registers in EXTRA_INFO (register id -> name)
+XTENSA_EXTRA_REGS = {0: "exccause", 1: "excvaddr"}
+XTENSA_EXTRA_REGS.update({177 + n: f"epc{n + 1}" for n in range(7)})
+XTENSA_EXTRA_REGS.update({194 + n: f"eps{n + 2}" for n in range(6)})
+XTENSA_ISR_INDEX = 37               # word of EXTRA_INFO set when the crash was in an ISR
+RISCV_ISR_INDEX = 1
+
+EXCCAUSE_NAMES = {
+    0: "IllegalInstruction", 1: "Syscall", 2: "InstructionFetchError", 3: "LoadStoreError",
+    4: "Level1Interrupt", 5: "Alloca", 6: "IntegerDivideByZero", 8: "Privileged",
+    9: "LoadStoreAlignment", 12: "InstrPIFDataError", 13: "LoadStorePIFDataError",
+    14: "InstrPIFAddrError", 15: "LoadStorePIFAddrError", 20: "InstFetchProhibited",
+    28: "LoadProhibited", 29: "StoreProhibited",
+    64: "UnknownException", 65: "DebugException", 66: "DoubleException",
+    67: "KernelException", 68: "CoprocessorException", 69: "InterruptWDTTimeoutCPU0",
+    70: "InterruptWDTTimeoutCPU1", 71: "CacheError",
+}
+
+
+class CoreDumpError(Exception):
+    """No core dump partition, or a corrupt dump."""
+
+
+class NoCoreDump(CoreDumpError):
+    """The partition is erased: the device has not crashed since."""
+
+
+class Task:
+    def __init__(self, handle, name="", pc=None, sp=None, stack_start=None, stack_len=None):
+        self.handle = handle
+        self.name = name
+        self.pc = pc
+        self.sp = sp
+        self.stack_start = stack_start
+        self.stack_len = stack_len
+
+
+def _cstr(data):
+    return data.split(b"\x00")[0].decode("ascii", "replace")
+
+
+def _words(data):
+    return struct.unpack_from(f"<{len(data) // 4}I", data)
+
+
+class CoreDump:
+    """A decoded core dump. `data` starts at the partition's first byte."""
+
+    def __init__(self, data):
+        if len(data) < 12:
+            raise CoreDumpError("Core dump is truncated")
+        data_len, version = struct.unpack_from("<II", data)
+        if data_len in EMPTY:
+            raise NoCoreDump("No core dump (the partition is erased)")
+        self.version = version
+        self.dump_version = version & 0xFFFF
+        self.chip_id = version >> 16
+        if self.dump_version not in VERSIONS:
+            raise CoreDumpError(f"Unknown core dump version 0x{self.dump_version:04x}")
+        if data_len > len(data):
+            raise CoreDumpError(f"Core dump is {data_len:,} bytes, only {len(data):,} available")
+        self.format, self.checksum_type, words = VERSIONS[self.dump_version]
+        self.header = dict(zip(HEADER_FIELDS[words], struct.unpack_from(f"<{words}I", data)))
+        self.data_len = data_len
+        self.raw = bytes(data[:data_len])
+        size = 4 if self.checksum_type == "crc32" else 32
+        body, stored = self.raw[:-size], self.raw[-size:]
+        if self.checksum_type == "crc32":
+            self.checksum_ok = struct.pack("<I", zlib.crc32(body)) == stored
+        else:
+            self.checksum_ok = hashlib.sha256(body).digest() == stored
+        self.body = self.raw[words * 4:-size]
+
+        self.tasks = []
+        self.segments = []          # (address, bytes)
+        self.crashed = None
+        self.isr = None
+        self.exception = {}
+        self.panic = ""
+        self.app_sha256 = ""
+        self.machine = EM_XTENSA if self.chip_id in XTENSA_CHIPS else EM_RISCV
+        if self.format == "elf":
+            self._parse_elf(self.body)
+        else:
+            self._parse_bin(self.body)
+        for task in self.tasks:
+            if not task.name:
+                task.name = _cstr(self.read(task.handle + TCB_NAME_OFFSET, TCB_NAME_SIZE) or b"")
+
+    @property
+    def chip(self):
+        return CHIPS.get(self.chip_id, f"chip {self.chip_id}")
+
+    @property
+    def elf(self):
+        """The ELF core file (for esp-coredump/GDB), or None for binary dumps."""
+        return self.body if self.format == "elf" else None
+
+    def read(self, address, size):
+        """`size` bytes of the dumped memory at `address`, or None."""
+        for start, chunk in self.segments:
+            if start <= address and address + size <= start + len(chunk):
+                return chunk[address - start:address - start + size]
+        return None
+
+    # ---------------------------------------------------------------- ELF
+    def _parse_elf(self, elf):
+        if elf[:4] != b"\x7fELF" or len(elf) < 52:
+            raise CoreDumpError("ELF core dump without an ELF header")
+        self.machine, = struct.unpack_from("<H", elf, 18)
+        phoff, = struct.unpack_from("<I", elf, 28)
+        phentsize, phnum = struct.unpack_from("<HH", elf, 42)
+        notes = []
+        for i in range(phnum):
+            p_type, p_offset, p_vaddr, _, p_filesz = struct.unpack_from("<5I", elf, phoff + i * phentsize)
+            chunk = elf[p_offset:p_offset + p_filesz]
+            if p_type == PT_LOAD:
+                self.segments.append((p_vaddr, chunk))
+            elif p_type == PT_NOTE:
+                notes.extend(self._notes(chunk))
+        task_info = {}
+        for name, kind, desc in notes:
+            if name == NOTE_PRSTATUS and len(desc) >= PRSTATUS_REGS + 4:
+                handle, = struct.unpack_from("<I", desc, 24)
+                regs = _words(desc[PRSTATUS_REGS:])
+                sp_index = 65 if self.machine == EM_XTENSA else 2
+                self.tasks.append(Task(handle, pc=regs[0],
+                                       sp=regs[sp_index] if len(regs) > sp_index else None))
+            elif name == NOTE_TASK and len(desc) >= 36:
+                _, _, handle, stack_start, stack_len = struct.unpack_from("<5I", desc)
+                task_info[handle] = (stack_start, stack_len, _cstr(desc[20:36]))
+            elif name == NOTE_EXTRA and len(desc) >= 4:
+                self._parse_extra(_words(desc))
+            elif name == NOTE_PANIC:
+                self.panic = _cstr(desc).strip()
+            elif name == NOTE_INFO and len(desc) >= 4:
+                self.app_sha256 = _cstr(desc[4:68])
+        for task in self.tasks:
+            if task.handle in task_info:
+                task.stack_start, task.stack_len, task.name = task_info[task.handle]
+
+    @staticmethod
+    def _notes(segment):
+        pos = 0
+        while pos + 12 <= len(segment):
+            namesz, descsz, kind = struct.unpack_from("<3I", segment, pos)
+            pos += 12
+            name = segment[pos:pos + namesz].split(b"\x00")[0]
+            pos += (namesz + 3) & ~3
+            desc = segment[pos:pos + descsz]
+            pos += (descsz + 3) & ~3
+            yield name, kind, desc
+
+    def _parse_extra(self, words):
+        self.crashed = words[0]
+        if self.machine == EM_XTENSA:
+            for i in range(1, len(words) - 1, 2):
+                name = XTENSA_EXTRA_REGS.get(words[i])
+                if name and (words[i] <= 1 or words[i + 1]):     # EPCn/EPSn only when set
+                    self.exception[name] = words[i + 1]
+            if len(words) > XTENSA_ISR_INDEX:
+                self.isr = bool(words[XTENSA_ISR_INDEX])
+        elif len(words) > RISCV_ISR_INDEX:
+            self.isr = bool(words[RISCV_ISR_INDEX])
+
+    # ------------------------------------------------------------- binary
+    def _parse_bin(self, body):
+        tcb_size = self.header["tcb_size"]
+        pos = 0
+        for _ in range(self.header["tasks"]):
+            if pos + 12 > len(body):
+                raise CoreDumpError("Binary core dump ends inside the task list")
+            handle, top, end = struct.unpack_from("<3I", body, pos)
+            pos += 12
+            tcb = body[pos:pos + tcb_size]
+            pos += (tcb_size + 3) & ~3
+            start, length = min(top, end), abs(end - top)
+            stack = body[pos:pos + length]
+            pos += (length + 3) & ~3
+            self.segments.append((handle, tcb))
+            self.segments.append((start, stack))
+            task = Task(handle, stack_start=start, stack_len=length)
+            frame = _words(stack[:100])
+            if len(frame) > 5:
+                task.pc = frame[1] if self.machine == EM_XTENSA else frame[0]
+                if self.machine != EM_XTENSA:
+                    task.sp = frame[2]
+                else:
+                    task.sp = frame[4] if frame[0] else frame[5]    # a1 of an exception/solicited frame
+            if not self.tasks:      # the first task is the crashed one
+                self.crashed = handle
+                if self.machine == EM_XTENSA and frame and frame[0] and len(frame) > 21:
+                    self.exception = {"exccause": frame[20], "excvaddr": frame[21]}
+            self.tasks.append(task)
+        for _ in range(self.header.get("segments", 0)):
+            if pos + 8 > len(body):
+                break
+            address, size = struct.unpack_from("<II", body, pos)
+            pos += 8
+            self.segments.append((address, body[pos:pos + size]))
+            pos += size
+
+    # ------------------------------------------------------------- report
+    def describe(self):
+        major, minor = self.dump_version >> 8, self.dump_version & 0xFF
+        check = "OK" if self.checksum_ok else "MISMATCH"
+        rev = f" rev {self.header['chip_rev']}" if "chip_rev" in self.header else ""
+        lines = [f"  Core dump: {self.format.upper()} v{major}.{minor}, {self.chip}{rev}, "
+                 f"{self.data_len:,} bytes, {self.checksum_type} {check}"]
+        if self.app_sha256:
+            lines.append(f"  App ELF SHA-256: {self.app_sha256}")
+        if self.panic:
+            lines.append(f"  Panic: {self.panic}")
+        names = {t.handle: t.name for t in self.tasks}
+        if self.crashed == CRASHED_TASK_SKIPPED:
+            lines.append("  Crashed task: not dumped (corrupt TCB or stack)")
+        elif self.crashed is not None:
+            where = "" if self.isr is None else (", in an ISR" if self.isr else ", not in an ISR")
+            lines.append(f"  Crashed task: 0x{self.crashed:08x} '{names.get(self.crashed, '?')}'{where}")
+        if self.exception:
+            regs = []
+            for name, value in self.exception.items():
+                text = f"{name} 0x{value:08x}"
+                if name == "exccause" and value in EXCCAUSE_NAMES:
+                    text = f"{name} {value} ({EXCCAUSE_NAMES[value]})"
+                regs.append(text)
+            lines.append("  " + ", ".join(regs))
+        lines.append(f"  Tasks ({len(self.tasks)}):")
+        lines.append(f"      {'TCB':10s}  {'name':16s} {'PC':10s}  {'SP':10s}  stack")
+        for t in self.tasks:
+            mark = "*" if t.handle == self.crashed else " "
+            pc = f"0x{t.pc:08x}" if t.pc is not None else "-"
+            sp = f"0x{t.sp:08x}" if t.sp is not None else "-"
+            stack = f"0x{t.stack_start:08x} +{t.stack_len}" if t.stack_start is not None else "-"
+            lines.append(f"    {mark} 0x{t.handle:08x}  {t.name[:16]:16s} {pc:10s}  {sp:10s}  {stack}")
+        dumped = sum(len(chunk) for _, chunk in self.segments)
+        lines.append(f"  Memory: {len(self.segments)} segment(s), {dumped:,} bytes")
+        return lines
+
+
+def find_coredump_partition(partitions):
+    partition = find_partition(partitions, ptype=DATA_TYPE, subtype=COREDUMP_SUBTYPE)
+    if partition is None:
+        raise CoreDumpError("No coredump partition in the partition table")
+    return partition
+
+
+def read_device_dump(session):
+    """Read just the core dump from a device. Returns (CoreDump, Partition)."""
+    partition = find_coredump_partition(read_partition_table(session))
+    data = session.read_flash(partition.offset, min(FIRST_READ, partition.size))
+    data_len, = struct.unpack_from("<I", data)
+    if data_len not in EMPTY and len(data) < data_len <= partition.size:
+        data += session.read_flash(partition.offset + len(data), data_len - len(data))
+    return CoreDump(data), partition
+
+
+def load_backup_dump(path):
+    """Core dump out of a full-ROM backup, or a bare coredump partition image.
+
+    Returns (CoreDump, Partition or None).
+    """
+    with open(path, "rb") as f:
+        f.seek(PARTITION_TABLE_OFFSET)
+        try:
+            partition = find_coredump_partition(parse_partition_table(f.read(PARTITION_TABLE_SIZE)))
+        except PartitionTableError:
+            partition = None
+        f.seek(partition.offset if partition else 0)
+        data = f.read(partition.size if partition else -1)
+    if partition is not None and len(data) < partition.size:
+        raise CoreDumpError(f"{path}: backup ends before the coredump partition "
+                            f"(0x{partition.offset:X}..0x{partition.end:X})")
+    return CoreDump(data), partition
@@ -0,0 +1,239 @@
+"""
+espROMkit dashboard — one operation on many ports at once.
+
+This is the part of the GUI dashboard that knows nothing about tkinter.
+Each attached port has a PortTask with its own state, progress,
+throughput and log. Dashboard.start() runs the same work on a set of
+ports, one thread per port. Ports share the GUI's SessionPool, so each
+keeps its stub-loaded connection between operations.
+
+Worker threads never touch widgets. They only update their PortTask, and
+the window redraws rows whose `version` changed every REFRESH_MS. This
+costs one pass of the Tk event loop per refresh, however many ports are
+transferring. Calling root.after() once per chunk from each of 16
+threads would cost one callback per chunk. The cost stays flat because
+the work per refresh does not depend on how often progress is reported.
+
+esptool and the backup/erase/verify helpers print to sys.stdout.
+ThreadOutput stands in for sys.stdout and sys.stderr and sends each write
+to the sink registered for the writing thread. Every port's output lands
+in its own log, and the single-device window routes its worker the same
+way.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from espromkit_backup import BackupCancelled
+from espromkit_session import DEVICE_ERRORS
+
+REFRESH_MS = 200
+LOG_LINES = 500             # log lines kept per port
+RATE_WINDOW = 3.0           # seconds of progress that throughput is averaged over
+
+
+class ThreadOutput:
+    """A sys.stdout/sys.stderr stand-in that sends writes to per-thread sinks."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._sinks = {}        # thread ident -> callable(text)
+
+    @contextmanager
+    def route(self, sink):
+        """Send this thread's writes to `sink` inside the block."""
+        ident = threading.get_ident()
+        self._sinks[ident] = sink
+        try:
+            yield
+        finally:
+            self._sinks.pop(ident, None)
+
+    def write(self, text):
+        sink = self._sinks.get(threading.get_ident())
+        if sink is not None:
+            sink(text)
+        elif self.fallback is not None:     # None under pythonw
+            self.fallback.write(text)
+        return len(text)
+
+    def flush(self):
+        if self.fallback is not None and threading.get_ident() not in self._sinks:
+            self.fallback.flush()
+
+    def isatty(self):
+        return False
+
+
+def install_output():
+    """Route sys.stdout and sys.stderr by thread. Returns (stdout, stderr)."""
+    if not isinstance(sys.stdout, ThreadOutput):
+        sys.stdout = ThreadOutput(sys.stdout)
+    if not isinstance(sys.stderr, ThreadOutput):
+        sys.stderr = ThreadOutput(sys.stderr)
+    return sys.stdout, sys.stderr
+
+
+class PortTask:
+    """One port's row: written by its worker thread, read by the window."""
+
+    def __init__(self, port, description=""):
+        self.port = port
+        self.description = description
+        self.info = {}
+        self.state = "idle"
+        self.action = ""
+        self.message = ""           # last line logged
+        self.done = 0
+        self.total = 0
+        self.rate = 0.0             # bytes/s over the last RATE_WINDOW seconds
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.lines = deque(maxlen=LOG_LINES)
+        self.line_count = 0         # lines ever logged, so readers can ask for new ones
+        self.version = 0            # bumped on every change
+        self._partial = ""
+        self._samples = deque()     # (time, done)
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self):
+        return self.state == "running"
+
+    @property
+    def percent(self):
+        return 100 * self.done / self.total if self.total else 0.0
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def begin(self, action):
+        with self._lock:
+            self.state = "running"
+            self.action = action
+            self.done = self.total = 0
+            self.rate = 0.0
+            self.started, self.finished = time.time(), None
+            self._samples.clear()
+            self.cancel_event.clear()
+            self.message = ""
+            self._append(f"--- {action} on {self.port} ---")
+
+    def finish(self, state):
+        with self._lock:
+            self.state = state
+            self.finished = time.time()
+            self.rate = 0.0
+            self._append(f"--- {self.action} {state} in {self.elapsed:.1f}s ---")
+
+    def set_info(self, info):
+        with self._lock:
+            self.info = dict(info)
+            self.version += 1
+
+    def _append(self, line):
+        self.lines.append(line)
+        self.line_count += 1
+        self.version += 1
+
+    def write(self, text):
+        """Sink for this port's output: split into lines, keep the last LOG_LINES."""
+        with self._lock:
+            text = self._partial + text.replace("\r\n", "\n")
+            *complete, self._partial = text.split("\n")
+            for line in complete:
+                line = line.rsplit("\r", 1)[-1]    # keep the final state of a progress line
+                self._append(line)
+                if line.strip():
+                    self.message = line.strip()
+
+    def progress(self, done, total):
+        """progress_fn for backup_region and friends."""
+        now = time.time()
+        with self._lock:
+            if self._samples and done < self._samples[-1][1]:
+                self._samples.clear()               # next region started
+            self._samples.append((now, done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+            t0, d0 = self._samples[0]
+            self.rate = (done - d0) / (now - t0) if now > t0 else self.rate
+            self.done, self.total = done, total
+            self.version += 1
+
+    def new_lines(self, seen):
+        """(lines logged after the first `seen`, line_count); lines already dropped are skipped."""
+        with self._lock:
+            count = self.line_count
+            fresh = min(count - seen, len(self.lines))
+            return (list(self.lines)[len(self.lines) - fresh:] if fresh > 0 else []), count
+
+
+class Dashboard:
+    """The attached ports, their tasks, and the work running on them."""
+
+    def __init__(self):
+        self.tasks = {}                 # port -> PortTask, in the order ports appeared
+        self.stdout, self.stderr = install_output()
+        self._lock = threading.Lock()
+
+    def sync_ports(self, ports):
+        """Match the rows to `ports` [(device, description)]; busy rows are kept."""
+        present = dict(ports)
+        with self._lock:
+            for port, description in ports:
+                if port not in self.tasks:
+                    self.tasks[port] = PortTask(port, description)
+            for port in list(self.tasks):
+                if port not in present and not self.tasks[port].busy:
+                    del self.tasks[port]
+            return list(self.tasks.values())
+
+    def task(self, port):
+        return self.tasks.get(port)
+
+    @property
+    def running(self):
+        return [t for t in self.tasks.values() if t.busy]
+
+    def start(self, ports, action, work):
+        """Run work(task) -> bool on each idle port in its own thread. Returns the tasks started."""
+        started = []
+        for port in ports:
+            task = self.tasks.get(port)
+            if task is None or task.busy:
+                continue
+            task.begin(action)
+            threading.Thread(target=self._run, args=(task, work), daemon=True,
+                             name=f"dashboard-{port}").start()
+            started.append(task)
+        return started
+
+    def _run(self, task, work):
+        with self.stdout.route(task.write), self.stderr.route(task.write):
+            try:
+                state = "done" if work(task) else "failed"
+            except BackupCancelled:
+                state = "cancelled"
+            except DEVICE_ERRORS as e:
+                print(f"ERROR: {e}")
+                state = "failed"
+            except Exception as e:
+                print(f"ERROR: {type(e).__name__}: {e}")
+                state = "failed"
+        task.finish(state)
+
+    def cancel(self, ports):
+        """Ask running operations on `ports` to stop at their next checkpoint."""
+        for port in ports:
+            task = self.tasks.get(port)
+            if task is not None and task.busy:
+                task.cancel_event.set()
+                task.write("Cancelling after the current chunk...\n")
@@ -0,0 +1,133 @@
+"""
+espROMkit erase planner — erase and write only the sectors that change.
+
+write_flash erases every sector an image covers, even when the sector is
+already identical on the device or is 0xFF on both sides. The planner
+compares the image with the device first (device-side MD5, see
+espromkit_verify) and sorts each 4 KB sector into:
+
+  skip   the device already holds exactly these bytes
+  erase  the image is all 0xFF here but the device is not
+  write  anything else
+
+Erase-only sectors next to written ones join the write (the stub erases
+ahead of the data, 0xFF compresses to almost nothing). Runs that are only
+erased become erase_region calls split on 64 KB boundaries, so the stub
+can use block erases. Erase time then scales with what changes, not with
+the size of the image.
+"""
+
+import time
+
+from espromkit_session import SECTOR_SIZE
+from espromkit_verify import BLOCK_SIZE, diff_region
+
+
+ERASED_SECTOR = b"\xff" * SECTOR_SIZE
+
+
+class RestorePlan:
+    """Erase and write operations that bring flash in line with `data`."""
+
+    def __init__(self, offset, data):
+        self.offset = offset
+        self.data = data
+        self.writes = []    # [(start, end)] absolute flash addresses
+        self.erases = []    # [(start, end)] 64 KB blocks or sector runs
+
+    @property
+    def write_bytes(self):
+        return sum(end - start for start, end in self.writes)
+
+    @property
+    def erase_bytes(self):
+        return sum(end - start for start, end in self.erases)
+
+    @property
+    def skip_bytes(self):
+        return len(self.data) - self.write_bytes - self.erase_bytes
+
+    def summary(self):
+        block_ops = [(s, e) for s, e in self.erases if s % BLOCK_SIZE == 0 and e - s >= BLOCK_SIZE]
+        blocks = sum((e - s) // BLOCK_SIZE for s, e in block_ops)
+        sectors = (self.erase_bytes - blocks * BLOCK_SIZE + SECTOR_SIZE - 1) // SECTOR_SIZE
+        return (f"{self.skip_bytes:,} bytes unchanged (skipped), "
+                f"{self.erase_bytes:,} bytes erase-only ({blocks} x 64 KB block, "
+                f"{sectors} x 4 KB sector), "
+                f"{self.write_bytes:,} bytes to write in {len(self.writes)} run(s)")
+
+
+def _is_erased(data):
+    return data == ERASED_SECTOR[:len(data)]
+
+
+def _split_erase(start, end):
+    """Split [start, end) into 64 KB-aligned blocks and leftover sector runs."""
+    ops = []
+    while start < end:
+        if start % BLOCK_SIZE == 0 and end - start >= BLOCK_SIZE:
+            stop = start + (end - start) // BLOCK_SIZE * BLOCK_SIZE
+        else:
+            stop = min(end, start - start % BLOCK_SIZE + BLOCK_SIZE)
+        ops.append((start, stop))
+        start = stop
+    return ops
+
+
+def plan_restore(session, offset, data):
+    """Compare `data` with flash at `offset` and build a RestorePlan."""
+    plan = RestorePlan(offset, data)
+    runs = []   # [start, end, has_write]
+    for start, end in diff_region(session, offset, data):
+        for sector in range(start, end, SECTOR_SIZE):
+            stop = min(sector + SECTOR_SIZE, end)
+            write = not _is_erased(data[sector - offset:stop - offset])
+            if runs and runs[-1][1] == sector:
+                runs[-1][1] = stop
+                runs[-1][2] = runs[-1][2] or write
+            else:
+                runs.append([sector, stop, write])
+    for start, end, write in runs:
+        lo = -(-start // SECTOR_SIZE) * SECTOR_SIZE
+        hi = end // SECTOR_SIZE * SECTOR_SIZE
+        if write or lo >= hi:
+            plan.writes.append((start, end))
+            continue
+        # erase_region only takes whole sectors: a ragged edge (the partial
+        # last sector of an image, or an unaligned offset) is written as 0xFF,
+        # which erases its sector the way write_flash does
+        if start < lo:
+            plan.writes.append((start, lo))
+        plan.erases.extend(_split_erase(lo, hi))
+        if hi < end:
+            plan.writes.append((hi, end))
+    plan.writes.sort()
+    return plan
+
+
+def _run_progress(progress_fn, base, size, total):
+    """Map one write run's progress (possibly in compressed bytes) onto the whole plan."""
+    if progress_fn is None:
+        return None
+    return lambda done, run_total: progress_fn(base + size * done // max(run_total, 1), total)
+
+
+def execute_plan(session, plan, log=print, progress_fn=None):
+    """Run the plan's erases and writes over an open session.
+
+    progress_fn(done, total) counts written bytes across all write runs.
+    """
+    t = time.time()
+    for start, end in plan.erases:
+        session.erase_region(start, end - start)
+    levels = set()
+    written = 0
+    for start, end in plan.writes:
+        piece = plan.data[start - plan.offset:end - plan.offset]
+        log(f"  Writing 0x{start:X}..0x{end:X} ({len(piece):,} bytes)")
+        report = _run_progress(progress_fn, written, len(piece), plan.write_bytes)
+        levels.add(session.write_flash(start, piece, report))
+        written += len(piece)
+    used = ", ".join("raw" if level == 0 else f"zlib {level}" for level in sorted(levels))
+    log(f"  Erased {plan.erase_bytes:,} and wrote {plan.write_bytes:,} bytes "
+        f"in {time.time() - t:.1f}s" + (f" ({used})" if used else ""))
@@ -0,0 +1,338 @@
+"""
+espROMkit fake device — an ESP32 in download mode on a pseudo-terminal.
+
+FakeDevice opens a pty and answers the serial bootloader protocol on the
+master side, so everything that talks to a port (esptool runs,
+DeviceSession, the job server) can be exercised without hardware:
+
+  ROM      SYNC, READ_REG (chip magic, eFuses, SPI/RTC registers),
+           WRITE_REG (SPI user commands: RDID returns the flash ID),
+           MEM_BEGIN/DATA/END (the stub upload; answered with "OHAI")
+  stub     CHANGE_BAUDRATE, SPI_SET_PARAMS, READ_FLASH (acked frames and
+           an MD5 trailer), SPI_FLASH_MD5, FLASH_BEGIN/DATA/END,
+           FLASH_DEFL_BEGIN/DATA/END, ERASE_REGION, ERASE_FLASH
+
+Flash is a bytearray (erased to 0xFF, or loaded from an image), so a
+backup reads back what a restore wrote. A pty has no modem lines: the
+chip cannot be reset, and once the stub is running it stays running,
+as it does after esptool --after no_reset. `latency` adds a delay to
+every reply and `flash_rate` (bytes/s) paces reads, writes and erases,
+to make a fake device as slow as a real one. With `line=True` every
+frame also takes as long as it would on a UART at the current baud
+(10 bits a byte, 115200 until CHANGE_BAUDRATE). `commands` counts the
+requests seen, by name.
+
+Run this file to keep fake devices up for the CLI or the job server:
+
+  python espromkit_fakedevice.py --count 2 --image backup.bin --line
+"""
+
+import argparse
+import hashlib
+import os
+import select
+import struct
+import threading
+import time
+import tty
+import zlib
+from collections import Counter
+
+from esptool.loader import ESPLoader
+from esptool.targets.esp32 import ESP32ROM
+
+SLIP_END, SLIP_ESC = b"\xc0", b"\xdb"
+SECTOR_SIZE = 0x1000
+DEFAULT_MAC = "24:0a:c4:00:00:01"
+DEFAULT_FLASH_ID = 0x1640C8         # GigaDevice 4MB
+SYNC_VALUE = 0x20120707             # what the ROM puts in a SYNC reply
+STATUS_FAILED, STATUS_INVALID = 1, 0x05
+
+COMMANDS = {op: name for name, op in ESPLoader.ESP_CMDS.items()}
+
+# SPI user-command registers (esptool's run_spiflash_command)
+SPI_CMD_REG = ESP32ROM.SPI_REG_BASE
+SPI_USR2_REG = ESP32ROM.SPI_REG_BASE + ESP32ROM.SPI_USR2_OFFS
+SPI_W0_REG = ESP32ROM.SPI_REG_BASE + ESP32ROM.SPI_W0_OFFS
+SPI_CMD_USR = 1 << 18
+SPIFLASH_RDID = 0x9F
+
+
+class DeviceStopped(Exception):
+    """The fake device was closed while a request was in progress."""
+
+
+def slip_encode(packet):
+    return SLIP_END + packet.replace(SLIP_ESC, b"\xdb\xdd").replace(SLIP_END, b"\xdb\xdc") + SLIP_END
+
+
+def _efuse_words(mac):
+    """eFuse words 1 and 2 holding the base MAC, as ESP32ROM.read_mac() expects."""
+    b = bytes.fromhex(mac.replace(":", ""))
+    return {
+        ESP32ROM.EFUSE_RD_REG_BASE + 4: struct.unpack(">I", b[2:6])[0],
+        ESP32ROM.EFUSE_RD_REG_BASE + 8: (b[0] << 8) | b[1],
+    }
+
+
+class FakeDevice:
+    """One fake ESP32 (PICO-D4, 40 MHz crystal) behind a pty."""
+
+    def __init__(self, flash_size=0x400000, image=None, mac=DEFAULT_MAC,
+                 flash_id=DEFAULT_FLASH_ID, latency=0.0, flash_rate=None, line=False):
+        self.flash = bytearray(b"\xff" * flash_size)
+        if image:
+            self.flash[:len(image)] = image[:flash_size]
+        self.mac = mac
+        self.flash_id = flash_id
+        self.latency = latency
+        self.flash_rate = flash_rate
+        self.line = line
+        self.baud = ESPLoader.ESP_ROM_BAUD
+        self.stub = False
+        self.commands = Counter()
+        self.regs = {
+            ESP32ROM.CHIP_DETECT_MAGIC_REG_ADDR: ESP32ROM.MAGIC_VALUE,
+            ESP32ROM.EFUSE_RD_REG_BASE + 12: (5 << 9) | (1 << 15),     # PICO-D4, rev 1
+            ESP32ROM.EFUSE_RD_REG_BASE + 16: 100,                      # CK8M calibration
+            ESP32ROM.RTCCALICFG1: 1024 << ESP32ROM.TIMERS_RTC_CALI_VALUE_S,
+            ESP32ROM.UART_CLKDIV_REG: 80_000_000 // ESPLoader.ESP_ROM_BAUD,
+        }
+        self.regs.update(_efuse_words(mac))
+        self._deflate = None        # (decompressor, next flash address) while writing
+        self._raw = None            # (next flash address, end of the erased range)
+        self._buf = b""
+        self._stop = threading.Event()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    # --------------------------------------------------------------- wire
+    def _read_frame(self):
+        """Next SLIP frame from the host (escape codes undone)."""
+        while True:
+            start = self._buf.find(SLIP_END)
+            if start >= 0:
+                end = self._buf.find(SLIP_END, start + 1)
+                if end > start + 1:
+                    frame, self._buf = self._buf[start + 1:end], self._buf[end:]
+                    self._pace_line(len(frame) + 2)
+                    return frame.replace(b"\xdb\xdc", SLIP_END).replace(b"\xdb\xdd", SLIP_ESC)
+                if end == start + 1:        # back-to-back delimiters
+                    self._buf = self._buf[end:]
+                    continue
+            if self._stop.is_set():
+                raise DeviceStopped()
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if ready:
+                try:
+                    self._buf += os.read(self._master, 65536)
+                except OSError:
+                    raise DeviceStopped()
+
+    def _send(self, packet):
+        data = slip_encode(packet)
+        self._pace_line(len(data))
+        while data:
+            if self._stop.is_set():
+                raise DeviceStopped()
+            _, ready, _ = select.select([], [self._master], [], 0.1)
+            if ready:
+                data = data[os.write(self._master, data):]
+
+    def _reply(self, op, value=0, data=b"", ok=True, error=0):
+        status = bytes((0 if ok else STATUS_FAILED, error))
+        if not self.stub:
+            status += b"\x00\x00"       # the ROM sends two reserved bytes more
+        body = data + status
+        if self.latency:
+            time.sleep(self.latency)
+        self._send(struct.pack("<BBHI", 1, op, len(body), value) + body)
+
+    def _pace_line(self, size):
+        if self.line:
+            time.sleep(size * 10 / self.baud)
+
+    def _pace(self, size):
+        if self.flash_rate:
+            time.sleep(size / self.flash_rate)
+
+    def _serve(self):
+        try:
+            while True:
+                frame = self._read_frame()
+                if len(frame) < 8 or frame[0] != 0:
+                    continue
+                _, op, size, _ = struct.unpack("<BBHI", frame[:8])
+                self.commands[COMMANDS.get(op, f"0x{op:02X}")] += 1
+                self._handle(op, frame[8:8 + size])
+        except DeviceStopped:
+            pass
+
+    # ----------------------------------------------------------- commands
+    def _handle(self, op, data):
+        cmds = ESPLoader.ESP_CMDS
+        if op == cmds["SYNC"]:
+            for _ in range(8):
+                self._reply(op, 0 if self.stub else SYNC_VALUE)
+        elif op == cmds["READ_REG"]:
+            self._reply(op, self.regs.get(struct.unpack("<I", data[:4])[0], 0))
+        elif op == cmds["WRITE_REG"]:
+            for pos in range(0, len(data) - 15, 16):
+                self._write_reg(*struct.unpack("<III", data[pos:pos + 12]))
+            self._reply(op)
+        elif op in (cmds["MEM_BEGIN"], cmds["MEM_DATA"], cmds["SPI_ATTACH"], cmds["SPI_SET_PARAMS"]):
+            self._reply(op)
+        elif op == cmds["MEM_END"]:
+            self._reply(op)
+            if struct.unpack("<I", data[:4])[0] == 0:      # entry point given: run the stub
+                self.stub = True
+                self._send(b"OHAI")
+        elif op == cmds["CHANGE_BAUDRATE"]:
+            baud = struct.unpack("<I", data[:4])[0]
+            self._reply(op)
+            self.regs[ESP32ROM.UART_CLKDIV_REG] = 80_000_000 // baud
+            self.baud = baud
+        elif op == cmds["SPI_FLASH_MD5"]:
+            addr, size = struct.unpack("<II", data[:8])
+            if addr + size > len(self.flash):
+                self._reply(op, ok=False, error=0xC1)
+                return
+            self._pace(size // 8)
+            digest = hashlib.md5(self.flash[addr:addr + size])
+            self._reply(op, data=digest.digest() if self.stub else digest.hexdigest().encode())
+        elif op == cmds["READ_FLASH"] and self.stub:
+            self._read_flash(op, *struct.unpack("<IIII", data[:16]))
+        elif op == cmds["FLASH_BEGIN"] and self.stub:
+            size, _, _, offset = struct.unpack("<IIII", data[:16])
+            end = offset + (size + SECTOR_SIZE - 1) // SECTOR_SIZE * SECTOR_SIZE
+            if end > len(self.flash):
+                self._reply(op, ok=False, error=0xC1)
+                return
+            self.flash[offset:end] = b"\xff" * (end - offset)
+            self._raw = (offset, end)
+            self._reply(op)
+        elif op == cmds["FLASH_DATA"] and self._raw is not None:
+            length = struct.unpack("<I", data[:4])[0]
+            addr, end = self._raw
+            # The 0xFF padding of the last block lands past the erased range;
+            # programming 1 bits changes nothing, so it is dropped here.
+            chunk = data[16:16 + min(length, max(end - addr, 0))]
+            self.flash[addr:addr + len(chunk)] = chunk
+            self._raw = (addr + length, end)
+            self._pace(length)
+            self._reply(op)
+        elif op == cmds["FLASH_END"] and self.stub:
+            self._raw = None
+            self._reply(op)
+        elif op == cmds["FLASH_DEFL_BEGIN"] and self.stub:
+            size, _, _, offset = struct.unpack("<IIII", data[:16])
+            if offset + size > len(self.flash):
+                self._reply(op, ok=False, error=0xC1)
+                return
+            end = offset + (size + SECTOR_SIZE - 1) // SECTOR_SIZE * SECTOR_SIZE
+            self.flash[offset:end] = b"\xff" * (end - offset)
+            self._deflate = (zlib.decompressobj(), offset)
+            self._reply(op)
+        elif op == cmds["FLASH_DEFL_DATA"] and self._deflate is not None:
+            length = struct.unpack("<I", data[:4])[0]
+            decompressor, addr = self._deflate
+            try:
+                chunk = decompressor.decompress(data[16:16 + length])
+            except zlib.error:
+                self._reply(op, ok=False, error=0xC3)
+                return
+            self.flash[addr:addr + len(chunk)] = chunk
+            self._deflate = (decompressor, addr + len(chunk))
+            self._pace(len(chunk))
+            self._reply(op)
+        elif op == cmds["FLASH_DEFL_END"] and self.stub:
+            self._deflate = None
+            self._reply(op)
+        elif op == cmds["ERASE_REGION"] and self.stub:
+            offset, size = struct.unpack("<II", data[:8])
+            if offset % SECTOR_SIZE or size % SECTOR_SIZE or offset + size > len(self.flash):
+                self._reply(op, ok=False, error=0xC1)
+                return
+            self.flash[offset:offset + size] = b"\xff" * size
+            self._pace(size // 4)
+            self._reply(op)
+        elif op == cmds["ERASE_FLASH"] and self.stub:
+            self.flash[:] = b"\xff" * len(self.flash)
+            self._reply(op)
+        else:
+            self._reply(op, ok=False, error=STATUS_INVALID)
+
+    def _write_reg(self, addr, value, mask):
+        self.regs[addr] = (self.regs.get(addr, 0) & ~mask) | (value & mask)
+        if addr == SPI_CMD_REG and value & SPI_CMD_USR:
+            if self.regs.get(SPI_USR2_REG, 0) & 0xFF == SPIFLASH_RDID:
+                self.regs[SPI_W0_REG] = self.flash_id
+            self.regs[SPI_CMD_REG] = 0      # the command completes at once
+
+    def _read_flash(self, op, offset, length, block_size, _in_flight):
+        if offset + length > len(self.flash):
+            self._reply(op, ok=False, error=0xC1)
+            return
+        self._reply(op)
+        data = bytes(self.flash[offset:offset + length])
+        for pos in range(0, length, block_size):
+            block = data[pos:pos + block_size]
+            self._pace(len(block))
+            self._send(block)
+            self._read_frame()      # the host acks every block with its byte count
+        self._send(hashlib.md5(data).digest())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake ESP32 devices on pseudo-terminals.")
+    parser.add_argument("--count", type=int, default=1, help="number of devices (default: 1)")
+    parser.add_argument("--image", help="flash contents to start with (e.g. a full-ROM backup)")
+    parser.add_argument("--size", type=lambda v: int(v, 0), default=0x400000,
+                        help="flash size (default: 0x400000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument("--rate", type=float, help="flash read/write/erase speed in bytes/s")
+    parser.add_argument("--line", action="store_true",
+                        help="take as long as a real UART at the current baud for every frame")
+    args = parser.parse_args()
+
+    image = None
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    devices = []
+    for n in range(args.count):
+        mac = DEFAULT_MAC[:-2] + f"{n + 1:02x}"
+        devices.append(FakeDevice(args.size, image, mac, latency=args.latency, flash_rate=args.rate,
+                                  line=args.line))
+        print(f"  {devices[-1].port}  {mac}")
+    print("  Press Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices:
+            device.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+espROMkit farm — pipelined job runner for a station with many USB ports.
+
+Running a job device by device leaves the host idle while each chip
+erases or hashes its flash. The farm splits a job into stages, each with
+its own queue and worker pool:
+
+  connect  reset, load the stub, resolve per-device images
+  erase    pre steps, then erase-only sectors from the erase plan
+  write    stream the changed sectors (pre-compressed when whole)
+  verify   the job's verify step (device-side MD5)
+  reboot   hard reset if the job asks for it (or the boot check), release the port
+
+A device moves to the next stage's queue as soon as a stage finishes, so
+while one stick erases, another is written and a third is verified.
+Stage pool sizes cap how many devices share a stage at once (the write
+pool is kept small so a USB hub is not saturated). Throughput is
+reported in devices per minute.
+"""
+
+import queue
+import threading
+import time
+
+from espromkit_bootcheck import check_boot
+from espromkit_erase import plan_restore
+from espromkit_job import ManifestError
+from espromkit_metrics import STAGE_SECONDS, record_device
+from espromkit_session import DeviceSession
+
+
+STAGES = ("connect", "erase", "write", "verify", "reboot")
+DEFAULT_WORKERS = {"connect": 4, "erase": 4, "write": 2, "verify": 4, "reboot": 2}
+POLL_INTERVAL = 1.0
+
+
+class Unit:
+    """One device travelling through the pipeline."""
+
+    def __init__(self, port):
+        self.port = port
+        self.session = None
+        self.images = []
+        self.plans = []
+        self.written = 0
+        self.write_seconds = 0.0
+        self.error = None
+        self.t_start = time.time()
+        self.stage_times = {}
+
+
+class FarmStats:
+    """Counters shared by all workers."""
+
+    def __init__(self):
+        self.t_start = time.time()
+        self.passed = 0
+        self.failed = 0
+        self.busy = {name: 0.0 for name in STAGES}   # seconds spent per stage
+        self.lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.passed + self.failed
+
+    def devices_per_minute(self):
+        minutes = (time.time() - self.t_start) / 60
+        return self.passed / minutes if minutes > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.passed} passed, {self.failed} failed, "
+                f"{self.devices_per_minute():.1f} devices/min")
+
+
+class Farm:
+    """Feeds devices through the stage queues of a preflighted Job."""
+
+    def __init__(self, job, workers=None, log=print, station=None):
+        self.job = job
+        self.station = station      # StationDB: every finished device is recorded
+        self.workers = dict(DEFAULT_WORKERS, **(workers or {}))
+        self.stats = FarmStats()
+        self.queues = {name: queue.Queue() for name in STAGES}
+        self.active = set()         # ports with a unit in the pipeline
+        self.done_ports = set()     # ports finished; skipped until unplugged
+        self._log = log
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads = []
+
+    def log(self, port, message):
+        with self.stats.lock:
+            self._log(f"  [{port}] {message}")
+
+    # ------------------------------------------------------------ stages
+    def _connect(self, unit):
+        unit.session = DeviceSession(unit.port, self.job.baud_for(unit.port)).connect()
+        self.log(unit.port, f"{unit.session.mac}  {unit.session.flash_size_name} flash")
+        unit.images = self.job.prepare(unit.session)
+
+    def _erase(self, unit):
+        session = unit.session
+        for name, args in self.job.pre:
+            self.job.run_step(session, name, args, unit.images, lambda m: self.log(unit.port, m.strip()))
+        unit.plans = [plan_restore(session, i.offset, i.data) for i in unit.images]
+        for plan in unit.plans:
+            for start, end in plan.erases:
+                session.erase_region(start, end - start)
+
+    def _write(self, unit):
+        written = 0
+        t = time.time()
+        for image, plan in zip(unit.images, unit.plans):
+            if plan.writes == [(image.offset, image.end)]:
+                unit.session.write_flash(image.offset, image.data, compressed=image.compressed)
+            else:
+                for start, end in plan.writes:
+                    piece = image.data[start - image.offset:end - image.offset]
+                    unit.session.write_flash(start, piece)
+            written += plan.write_bytes
+        unit.written, unit.write_seconds = written, time.time() - t
+        self.log(unit.port, f"wrote {written:,} bytes")
+
+    def _verify(self, unit):
+        for name, args in self.job.post:
+            if name in ("reboot", "bootcheck"):
+                continue
+            if not self.job.run_step(unit.session, name, args, unit.images,
+                                     lambda m: self.log(unit.port, m.strip())):
+                raise ManifestError("verify failed")
+
+    def _reboot(self, unit):
+        steps = dict(self.job.post)
+        if "bootcheck" in steps:
+            unit.session.close()
+            result = check_boot(unit.port, **steps["bootcheck"])
+            self.log(unit.port, f"boot check {result.summary()}")
+            if not result.ok:
+                raise ManifestError(f"boot check: {result.reason}")
+            return
+        if "reboot" in steps:
+            unit.session.hard_reset()
+        unit.session.close()
+
+    # ----------------------------------------------------------- workers
+    def _worker(self, index):
+        name = STAGES[index]
+        stage_fn = getattr(self, f"_{name}")
+        q = self.queues[name]
+        while True:
+            unit = q.get()
+            if unit is None:
+                return
+            t = time.time()
+            try:
+                stage_fn(unit)
+                ok = True
+            except Exception as e:  # one bad device must not stop its worker
+                self.log(unit.port, f"FAIL in {name}: {e}")
+                unit.error = f"{name}: {e}"
+                ok = False
+            elapsed = time.time() - t
+            unit.stage_times[name] = elapsed
+            STAGE_SECONDS.observe(elapsed, stage=name, port=unit.port)
+            with self.stats.lock:
+                self.stats.busy[name] += elapsed
+            if ok and index + 1 < len(STAGES):
+                self.queues[STAGES[index + 1]].put(unit)
+            else:
+                self._finish(unit, ok)
+
+    def _finish(self, unit, ok):
+        if unit.session is not None:
+            unit.session.close()
+        with self.stats.lock:
+            if ok:
+                self.stats.passed += 1
+            else:
+                self.stats.failed += 1
+        if self.station is not None:
+            self.station.record("farm", unit.port, ok, unit.session, unit.written or None,
+                                unit.write_seconds or None, time.time() - unit.t_start,
+                                self.job.baud_for(unit.port), unit.error)
+        self.job.count_result(unit.port, ok)
+        record_device(unit.port, unit.session, ok)
+        times = " ".join(f"{n}={unit.stage_times[n]:.1f}s" for n in STAGES if n in unit.stage_times)
+        self.log(unit.port, f"{'PASS' if ok else 'FAIL'} in {time.time() - unit.t_start:.1f}s ({times})")
+        with self._lock:
+            self.active.discard(unit.port)
+            self.done_ports.add(unit.port)
+            self._idle.notify_all()
+        self._log(f"  -- {self.stats.summary()}")
+
+    def start(self):
+        for index, name in enumerate(STAGES):
+            for _ in range(max(1, self.workers[name])):
+                t = threading.Thread(target=self._worker, args=(index,), daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def submit(self, port):
+        """Queue the device on `port` unless it is already in the pipeline."""
+        with self._lock:
+            if port in self.active:
+                return False
+            self.active.add(port)
+            self.done_ports.discard(port)
+        self.queues["connect"].put(Unit(port))
+        return True
+
+    def wait(self):
+        """Block until every submitted device has left the pipeline."""
+        with self._lock:
+            while self.active:
+                self._idle.wait(POLL_INTERVAL)
+
+    def stop(self):
+        for name in STAGES:
+            for _ in range(max(1, self.workers[name])):
+                self.queues[name].put(None)
+        for t in self._threads:
+            t.join()
+
+    # -------------------------------------------------------------- runs
+    def run(self, ports):
+        """Flash each port once, all stages overlapping."""
+        self.start()
+        for port in ports:
+            self.submit(port)
+        self.wait()
+        self.stop()
+        return self.stats
+
+    def watch(self, ports_fn, stop_event=None, poll=POLL_INTERVAL):
+        """Station mode: flash every device that appears in ports_fn().
+
+        A finished port is skipped until it disappears, i.e. until the
+        operator unplugs the device and connects the next one.
+        """
+        self.start()
+        try:
+            while stop_event is None or not stop_event.is_set():
+                present = set(ports_fn())
+                with self._lock:
+                    self.done_ports &= present
+                    new = present - self.active - self.done_ports
+                for port in sorted(new):
+                    self.submit(port)
+                time.sleep(poll)
+        except KeyboardInterrupt:
+            self._log("\n  Stopping: finishing devices already in the pipeline...")
+        self.wait()
+        self.stop()
+        return self.stats
+
+
+def parse_workers(specs):
+    """Turn ["write=2", "verify=6"] into {"write": 2, "verify": 6}."""
+    workers = {}
+    for spec in specs or []:
+        name, _, count = spec.partition("=")
+        if name not in STAGES or not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Bad --workers '{spec}' (expected STAGE=N, STAGE one of "
+                             f"{', '.join(STAGES)})")
+        workers[name] = int(count)
+    return workers
+
+
+def format_stage_report(stats):
+    """Share of worker time spent in each stage."""
+    total = sum(stats.busy.values()) or 1
+    return [f"  {name:8s} {stats.busy[name]:8.1f}s  {100 * stats.busy[name] / total:5.1f}%"
+            for name in STAGES]
+
@@ -0,0 +1,152 @@
+"""
+espROMkit Flash Download Tool import — run multi_download.conf as a job.
+
+Espressif's Flash Download Tool (Windows only) keeps its factory-mode
+setup in configure/<chip>/multi_download.conf:
+
+  [DOWNLOAD PATH]   file_selN / file_pathN / file_offsetN, N = 0..13
+  [DOWNLOAD]        com_portN / baudrateN for the 8 port slots
+  [FLASH_CRYSTAL]   SPI mode/speed, used unless spicfgdis = 1
+  [ESPTOOL_PARAM]   flash_mode/freq/size ("keep"), verify, after, ...
+  [LOG_CHECK]       boot log check after the flash (-> bootcheck step)
+  [STATISTICS]      passN / failN counters per port slot
+
+load_fdt_conf() turns it into a regular job manifest, so it is
+preflighted once and run by `job` or `farm` like any other manifest.
+Relative file paths are resolved against the tool's folder (two levels
+above configure/<chip>/), as the tool itself does. baudrateN is an index
+into the tool's baud list. Each finished device bumps its slot's
+pass/fail counter in the .conf; only those lines are rewritten.
+"""
+
+import configparser
+import os
+import re
+import threading
+
+
+FILE_SLOTS = 14
+PORT_SLOTS = 8
+
+# The tool's combo boxes store indexes, not values.
+BAUD_RATES = (115200, 230400, 460800, 576000, 921600, 1152000, 1500000, 2000000)
+SPI_MODES = ("qio", "qout", "dio", "dout", "dio")     # FASTRD is sent as dio
+SPI_SPEEDS = ("40m", "26m", "20m", "80m")
+
+_counter_lock = threading.Lock()
+
+
+def _tool_dir(path):
+    """Folder the tool runs from: .../configure/esp32/x.conf -> ..."""
+    conf_dir = os.path.dirname(os.path.abspath(path))
+    parent = os.path.dirname(conf_dir)
+    if os.path.basename(parent).lower() == "configure":
+        return os.path.dirname(parent)
+    return conf_dir
+
+
+def _resolve(tool_dir, default_path, name):
+    """Tool-relative or Windows paths -> a local path (falls back to default_path)."""
+    name = name.replace("\\", "/")
+    if re.match(r"^[A-Za-z]:/", name) and os.sep == "/":
+        return os.path.normpath(os.path.join(tool_dir, default_path, name.rsplit("/", 1)[-1]))
+    return os.path.normpath(os.path.join(tool_dir, name))
+
+
+def _baud(value):
+    value = (value or "").strip()
+    if not value.isdigit():
+        return None
+    n = int(value)
+    if n < len(BAUD_RATES):
+        return BAUD_RATES[n]
+    return n if n >= 9600 else None
+
+
+def _section(conf, name):
+    return conf[name] if conf.has_section(name) else {}
+
+
+def load_fdt_conf(path):
+    """Parse multi_download.conf -> (manifest dict, {port: (slot, baud)})."""
+    conf = configparser.ConfigParser(interpolation=None)
+    if not conf.read(path):
+        raise OSError(f"Cannot read {path}")
+    files, download = _section(conf, "DOWNLOAD PATH"), _section(conf, "DOWNLOAD")
+    params, crystal = _section(conf, "ESPTOOL_PARAM"), _section(conf, "FLASH_CRYSTAL")
+    log_check = _section(conf, "LOG_CHECK")
+
+    tool_dir = _tool_dir(path)
+    default_path = files.get("default_path", "./bin/")
+    images = []
+    for n in range(FILE_SLOTS):
+        if files.get(f"file_sel{n}", "0").strip() != "1":
+            continue
+        name, offset = files.get(f"file_path{n}", "").strip(), files.get(f"file_offset{n}", "").strip()
+        if not name or not offset:
+            continue
+        images.append({"offset": offset, "file": _resolve(tool_dir, default_path, name)})
+
+    if crystal.get("spicfgdis", "1").strip() == "0":
+        mode = SPI_MODES[int(crystal.get("spimode", "2"))]
+        freq = SPI_SPEEDS[int(crystal.get("spispeed", "0"))]
+    else:
+        mode, freq = params.get("flash_mode", "keep"), params.get("flash_freq", "keep")
+
+    post = []
+    if params.get("verify", "True").strip().lower() == "true":
+        post.append("verify")
+    if log_check.get("log_check_enable", "False").strip().lower() == "true":
+        check = {
+            "expect": log_check.get("log_check_str", "").strip() or None,
+            "baud": int(log_check.get("log_check_baud", "115200")),
+            "delay": float(log_check.get("log_check_delaytime", "0")),
+            "timeout": float(log_check.get("log_check_timeout", "5")),
+        }
+        if log_check.get("log_check_enable_cmd", "False").strip().lower() == "true":
+            check["command"] = log_check.get("log_check_cmd_str", "").strip() or None
+        post.append({"bootcheck": check})     # resets the device itself
+    elif params.get("after", "hard_reset").strip() == "hard_reset":
+        post.append("reboot")
+
+    manifest = {
+        "name": os.path.basename(path),
+        "flash_mode": mode.strip().lower(),
+        "flash_freq": freq.strip().lower(),
+        "flash_size": params.get("flash_size", "keep").strip(),
+        "images": images,
+        "post": post,
+    }
+    ports = {}
+    for slot in range(1, PORT_SLOTS + 1):
+        port = download.get(f"com_port{slot}", "").strip()
+        if port:
+            ports[port] = (slot, _baud(download.get(f"baudrate{slot}")))
+    return manifest, ports
+
+
+def bump_counter(path, slot, ok):
+    """Add one to passN or failN in [STATISTICS], leaving every other line alone."""
+    key = f"{'pass' if ok else 'fail'}{slot}"
+    pattern = re.compile(rf"^(\s*{key}\s*=\s*)(\d*)(\s*)$")
+    with _counter_lock:
+        with open(path, newline="") as f:
+            lines = f.readlines()
+        section = None
+        for i, line in enumerate(lines):
+            body = line.rstrip("\r\n")
+            if body.strip().startswith("["):
+                section = body.strip()
+                continue
+            match = pattern.match(body) if section == "[STATISTICS]" else None
+            if match:
+                count = int(match.group(2) or 0) + 1
+                lines[i] = f"{match.group(1)}{count}{match.group(3)}{line[len(body):]}"
+                break
+        else:
+            return False
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            f.writelines(lines)
+        os.replace(tmp, path)
+    return True
@@ -0,0 +1,464 @@
+"""
+espROMkit image formats — raw backups to and from Intel HEX and UF2.
+
+Backups are raw .bin files, the same thing esptool's merge-bin writes by
+default. Other tools want Intel HEX (`esptool merge-bin --format hex`,
+most programmers) or UF2 (the TinyUF2 bootloader, `--format uf2`). Every
+converter here streams: a raw file is read in CHUNK_SIZE pieces, HEX and
+UF2 are parsed a record or block at a time, and memory use does not
+depend on the size of the image.
+
+Erased flash reads as 0xFF. When a raw image is written as HEX or UF2,
+granules (one HEX record, one UF2 block) that are all 0xFF are left out,
+so a mostly empty 4 MB backup turns into a small file. The first and last
+granule are always kept: the image still spans the whole backup and
+converts back to a raw file of the same size at the same offset.
+
+ImageFile reads any of the three formats as (address, bytes) segments.
+restore_image() writes a HEX or UF2 image to a device without expanding
+it into a full-size file. It builds one WINDOW_SIZE buffer at a time,
+with 0xFF wherever the file has no data, so the whole span is restored
+just like the raw backup it came from. Each window gets the erase plan
+(espromkit_erase), the device-side MD5 check and at most one repair pass
+before the next window is read.
+"""
+
+import os
+import re
+import struct
+
+from espromkit_erase import _run_progress, execute_plan, plan_restore
+from espromkit_geometry import check_fits
+from espromkit_job import patch_flash_params
+from espromkit_verify import BLOCK_SIZE, RegionCheck, diff_region, repair_images
+
+
+FORMATS = ("bin", "hex", "uf2")
+EXTENSIONS = {".bin": "bin", ".hex": "hex", ".ihex": "hex", ".uf2": "uf2"}
+FORMAT_NAMES = {"bin": "raw binary", "hex": "Intel HEX", "uf2": "UF2"}
+
+CHUNK_SIZE = 0x10000            # raw bytes read at a time; largest merged segment
+WINDOW_SIZE = 16 * BLOCK_SIZE   # bytes planned, written and verified at a time
+
+HEX_RECORD = 16                 # data bytes per HEX record, as esptool/intelhex write them
+HEX_DATA, HEX_EOF, HEX_SEGMENT, HEX_START_SEGMENT, HEX_LINEAR, HEX_START_LINEAR = range(6)
+
+UF2_BLOCK = 512
+UF2_PAYLOAD = 256               # data bytes per block written here
+UF2_MAX_PAYLOAD = 476
+UF2_MAGIC_START0 = 0x0A324655
+UF2_MAGIC_START1 = 0x9E5D5157
+UF2_MAGIC_END = 0x0AB16F30
+UF2_NOT_MAIN_FLASH = 0x00000001
+UF2_FILE_CONTAINER = 0x00001000
+UF2_FAMILY_PRESENT = 0x00002000
+UF2_HEADER = struct.Struct("<8I")
+
+# UF2 family IDs of the Espressif chips, as in esptool's targets
+UF2_FAMILIES = {
+    "esp8266": 0x7EAB61ED,
+    "esp32": 0x1C5F21B0,
+    "esp32s2": 0xBFDD4EEE,
+    "esp32s3": 0xC47E5767,
+    "esp32c2": 0x2B88D29C,
+    "esp32c3": 0xD42BA06C,
+    "esp32c5": 0xF71C0343,
+    "esp32c6": 0x540DDF62,
+    "esp32c61": 0x77D850C4,
+    "esp32h2": 0x332726F6,
+    "esp32p4": 0x3D308E94,
+}
+
+
+class FormatError(Exception):
+    pass
+
+
+def uf2_family(chip):
+    """UF2 family ID for a chip name or description ('ESP32-S3 (QFN56)...', 'esp32c3',
+    '0xc47e5767'), or None if it is not an Espressif chip."""
+    if not chip:
+        return None
+    name = chip.split(" ")[0].replace("-", "").lower()
+    try:
+        return int(name, 0)
+    except ValueError:
+        pass
+    # ESP32 descriptions name the package ('ESP32-D0WD-V3'): longest known prefix wins
+    matches = [key for key in UF2_FAMILIES if name.startswith(key)]
+    return UF2_FAMILIES[max(matches, key=len)] if matches else None
+
+
+def family_name(family_id):
+    return next((name.upper() for name, fid in UF2_FAMILIES.items() if fid == family_id),
+                f"0x{family_id:08X}")
+
+
+def detect_format(path):
+    """'bin', 'hex' or 'uf2', from the file's extension or else its first bytes."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext]
+    try:
+        with open(path, "rb") as f:
+            head = f.read(UF2_HEADER.size)
+    except OSError:
+        return "bin"
+    if len(head) == UF2_HEADER.size:
+        magic0, magic1 = struct.unpack_from("<II", head)
+        if (magic0, magic1) == (UF2_MAGIC_START0, UF2_MAGIC_START1):
+            return "uf2"
+    text = head.lstrip()
+    if text[:1] == b":" and all(c in b":0123456789abcdefABCDEF\r\n" for c in text[1:]):
+        return "hex"
+    return "bin"
+
+
+# ------------------------------------------------------------------ readers
+def _read_raw(path, offset, granule=None):
+    """Segments of a raw image at `offset`; with `granule`, all-0xFF granules are left out.
+
+    Granules are aligned to flash addresses. The first and the last one
+    are kept either way, so the segments still span the whole file.
+    """
+    end = offset + os.path.getsize(path)
+    blank = re.compile(rb"\xff{%d,}" % granule) if granule else None
+    with open(path, "rb") as f:
+        pos = offset
+        while pos < end:
+            chunk = f.read(min(CHUNK_SIZE, end - pos))
+            if not chunk:
+                break
+            kept = pos      # start of the data not yet yielded
+            for run in blank.finditer(chunk) if blank else ():
+                # whole granules inside the 0xFF run, never the file's first or last
+                lo = max(-(-(pos + run.start()) // granule) * granule,
+                         offset - offset % granule + granule)
+                hi = min((pos + run.end()) // granule * granule, (end - 1) // granule * granule)
+                if hi - lo < granule:
+                    continue
+                if lo > kept:
+                    yield kept, chunk[kept - pos:lo - pos]
+                kept = hi
+            if kept < pos + len(chunk):
+                yield kept, chunk[kept - pos:]
+            pos += len(chunk)
+
+
+def _read_hex(path):
+    """Data records of an Intel HEX file as (address, bytes)."""
+    base = 0
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(":"):
+                raise FormatError(f"{path}, line {number}: not an Intel HEX record")
+            try:
+                record = bytes.fromhex(line[1:])
+            except ValueError:
+                raise FormatError(f"{path}, line {number}: not an Intel HEX record") from None
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise FormatError(f"{path}, line {number}: bad record length")
+            if sum(record) & 0xFF:
+                raise FormatError(f"{path}, line {number}: checksum mismatch")
+            kind, data = record[3], record[4:-1]
+            if kind == HEX_DATA:
+                yield base + (record[1] << 8 | record[2]), data
+            elif kind == HEX_EOF:
+                return
+            elif kind == HEX_SEGMENT:
+                base = int.from_bytes(data, "big") << 4
+            elif kind == HEX_LINEAR:
+                base = int.from_bytes(data, "big") << 16
+            elif kind not in (HEX_START_SEGMENT, HEX_START_LINEAR):
+                raise FormatError(f"{path}, line {number}: unknown record type {kind:02X}")
+    raise FormatError(f"{path}: no end-of-file record (truncated?)")
+
+
+def _read_uf2(path, family=None, families=None):
+    """Payloads of a UF2 file as (address, bytes).
+
+    Blocks flagged "not main flash" and file-container blocks are
+    skipped; so are blocks of another family when `family` is given.
+    Family IDs seen are added to the `families` set.
+    """
+    with open(path, "rb") as f:
+        number = 0
+        while True:
+            block = f.read(UF2_BLOCK)
+            if not block:
+                return
+            if len(block) != UF2_BLOCK:
+                raise FormatError(f"{path}: truncated block {number}")
+            (magic0, magic1, flags, address, size, _, _,
+             block_family) = UF2_HEADER.unpack_from(block)
+            magic_end, = struct.unpack_from("<I", block, UF2_BLOCK - 4)
+            if (magic0, magic1, magic_end) != (UF2_MAGIC_START0, UF2_MAGIC_START1, UF2_MAGIC_END):
+                raise FormatError(f"{path}: block {number} has no UF2 magic")
+            if size > UF2_MAX_PAYLOAD:
+                raise FormatError(f"{path}: block {number} claims {size} data bytes")
+            number += 1
+            if flags & (UF2_NOT_MAIN_FLASH | UF2_FILE_CONTAINER):
+                continue
+            if flags & UF2_FAMILY_PRESENT:
+                if families is not None:
+                    families.add(block_family)
+                if family is not None and block_family != family:
+                    continue
+            yield address, block[UF2_HEADER.size:UF2_HEADER.size + size]
+
+
+def _merge(segments, limit=CHUNK_SIZE):
+    """Join back-to-back segments into pieces of up to `limit` bytes."""
+    start, buf = None, bytearray()
+    for address, data in segments:
+        if start is not None and address == start + len(buf) and len(buf) + len(data) <= limit:
+            buf += data
+            continue
+        if buf:
+            yield start, bytes(buf)
+        start, buf = address, bytearray(data)
+    if buf:
+        yield start, bytes(buf)
+
+
+class ImageFile:
+    """A raw, Intel HEX or UF2 image on disk, read as address-ordered segments.
+
+    Opening it scans the whole file once (checksums, magics, the address
+    span, whether segments come in address order) without keeping data.
+    `offset` places a raw file in flash; HEX and UF2 carry their addresses.
+    """
+
+    def __init__(self, path, fmt=None, offset=0, family=None):
+        self.path = path
+        self.format = fmt or detect_format(path)
+        if self.format not in FORMATS:
+            raise FormatError(f"Unknown image format '{self.format}'")
+        self.offset = offset if self.format == "bin" else None
+        self.family = family
+        self.families = set()           # UF2 family IDs in the file
+        self.start = self.end = None
+        self.data_bytes = 0
+        self.ranges = 0
+        self.ordered = True
+        for address, data in _merge(self._read(families=self.families)):
+            if self.end is not None and address < self.end:
+                self.ordered = False
+            if self.end is None or address != self.end:
+                self.ranges += 1
+            self.start = address if self.start is None else min(self.start, address)
+            self.end = address + len(data) if self.end is None else max(self.end, address + len(data))
+            self.data_bytes += len(data)
+        if self.start is None:
+            raise FormatError(f"{path}: no data" + (
+                f" for {family_name(family)} (file holds "
+                f"{', '.join(family_name(f) for f in sorted(self.families))})"
+                if family is not None and self.families else ""))
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def _read(self, granule=None, families=None):
+        if self.format == "hex":
+            return _read_hex(self.path)
+        if self.format == "uf2":
+            return _read_uf2(self.path, self.family, families)
+        return _read_raw(self.path, self.offset, granule)
+
+    def segments(self, granule=None):
+        """(address, bytes) pieces in file order; raw files skip all-0xFF granules."""
+        return _merge(self._read(granule))
+
+    def windows(self, size=WINDOW_SIZE):
+        """(address, bytes) for the whole span in `size`-aligned windows, 0xFF where no data.
+
+        Address-ordered files are read once; others are re-read for every
+        window (later data overrides earlier, as when flashing in order).
+        """
+        base = self.start - self.start % size
+        first = max(base, self.start)
+        window = bytearray(b"\xff" * (min(base + size, self.end) - first))
+        at = first
+        pending = self.segments() if self.ordered else None
+        carry = None
+        while at < self.end:
+            stop = at + len(window)
+            if pending is None:
+                for address, data in self.segments():
+                    _copy(window, at, address, data)
+            else:
+                while True:
+                    segment = carry or next(pending, None)
+                    carry = None
+                    if segment is None:
+                        break
+                    address, data = segment
+                    _copy(window, at, address, data)
+                    if address + len(data) > stop:
+                        carry = segment
+                        break
+            yield at, bytes(window)
+            at = stop
+            window = bytearray(b"\xff" * (min(stop + size, self.end) - stop))
+
+    def describe(self):
+        gaps = f", {self.ranges} data range(s)" if self.format != "bin" else ""
+        family = (", " + "/".join(family_name(f) for f in sorted(self.families))
+                  if self.families else "")
+        return (f"{FORMAT_NAMES[self.format]}, 0x{self.start:06X}..0x{self.end:06X} "
+                f"({self.size:,} bytes, {self.data_bytes:,} with data{gaps}{family})")
+
+
+def _copy(window, window_start, address, data):
+    """Copy the part of `data` (at `address`) that falls inside the window."""
+    lo = max(address, window_start)
+    hi = min(address + len(data), window_start + len(window))
+    if lo < hi:
+        window[lo - window_start:hi - window_start] = data[lo - address:hi - address]
+
+
+# ------------------------------------------------------------------ writers
+def _hex_record(kind, address, data=b""):
+    record = bytes((len(data), address >> 8 & 0xFF, address & 0xFF, kind)) + data
+    return f":{record.hex().upper()}{-sum(record) & 0xFF:02X}\n"
+
+
+def write_hex(out, segments):
+    """Write segments as Intel HEX text. Returns the number of data bytes written."""
+    upper = None
+    written = 0
+    for address, data in segments:
+        pos = 0
+        while pos < len(data):
+            at = address + pos
+            if at >> 16 != upper:
+                upper = at >> 16
+                out.write(_hex_record(HEX_LINEAR, 0, upper.to_bytes(2, "big")))
+            n = min(HEX_RECORD - at % HEX_RECORD, len(data) - pos)
+            out.write(_hex_record(HEX_DATA, at & 0xFFFF, data[pos:pos + n]))
+            pos += n
+        written += len(data)
+    out.write(_hex_record(HEX_EOF, 0))
+    return written
+
+
+def _uf2_blocks(segments):
+    """(address, payload) per UF2 block, split on UF2_PAYLOAD boundaries."""
+    for address, data in segments:
+        pos = 0
+        while pos < len(data):
+            at = address + pos
+            n = min(UF2_PAYLOAD - at % UF2_PAYLOAD, len(data) - pos)
+            yield at, data[pos:pos + n]
+            pos += n
+
+
+def write_uf2(out, blocks, count, family):
+    """Write `count` (address, payload) blocks as UF2. Returns the data bytes written."""
+    written = 0
+    for number, (address, payload) in enumerate(blocks):
+        header = UF2_HEADER.pack(UF2_MAGIC_START0, UF2_MAGIC_START1, UF2_FAMILY_PRESENT,
+                                 address, len(payload), number, count, family)
+        out.write(header + payload.ljust(UF2_MAX_PAYLOAD, b"\x00")
+                  + struct.pack("<I", UF2_MAGIC_END))
+        written += len(payload)
+    return written
+
+
+def convert(source, out_path, fmt=None, family=None):
+    """Write ImageFile `source` to `out_path` as 'bin', 'hex' or 'uf2'. Returns the format.
+
+    A raw file covers the whole span of the source, 0xFF where it has no
+    data; it belongs at source.start. UF2 output needs a family ID.
+    """
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(out_path)[1].lower(), "bin")
+    if fmt == "uf2" and family is None:
+        family = next(iter(source.families), None) if len(source.families) == 1 else None
+        if family is None:
+            raise FormatError("UF2 output needs the chip family (e.g. --family esp32s3)")
+    if os.path.abspath(out_path) == os.path.abspath(source.path):
+        raise FormatError(f"{out_path} is the input file")
+    tmp = out_path + ".part"
+    try:
+        if fmt == "hex":
+            with open(tmp, "w", encoding="ascii", newline="\n") as out:
+                write_hex(out, source.segments(HEX_RECORD))
+        elif fmt == "uf2":
+            count = sum(1 for _ in _uf2_blocks(source.segments(UF2_PAYLOAD)))
+            with open(tmp, "wb") as out:
+                write_uf2(out, _uf2_blocks(source.segments(UF2_PAYLOAD)), count, family)
+        else:
+            with open(tmp, "wb") as out:
+                for _, window in source.windows():
+                    out.write(window)
+        os.replace(tmp, out_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return fmt
+
+
+# ------------------------------------------------------------------ restore
+class ImageRestore:
+    """Totals of a windowed restore."""
+
+    def __init__(self):
+        self.written = 0
+        self.erased = 0
+        self.skipped = 0
+        self.mismatches = []    # [(start, end)] still wrong after the repair pass
+
+    @property
+    def ok(self):
+        return not self.mismatches
+
+
+def restore_image(session, source, flash_mode, flash_freq, flash_size, log=print,
+                  progress_fn=None):
+    """Write ImageFile `source` over an open session, one window at a time.
+
+    Each window is compared with flash, erased and written where it
+    differs, checked by device-side MD5 and repaired once. A bootloader
+    in the span gets the flash parameters stamped in, as for raw images.
+    Raises FormatError if the image does not fit or is for another chip.
+    """
+    if source.format == "uf2" and source.families:
+        family = uf2_family(session.chip)
+        if family is not None and family not in source.families:
+            raise FormatError(f"{os.path.basename(source.path)} is for "
+                              f"{'/'.join(family_name(f) for f in sorted(source.families))}, "
+                              f"not {session.chip}")
+        if family is not None and len(source.families) > 1:
+            source = ImageFile(source.path, "uf2", family=family)
+    error = check_fits(source.start, source.size, session.flash_size)
+    if error:
+        raise FormatError(error)
+    result = ImageRestore()
+    for address, data in source.windows():
+        boot = session.bootloader_offset
+        if address <= boot < address + len(data):
+            rel = boot - address
+            data = data[:rel] + patch_flash_params(data[rel:], boot, boot, flash_mode,
+                                                   flash_freq, flash_size, session.flash_size)
+        plan = plan_restore(session, address, data)
+        log(f"  0x{address:06X}..0x{address + len(data):06X}: {plan.summary()}")
+        report = _run_progress(progress_fn, address - source.start, len(data), source.size)
+        execute_plan(session, plan, log=log, progress_fn=report)
+        result.written += plan.write_bytes
+        result.erased += plan.erase_bytes
+        result.skipped += plan.skip_bytes
+        check = RegionCheck(address, source.path, data)
+        check.mismatches = diff_region(session, address, data)
+        if not check.ok:
+            repair_images(session, [check], log=log)
+        result.mismatches.extend(check.mismatches)
+        if progress_fn is not None:
+            progress_fn(address + len(data) - source.start, source.size)
+    if result.ok:
+        log(f"  Verified 0x{source.start:X}..0x{source.end:X} ({source.size:,} bytes)")
+    return result
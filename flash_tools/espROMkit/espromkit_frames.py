@@ -0,0 +1,502 @@
+"""
+espROMkit frames — pre-convert animated GIFs to RGB565 frame streams.
+
+espgfxGIF decodes LZW on the ESP32 for every frame and maps each palette
+index to RGB565 while pushing the whole canvas over SPI. On the 240x135
+and 160x80 panels that per-frame work caps the frame rate. This pipeline
+does it once on the host:
+
+  decode   GIF (LZW, interlace, transparency, disposal) -> RGB565 canvas
+  resize   nearest-neighbour to the panel, aspect kept, centred on black
+  delta    compare with the previous output frame on a tile grid and keep
+           only the dirty rectangles (plus a key frame every N frames)
+
+Each GIF becomes one .rgb565 file:
+
+  header  "R565" | u8 version | u8 flags | u16 width | u16 height
+          | u16 frame count | u16 loop count | u16 tile size    (16 bytes)
+  index   per frame: u32 offset | u32 length | u16 delay ms | u16 rects
+  frame   per rect:  u16 x | u16 y | u16 w | u16 h | w*h u16 RGB565
+
+All integers are little-endian, so a rect's pixels can go straight from
+the read buffer to Arduino_GFX draw16bitRGBBitmap(). A key frame is a
+single full-panel rect. The index lets a player loop and seek without
+scanning the file.
+
+NumPy is optional: with it, palette lookup, resize and the tile diff are
+array operations; without it the same steps run in plain Python.
+"""
+
+import os
+import re
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+MAGIC = b"R565"
+VERSION = 1
+HEADER_FORMAT = "<4sBBHHHHH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+INDEX_FORMAT = "<IIHH"
+INDEX_SIZE = struct.calcsize(INDEX_FORMAT)
+RECT_FORMAT = "<HHHH"
+RECT_SIZE = struct.calcsize(RECT_FORMAT)
+
+DEFAULT_TILE = 16
+DEFAULT_KEYFRAME = 0        # 0: only the first frame is a key frame
+FULL_FRAME_RATIO = 0.75     # dirty share above which a frame is sent whole
+MIN_DELAY_MS = 20           # browsers and gifdec treat 0/1 cs delays as ~20 ms
+
+# Rough ESP32 @ 240 MHz figures for the estimate in `frames bench`,
+# in line with espgfxGIF's ~70 fps on a 240x135 GIF.
+COST_NS = {
+    "read_byte": 250,       # SPIFFS/LittleFS reads in 4 KB chunks, ~4 MB/s
+    "lzw_pixel": 120,       # gifdec LZW decode into the index buffer
+    "lookup_pixel": 15,     # palette index -> RGB565 in writeIndexedPixels
+    "spi_pixel": 200,       # 16 bits at 80 MHz SPI
+    "rect": 3000,           # setAddrWindow + transaction per rectangle
+}
+
+
+class FramesError(Exception):
+    """A GIF could not be decoded, or a frame stream is malformed."""
+
+
+def rgb565(r, g, b):
+    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+
+
+def parse_size(text):
+    """"240x135" -> (240, 135)."""
+    match = re.fullmatch(r"\s*(\d+)\s*[xX]\s*(\d+)\s*", text or "")
+    if not match or not int(match.group(1)) or not int(match.group(2)):
+        raise FramesError(f"Bad size '{text}' (expected WIDTHxHEIGHT, e.g. 240x135)")
+    return int(match.group(1)), int(match.group(2))
+
+
+def size_from_name(path):
+    """Panel size from names like homervanish_240x135.gif, else None."""
+    match = re.search(r"_(\d+)x(\d+)\.gif$", os.path.basename(path), re.IGNORECASE)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+# ------------------------------------------------------------------ decode
+def _lzw_decode(data, min_size, count):
+    """GIF LZW data -> `count` palette indices."""
+    clear = 1 << min_size
+    end = clear + 1
+    base = [bytes((i,)) for i in range(clear)] + [b"", b""]
+    table = list(base)
+    size = min_size + 1
+    out = bytearray()
+    prev = None
+    bits = nbits = 0
+    for byte in data:
+        bits |= byte << nbits
+        nbits += 8
+        while nbits >= size:
+            code = bits & ((1 << size) - 1)
+            bits >>= size
+            nbits -= size
+            if code == clear:
+                table = list(base)
+                size = min_size + 1
+                prev = None
+                continue
+            if code == end:
+                return out[:count] + bytes(max(0, count - len(out)))
+            if prev is None:
+                entry = table[code] if code < clear else b""
+            elif code < len(table):
+                entry = table[code]
+                if len(table) < 4096:
+                    table.append(prev + entry[:1])
+            elif code == len(table) and len(table) < 4096:
+                entry = prev + prev[:1]
+                table.append(entry)
+            else:
+                raise FramesError("Corrupt LZW data")
+            out += entry
+            prev = entry
+            if len(table) == 1 << size and size < 12:
+                size += 1
+            if len(out) >= count:
+                return out[:count]
+    return out[:count] + bytes(max(0, count - len(out)))
+
+
+def _deinterlace(indices, width, height):
+    rows = list(range(0, height, 8)) + list(range(4, height, 8)) \
+        + list(range(2, height, 4)) + list(range(1, height, 2))
+    out = bytearray(len(indices))
+    for src, dst in enumerate(rows):
+        out[dst * width:(dst + 1) * width] = indices[src * width:(src + 1) * width]
+    return out
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def take(self, n):
+        if self.pos + n > len(self.data):
+            raise FramesError("GIF is truncated")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def byte(self):
+        return self.take(1)[0]
+
+    def sub_blocks(self):
+        chunks = []
+        while True:
+            n = self.byte()
+            if n == 0:
+                return b"".join(chunks)
+            chunks.append(self.take(n))
+
+
+def _palette(raw):
+    return [rgb565(raw[i], raw[i + 1], raw[i + 2]) for i in range(0, len(raw), 3)]
+
+
+class GifDecoder:
+    """Composites GIF frames into full RGB565 canvases.
+
+    Canvases are NumPy uint16 arrays of shape (height, width) when NumPy
+    is installed, else flat array('H') of width*height.
+    """
+
+    def __init__(self, data):
+        if data[:6] not in (b"GIF87a", b"GIF89a"):
+            raise FramesError("Not a GIF file")
+        self.data = data
+        self.width, self.height, flags, self.background, _ = struct.unpack("<HHBBB", data[6:13])
+        self.loop = 0
+        self.decoded_pixels = 0     # LZW output so far, for the cost estimate
+        self.global_palette = None
+        self._start = 13
+        if flags & 0x80:
+            size = 3 << ((flags & 0x07) + 1)
+            self.global_palette = _palette(data[13:13 + size])
+            self._start += size
+
+    def _blank(self):
+        if np is not None:
+            return np.zeros((self.height, self.width), dtype=np.uint16)
+        return array("H", bytes(2 * self.width * self.height))
+
+    def _fill(self, canvas, x, y, w, h, color=0):
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x >= x1 or y >= y1:
+            return
+        if np is not None:
+            canvas[y:y1, x:x1] = color
+            return
+        row = array("H", [color]) * (x1 - x)
+        for yy in range(y, y1):
+            canvas[yy * self.width + x:yy * self.width + x1] = row
+
+    def _blit(self, canvas, indices, x, y, w, h, palette, transparent):
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x >= x1 or y >= y1:
+            return
+        if np is not None:
+            lut = np.zeros(256, dtype=np.uint16)
+            lut[:len(palette)] = palette
+            idx = np.frombuffer(bytes(indices), dtype=np.uint8).reshape(h, w)[:y1 - y, :x1 - x]
+            region = canvas[y:y1, x:x1]
+            if transparent is None:
+                region[:] = lut[idx]
+            else:
+                mask = idx != transparent
+                region[mask] = lut[idx[mask]]
+            return
+        lut = palette + [0] * (256 - len(palette))
+        for row in range(y1 - y):
+            src = indices[row * w:row * w + (x1 - x)]
+            base = (y + row) * self.width + x
+            if transparent is None:
+                canvas[base:base + len(src)] = array("H", [lut[i] for i in src])
+            else:
+                for k, i in enumerate(src):
+                    if i != transparent:
+                        canvas[base + k] = lut[i]
+
+    def frames(self):
+        """Yield (delay_ms, canvas) for every frame, composited."""
+        r = _Reader(self.data)
+        r.pos = self._start
+        canvas = self._blank()
+        delay, transparent, disposal = 0, None, 0
+        while r.pos < len(self.data):
+            block = r.byte()
+            if block == 0x3B:           # trailer
+                return
+            if block == 0x21:           # extension
+                label = r.byte()
+                body = r.sub_blocks()
+                if label == 0xF9 and len(body) >= 4:
+                    packed, centis, tindex = struct.unpack("<BHB", body[:4])
+                    disposal = (packed >> 2) & 0x07
+                    transparent = tindex if packed & 0x01 else None
+                    delay = centis * 10
+                elif label == 0xFF and body[:11] in (b"NETSCAPE2.0", b"ANIMEXTS1.0") \
+                        and len(body) >= 14 and body[11] == 1:
+                    self.loop = struct.unpack("<H", body[12:14])[0]     # sub-block id 1: loop count
+                continue
+            if block != 0x2C:
+                raise FramesError(f"Unexpected GIF block 0x{block:02X} at {r.pos - 1}")
+            x, y, w, h, flags = struct.unpack("<HHHHB", r.take(9))
+            palette = self.global_palette
+            if flags & 0x80:
+                palette = _palette(r.take(3 << ((flags & 0x07) + 1)))
+            if palette is None:
+                raise FramesError("GIF frame has no palette")
+            min_size = r.byte()
+            if not 2 <= min_size <= 11:
+                raise FramesError(f"Bad LZW code size {min_size}")
+            indices = _lzw_decode(r.sub_blocks(), min_size, w * h)
+            if flags & 0x40:
+                indices = _deinterlace(indices, w, h)
+
+            saved = None
+            if disposal == 3:
+                saved = canvas.copy() if np is not None else array("H", canvas)
+            self.decoded_pixels += w * h
+            self._blit(canvas, indices, x, y, w, h, palette, transparent)
+            yield max(delay, MIN_DELAY_MS), canvas
+            if disposal == 2:
+                self._fill(canvas, x, y, w, h)
+            elif disposal == 3:
+                canvas = saved
+            delay, transparent, disposal = 0, None, 0
+
+
+# ------------------------------------------------------------------ resize
+class Scaler:
+    """Nearest-neighbour fit of a source canvas into the panel, centred."""
+
+    def __init__(self, src_size, dst_size):
+        (sw, sh), (self.width, self.height) = src_size, dst_size
+        self.src_width = sw
+        scale = min(self.width / sw, self.height / sh)
+        ow, oh = max(1, round(sw * scale)), max(1, round(sh * scale))
+        self.ox, self.oy = (self.width - ow) // 2, (self.height - oh) // 2
+        self.xs = [min(sw - 1, x * sw // ow) for x in range(ow)]
+        self.ys = [min(sh - 1, y * sh // oh) for y in range(oh)]
+        self.identity = (sw, sh) == (self.width, self.height)
+
+    def __call__(self, canvas):
+        if self.identity:
+            return canvas.copy() if np is not None else array("H", canvas)
+        ow, oh = len(self.xs), len(self.ys)
+        if np is not None:
+            out = np.zeros((self.height, self.width), dtype=np.uint16)
+            out[self.oy:self.oy + oh, self.ox:self.ox + ow] = canvas[np.ix_(self.ys, self.xs)]
+            return out
+        out = array("H", bytes(2 * self.width * self.height))
+        sw = self.src_width
+        for row, sy in enumerate(self.ys):
+            src = canvas[sy * sw:(sy + 1) * sw]
+            base = (self.oy + row) * self.width + self.ox
+            out[base:base + ow] = array("H", [src[x] for x in self.xs])
+        return out
+
+
+# ------------------------------------------------------------------- delta
+def dirty_tiles(frame, prev, width, height, tile):
+    """Rows of booleans: which tile differs from the previous frame."""
+    tw, th = -(-width // tile), -(-height // tile)
+    if np is not None:
+        diff = np.zeros((th * tile, tw * tile), dtype=bool)
+        diff[:height, :width] = frame != prev
+        return diff.reshape(th, tile, tw, tile).any(axis=(1, 3)).tolist()
+    grid = [[False] * tw for _ in range(th)]
+    for y in range(height):
+        row = grid[y // tile]
+        base = y * width
+        for tx in range(tw):
+            if row[tx]:
+                continue
+            a, b = base + tx * tile, base + min(width, (tx + 1) * tile)
+            if frame[a:b] != prev[a:b]:
+                row[tx] = True
+    return grid
+
+
+def tiles_to_rects(grid, width, height, tile):
+    """Merge dirty tiles into rectangles: runs per tile row, stacked when equal."""
+    rects = []
+    open_runs = {}
+    for ty, row in enumerate(grid + [[]]):
+        runs = set()
+        tx = 0
+        while tx < len(row):
+            if row[tx]:
+                start = tx
+                while tx < len(row) and row[tx]:
+                    tx += 1
+                runs.add((start, tx))
+            else:
+                tx += 1
+        for run in list(open_runs):
+            if run not in runs:
+                rects.append((run, open_runs.pop(run), ty))
+        for run in runs:
+            open_runs.setdefault(run, ty)
+    out = []
+    for (tx0, tx1), ty0, ty1 in sorted(rects, key=lambda r: (r[1], r[0])):
+        x, y = tx0 * tile, ty0 * tile
+        out.append((x, y, min(width, tx1 * tile) - x, min(height, ty1 * tile) - y))
+    return out
+
+
+def _rect_pixels(frame, width, x, y, w, h):
+    if np is not None:
+        return frame[y:y + h, x:x + w].astype("<u2").tobytes()
+    rows = array("H")
+    for yy in range(y, y + h):
+        rows.extend(frame[yy * width + x:yy * width + x + w])
+    if sys.byteorder == "big":
+        rows.byteswap()
+    return rows.tobytes()
+
+
+class StreamStats:
+    """Sizes and estimated ESP32 cost of one converted GIF."""
+
+    def __init__(self, name, gif_bytes, width, height):
+        self.name = name
+        self.gif_bytes = gif_bytes
+        self.width, self.height = width, height
+        self.frames = 0
+        self.key_frames = 0
+        self.stream_bytes = 0
+        self.rects = 0
+        self.dirty_pixels = 0
+        self.gif_pixels = 0         # pixels LZW-decoded by gifdec (frame rects)
+        self.canvas_pixels = 0      # pixels gifdec pushes (whole canvas, every frame)
+
+    @property
+    def dirty_share(self):
+        total = self.frames * self.width * self.height
+        return self.dirty_pixels / total if total else 0.0
+
+    def gif_cost_ms(self):
+        """Per frame: read compressed bytes, LZW, palette lookup, push the canvas."""
+        c = COST_NS
+        ns = (self.gif_bytes * c["read_byte"] + self.gif_pixels * c["lzw_pixel"]
+              + self.canvas_pixels * (c["lookup_pixel"] + c["spi_pixel"]) + self.frames * c["rect"])
+        return ns / 1e6 / max(1, self.frames)
+
+    def stream_cost_ms(self):
+        """Per frame: read the RGB565 bytes, push only the dirty rects."""
+        c = COST_NS
+        ns = (self.stream_bytes * c["read_byte"] + self.dirty_pixels * c["spi_pixel"]
+              + self.rects * c["rect"])
+        return ns / 1e6 / max(1, self.frames)
+
+
+def encode_stream(decoder, size=None, keyframe=DEFAULT_KEYFRAME, tile=DEFAULT_TILE, name="",
+                  gif_bytes=0):
+    """Decode, resize and delta-encode a GIF. Returns (stream bytes, StreamStats)."""
+    width, height = size or (decoder.width, decoder.height)
+    scale = Scaler((decoder.width, decoder.height), (width, height))
+    stats = StreamStats(name, gif_bytes, width, height)
+    index, payload = [], []
+    offset = 0
+    prev = None
+    full = [(0, 0, width, height)]
+    for number, (delay, canvas) in enumerate(decoder.frames()):
+        frame = scale(canvas)
+        if prev is None or (keyframe and number % keyframe == 0):
+            rects = full
+            stats.key_frames += 1
+        else:
+            rects = tiles_to_rects(dirty_tiles(frame, prev, width, height, tile), width, height, tile)
+            if sum(w * h for _, _, w, h in rects) > FULL_FRAME_RATIO * width * height:
+                rects = full
+        chunk = b"".join(struct.pack(RECT_FORMAT, x, y, w, h) + _rect_pixels(frame, width, x, y, w, h)
+                         for x, y, w, h in rects)
+        index.append((offset, len(chunk), min(delay, 0xFFFF), len(rects)))
+        payload.append(chunk)
+        offset += len(chunk)
+        prev = frame
+        stats.frames += 1
+        stats.rects += len(rects)
+        stats.dirty_pixels += sum(w * h for _, _, w, h in rects)
+        stats.canvas_pixels += decoder.width * decoder.height
+    if not stats.frames:
+        raise FramesError("GIF has no frames")
+    stats.gif_pixels = decoder.decoded_pixels
+    if stats.frames > 0xFFFF:
+        raise FramesError(f"Too many frames ({stats.frames})")
+
+    table_size = HEADER_SIZE + INDEX_SIZE * len(index)
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, width, height,
+                         len(index), decoder.loop, tile)
+    table = b"".join(struct.pack(INDEX_FORMAT, table_size + off, length, delay, rects)
+                     for off, length, delay, rects in index)
+    data = header + table + b"".join(payload)
+    stats.stream_bytes = len(data)
+    return data, stats
+
+
+def convert_gif(path, out_path=None, size=None, keyframe=DEFAULT_KEYFRAME, tile=DEFAULT_TILE):
+    """Convert one GIF file; writes <out_path> unless it is None. Returns StreamStats."""
+    with open(path, "rb") as f:
+        data = f.read()
+    size = size or size_from_name(path)
+    stream, stats = encode_stream(GifDecoder(data), size, keyframe, tile,
+                                  os.path.basename(path), len(data))
+    if out_path:
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(stream)
+    return stats
+
+
+# -------------------------------------------------------------------- read
+def read_stream(data):
+    """Parse a .rgb565 file -> (width, height, loop, [(delay_ms, [(x, y, w, h, pixels)])])."""
+    if len(data) < HEADER_SIZE or data[:4] != MAGIC:
+        raise FramesError("Not an RGB565 frame stream")
+    _, version, _, width, height, count, loop, _ = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+    if version != VERSION:
+        raise FramesError(f"Unsupported stream version {version}")
+    frames = []
+    for i in range(count):
+        offset, length, delay, nrects = struct.unpack_from(INDEX_FORMAT, data, HEADER_SIZE + i * INDEX_SIZE)
+        rects, pos = [], offset
+        for _ in range(nrects):
+            x, y, w, h = struct.unpack_from(RECT_FORMAT, data, pos)
+            pos += RECT_SIZE
+            rects.append((x, y, w, h, data[pos:pos + 2 * w * h]))
+            pos += 2 * w * h
+        if pos != offset + length:
+            raise FramesError(f"Frame {i} length mismatch")
+        frames.append((delay, rects))
+    return width, height, loop, frames
+
+
+def format_bench(all_stats):
+    """Table for `frames bench`: sizes and estimated ms/frame on the ESP32."""
+    lines = [f"  {'GIF':28s} {'frames':>6s} {'GIF KB':>8s} {'RGB565 KB':>10s} {'dirty':>6s} "
+             f"{'GIF ms':>7s} {'RGB ms':>7s} {'fps GIF->RGB':>14s}"]
+    for s in all_stats:
+        gif_ms, rgb_ms = s.gif_cost_ms(), s.stream_cost_ms()
+        lines.append(
+            f"  {s.name[:28]:28s} {s.frames:6d} {s.gif_bytes / 1024:8.1f} {s.stream_bytes / 1024:10.1f} "
+            f"{100 * s.dirty_share:5.1f}% {gif_ms:7.2f} {rgb_ms:7.2f} "
+            f"{1000 / gif_ms:6.0f}->{1000 / rgb_ms:<6.0f}"
+        )
+    return lines
@@ -0,0 +1,492 @@
+"""
+espROMkit filesystem images — build SPIFFS/LittleFS images from a folder.
+
+Sketches such as espgfxGIF read their assets from a `data/` folder that
+lives in the SPIFFS partition. Instead of the Arduino IDE plugin or a full
+ROM restore, build the image here and write only the filesystem
+partition; with the erase planner only sectors that changed are written.
+
+SPIFFS images use the layout of ESP-IDF's spiffsgen.py with the
+Arduino-ESP32 / ESP-IDF defaults: 256-byte pages, 4 KB blocks, 32-byte
+object names, 4-byte metadata, magic + magic length enabled.
+
+LittleFS images need littlefs-python (pip install littlefs-python) and
+use the esp_littlefs defaults: 4 KB blocks, 128-byte read/prog size,
+64-byte names, on-disk version 2.0 so older cores can mount them.
+
+FsArchive goes the other way: it opens a full-ROM backup (or a raw
+filesystem image) with mmap and lists or extracts files without loading
+the partition. For SPIFFS only the lookup and index pages are read to
+list files; data pages are touched when a file is extracted.
+"""
+
+import fnmatch
+import mmap
+import os
+import struct
+
+try:
+    import littlefs
+except ImportError:
+    littlefs = None
+
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_partitions import (
+    DATA_SUBTYPES, DATA_TYPE, PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, PartitionTableError,
+    find_partition, parse_partition_table, read_partition_table,
+)
+from espromkit_verify import diff_region
+
+
+FS_TYPES = ("spiffs", "littlefs")
+FS_SUBTYPES = {name: code for code, name in DATA_SUBTYPES.items() if name in FS_TYPES}
+
+SPIFFS_PAGE_SIZE = 256
+SPIFFS_BLOCK_SIZE = 0x1000
+SPIFFS_OBJ_NAME_LEN = 32
+SPIFFS_META_LEN = 4
+SPIFFS_MAGIC = 0x20140529
+
+# Page header flags: a cleared bit means set (NOR flash only clears bits)
+FLAG_USED = 0x01
+FLAG_FINAL = 0x02
+FLAG_INDEX = 0x04
+FLAG_IXDELE = 0x40
+FLAG_DELET = 0x80
+FLAGS_INDEX_PAGE = 0xF8     # used, final, index
+FLAGS_DATA_PAGE = 0xFC      # used, final
+TYPE_FILE = 1
+OBJ_ID_INDEX = 0x8000       # set in the object id of index pages
+
+LITTLEFS_BLOCK_SIZE = 0x1000
+LITTLEFS_IO_SIZE = 128
+LITTLEFS_NAME_MAX = 64
+LITTLEFS_DISK_VERSION = 0x00020000
+LITTLEFS_MAGIC = b"littlefs"
+
+
+class FsImageError(Exception):
+    """The folder does not fit, or a name is not representable."""
+
+
+class SpiffsLayout:
+    """Derived sizes for one SPIFFS configuration."""
+
+    def __init__(self, page_size=SPIFFS_PAGE_SIZE, block_size=SPIFFS_BLOCK_SIZE,
+                 obj_name_len=SPIFFS_OBJ_NAME_LEN, meta_len=SPIFFS_META_LEN):
+        self.page_size = page_size
+        self.block_size = block_size
+        self.obj_name_len = obj_name_len
+        self.meta_len = meta_len
+        self.pages_per_block = block_size // page_size
+        self.lu_pages = -(-self.pages_per_block * 2 // page_size)
+        self.lu_ids_per_page = page_size // 2
+        self.data_header_len = 5                    # obj id, span ix, flags
+        self.index_header_len = 8                   # same, padded to 4 bytes
+        self.index_head_len = self.index_header_len + 4 + 1 + obj_name_len + meta_len
+        self.data_len = page_size - self.data_header_len
+        self.head_entries = (page_size - self.index_head_len) // 2
+        self.index_entries = (page_size - self.index_header_len) // 2
+
+    def magic(self, bix, block_count):
+        return (SPIFFS_MAGIC ^ self.page_size ^ (block_count - bix)) & 0xFFFF
+
+
+class _IndexPage:
+    def __init__(self, layout, obj_id, span_ix, size=0, name=""):
+        self.obj_id = obj_id
+        self.span_ix = span_ix
+        self.size = size
+        self.name = name
+        self.limit = layout.head_entries if span_ix == 0 else layout.index_entries
+        self.entries = []       # absolute page indices of data pages
+
+    @property
+    def full(self):
+        return len(self.entries) >= self.limit
+
+    def render(self, layout):
+        page = struct.pack("<HHB", self.obj_id | OBJ_ID_INDEX, self.span_ix, FLAGS_INDEX_PAGE)
+        page += b"\xff" * (layout.index_header_len - layout.data_header_len)
+        if self.span_ix == 0:
+            name = self.name.encode("utf-8")
+            page += struct.pack("<IB", self.size, TYPE_FILE)
+            page += name + b"\x00" * (layout.obj_name_len - len(name) + layout.meta_len)
+        page += b"".join(struct.pack("<H", ix) for ix in self.entries)
+        return page + b"\xff" * (layout.page_size - len(page))
+
+
+class SpiffsBuilder:
+    """Packs files into a SPIFFS image of `size` bytes."""
+
+    def __init__(self, size, layout=None):
+        self.layout = layout or SpiffsLayout()
+        if size % self.layout.block_size:
+            raise FsImageError(f"SPIFFS size 0x{size:X} is not a multiple of the block size")
+        self.size = size
+        self.block_count = size // self.layout.block_size
+        self.blocks = []        # per block: [(obj id for lookup, page content or _IndexPage)]
+        self.next_obj_id = 1
+
+    def _place(self, lookup_id, page):
+        """Put a page into the next free slot; returns its absolute page index."""
+        usable = self.layout.pages_per_block - self.layout.lu_pages
+        if not self.blocks or len(self.blocks[-1]) >= usable:
+            if len(self.blocks) >= self.block_count:
+                raise FsImageError(f"Files do not fit in a {self.size:,} byte SPIFFS image")
+            self.blocks.append([])
+        block = self.blocks[-1]
+        block.append((lookup_id, page))
+        return ((len(self.blocks) - 1) * self.layout.pages_per_block
+                + self.layout.lu_pages + len(block) - 1)
+
+    def add(self, name, data):
+        """Add one file; `name` is its absolute path in the image ("/a.gif")."""
+        if len(name.encode("utf-8")) >= self.layout.obj_name_len:
+            raise FsImageError(f"'{name}' is longer than {self.layout.obj_name_len - 1} bytes")
+        layout = self.layout
+        obj_id = self.next_obj_id
+        self.next_obj_id += 1
+        index = _IndexPage(layout, obj_id, 0, len(data), name)
+        self._place(obj_id | OBJ_ID_INDEX, index)
+        for span_ix, pos in enumerate(range(0, len(data), layout.data_len)):
+            if index.full:
+                index = _IndexPage(layout, obj_id, index.span_ix + 1)
+                self._place(obj_id | OBJ_ID_INDEX, index)
+            page = struct.pack("<HHB", obj_id, span_ix, FLAGS_DATA_PAGE)
+            page += data[pos:pos + layout.data_len]
+            index.entries.append(self._place(obj_id, page))
+
+    def _lookup_pages(self, lookup_ids, bix):
+        layout = self.layout
+        table = bytearray(b"\xff" * (layout.lu_pages * layout.page_size))
+        for i, obj_id in enumerate(lookup_ids):
+            struct.pack_into("<H", table, i * 2, obj_id)
+        # Magic sits in the second-to-last id slot of the last lookup page
+        last_used = len(lookup_ids) - (layout.lu_pages - 1) * layout.lu_ids_per_page
+        if layout.lu_ids_per_page - last_used >= 2:
+            struct.pack_into("<H", table, len(table) - 4, layout.magic(bix, self.block_count))
+        return bytes(table)
+
+    def build(self):
+        layout = self.layout
+        out = bytearray()
+        for bix in range(self.block_count):
+            pages = self.blocks[bix] if bix < len(self.blocks) else []
+            out += self._lookup_pages([lookup_id for lookup_id, _ in pages], bix)
+            for _, page in pages:
+                if isinstance(page, _IndexPage):
+                    page = page.render(layout)
+                out += page + b"\xff" * (layout.page_size - len(page))
+            out += b"\xff" * ((bix + 1) * layout.block_size - len(out))
+        return bytes(out)
+
+
+def walk_files(folder):
+    """(image path, host path) for every file under `folder`, sorted."""
+    files = []
+    for root, dirs, names in os.walk(folder):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, folder).replace(os.sep, "/")
+            files.append(("/" + rel, path))
+    return files
+
+
+def build_spiffs(folder, size):
+    builder = SpiffsBuilder(size)
+    for name, path in walk_files(folder):
+        with open(path, "rb") as f:
+            builder.add(name, f.read())
+    return builder.build()
+
+
+def build_littlefs(folder, size):
+    if littlefs is None:
+        raise FsImageError(
+            "littlefs-python is required for LittleFS images. Install with: pip install littlefs-python"
+        )
+    if size % LITTLEFS_BLOCK_SIZE:
+        raise FsImageError(f"LittleFS size 0x{size:X} is not a multiple of 4 KB")
+    fs = littlefs.LittleFS(
+        block_size=LITTLEFS_BLOCK_SIZE, block_count=size // LITTLEFS_BLOCK_SIZE,
+        read_size=LITTLEFS_IO_SIZE, prog_size=LITTLEFS_IO_SIZE,
+        name_max=LITTLEFS_NAME_MAX, disk_version=LITTLEFS_DISK_VERSION,
+    )
+    try:
+        for name, path in walk_files(folder):
+            parent = os.path.dirname(name)
+            if parent != "/":
+                fs.makedirs(parent, exist_ok=True)
+            with open(path, "rb") as src, fs.open(name, "wb") as dst:
+                dst.write(src.read())
+    except littlefs.errors.LittleFSError as e:
+        raise FsImageError(f"LittleFS: {e} (folder too large for {size:,} bytes?)")
+    return bytes(fs.context.buffer)
+
+
+def build_image(folder, size, fs_type="spiffs"):
+    """Build a `size`-byte image of `folder` as SPIFFS or LittleFS."""
+    if not os.path.isdir(folder):
+        raise FsImageError(f"Not a folder: {folder}")
+    if fs_type == "littlefs":
+        return build_littlefs(folder, size)
+    return build_spiffs(folder, size)
+
+
+def find_fs_partition(partitions, label=None):
+    """The partition to put a filesystem in: by label, else the first spiffs/littlefs."""
+    if label:
+        return find_partition(partitions, label=label)
+    for subtype in FS_SUBTYPES.values():
+        part = find_partition(partitions, ptype=DATA_TYPE, subtype=subtype)
+        if part is not None:
+            return part
+    return None
+
+
+def flash_filesystem(session, source, fs_type="spiffs", label=None, log=print):
+    """Build (or load) an image and write only the filesystem partition.
+
+    `source` is a folder to pack or a prebuilt image file. Returns the
+    partition that was written.
+    """
+    part = find_fs_partition(read_partition_table(session), label)
+    if part is None:
+        raise FsImageError(f"No {'partition ' + repr(label) if label else 'spiffs/littlefs partition'} "
+                           f"on this device")
+    if os.path.isdir(source):
+        log(f"  Building {fs_type} image of {source} for {part.label} ({part.size:,} bytes)...")
+        data = build_image(source, part.size, fs_type)
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+        if len(data) > part.size:
+            raise FsImageError(f"{os.path.basename(source)} ({len(data):,} bytes) is larger than "
+                               f"{part.label} ({part.size:,} bytes)")
+    log(f"  Comparing with {part.label} at 0x{part.offset:X}...")
+    plan = plan_restore(session, part.offset, data)
+    log(f"  Plan: {plan.summary()}")
+    execute_plan(session, plan, log)
+    bad = diff_region(session, part.offset, data)
+    if bad:
+        raise FsImageError(f"Verify failed at 0x{bad[0][0]:X}")
+    log(f"  Verified {part.label}")
+    return part
+
+
+# ------------------------------------------------------------------ reading
+class SpiffsReader:
+    """Lists and reads files of a SPIFFS image held in a buffer (e.g. mmap)."""
+
+    def __init__(self, buf, layout=None):
+        self.buf = buf
+        self.layout = layout or SpiffsLayout()
+        self.files = {}     # name -> (size, {index span: page index})
+        self._scan()
+
+    def _header(self, page_ix):
+        pos = page_ix * self.layout.page_size
+        return struct.unpack_from("<HHB", self.buf, pos)
+
+    @staticmethod
+    def _live(flags):
+        return not flags & (FLAG_USED | FLAG_FINAL) and flags & FLAG_DELET
+
+    def _scan(self):
+        layout = self.layout
+        usable = layout.pages_per_block - layout.lu_pages
+        objects = {}    # obj id -> {index span: page index}
+        names = {}      # obj id -> (name, size)
+        for bix in range(len(self.buf) // layout.block_size):
+            base = bix * layout.block_size
+            ids = struct.unpack_from(f"<{usable}H", self.buf, base)
+            for i, lookup_id in enumerate(ids):
+                if lookup_id in (0xFFFF, 0x0000) or not lookup_id & OBJ_ID_INDEX:
+                    continue    # free, deleted or data page
+                page_ix = bix * layout.pages_per_block + layout.lu_pages + i
+                obj_id, span_ix, flags = self._header(page_ix)
+                if (obj_id != lookup_id or not self._live(flags) or flags & FLAG_INDEX
+                        or not flags & FLAG_IXDELE):
+                    continue
+                obj_id &= ~OBJ_ID_INDEX
+                objects.setdefault(obj_id, {})[span_ix] = page_ix
+                if span_ix == 0:
+                    pos = page_ix * layout.page_size + layout.index_header_len
+                    size, obj_type = struct.unpack_from("<IB", self.buf, pos)
+                    raw = bytes(self.buf[pos + 5:pos + 5 + layout.obj_name_len])
+                    if obj_type == TYPE_FILE and size != 0xFFFFFFFF:
+                        names[obj_id] = (raw.split(b"\x00")[0].decode("utf-8", "replace"), size)
+        for obj_id, (name, size) in names.items():
+            self.files[name] = (size, objects[obj_id])
+
+    def read(self, name):
+        layout = self.layout
+        size, index_pages = self.files[name]
+        out = bytearray()
+        span = 0
+        while len(out) < size:
+            if span < layout.head_entries:
+                index_span, slot, header = 0, span, layout.index_head_len
+            else:
+                rest = span - layout.head_entries
+                index_span = 1 + rest // layout.index_entries
+                slot, header = rest % layout.index_entries, layout.index_header_len
+            index_ix = index_pages.get(index_span)
+            if index_ix is None:
+                raise FsImageError(f"{name}: index page {index_span} missing")
+            pos = index_ix * layout.page_size + header + slot * 2
+            page_ix = struct.unpack_from("<H", self.buf, pos)[0]
+            obj_id, span_ix, flags = self._header(page_ix)
+            if span_ix != span or not self._live(flags):
+                raise FsImageError(f"{name}: data page {span} is corrupt")
+            start = page_ix * layout.page_size + layout.data_header_len
+            out += self.buf[start:start + min(layout.data_len, size - len(out))]
+            span += 1
+        return bytes(out)
+
+
+class _ReadOnlyContext(littlefs.UserContext if littlefs else object):
+    """littlefs-python block device reading straight from a buffer."""
+
+    def __init__(self, buf):
+        self.buffer = buf
+        self.in_size = len(buf)
+
+    def read(self, cfg, block, off, size):
+        start = block * cfg.block_size + off
+        return bytes(self.buffer[start:start + size])
+
+    def prog(self, cfg, block, off, data):
+        return -30      # LFS_ERR_ROFS
+
+    def erase(self, cfg, block):
+        return -30
+
+
+class LittleFsReader:
+    """Lists and reads files of a LittleFS image held in a buffer."""
+
+    def __init__(self, buf):
+        if littlefs is None:
+            raise FsImageError(
+                "littlefs-python is required to read LittleFS. Install with: pip install littlefs-python"
+            )
+        self.fs = littlefs.LittleFS(
+            context=_ReadOnlyContext(buf), block_size=LITTLEFS_BLOCK_SIZE,
+            block_count=len(buf) // LITTLEFS_BLOCK_SIZE, read_size=LITTLEFS_IO_SIZE,
+            prog_size=LITTLEFS_IO_SIZE, name_max=LITTLEFS_NAME_MAX, mount=False,
+        )
+        try:
+            self.fs.mount()
+        except littlefs.errors.LittleFSError as e:
+            raise FsImageError(f"Cannot mount LittleFS: {e}")
+        self.files = {}
+        for root, _, names in self.fs.walk("/"):
+            for name in names:
+                path = root.rstrip("/") + "/" + name
+                self.files[path] = (self.fs.stat(path).size, None)
+
+    def read(self, name):
+        with self.fs.open(name, "rb") as f:
+            return f.read()
+
+
+def detect_fs_type(buf):
+    """"littlefs" if a LittleFS superblock is present, else "spiffs"."""
+    for block in (0, 1):
+        pos = block * LITTLEFS_BLOCK_SIZE + 8
+        if bytes(buf[pos:pos + len(LITTLEFS_MAGIC)]) == LITTLEFS_MAGIC:
+            return "littlefs"
+    return "spiffs"
+
+
+class FsArchive:
+    """A filesystem inside a full-ROM backup or a raw image, opened with mmap.
+
+    The partition is found through the backup's partition table (by label,
+    else the first spiffs/littlefs partition). A file without a partition
+    table is treated as a bare filesystem image.
+    """
+
+    def __init__(self, path, label=None):
+        self.path = path
+        self.partition = None
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # empty file
+            self._file.close()
+            raise FsImageError(f"{path} is empty")
+        view = memoryview(self._map)
+        try:
+            table = parse_partition_table(
+                bytes(view[PARTITION_TABLE_OFFSET:PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE])
+            )
+        except PartitionTableError:
+            table = None
+        if table is not None:
+            self.partition = find_fs_partition(table, label)
+            if self.partition is None:
+                self.close()
+                raise FsImageError(f"{path}: no filesystem partition in the partition table")
+            if self.partition.end > len(self._map):
+                self.close()
+                raise FsImageError(f"{path}: backup ends before {self.partition.label} "
+                                   f"(0x{self.partition.offset:X}..0x{self.partition.end:X})")
+            self.buf = view[self.partition.offset:self.partition.end]
+        else:
+            self.buf = view
+        self.fs_type = detect_fs_type(self.buf)
+        reader = LittleFsReader if self.fs_type == "littlefs" else SpiffsReader
+        self.reader = reader(self.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.reader = None
+        self.buf = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # a littlefs handle still holds a view; freed with it
+            self._map = None
+        self._file.close()
+
+    def files(self, pattern=None):
+        """[(name, size)] sorted by name, optionally filtered by a glob."""
+        return sorted(
+            (name, size) for name, (size, _) in self.reader.files.items()
+            if pattern is None or fnmatch.fnmatch(name, pattern)
+            or fnmatch.fnmatch(os.path.basename(name), pattern)
+        )
+
+    def read(self, name):
+        return self.reader.read(name)
+
+    def extract(self, dest, pattern=None, log=print):
+        """Write matching files below `dest`. Returns the number extracted.
+
+        Names come from the device, so one that would land outside `dest`
+        ("../x", a symlinked folder) is skipped with a warning.
+        """
+        root = os.path.realpath(dest)
+        count = 0
+        for name, size in self.files(pattern):
+            parts = [p for p in name.replace("\\", "/").split("/") if p]
+            target = os.path.realpath(os.path.join(root, *parts)) if parts else root
+            if target == root or os.path.commonpath([root, target]) != root:
+                log(f"  WARNING: skipped {name!r}: outside {dest}")
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(self.read(name))
+            log(f"  {name}  ({size:,} bytes)")
+            count += 1
+        return count
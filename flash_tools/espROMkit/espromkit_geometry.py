@@ -0,0 +1,140 @@
+"""
+espROMkit flash geometry — exact flash size from the JEDEC ID.
+
+The SPI flash answers RDID (0x9F) with three bytes: manufacturer, memory
+type and capacity. esptool packs them little-endian into one integer, so
+`get flash id : 0x001640c8` reads as manufacturer 0xC8 (GigaDevice),
+memory type 0x40, capacity 0x16 = 2^22 bytes = 4MB. Backups and restores
+use the decoded size instead of assuming 4MB, which would cut an 8/16MB
+backup in half or read past the end of a 2MB part.
+
+Decoded sizes are cached per MAC in ~/.espromkit/flash_geometry.json, so
+a device's size is known before connecting, and a size the user entered
+for a part with an unknown ID is asked only once.
+"""
+
+import json
+import os
+
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".espromkit", "flash_geometry.json")
+
+MANUFACTURERS = {
+    0x0B: "XTX", 0x1C: "EON", 0x20: "XMC/Micron", 0x5E: "Zbit", 0x68: "Boya",
+    0x85: "Puya", 0x9D: "ISSI", 0xA1: "Fudan", 0xC2: "Macronix",
+    0xC8: "GigaDevice", 0xEF: "Winbond",
+}
+
+# Capacity byte -> bytes. 0x12..0x19 is log2(size) for nearly every vendor;
+# 0x20/0x21 are the 64/128MB codes Micron, XMC and ISSI use past 0x19.
+CAPACITY_CODES = {code: 1 << code for code in range(0x12, 0x1A)}
+CAPACITY_CODES.update({0x20: 64 << 20, 0x21: 128 << 20})
+
+
+def size_name(size):
+    """0x400000 -> "4MB", 0x40000 -> "256KB"."""
+    if size >= 0x100000:
+        return f"{size >> 20}MB"
+    return f"{size >> 10}KB"
+
+
+class FlashGeometry:
+    """Decoded JEDEC ID of the SPI flash."""
+
+    def __init__(self, flash_id):
+        self.flash_id = flash_id
+        self.manufacturer_id = flash_id & 0xFF
+        self.memory_type = (flash_id >> 8) & 0xFF
+        self.capacity_code = (flash_id >> 16) & 0xFF
+        self.size = CAPACITY_CODES.get(self.capacity_code)
+
+    @property
+    def device_id(self):
+        """Memory type and capacity as esptool prints them ("Device: 4016")."""
+        return (self.memory_type << 8) | self.capacity_code
+
+    @property
+    def manufacturer(self):
+        return MANUFACTURERS.get(self.manufacturer_id, f"0x{self.manufacturer_id:02X}")
+
+    @property
+    def size_name(self):
+        return size_name(self.size) if self.size else ""
+
+    def describe(self):
+        size = self.size_name or f"unknown capacity 0x{self.capacity_code:02X}"
+        return (f"{self.manufacturer} (0x{self.manufacturer_id:02X}) "
+                f"device 0x{self.device_id:04X}, {size}")
+
+
+def geometry_from_esptool(manufacturer, device):
+    """Rebuild the geometry from esptool's "Manufacturer: c8" / "Device: 4016"."""
+    try:
+        mfr = int(manufacturer, 16)
+        dev = int(device, 16)
+    except ValueError:
+        return None
+    return FlashGeometry(((dev & 0xFF) << 16) | (dev & 0xFF00) | mfr)
+
+
+def _mac_key(mac):
+    return mac.replace(":", "").lower()
+
+
+class GeometryCache:
+    """Flash size per MAC, persisted as JSON."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, mac):
+        """Cached flash size in bytes for `mac`, or None."""
+        entry = self.entries.get(_mac_key(mac)) if mac else None
+        return entry.get("size") if entry else None
+
+    def put(self, mac, size, flash_id=None):
+        if not mac or not size:
+            return
+        entry = {"size": size}
+        if flash_id is not None:
+            entry["flash_id"] = f"0x{flash_id:08x}"
+        if self.entries.get(_mac_key(mac)) == entry:
+            return
+        self.entries[_mac_key(mac)] = entry
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass    # the cache is an optimisation; never fail a flash over it
+
+
+def check_fits(offset, length, flash_size):
+    """Error message if [offset, offset+length) runs past the flash, else None."""
+    if flash_size and offset + length > flash_size:
+        return (f"0x{offset:X}..0x{offset + length:X} is beyond the end of the "
+                f"{size_name(flash_size)} flash (0x{flash_size:X})")
+    return None
+
+
+def resolve_flash_size(mac=None, flash_id=None, cache=None):
+    """Exact flash size in bytes: from the JEDEC ID, else the MAC cache.
+
+    A size decoded from the ID is stored for the MAC. Returns None when
+    neither source knows the size.
+    """
+    cache = cache if cache is not None else GeometryCache()
+    if flash_id is not None:
+        size = FlashGeometry(flash_id).size
+        if size:
+            cache.put(mac, size, flash_id)
+            return size
+    return cache.get(mac)
@@ -17,7 +17,8 @@ ESP32 Flash Layout (typical):
 
 import sys
 import os
-import io
+import sqlite3
+import argparse
 import threading
 import time
 from datetime import datetime
@@ -38,10 +39,19 @@ try:
 except ImportError:
     sys.exit("ERROR: pyserial is required. Install with: pip install pyserial")
 
-try:
-    import esptool
-except ImportError:
-    sys.exit("ERROR: esptool is required. Install with: pip install esptool")
+from espromkit_backup import BackupCancelled, backup_region, pending_backup
+from espromkit_catalog import Catalog, backup_info
+from espromkit_dashboard import REFRESH_MS, Dashboard, install_output
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_formats import FORMAT_NAMES, FormatError, ImageFile, detect_format, restore_image
+from espromkit_geometry import GeometryCache, check_fits
+from espromkit_job import patch_flash_params
+from espromkit_metrics import parse_listen, serve_metrics
+from espromkit_ota import OtaError, ota_flash
+from espromkit_partitions import PartitionTableError
+from espromkit_postproc import PostProcessor, describe
+from espromkit_session import DEVICE_ERRORS, SessionPool
+from espromkit_verify import repair_images, verify_images
 
 
 # Default flash parameters
@@ -69,7 +79,6 @@ KNOWN_DEVICES = {
 
 FLASH_SIZES = ["detect", "1MB", "2MB", "4MB", "8MB", "16MB"]
 FLASH_SIZE_BYTES = {
-    "detect": 0x400000,
     "1MB": 0x100000,
     "2MB": 0x200000,
     "4MB": 0x400000,
@@ -89,7 +98,36 @@ RESTORE_MODES = [
     ("Bootloader + App (two .bin files)", "bl_app"),
     ("App only (.bin at 0x10000)", "app"),
     ("Custom offset", "custom"),
+    ("OTA slot", "ota"),
 ]
+# (label, offset) of each file the fixed-offset restore modes write
+RESTORE_FILES = {
+    "full": [("Full ROM", 0x0)],
+    "bl_app": [("Bootloader", 0x1000), ("Application", 0x10000)],
+    "app": [("Application", 0x10000)],
+}
+# Restores also take Intel HEX and UF2 images (espromkit_formats)
+IMAGE_FILETYPES = [("Flash images", "*.bin *.hex *.uf2"), ("Binary files", "*.bin"),
+                   ("All files", "*.*")]
+
+
+def backup_layout(mode, total_bytes):
+    """(name, offset, size) of each region a backup in `mode` reads."""
+    app_off = ESP32_PARTITIONS["application"]["offset"]
+    if mode == "full":
+        return [("full", 0x0, total_bytes)]
+    if mode == "app":
+        return [("app", app_off, total_bytes - app_off)]
+    return [
+        ("bootloader",      0x1000, 0x7000),
+        ("partition_table",  0x8000, 0x1000),
+        ("application",     app_off, total_bytes - app_off),
+    ]
+
+
+def backup_filename(mac, suffix):
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{(mac or 'unknown').replace(':', '')}_{ts}_{suffix}.bin"
 
 
 class LogRedirector:
@@ -123,9 +161,61 @@ class EspROMkitGUI:
         self.baud_var = tk.StringVar(value=str(DEFAULT_BAUD))
         self.chip_info = {}
         self.working = False
+        self.cancel_event = threading.Event()
+        # Worker output goes to the log of whichever window started the worker
+        self.stdout, self.stderr = install_output()
+        self.dashboard = None
+        # Detect, Backup, Restore and Reboot share one connection per port
+        self.pool = SessionPool()
+        # Finished backups are hashed, compressed and split in worker processes
+        self.post = PostProcessor(on_done=self._post_done,
+                                  log=lambda line: self.root.after(0, self.log, line + "\n"))
+        try:
+            self.catalog = Catalog()
+        except (sqlite3.Error, OSError):
+            self.catalog = None
 
         self._build_ui()
         self.refresh_ports()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.root.after(5000, self._expire_sessions)
+
+    def _expire_sessions(self):
+        """Release ports whose session has been idle (runs every 5 s)."""
+        if not self.working:
+            self.pool.expire_idle()
+        self.root.after(5000, self._expire_sessions)
+
+    def open_dashboard(self):
+        """Show the multi-port dashboard (created on first use)."""
+        if self.dashboard is None:
+            self.dashboard = DashboardWindow(self)
+        else:
+            self.dashboard.deiconify()
+            self.dashboard.lift()
+
+    def _on_close(self):
+        running = self.dashboard.dashboard.running if self.dashboard is not None else []
+        if running and not messagebox.askyesno(
+            "Operations running",
+            f"{len(running)} dashboard operation(s) are still running. Quit anyway?",
+        ):
+            return
+        self.pool.close_all()
+        self.post.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        self.root.destroy()
+
+    def _post_done(self, result):
+        """Called on the pool's callback thread when a backup is post-processed."""
+        line = f"Post-processed {os.path.basename(result['file'])}: {describe(result)}\n"
+        if self.catalog is not None:
+            try:
+                self.catalog.add(result)
+            except sqlite3.Error as e:
+                line += f"  Not cataloged: {e}\n"
+        self.root.after(0, self.log, line)
 
     # ------------------------------------------------------------------ UI
     def _build_ui(self):
@@ -151,6 +241,10 @@ class EspROMkitGUI:
             width=10,
         ).pack(side="left")
 
+        ttk.Button(port_frame, text="Dashboard...", command=self.open_dashboard).pack(
+            side="right"
+        )
+
         # === Device info ===
         info_frame = ttk.LabelFrame(self.root, text="2. Device Info", padding=8)
         info_frame.pack(fill="x", padx=10, pady=4)
@@ -219,6 +313,11 @@ class EspROMkitGUI:
         )
         self.reboot_btn.pack(side="left", padx=(0, 8))
 
+        self.cancel_btn = ttk.Button(
+            util_row, text="Cancel", command=self._on_cancel, state="disabled"
+        )
+        self.cancel_btn.pack(side="left", padx=(0, 8))
+
         ttk.Label(util_row, text="Flash size:").pack(side="left", padx=(20, 2))
         self.flash_size_var = tk.StringVar(value="detect")
         ttk.Combobox(
@@ -287,36 +386,52 @@ class EspROMkitGUI:
             self.backup_btn.configure(state="disabled")
             self.restore_btn.configure(state="disabled")
             self.reboot_btn.configure(state="disabled")
+            self.cancel_btn.configure(state="normal")
+            self.cancel_event.clear()
+            self.progress.configure(mode="indeterminate", value=0)
             self.progress.start(10)
         else:
             has_info = bool(self.chip_info)
             self.backup_btn.configure(state="normal" if has_info else "disabled")
             self.restore_btn.configure(state="normal" if has_info else "disabled")
             self.reboot_btn.configure(state="normal" if has_info else "disabled")
+            self.cancel_btn.configure(state="disabled")
             self.progress.stop()
+            self.progress.configure(mode="indeterminate", value=0)
 
-    # -------------------------------------------- esptool wrapper (threaded)
-    def _run_esptool_threaded(self, args, on_done=None):
-        """Run esptool in a background thread, capturing output to the log."""
+    def _on_cancel(self):
+        """Ask the running operation to stop at the next checkpoint."""
+        if self.working and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.log("\nCancelling after the current chunk...\n")
+
+    def _report_progress(self, done, total):
+        """Thread-safe progress callback: switch the bar to determinate."""
+        def update():
+            self.progress.stop()
+            self.progress.configure(mode="determinate", maximum=total, value=done)
+        self.root.after(0, update)
+
+    # ----------------------------------------------- task runner (threaded)
+    def _run_task_threaded(self, task, on_done=None):
+        """Run task() in a background thread with stdout/stderr sent to the log.
+
+        task() returns an exit code (None means 0) or raises SystemExit.
+        """
 
         def worker():
-            old_stdout, old_stderr = sys.stdout, sys.stderr
             redirector = LogRedirector(self.log_text)
             err_redirector = LogRedirector(self.log_text, tag="stderr")
-            sys.stdout = redirector
-            sys.stderr = err_redirector
 
             rc = 0
-            try:
-                esptool.main(args)
-            except SystemExit as e:
-                rc = e.code if e.code else 0
-            except Exception as e:
-                rc = 1
-                redirector.write(f"\nesptool error: {e}\n")
-            finally:
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
+            with self.stdout.route(redirector.write), self.stderr.route(err_redirector.write):
+                try:
+                    rc = task() or 0
+                except SystemExit as e:
+                    rc = e.code if e.code else 0
+                except Exception as e:
+                    rc = 1
+                    redirector.write(f"\nesptool error: {e}\n")
 
             self.root.after(0, _finished, rc)
 
@@ -340,85 +455,37 @@ class EspROMkitGUI:
         self.log(f"Detecting device on {port} @ {baud} baud...\n\n")
 
         self.chip_info = {}
-        self._detect_output = io.StringIO()
+        result = {}
+        # Detect starts a workflow: always reset and reload the stub
+        self.pool.close(port)
 
-        def worker():
-            old_stdout, old_stderr = sys.stdout, sys.stderr
-
-            class Tee:
-                def __init__(tee_self, widget, buf):
-                    tee_self.redir = LogRedirector(widget)
-                    tee_self.buf = buf
-                def write(tee_self, text):
-                    tee_self.redir.write(text)
-                    tee_self.buf.write(text)
-                def flush(tee_self):
-                    pass
-
-            tee = Tee(self.log_text, self._detect_output)
-            sys.stdout = tee
-            sys.stderr = LogRedirector(self.log_text, tag="stderr")
+        def task():
+            with self.pool.session(port, baud) as session:
+                result["info"] = session.info()
 
-            rc = 0
-            try:
-                esptool.main([
-                    "--port", port,
-                    "--baud", baud,
-                    "--before", "default_reset",
-                    "--after", "no_reset",
-                    "flash_id",
-                ])
-            except SystemExit as e:
-                rc = e.code if e.code else 0
-            except Exception as e:
-                rc = 1
-                tee.write(f"\nesptool error: {e}\n")
-            finally:
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            self.root.after(0, _done, rc)
-
-        def _done(rc):
-            self._set_busy(False)
-            if rc != 0:
+        def on_done(rc):
+            if rc != 0 or "info" not in result:
                 self.info_label.configure(
                     text="Detection failed. Check connection.", foreground="red"
                 )
                 return
-            self._parse_chip_info(self._detect_output.getvalue())
-
-        self._set_busy(True)
-        threading.Thread(target=worker, daemon=True).start()
+            self._show_chip_info(result["info"])
 
-    def _parse_chip_info(self, output):
-        info = {}
-        for line in output.splitlines():
-            s = line.strip()
-            if s.startswith("Chip is "):
-                info["chip"] = s[len("Chip is "):]
-            elif s.startswith("Features:"):
-                info["features"] = s[len("Features:"):].strip()
-            elif s.startswith("MAC:"):
-                info["mac"] = s[len("MAC:"):].strip()
-            elif s.startswith("Crystal is"):
-                info["crystal"] = s[len("Crystal is"):].strip()
-            elif s.startswith("Chip ID:"):
-                info["chip_id"] = s[len("Chip ID:"):].strip()
-            elif "Auto-detected Flash size" in s:
-                info["flash_size"] = s.split(":")[-1].strip()
-            elif s.startswith("Detected flash size:"):
-                info["flash_size"] = s.split(":")[-1].strip()
+        self._run_task_threaded(task, on_done=on_done)
 
+    def _show_chip_info(self, info):
         self.chip_info = info
-        chip = info.get("chip", "Unknown")
+        chip = info.get("chip") or "Unknown"
         mac = info.get("mac", "N/A")
         chip_base = chip.split(" (")[0] if " (" in chip else chip
         friendly = KNOWN_DEVICES.get(chip_base, chip)
 
-        if info.get("flash_size"):
+        if info.get("flash_size") in FLASH_SIZES:
             self.flash_size_var.set(info["flash_size"])
 
+        self.log(f"Chip is {chip}\nFeatures: {info.get('features', '')}\n"
+                 f"Crystal is {info.get('crystal', '')}\nMAC: {mac}\n"
+                 f"Flash ID: {info.get('flash_id', '')}  {info.get('flash_chip', '')}\n")
         self.info_label.configure(
             text=f"{friendly}  |  Chip: {chip}  |  MAC: {mac}  |  Flash: {info.get('flash_size', 'N/A')}",
             foreground="black",
@@ -431,14 +498,20 @@ class EspROMkitGUI:
 
     # --------------------------------------------------------- Helpers
     def _flash_total_bytes(self):
-        return FLASH_SIZE_BYTES.get(self.flash_size_var.get(), 0x400000)
-
-    def _mac_slug(self):
-        return self.chip_info.get("mac", "unknown").replace(":", "")
+        """Selected flash size, or for "detect" the size from the JEDEC ID."""
+        selected = self.flash_size_var.get()
+        if selected in FLASH_SIZE_BYTES:
+            return FLASH_SIZE_BYTES[selected]
+        size = self.chip_info.get("flash_bytes") or GeometryCache().get(self.chip_info.get("mac"))
+        if not size:
+            messagebox.showwarning(
+                "Flash size unknown",
+                "Click Detect Device first, or pick the flash size from the list.",
+            )
+        return size
 
     def _default_filename(self, suffix):
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"{self._mac_slug()}_{ts}_{suffix}.bin"
+        return backup_filename(self.chip_info.get("mac"), suffix)
 
     # --------------------------------------------------------- Backup ROM
     def _on_backup(self):
@@ -448,17 +521,14 @@ class EspROMkitGUI:
 
         mode = self.backup_mode_var.get()
         total_bytes = self._flash_total_bytes()
+        if not total_bytes:
+            return
 
-        if mode == "full":
-            self._backup_region(port, 0x0, total_bytes, "full")
-
-        elif mode == "partitions":
+        if mode == "partitions":
             self._backup_partitions(port, total_bytes)
-
-        elif mode == "app":
-            app_off = ESP32_PARTITIONS["application"]["offset"]
-            app_size = total_bytes - app_off
-            self._backup_region(port, app_off, app_size, "app")
+        else:
+            name, offset, size = backup_layout(mode, total_bytes)[0]
+            self._backup_region(port, offset, size, name)
 
     def _backup_region(self, port, offset, size, suffix):
         """Back up a single flash region via a save-file dialog."""
@@ -470,6 +540,7 @@ class EspROMkitGUI:
         )
         if not path:
             return
+        self._confirm_resume(path, offset, size)
 
         baud = self.baud_var.get()
         self.log(
@@ -477,36 +548,73 @@ class EspROMkitGUI:
             f"({size:,} bytes) -> {path}\n\n"
         )
 
+        def task():
+            return self._backup_task(port, baud, [(suffix, offset, size, path)])
+
         def on_done(rc):
             if rc == 0 and os.path.exists(path):
                 fsize = os.path.getsize(path)
                 self.log(f"\nBackup complete: {path} ({fsize:,} bytes)\n")
                 messagebox.showinfo("Backup Complete", f"Saved to:\n{path}\n({fsize:,} bytes)")
+            elif self.cancel_event.is_set():
+                self._backup_cancelled()
             else:
                 self.log("\nBackup FAILED.\n")
                 messagebox.showerror("Backup Failed", "See log for details.")
 
-        self._run_esptool_threaded(
-            [
-                "--port", port,
-                "--baud", baud,
-                "--before", "default_reset",
-                "--after", "no_reset",
-                "read_flash",
-                hex(offset), str(size),
-                path,
-            ],
-            on_done=on_done,
+        self._run_task_threaded(task, on_done=on_done)
+
+    def _confirm_resume(self, path, offset, size):
+        """Offer to resume an interrupted backup into the same file."""
+        journal = pending_backup(path, offset, size)
+        if journal is None or not journal.chunks:
+            return
+        resume = messagebox.askyesno(
+            "Resume Backup",
+            f"An interrupted backup of this region was found:\n{path}\n\n"
+            f"{journal.done_bytes:,} of {size:,} bytes already saved.\n\n"
+            f"Resume it? (No starts over.)",
+        )
+        if not resume:
+            journal.discard()
+
+    def _backup_task(self, port, baud, regions):
+        """Worker: read each (name, offset, size, path) over the pooled session."""
+        try:
+            with self.pool.session(port, baud) as session:
+                return self._backup_regions(session, port, baud, regions)
+        except BackupCancelled:
+            return 1
+
+    def _backup_regions(self, session, port, baud, regions, cancel_event=None, progress_fn=None):
+        for idx, (name, offset, size, path) in enumerate(regions):
+            if len(regions) > 1:
+                print(f"\n[{idx + 1}/{len(regions)}] {name}: "
+                      f"0x{offset:X}..0x{offset + size:X} ({size:,} bytes)")
+            ok = backup_region(
+                port, offset, size, path, baud,
+                cancel_event=cancel_event or self.cancel_event,
+                progress_fn=progress_fn or self._report_progress,
+                session=session,
+            )
+            if not ok:
+                print(f"\nERROR: Failed to back up {name}.")
+                return 1
+            self.post.submit(path, offset, backup_info(session.info(), port))
+            if len(regions) > 1:
+                print(f"  OK: {os.path.basename(path)} ({os.path.getsize(path):,} bytes)")
+        return 0
+
+    def _backup_cancelled(self):
+        self.log("\nBackup cancelled. Save to the same file again to resume.\n")
+        messagebox.showinfo(
+            "Backup Cancelled",
+            "Progress was saved.\nBack up to the same file again to resume.",
         )
 
     def _backup_partitions(self, port, total_bytes):
         """Back up bootloader, partition table, and app as separate files."""
-        app_size = total_bytes - ESP32_PARTITIONS["application"]["offset"]
-        parts = [
-            ("bootloader",      0x1000, 0x7000),
-            ("partition_table",  0x8000, 0x1000),
-            ("application",     0x10000, app_size),
-        ]
+        parts = backup_layout("partitions", total_bytes)
 
         # Ask user for a directory to save all three files
         save_dir = filedialog.askdirectory(title="Select directory to save partition backups")
@@ -530,44 +638,22 @@ class EspROMkitGUI:
         if not confirm:
             return
 
-        # Chain the three reads sequentially
+        # The three reads share one connection in a single worker
         baud = self.baud_var.get()
         self.log(f"\nPartition backup to {save_dir}\n")
 
-        def run_chain(idx=0):
-            if idx >= len(files):
-                self._set_busy(False)
+        def on_done(rc):
+            if rc == 0:
                 self.log("\nAll partition backups complete.\n")
                 messagebox.showinfo("Backup Complete", f"3 partitions saved to:\n{save_dir}")
-                return
-
-            name, offset, size, path = files[idx]
-            self.log(f"\n[{idx + 1}/3] {name}: 0x{offset:X}..0x{offset + size:X} ({size:,} bytes)\n")
-
-            def on_part_done(rc):
-                if rc != 0:
-                    self.log(f"\nERROR: Failed to back up {name}.\n")
-                    messagebox.showerror("Backup Failed", f"Failed on {name}. See log.")
-                    return
-                if os.path.exists(path):
-                    fsize = os.path.getsize(path)
-                    self.log(f"  OK: {os.path.basename(path)} ({fsize:,} bytes)\n")
-                self.root.after(100, run_chain, idx + 1)
-
-            self._run_esptool_threaded(
-                [
-                    "--port", port,
-                    "--baud", baud,
-                    "--before", "default_reset",
-                    "--after", "no_reset",
-                    "read_flash",
-                    hex(offset), str(size),
-                    path,
-                ],
-                on_done=on_part_done,
-            )
+            elif self.cancel_event.is_set():
+                self._backup_cancelled()
+            else:
+                messagebox.showerror("Backup Failed", "See log for details.")
 
-        run_chain(0)
+        self._run_task_threaded(
+            lambda: self._backup_task(port, baud, files), on_done=on_done
+        )
 
     # -------------------------------------------------------- Restore ROM
     def _on_restore(self):
@@ -577,21 +663,15 @@ class EspROMkitGUI:
 
         mode = self.restore_mode_var.get()
 
-        if mode == "full":
-            self._restore_files(port, [("Full ROM", 0x0)])
-
-        elif mode == "bl_app":
-            self._restore_files(
-                port,
-                [("Bootloader", 0x1000), ("Application", 0x10000)],
-            )
-
-        elif mode == "app":
-            self._restore_files(port, [("Application", 0x10000)])
+        if mode in RESTORE_FILES:
+            self._restore_files(port, RESTORE_FILES[mode])
 
         elif mode == "custom":
             self._restore_custom(port)
 
+        elif mode == "ota":
+            self._restore_ota(port)
+
     def _restore_files(self, port, file_specs):
         """Ask user for .bin file(s) and flash them at the given offsets.
 
@@ -602,8 +682,8 @@ class EspROMkitGUI:
 
         for label, offset in file_specs:
             path = filedialog.askopenfilename(
-                title=f"Select {label} .bin file (0x{offset:X})",
-                filetypes=[("Binary files", "*.bin"), ("All files", "*.*")],
+                title=f"Select {label} image (0x{offset:X})",
+                filetypes=IMAGE_FILETYPES,
             )
             if not path:
                 return  # user cancelled
@@ -619,39 +699,14 @@ class EspROMkitGUI:
         if not confirm:
             return
 
-        baud = self.baud_var.get()
         self.log(f"\nStarting restore...\n{summary}\n\n")
-
-        # Build esptool args with multiple offset+file pairs
-        args = [
-            "--port", port,
-            "--baud", baud,
-            "--before", "default_reset",
-            "--after", "no_reset",
-            "write_flash",
-            "-z",
-            "--flash_mode", DEFAULT_FLASH_MODE,
-            "--flash_freq", DEFAULT_FLASH_FREQ,
-            "--flash_size", DEFAULT_FLASH_SIZE,
-        ]
-        for offset_hex, path in pairs:
-            args.extend([offset_hex, path])
-
-        def on_done(rc):
-            if rc == 0:
-                self.log("\nRestore complete.\n")
-                messagebox.showinfo("Restore Complete", "Flash write finished successfully.")
-            else:
-                self.log("\nRestore FAILED.\n")
-                messagebox.showerror("Restore Failed", "See log for details.")
-
-        self._run_esptool_threaded(args, on_done=on_done)
+        self._write_images(port, [(int(o, 16), p) for o, p in pairs])
 
     def _restore_custom(self, port):
         """Restore with a user-specified flash offset."""
         path = filedialog.askopenfilename(
-            title="Select .bin file for custom restore",
-            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")],
+            title="Select image for custom restore",
+            filetypes=IMAGE_FILETYPES,
         )
         if not path:
             return
@@ -681,32 +736,141 @@ class EspROMkitGUI:
         if not confirm:
             return
 
-        baud = self.baud_var.get()
         self.log(f"\nCustom restore: {path} ({fsize:,} bytes) -> 0x{offset:X}\n\n")
+        self._write_images(port, [(offset, path)])
+
+    def _restore_ota(self, port):
+        """Write an app into the inactive OTA slot; otadata flips only after verify."""
+        path = filedialog.askopenfilename(
+            title="Select application .bin for the inactive OTA slot",
+            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        baud = self.baud_var.get()
+        self.log(f"\nOTA restore: {path} ({os.path.getsize(path):,} bytes)\n\n")
+
+        def task():
+            try:
+                with self.pool.session(port, baud) as session:
+                    for line in ota_flash(session, path).describe():
+                        print(line)
+            except (OtaError, PartitionTableError) as e:
+                print(f"ERROR: {e}")
+                return 1
 
         def on_done(rc):
             if rc == 0:
-                self.log("\nRestore complete.\n")
-                messagebox.showinfo("Restore Complete", "Flash write finished successfully.")
+                self.log("\nOTA slot written and selected. Reboot to run it.\n")
+                messagebox.showinfo("OTA Complete", "New app selected.\nReboot the device to run it.")
             else:
+                self.log("\nOTA FAILED. otadata unchanged; the previous app still boots.\n")
+                messagebox.showerror("OTA Failed", "See log for details.")
+
+        self._run_task_threaded(task, on_done=on_done)
+
+    def _write_images(self, port, images):
+        """Write (offset, path) pairs over the pooled session, then verify.
+
+        Each image is compared with flash first so that only changed
+        sectors are erased and written (see espromkit_erase).
+        """
+        baud = self.baud_var.get()
+        result = {}
+
+        def task():
+            with self.pool.session(port, baud) as session:
+                result["checks"] = self._write_and_verify(session, images, self._report_progress)
+                if result["checks"] is None:
+                    return 1
+
+        def on_done(rc):
+            if rc != 0 or "checks" not in result:
                 self.log("\nRestore FAILED.\n")
                 messagebox.showerror("Restore Failed", "See log for details.")
+                return
+            self.log("\nRestore complete.\n")
+            self._verify_done(port, images, result["checks"])
 
-        self._run_esptool_threaded(
-            [
-                "--port", port,
-                "--baud", baud,
-                "--before", "default_reset",
-                "--after", "no_reset",
-                "write_flash",
-                "-z",
-                "--flash_mode", DEFAULT_FLASH_MODE,
-                "--flash_freq", DEFAULT_FLASH_FREQ,
-                "--flash_size", DEFAULT_FLASH_SIZE,
-                hex(offset), path,
-            ],
-            on_done=on_done,
-        )
+        self._run_task_threaded(task, on_done=on_done)
+
+    def _write_and_verify(self, session, images, progress_fn=None):
+        """Worker: write (offset, path) pairs, then verify. Returns [RegionCheck] or None.
+
+        HEX and UF2 images are verified as they are written; the checks
+        returned cover the raw images.
+        """
+        raw = []
+        for offset, path in images:
+            if detect_format(path) != "bin":
+                if not self._write_image_file(session, offset, path, progress_fn):
+                    return None
+                continue
+            raw.append((offset, path))
+            with open(path, "rb") as f:
+                data = f.read()
+            error = check_fits(offset, len(data), session.flash_size)
+            if error:
+                print(f"ERROR: {os.path.basename(path)}: {error}")
+                return None
+            data = patch_flash_params(
+                data, offset, session.bootloader_offset,
+                DEFAULT_FLASH_MODE, DEFAULT_FLASH_FREQ, DEFAULT_FLASH_SIZE,
+                session.flash_size,
+            )
+            print(f"Comparing {os.path.basename(path)} with flash at 0x{offset:X}...")
+            plan = plan_restore(session, offset, data)
+            print(f"  Plan: {plan.summary()}")
+            execute_plan(session, plan, progress_fn=progress_fn)
+        print("\nVerifying flash (device-side MD5)...")
+        return verify_images(session, raw)
+
+    def _write_image_file(self, session, offset, path, progress_fn=None):
+        """Worker: stream a HEX or UF2 image to flash. Returns True if flash matches it."""
+        try:
+            source = ImageFile(path)
+            print(f"{os.path.basename(path)}: {source.describe()}")
+            if source.start != offset:
+                print(f"  {FORMAT_NAMES[source.format]} addresses are used, not 0x{offset:X}")
+            result = restore_image(session, source, DEFAULT_FLASH_MODE, DEFAULT_FLASH_FREQ,
+                                   DEFAULT_FLASH_SIZE, progress_fn=progress_fn)
+        except (FormatError, OSError) as e:
+            print(f"ERROR: {e}")
+            return False
+        if not result.ok:
+            print(f"ERROR: {os.path.basename(path)} still differs from flash after repair")
+        return result.ok
+
+    # ------------------------------------------------------ Verify restore
+    def _verify_done(self, port, images, checks, repaired=False):
+        """Report verification results; offer to repair mismatching sectors."""
+        if all(c.ok for c in checks):
+            self.log("\nRestore verified.\n")
+            messagebox.showinfo("Restore Complete", "Flash written and verified.")
+        elif not repaired and messagebox.askyesno(
+            "Verify Mismatch",
+            "Flash differs from the file(s) in the sectors listed in the log.\n\n"
+            "Re-write only the mismatching sectors?",
+        ):
+            self._repair_restore(port, images, checks)
+        else:
+            self.log("\nRestore NOT verified.\n")
+            messagebox.showerror("Verify Failed", "Flash does not match. See log.")
+
+    def _repair_restore(self, port, images, checks):
+        baud = self.baud_var.get()
+
+        def task():
+            with self.pool.session(port, baud) as session:
+                repair_images(session, checks)
+
+        def on_done(rc):
+            if rc != 0:
+                messagebox.showerror("Verify Failed", "Could not repair flash. See log.")
+                return
+            self._verify_done(port, images, checks, repaired=True)
+
+        self._run_task_threaded(task, on_done=on_done)
 
     # -------------------------------------------------------- Reboot device
     def _on_reboot(self):
@@ -715,6 +879,14 @@ class EspROMkitGUI:
             return
 
         self.log("\nRebooting device...\n")
+        session = self.pool.take(port)
+        if session is not None:
+            try:
+                session.hard_reset()
+                self.log("Device rebooted successfully.\n")
+                return
+            except DEVICE_ERRORS:
+                session.close()
         try:
             with serial.Serial(port, 115200, timeout=1) as ser:
                 ser.dtr = False
@@ -727,9 +899,324 @@ class EspROMkitGUI:
             self.log(f"Reboot failed: {e}\nPlease reset the device manually.\n")
 
 
+class DashboardWindow(tk.Toplevel):
+    """One row per attached port; the same backup or restore on any selection at once.
+
+    Rows are redrawn from their PortTask every REFRESH_MS (see
+    espromkit_dashboard); click a row to show its log below. Closing the
+    window only hides it, so running operations carry on.
+    """
+
+    STATE_COLORS = {"running": "blue", "done": "green", "failed": "red", "cancelled": "darkorange"}
+    HEADINGS = ("", "Port", "Device", "Status", "Progress", "", "Speed", "Last message")
+
+    def __init__(self, gui):
+        super().__init__(gui.root)
+        self.gui = gui
+        self.dashboard = Dashboard()
+        self.rows = {}              # port -> {"var", "widgets", "version"}
+        self.focus_port = None
+        self._log_seen = 0
+        self.title("espROMkit — Dashboard")
+        self.geometry("1040x640")
+        self.minsize(860, 420)
+        self._build_ui()
+        self.refresh_ports()
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+        self.after(REFRESH_MS, self._refresh)
+
+    def _build_ui(self):
+        bar = ttk.Frame(self, padding=(10, 10, 10, 4))
+        bar.pack(fill="x")
+        ttk.Button(bar, text="Refresh", command=self.refresh_ports).pack(side="left")
+        self.all_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(bar, text="All", variable=self.all_var,
+                        command=self._select_all).pack(side="left", padx=(8, 0))
+        ttk.Button(bar, text="Detect", command=self._on_detect).pack(side="left", padx=(12, 2))
+
+        ttk.Button(bar, text="Backup...", command=self._on_backup).pack(side="left", padx=(12, 2))
+        self.backup_mode_var = tk.StringVar(value=BACKUP_MODES[0][0])
+        ttk.Combobox(bar, textvariable=self.backup_mode_var, state="readonly", width=18,
+                     values=[label for label, _ in BACKUP_MODES]).pack(side="left")
+
+        ttk.Button(bar, text="Restore...", command=self._on_restore).pack(side="left", padx=(12, 2))
+        self.restore_mode_var = tk.StringVar(value=RESTORE_MODES[0][0])
+        ttk.Combobox(bar, textvariable=self.restore_mode_var, state="readonly", width=18,
+                     values=[label for label, _ in RESTORE_MODES]).pack(side="left")
+
+        ttk.Button(bar, text="Reboot", command=self._on_reboot).pack(side="left", padx=(12, 2))
+        ttk.Button(bar, text="Cancel", command=self._on_cancel).pack(side="left", padx=2)
+        self.summary_label = ttk.Label(bar, text="", foreground="gray")
+        self.summary_label.pack(side="right")
+
+        self.table = ttk.Frame(self, padding=(10, 4))
+        self.table.pack(fill="x")
+        for col, heading in enumerate(self.HEADINGS):
+            ttk.Label(self.table, text=heading, font=("TkDefaultFont", 9, "bold")).grid(
+                row=0, column=col, sticky="w", padx=3)
+
+        self.log_frame = ttk.LabelFrame(self, text="Log", padding=4)
+        self.log_frame.pack(fill="both", expand=True, padx=10, pady=(4, 10))
+        self.log_text = scrolledtext.ScrolledText(
+            self.log_frame, height=12, state="disabled", font=("Consolas", 9), wrap="word"
+        )
+        self.log_text.pack(fill="both", expand=True)
+
+    # ------------------------------------------------------------- rows
+    def refresh_ports(self):
+        ports = [(p.device, p.description or "")
+                 for p in sorted(serial.tools.list_ports.comports(), key=lambda x: x.device)]
+        tasks = self.dashboard.sync_ports(ports)
+        kept = {t.port for t in tasks}
+        for port in list(self.rows):
+            if port not in kept:
+                for widget in self.rows.pop(port)["widgets"].values():
+                    widget.destroy()
+        for index, task in enumerate(tasks, start=1):
+            if task.port not in self.rows:
+                self._add_row(task)
+            for col, widget in enumerate(self.rows[task.port]["widgets"].values()):
+                widget.grid(row=index, column=col, sticky="w", padx=3, pady=1)
+        if self.focus_port not in self.rows:
+            self._focus(tasks[0].port if tasks else None)
+
+    def _add_row(self, task):
+        widgets = {
+            "check": ttk.Checkbutton(self.table),
+            "port": ttk.Label(self.table, text=task.port, width=16),
+            "device": ttk.Label(self.table, text=task.description, width=34),
+            "state": ttk.Label(self.table, text=task.state, width=10),
+            "bar": ttk.Progressbar(self.table, mode="determinate", length=150, maximum=100),
+            "percent": ttk.Label(self.table, width=5, anchor="e"),
+            "rate": ttk.Label(self.table, width=11, anchor="e"),
+            "message": ttk.Label(self.table, width=42),
+        }
+        var = tk.BooleanVar(value=self.all_var.get())
+        widgets["check"].configure(variable=var)
+        for key in ("port", "device", "state", "message"):
+            widgets[key].bind("<Button-1>", lambda e, port=task.port: self._focus(port))
+        self.rows[task.port] = {"var": var, "widgets": widgets, "version": -1}
+
+    def _select_all(self):
+        for row in self.rows.values():
+            row["var"].set(self.all_var.get())
+
+    def _selected(self):
+        ports = [port for port, row in self.rows.items() if row["var"].get()]
+        if not ports:
+            messagebox.showwarning("No ports", "Tick at least one port.", parent=self)
+        return ports
+
+    def _focus(self, port):
+        """Show `port`'s log in the pane below the rows."""
+        self.focus_port = port
+        self._log_seen = 0
+        self.log_frame.configure(text=f"Log — {port}" if port else "Log")
+        self.log_text.configure(state="normal")
+        self.log_text.delete("1.0", tk.END)
+        self.log_text.configure(state="disabled")
+        for p, row in self.rows.items():
+            row["widgets"]["port"].configure(font=("TkDefaultFont", 9, "bold" if p == port else "normal"))
+
+    def _refresh(self):
+        """Redraw changed rows and the focused log (runs every REFRESH_MS)."""
+        rate = 0.0
+        for port, row in self.rows.items():
+            task = self.dashboard.task(port)
+            if task is None:
+                continue
+            rate += task.rate if task.busy else 0.0
+            if task.version == row["version"]:
+                continue
+            row["version"] = task.version
+            w = row["widgets"]
+            info = task.info
+            if info:
+                w["device"].configure(text=f"{info.get('chip', '').split(' (')[0]}  {info.get('mac', '')}"
+                                           f"  {info.get('flash_size') or ''}")
+            w["state"].configure(text=f"{task.action}..." if task.busy else task.state,
+                                 foreground=self.STATE_COLORS.get(task.state, "gray"))
+            w["bar"].configure(value=task.percent)
+            w["percent"].configure(text=f"{task.percent:.0f}%" if task.total else "")
+            w["rate"].configure(text=f"{task.rate / 1024:,.0f} KB/s" if task.busy and task.rate else "")
+            w["message"].configure(text=task.message[:60])
+        task = self.dashboard.task(self.focus_port) if self.focus_port else None
+        if task is not None:
+            lines, self._log_seen = task.new_lines(self._log_seen)
+            if lines:
+                self.log_text.configure(state="normal")
+                self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+                self.log_text.see(tk.END)
+                self.log_text.configure(state="disabled")
+        running = len(self.dashboard.running)
+        self.summary_label.configure(
+            text=f"{running} running, {len(self.rows)} port(s)"
+                 + (f", {rate / 1024:,.0f} KB/s total" if running else ""))
+        self.after(REFRESH_MS, self._refresh)
+
+    def _start(self, ports, action, work):
+        started = self.dashboard.start(ports, action, work)
+        busy = len(ports) - len(started)
+        if busy:
+            messagebox.showinfo("Busy", f"{busy} port(s) are still running and were skipped.", parent=self)
+
+    # ---------------------------------------------------------- actions
+    def _on_detect(self):
+        ports = self._selected()
+        baud = self.gui.baud_var.get()
+
+        def work(task):
+            self.gui.pool.close(task.port)      # detect always resets, as in the main window
+            with self.gui.pool.session(task.port, baud) as session:
+                info = session.info()
+            task.set_info(info)
+            print(f"Chip is {info['chip']}\nMAC: {info['mac']}\n"
+                  f"Flash: {info.get('flash_size') or 'unknown'}  {info.get('flash_chip', '')}")
+            return True
+
+        self._start(ports, "detect", work)
+
+    def _on_backup(self):
+        ports = self._selected()
+        if not ports:
+            return
+        mode = dict(BACKUP_MODES)[self.backup_mode_var.get()]
+        folder = filedialog.askdirectory(parent=self, title=f"Folder for {len(ports)} backup(s)")
+        if not folder:
+            return
+        baud = self.gui.baud_var.get()
+
+        def work(task):
+            with self.gui.pool.session(task.port, baud) as session:
+                task.set_info(session.info())
+                total = session.flash_size or GeometryCache().get(session.mac)
+                if not total:
+                    print("ERROR: Flash size unknown; back up this device from the main window.")
+                    return False
+                regions = [(name, offset, size, os.path.join(folder, backup_filename(session.mac, name)))
+                           for name, offset, size in backup_layout(mode, total)]
+                return self.gui._backup_regions(session, task.port, baud, regions,
+                                                task.cancel_event, task.progress) == 0
+
+        self._start(ports, "backup", work)
+
+    def _ask_images(self, mode):
+        """File dialogs for a restore in `mode`: [(offset, path)], or None."""
+        if mode in RESTORE_FILES:
+            images = []
+            for label, offset in RESTORE_FILES[mode]:
+                path = filedialog.askopenfilename(
+                    parent=self, title=f"Select {label} image (0x{offset:X})",
+                    filetypes=IMAGE_FILETYPES,
+                )
+                if not path:
+                    return None
+                images.append((offset, path))
+            return images
+        path = filedialog.askopenfilename(
+            parent=self, title="Select image to restore",
+            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")] if mode == "ota" else IMAGE_FILETYPES,
+        )
+        if not path:
+            return None
+        if mode == "ota":
+            return [(None, path)]
+        offset_str = simpledialog.askstring(
+            "Flash Offset", "Enter flash offset in hex (e.g. 0x10000):",
+            initialvalue="0x10000", parent=self,
+        )
+        try:
+            return [(int(offset_str, 0), path)] if offset_str else None
+        except ValueError:
+            messagebox.showerror("Invalid Offset", f"'{offset_str}' is not a valid hex number.", parent=self)
+            return None
+
+    def _on_restore(self):
+        ports = self._selected()
+        if not ports:
+            return
+        mode = dict(RESTORE_MODES)[self.restore_mode_var.get()]
+        images = self._ask_images(mode)
+        if not images:
+            return
+        summary = "\n".join(
+            f"  {os.path.basename(path)} ({os.path.getsize(path):,} bytes) -> "
+            + ("inactive OTA slot" if offset is None else f"0x{offset:X}")
+            for offset, path in images
+        )
+        if not messagebox.askyesno(
+            "Confirm Restore",
+            f"This will overwrite flash on {len(ports)} device(s):\n\n{summary}\n\n"
+            f"{', '.join(ports)}\n\nContinue?",
+            parent=self,
+        ):
+            return
+        baud = self.gui.baud_var.get()
+
+        def work(task):
+            with self.gui.pool.session(task.port, baud) as session:
+                task.set_info(session.info())
+                if mode == "ota":
+                    try:
+                        for line in ota_flash(session, images[0][1]).describe():
+                            print(line)
+                    except (OtaError, PartitionTableError) as e:
+                        print(f"ERROR: {e}")
+                        return False
+                    return True
+                checks = self.gui._write_and_verify(session, images, task.progress)
+                if checks is None:
+                    return False
+                if not all(c.ok for c in checks):
+                    print("Re-writing the mismatching sectors...")
+                    repair_images(session, checks)
+                return all(c.ok for c in checks)
+
+        self._start(ports, "restore", work)
+
+    def _on_reboot(self):
+        ports = self._selected()
+
+        def work(task):
+            session = self.gui.pool.take(task.port)
+            if session is not None:
+                try:
+                    session.hard_reset()
+                    print("Device rebooted.")
+                    return True
+                except DEVICE_ERRORS:
+                    session.close()
+            with serial.Serial(task.port, 115200, timeout=1) as ser:
+                ser.dtr = False
+                ser.rts = True
+                time.sleep(0.1)
+                ser.rts = False
+            print("Device rebooted.")
+            return True
+
+        self._start(ports, "reboot", work)
+
+    def _on_cancel(self):
+        self.dashboard.cancel(self._selected())
+
+
 def main():
+    parser = argparse.ArgumentParser(description="espROMkit GUI — ESP32 Flash & Backup Tool")
+    parser.add_argument("--metrics", metavar="[HOST:]PORT",
+                        help="serve live station metrics (Prometheus text format) on /metrics")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="open the multi-port dashboard at start")
+    args = parser.parse_args()
+    if args.metrics:
+        try:
+            serve_metrics(*parse_listen(args.metrics))
+        except (ValueError, OSError) as e:
+            sys.exit(f"ERROR: metrics endpoint: {e}")
+
     root = tk.Tk()
-    EspROMkitGUI(root)
+    gui = EspROMkitGUI(root)
+    if args.dashboard:
+        gui.open_dashboard()
     root.mainloop()
 
 
@@ -0,0 +1,434 @@
+"""
+espROMkit batch jobs — flash the same image set onto many devices.
+
+A job manifest (JSON, or YAML if PyYAML is installed) lists the images and
+their offsets, flash mode/freq/size overrides, and the steps to run before
+and after writing. The manifest is preflighted once: files are loaded,
+hashed, validated and compressed. Running it on a device is then a single
+connection that only streams the pre-compressed data.
+
+Example manifest:
+
+    {
+      "name": "m5stickc-provisioning",
+      "flash_mode": "dio", "flash_freq": "80m", "flash_size": "4MB",
+      "images": [
+        {"offset": "0x1000",  "file": "bootloader.bin"},
+        {"offset": "0x8000",  "file": "partitions.bin"},
+        {"offset": "0x10000", "file": "app.bin"},
+        {"offset": "0x9000",  "size": "0x5000", "nvs": "devices.csv"}
+      ],
+      "pre":  [{"erase": {"offset": "0xe000", "size": "0x2000"}}],
+      "post": ["verify", {"bootcheck": {"expect": "setup done", "timeout": 5}}]
+    }
+
+Relative paths are resolved against the manifest's directory. `{mac}` in a
+file name is replaced per device with its MAC address without colons. An
+`nvs` image is generated per device from that device's row of a CSV (see
+espromkit_nvs), optionally with a "namespace" (default "config").
+
+A last `bootcheck` post step resets the device and watches its console
+for "expect" (see espromkit_bootcheck); optional "baud" (115200),
+"timeout", "delay" and a probe "command".
+"""
+
+import configparser
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from espromkit_bootcheck import (
+    DEFAULT_BAUD as BOOT_BAUD, DEFAULT_TIMEOUT as BOOT_TIMEOUT, check_boot,
+)
+from espromkit_fdt import PORT_SLOTS, bump_counter, load_fdt_conf
+from espromkit_metrics import record_device
+from espromkit_nvs import NvsError, build_device_nvs
+from espromkit_session import DEVICE_ERRORS, SECTOR_SIZE, DeviceSession
+from espromkit_verify import IMAGE_MAGIC, diff_region, image_length
+
+
+# Bootloader header codes (ESP32 / ESP32-S3 family, as used by esptool)
+FLASH_MODES = {"qio": 0, "qout": 1, "dio": 2, "dout": 3}
+FLASH_FREQS = {"80m": 0xF, "40m": 0x0, "26m": 0x1, "20m": 0x2}
+FLASH_SIZE_CODES = {
+    "1MB": 0x00, "2MB": 0x10, "4MB": 0x20, "8MB": 0x30,
+    "16MB": 0x40, "32MB": 0x50, "64MB": 0x60, "128MB": 0x70,
+}
+FLASH_SIZE_BYTES = {name: 0x100000 << (code >> 4) for name, code in FLASH_SIZE_CODES.items()}
+
+KEEP = ("keep", None)
+STEPS = ("erase", "verify", "reboot", "bootcheck")
+PRE_STEPS = ("erase",)      # the others need the images written or close the session
+
+
+class ManifestError(Exception):
+    """The manifest is malformed or refers to unusable files."""
+
+
+def _int(value, what):
+    try:
+        return value if isinstance(value, int) else int(str(value), 0)
+    except ValueError:
+        raise ManifestError(f"{what}: '{value}' is not a number")
+
+
+def _mac_slug(mac):
+    return mac.replace(":", "").lower()
+
+
+def patch_flash_params(data, offset, bootloader_offset, flash_mode, flash_freq,
+                       flash_size, device_flash_size=None):
+    """Stamp flash mode/freq/size into a bootloader header, like esptool.
+
+    Only an image written at the bootloader offset is touched. "detect"
+    uses device_flash_size; "keep" leaves a field alone. A SHA-256 digest
+    appended to the image is recomputed. Returns the (maybe new) bytes.
+    """
+    if offset != bootloader_offset or len(data) < 24 or data[0] != IMAGE_MAGIC:
+        return data
+    if flash_size == "detect":
+        flash_size = next(
+            (n for n, b in FLASH_SIZE_BYTES.items() if b == device_flash_size), "keep"
+        )
+    patched = bytearray(data)
+    if flash_mode not in KEEP:
+        patched[2] = FLASH_MODES[flash_mode]
+    if flash_freq not in KEEP:
+        patched[3] = (patched[3] & 0xF0) | FLASH_FREQS[flash_freq]
+    if flash_size not in KEEP:
+        patched[3] = (patched[3] & 0x0F) | FLASH_SIZE_CODES[flash_size]
+    if patched[23] == 1:    # hash_appended
+        length = image_length(data)
+        if length:
+            patched[length - 32:length] = hashlib.sha256(patched[:length - 32]).digest()
+    return bytes(patched)
+
+
+class PreparedImage:
+    """One (offset, file) pair, loaded, hashed and compressed."""
+
+    def __init__(self, offset, path, nvs=None):
+        self.offset = offset
+        self.path = path
+        self.nvs = nvs          # {"size": ..., "namespace": ...} for NVS CSVs
+        self.data = b""
+        self.compressed = b""
+        self.md5 = ""
+        self.sha256 = ""
+
+    @property
+    def templated(self):
+        return self.nvs is not None or "{" in os.path.basename(self.path)
+
+    @property
+    def end(self):
+        return self.offset + len(self.data)
+
+    def load(self, data=None):
+        if data is None:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        if not data:
+            raise ManifestError(f"{self.path}: file is empty")
+        self.data = data
+        self.compressed = zlib.compress(data, 9)
+        self.md5 = hashlib.md5(data).hexdigest()
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        return self
+
+    def for_device(self, mac):
+        """Resolve a templated file name for one device and load it."""
+        if self.nvs is not None:
+            try:
+                data = build_device_nvs(self.path, mac, self.nvs["size"], self.nvs["namespace"])
+            except NvsError as e:
+                raise ManifestError(str(e))
+            name = f"{_mac_slug(mac)}_nvs.bin"
+            return PreparedImage(self.offset, os.path.join(os.path.dirname(self.path), name)).load(data)
+        path = self.path.replace("{mac}", _mac_slug(mac))
+        if not os.path.isfile(path):
+            raise ManifestError(f"No per-device file for {mac}: {path}")
+        return PreparedImage(self.offset, path).load()
+
+
+class Job:
+    """A preflighted manifest that can be run on any number of devices."""
+
+    def __init__(self, manifest, base_dir, defaults):
+        self.base_dir = base_dir
+        self.name = manifest.get("name", "job")
+        self.baud = _int(manifest.get("baud", defaults["baud"]), "baud")
+        self.flash_mode = manifest.get("flash_mode", defaults["flash_mode"])
+        self.flash_freq = manifest.get("flash_freq", defaults["flash_freq"])
+        self.flash_size = manifest.get("flash_size", defaults["flash_size"])
+        self.fdt_conf = None        # multi_download.conf whose counters this job updates
+        self.port_slots = {}        # port -> Flash Download Tool slot (1..8)
+        self.port_bauds = {}        # port -> baud, where it differs from self.baud
+        self._slot_lock = threading.Lock()
+        self.images = []
+        for i, entry in enumerate(manifest.get("images", [])):
+            source = entry.get("file", entry.get("nvs"))
+            if "offset" not in entry or source is None:
+                raise ManifestError(f"images[{i}]: needs 'offset' and 'file' (or 'nvs')")
+            path = os.path.join(base_dir, os.path.expanduser(source))
+            nvs = None
+            if "nvs" in entry:
+                if "size" not in entry:
+                    raise ManifestError(f"images[{i}]: an 'nvs' image needs the partition 'size'")
+                nvs = {
+                    "size": _int(entry["size"], f"images[{i}].size"),
+                    "namespace": entry.get("namespace", "config"),
+                }
+            offset = _int(entry["offset"], f"images[{i}].offset")
+            self.images.append(PreparedImage(offset, path, nvs))
+        self.pre = [self._step(s, PRE_STEPS, "pre") for s in manifest.get("pre", [])]
+        self.post = [self._step(s) for s in manifest.get("post", ["verify"])]
+        names = [name for name, _ in self.post]
+        if "bootcheck" in names[:-1]:
+            raise ManifestError("'bootcheck' must be the last post step")
+        if "reboot" in names[:-1] and names[names.index("reboot") + 1:] != ["bootcheck"]:
+            raise ManifestError("'reboot' must be the last post step")
+
+    @classmethod
+    def from_file(cls, path, defaults):
+        """Load a .json/.yaml manifest or a multi_download.conf. Not preflighted yet."""
+        if path.lower().endswith(".conf"):
+            return cls.from_fdt_conf(path, defaults)
+        with open(path) as f:
+            text = f.read()
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ManifestError(
+                    "PyYAML is required for YAML manifests. Install with: pip install pyyaml"
+                )
+            manifest = yaml.safe_load(text)
+        else:
+            try:
+                manifest = json.loads(text)
+            except ValueError as e:
+                raise ManifestError(f"{path}: {e}")
+        if not isinstance(manifest, dict):
+            raise ManifestError(f"{path}: expected a mapping at the top level")
+        return cls(manifest, os.path.dirname(os.path.abspath(path)), defaults)
+
+    @classmethod
+    def from_fdt_conf(cls, path, defaults):
+        """A job from the Flash Download Tool's multi_download.conf (see espromkit_fdt)."""
+        try:
+            manifest, ports = load_fdt_conf(path)
+        except (ValueError, IndexError, configparser.Error) as e:
+            raise ManifestError(f"{path}: {e}")
+        if not manifest["images"]:
+            raise ManifestError(f"{path}: no file is selected in [DOWNLOAD PATH]")
+        job = cls(manifest, os.path.dirname(os.path.abspath(path)), defaults)
+        job.fdt_conf = path
+        job.port_slots = {port: slot for port, (slot, _) in ports.items()}
+        job.port_bauds = {port: baud for port, (_, baud) in ports.items() if baud}
+        return job
+
+    def baud_for(self, port):
+        return self.port_bauds.get(port, self.baud)
+
+    def count_result(self, port, ok):
+        """Bump the .conf's [STATISTICS] counter for `port`'s slot.
+
+        Ports the .conf does not name take the free slots in order.
+        """
+        if self.fdt_conf is None:
+            return
+        with self._slot_lock:
+            slot = self.port_slots.get(port)
+            if slot is None:
+                free = [n for n in range(1, PORT_SLOTS + 1) if n not in self.port_slots.values()]
+                if not free:
+                    return
+                slot = self.port_slots[port] = free[0]
+        try:
+            bump_counter(self.fdt_conf, slot, ok)
+        except OSError:
+            pass    # counters are informational; never fail a device over them
+
+    def _step(self, step, allowed=STEPS, where="post"):
+        """Normalize a step to (name, args)."""
+        if isinstance(step, str):
+            name, args = step, {}
+        elif isinstance(step, dict) and len(step) == 1:
+            name, args = next(iter(step.items()))
+            args = args or {}
+        else:
+            raise ManifestError(f"Invalid step: {step!r}")
+        if name not in STEPS:
+            raise ManifestError(f"Unknown step '{name}' (expected one of {', '.join(STEPS)})")
+        if name not in allowed:
+            raise ManifestError(f"'{name}' is not allowed in {where} "
+                                f"(expected one of {', '.join(allowed)})")
+        if not isinstance(args, dict):
+            raise ManifestError(f"{name}: expected a mapping of arguments, got {args!r}")
+        if name == "erase":
+            offset = _int(args.get("offset"), "erase.offset")
+            size = _int(args.get("size"), "erase.size")
+            if offset % SECTOR_SIZE or size % SECTOR_SIZE:
+                raise ManifestError("erase offset and size must be 4 KB aligned")
+            args = {"offset": offset, "size": size}
+        if name == "bootcheck":
+            try:
+                args = {
+                    "expect": args.get("expect"),
+                    "baud": _int(args.get("baud", BOOT_BAUD), "bootcheck.baud"),
+                    "timeout": float(args.get("timeout", BOOT_TIMEOUT)),
+                    "delay": float(args.get("delay", 0)),
+                    "command": args.get("command"),
+                }
+            except (TypeError, ValueError) as e:
+                raise ManifestError(f"bootcheck: {e}")
+        return name, args
+
+    # ------------------------------------------------------------ preflight
+    def preflight(self, log=print):
+        """Load, hash, compress and validate every non-templated image."""
+        if self.flash_mode not in KEEP and self.flash_mode not in FLASH_MODES:
+            raise ManifestError(f"Unknown flash_mode '{self.flash_mode}'")
+        if self.flash_freq not in KEEP and self.flash_freq not in FLASH_FREQS:
+            raise ManifestError(f"Unknown flash_freq '{self.flash_freq}'")
+        if self.flash_size not in KEEP + ("detect",) and self.flash_size not in FLASH_SIZE_CODES:
+            raise ManifestError(f"Unknown flash_size '{self.flash_size}'")
+        if not self.images:
+            raise ManifestError("Manifest has no images")
+
+        for image in self.images:
+            if image.offset % SECTOR_SIZE:
+                raise ManifestError(f"{image.path}: offset 0x{image.offset:X} is not 4 KB aligned")
+            if image.nvs is not None and not os.path.isfile(image.path):
+                raise ManifestError(f"File not found: {image.path}")
+            if image.templated:
+                log(f"  0x{image.offset:06X}  {os.path.basename(image.path)}  (per device)")
+                continue
+            if not os.path.isfile(image.path):
+                raise ManifestError(f"File not found: {image.path}")
+            image.load()
+            log(f"  0x{image.offset:06X}  {os.path.basename(image.path):32s} "
+                f"{len(image.data):>10,} bytes -> {len(image.compressed):>10,} "
+                f"sha256 {image.sha256[:16]}")
+
+        self._check_layout(self.images, FLASH_SIZE_BYTES.get(self.flash_size))
+        return self
+
+    def _check_layout(self, images, flash_bytes):
+        loaded = sorted((i for i in images if i.data), key=lambda i: i.offset)
+        for a, b in zip(loaded, loaded[1:]):
+            if a.end > b.offset:
+                raise ManifestError(
+                    f"{os.path.basename(a.path)} (ends 0x{a.end:X}) overlaps "
+                    f"{os.path.basename(b.path)} (starts 0x{b.offset:X})"
+                )
+        if flash_bytes and loaded and loaded[-1].end > flash_bytes:
+            raise ManifestError(
+                f"{os.path.basename(loaded[-1].path)} ends at 0x{loaded[-1].end:X}, "
+                f"beyond the {flash_bytes // 0x100000}MB flash"
+            )
+
+    def _patch_bootloader(self, image, bootloader_offset, device_flash_size):
+        patched = patch_flash_params(
+            image.data, image.offset, bootloader_offset,
+            self.flash_mode, self.flash_freq, self.flash_size, device_flash_size,
+        )
+        if patched == image.data:
+            return image
+        return PreparedImage(image.offset, image.path).load(patched)
+
+    # ------------------------------------------------------------------ run
+    def prepare(self, session):
+        """Images for the connected device: templates resolved, header patched."""
+        images = [
+            self._patch_bootloader(
+                i.for_device(session.mac) if i.templated else i,
+                session.bootloader_offset, session.flash_size,
+            )
+            for i in self.images
+        ]
+        self._check_layout(images, session.flash_size)
+        return images
+
+    def run(self, port, log=print, session=None, station=None):
+        """Run the job on the device at `port`. Returns True on success.
+
+        With a StationDB as `station`, the run is recorded there.
+        """
+        own_session = session is None
+        if own_session:
+            session = DeviceSession(port, self.baud_for(port))
+        t_start = time.time()
+        ok = False
+        written, t_write, detail = 0, 0.0, None
+        try:
+            if not session.connected:
+                session.connect()
+            log(f"  Device {session.mac} on {port}")
+            images = self.prepare(session)
+
+            for name, args in self.pre:
+                self.run_step(session, name, args, images, log)
+            for image in images:
+                t = time.time()
+                session.write_flash(image.offset, image.data, compressed=image.compressed)
+                written += len(image.data)
+                t_write += time.time() - t
+                log(f"  Wrote {os.path.basename(image.path)} at 0x{image.offset:X} "
+                    f"({len(image.data):,} bytes) in {time.time() - t:.1f}s")
+            for name, args in self.post:
+                if not self.run_step(session, name, args, images, log):
+                    detail = f"{name} failed"
+                    return False
+            ok = True
+        except ManifestError as e:
+            log(f"  ERROR: {e}")
+            detail = str(e)
+            return False
+        except DEVICE_ERRORS as e:
+            log(f"  ERROR: {port}: {e}")
+            detail = str(e)
+            return False
+        finally:
+            if station is not None:
+                station.record("job", port, ok, session, written or None, t_write or None,
+                               time.time() - t_start, self.baud_for(port), detail)
+            self.count_result(port, ok)
+            record_device(port, session, ok)
+            if own_session:
+                session.close()
+        log(f"  Job '{self.name}' done in {time.time() - t_start:.1f}s")
+        return True
+
+    def run_step(self, session, name, args, images, log=print):
+        """Run one pre/post step. Returns False if a verify fails."""
+        if name == "erase":
+            log(f"  Erasing 0x{args['offset']:X}..0x{args['offset'] + args['size']:X}")
+            session.erase_region(args["offset"], args["size"])
+        elif name == "verify":
+            for image in images:
+                bad = diff_region(session, image.offset, image.data)
+                if bad:
+                    ranges = ", ".join(f"0x{s:X}..0x{e:X}" for s, e in bad)
+                    log(f"  VERIFY FAILED: {os.path.basename(image.path)} at {ranges}")
+                    return False
+            log(f"  Verified {len(images)} image(s)")
+        elif name == "reboot":
+            log("  Rebooting device...")
+            session.hard_reset()
+        elif name == "bootcheck":
+            session.close()     # the check opens the port at the app's baud
+            result = check_boot(session.port, **args)
+            log(f"  Boot check: {result.summary()}")
+            if not result.ok:
+                for line in result.last_lines():
+                    log(f"    | {line}")
+                return False
+        return True
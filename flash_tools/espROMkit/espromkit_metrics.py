@@ -0,0 +1,262 @@
+"""
+espROMkit metrics — live station counters in the Prometheus text format.
+
+An in-process registry of counters, gauges and histograms, each keyed
+by label values. DeviceSession feeds it on every flash operation, so
+every command that flashes or reads a device is covered without extra
+wiring. The farm, jobs and backups add results and retries:
+
+  espromkit_flash_read_bytes_total      bytes read, per port and chip
+  espromkit_flash_written_bytes_total   uncompressed bytes written
+  espromkit_write_kbps / _read_kbps     effective kbit/s of the last
+                                        transfer (uncompressed, as the
+                                        Flash Download Tool reports it)
+  espromkit_phase_seconds               latency of connect, read, write,
+                                        erase and md5 calls
+  espromkit_farm_stage_seconds          time a device spent in each farm stage
+  espromkit_retries_total               backup read retries and pool
+                                        reconnects, per port and reason
+  espromkit_devices_total               finished devices per port, chip
+                                        and result (pass/fail)
+  espromkit_postproc_pending            backups queued or running on the
+                                        post-processing pool
+  espromkit_postproc_blocked_seconds_total
+                                        time readers waited for a free slot
+
+registry.exposition() renders the text format (version 0.0.4) that
+Prometheus scrapes. serve_metrics() publishes it on /metrics from a
+background thread (`farm --metrics`, `espromkit_gui.py --metrics`); the
+job server has a /metrics route of its own. A slow adapter shows up as a
+low kbit/s next to its port, and a degrading hub as a retry counter that
+keeps climbing.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {', '.join(self.labelnames) or '(none)'}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """[(suffix, label values, extra labels, value)] for the exposition."""
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block takes (also when it raises)."""
+        t = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - t, **labels)
+
+    def value(self, **labels):
+        """(count, sum) of the observations for these labels."""
+        counts, total = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts), total
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                running = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    running += count
+                    rows.append(("_bucket", key, (("le", _format_value(bound)),), running))
+                rows.append(("_sum", key, (), total))
+                rows.append(("_count", key, (), running))
+        return rows
+
+
+class Registry:
+    """The metrics of one process, rendered together for a scrape."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def exposition(self):
+        """Every metric in the Prometheus text format."""
+        lines = []
+        for metric in sorted(self.metrics.values(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, extra, value in metric.samples():
+                labels = _format_labels(metric.labelnames, key, extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+BYTES_READ = REGISTRY.counter(
+    "espromkit_flash_read_bytes_total", "Bytes read from flash.", ("port", "chip"))
+BYTES_WRITTEN = REGISTRY.counter(
+    "espromkit_flash_written_bytes_total", "Uncompressed bytes written to flash.", ("port", "chip"))
+READ_KBPS = REGISTRY.gauge(
+    "espromkit_read_kbps", "Effective rate of the last flash read in kbit/s.", ("port", "chip"))
+WRITE_KBPS = REGISTRY.gauge(
+    "espromkit_write_kbps", "Effective rate of the last flash write in kbit/s (uncompressed data).",
+    ("port", "chip"))
+PHASE_SECONDS = REGISTRY.histogram(
+    "espromkit_phase_seconds", "Latency of device operations (connect, read, write, erase, md5).",
+    ("phase", "port"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "espromkit_farm_stage_seconds", "Time a device spent in each farm stage.", ("stage", "port"))
+RETRIES = REGISTRY.counter(
+    "espromkit_retries_total", "Retried device operations.", ("port", "reason"))
+DEVICES = REGISTRY.counter(
+    "espromkit_devices_total", "Finished devices by result.", ("port", "chip", "result"))
+POSTPROC_PENDING = REGISTRY.gauge(
+    "espromkit_postproc_pending", "Backups queued or running on the post-processing pool.")
+POSTPROC_BLOCKED = REGISTRY.counter(
+    "espromkit_postproc_blocked_seconds_total",
+    "Time backups waited for a free post-processing slot (back-pressure).")
+
+
+def chip_label(session):
+    """'ESP32-PICO-D4' from 'ESP32-PICO-D4 (revision v1.1)'; 'unknown' before connecting."""
+    chip = getattr(session, "chip", "") or ""
+    return chip.split(" (")[0] or "unknown"
+
+
+def record_transfer(session, direction, size, seconds):
+    """Count a finished read or write and update its kbit/s gauge."""
+    labels = {"port": session.port, "chip": chip_label(session)}
+    (BYTES_READ if direction == "read" else BYTES_WRITTEN).inc(size, **labels)
+    if seconds > 0:
+        (READ_KBPS if direction == "read" else WRITE_KBPS).set(round(size * 8 / 1000 / seconds, 1), **labels)
+    PHASE_SECONDS.observe(seconds, phase=direction, port=session.port)
+
+
+def record_device(port, session, ok):
+    DEVICES.inc(port=port, chip=chip_label(session), result="pass" if ok else "fail")
+
+
+def parse_listen(value):
+    """'9266' or 'HOST:9266' -> (host, port)."""
+    host, _, port = str(value).rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Bad metrics address '{value}' (expected [HOST:]PORT)")
+    return host or DEFAULT_METRICS_HOST, int(port)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.server.registry.exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(host, port, registry=REGISTRY):
+    """Serve /metrics from a daemon thread. Returns the server (shutdown() to stop)."""
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.registry = registry
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,230 @@
+"""
+espROMkit NVS generator — build per-device NVS partition images.
+
+Produces the same on-flash format as ESP-IDF's nvs_partition_gen.py
+(version 2 pages), so a sketch reads the values back with Preferences or
+nvs_get_*(). Values come from one CSV row per device, keyed by MAC:
+
+    mac,ssid,password,device_id:u32,cert:base64
+    d4:d4:da:98:66:d0,Line-3,s3cret,1001,MIIB...
+
+Columns are `key` (string) or `key:type` with type one of u8, i8, u16,
+i16, u32, i32, u64, i64, string, hex2bin, base64. Keys are at most 15
+characters. Empty cells are skipped.
+"""
+
+import base64
+import csv
+import struct
+import zlib
+
+
+PAGE_SIZE = 0x1000
+ENTRY_SIZE = 32
+ENTRIES_PER_PAGE = 126
+FIRST_ENTRY = 64                # page header (32) + entry state bitmap (32)
+MIN_PARTITION_SIZE = 0x3000     # ESP-IDF needs one spare page to run GC
+MAX_KEY_LEN = 15
+
+PAGE_ACTIVE = 0xFFFFFFFE
+PAGE_FULL = 0xFFFFFFFC
+PAGE_VERSION2 = 0xFE
+
+INT_TYPES = {
+    "u8": (0x01, "<B"), "i8": (0x11, "<b"),
+    "u16": (0x02, "<H"), "i16": (0x12, "<h"),
+    "u32": (0x04, "<I"), "i32": (0x14, "<i"),
+    "u64": (0x08, "<Q"), "i64": (0x18, "<q"),
+}
+TYPE_STR = 0x21
+TYPE_BLOB_DATA = 0x42
+TYPE_BLOB_IDX = 0x48
+TYPE_NAMES = tuple(INT_TYPES) + ("string", "hex2bin", "base64")
+
+
+class NvsError(Exception):
+    """A value or layout that cannot be encoded as NVS."""
+
+
+def _crc32(data):
+    return zlib.crc32(data, 0xFFFFFFFF) & 0xFFFFFFFF
+
+
+def _mac_key(mac):
+    return "".join(c for c in mac.lower() if c in "0123456789abcdef")
+
+
+class _Page:
+    def __init__(self, seqno):
+        self.seqno = seqno
+        self.buf = bytearray(b"\xff" * PAGE_SIZE)
+        self.used = 0
+
+    @property
+    def free(self):
+        return ENTRIES_PER_PAGE - self.used
+
+    def add(self, entries):
+        """Append a run of 32-byte entries and mark them written."""
+        for entry in entries:
+            pos = FIRST_ENTRY + self.used * ENTRY_SIZE
+            self.buf[pos:pos + ENTRY_SIZE] = entry
+            bit = self.used * 2
+            self.buf[32 + bit // 8] &= ~(1 << (bit % 8)) & 0xFF
+            self.used += 1
+
+    def finish(self, state):
+        header = struct.pack("<IIB", state, self.seqno, PAGE_VERSION2) + b"\xff" * 19
+        header += struct.pack("<I", _crc32(header[4:28]))
+        self.buf[:32] = header
+        return bytes(self.buf)
+
+
+def _entry(ns, etype, span, key, data, chunk=0xFF):
+    key = key.encode("ascii")
+    if not key or len(key) > MAX_KEY_LEN:
+        raise NvsError(f"Key '{key.decode()}' must be 1-{MAX_KEY_LEN} characters")
+    entry = bytearray(struct.pack("<BBBB", ns, etype, span, chunk))
+    entry += b"\xff" * 4
+    entry += key.ljust(16, b"\x00")
+    entry += data.ljust(8, b"\xff")
+    entry[4:8] = struct.pack("<I", _crc32(bytes(entry[:4] + entry[8:])))
+    return bytes(entry)
+
+
+def _data_entries(payload):
+    """Split variable-length data into 32-byte entries padded with 0xFF."""
+    padded = payload + b"\xff" * (-len(payload) % ENTRY_SIZE)
+    return [padded[i:i + ENTRY_SIZE] for i in range(0, len(padded), ENTRY_SIZE)]
+
+
+class NvsBuilder:
+    """Accumulates namespaces and values, then renders a partition image."""
+
+    def __init__(self, size):
+        if size % PAGE_SIZE or size < MIN_PARTITION_SIZE:
+            raise NvsError(f"NVS size 0x{size:X} must be a multiple of 0x1000, >= 0x3000")
+        self.size = size
+        self.pages = [_Page(0)]
+        self.namespaces = {}
+
+    def _reserve(self, count):
+        if count > ENTRIES_PER_PAGE:
+            raise NvsError("Value too large for one NVS page")
+        if self.pages[-1].free < count:
+            # Keep the last page of the partition free, as ESP-IDF requires
+            if (len(self.pages) + 1) * PAGE_SIZE >= self.size:
+                raise NvsError(f"Values do not fit in a 0x{self.size:X} NVS partition")
+            self.pages.append(_Page(len(self.pages)))
+        return self.pages[-1]
+
+    def _ns_index(self, namespace):
+        if namespace not in self.namespaces:
+            index = len(self.namespaces) + 1
+            self.namespaces[namespace] = index
+            self._reserve(1).add([_entry(0, INT_TYPES["u8"][0], 1, namespace, bytes([index]))])
+        return self.namespaces[namespace]
+
+    def add(self, namespace, key, vtype, value):
+        """Add one value; `value` is the CSV text for `vtype`."""
+        ns = self._ns_index(namespace)
+        if vtype in INT_TYPES:
+            etype, fmt = INT_TYPES[vtype]
+            try:
+                packed = struct.pack(fmt, int(value, 0))
+            except (ValueError, struct.error):
+                raise NvsError(f"{key}: '{value}' is not a valid {vtype}")
+            self._reserve(1).add([_entry(ns, etype, 1, key, packed)])
+        elif vtype == "string":
+            data = value.encode("utf-8") + b"\x00"
+            self._add_var(ns, TYPE_STR, key, data)
+        elif vtype in ("hex2bin", "base64"):
+            try:
+                data = bytes.fromhex(value) if vtype == "hex2bin" else base64.b64decode(value)
+            except ValueError:
+                raise NvsError(f"{key}: invalid {vtype} value")
+            self._add_blob(ns, key, data)
+        else:
+            raise NvsError(f"{key}: unknown type '{vtype}' (expected {', '.join(TYPE_NAMES)})")
+
+    def _add_var(self, ns, etype, key, data, chunk=0xFF):
+        entries = _data_entries(data)
+        header = struct.pack("<HHI", len(data), 0xFFFF, _crc32(data))
+        span = 1 + len(entries)
+        self._reserve(span).add([_entry(ns, etype, span, key, header, chunk)] + entries)
+
+    def _add_blob(self, ns, key, data):
+        """Blob v2: data chunks that each fit in a page, then an index entry."""
+        chunk_count = 0
+        pos = 0
+        while pos < len(data) or chunk_count == 0:
+            page = self.pages[-1]
+            room = (page.free - 1) * ENTRY_SIZE
+            if room < ENTRY_SIZE:
+                room = (self._reserve(ENTRIES_PER_PAGE).free - 1) * ENTRY_SIZE
+            piece = data[pos:pos + room]
+            self._add_var(ns, TYPE_BLOB_DATA, key, piece, chunk=chunk_count)
+            pos += len(piece)
+            chunk_count += 1
+        index = struct.pack("<IBBH", len(data), chunk_count, 0, 0xFFFF)
+        self._reserve(1).add([_entry(ns, TYPE_BLOB_IDX, 1, key, index)])
+
+    def build(self):
+        """Render the partition: full pages, one active page, erased rest."""
+        out = bytearray()
+        for page in self.pages[:-1]:
+            out += page.finish(PAGE_FULL)
+        out += self.pages[-1].finish(PAGE_ACTIVE)
+        out += b"\xff" * (self.size - len(out))
+        return bytes(out)
+
+
+def parse_columns(header):
+    """Map CSV header names to (key, type); the `mac` column is skipped."""
+    columns = []
+    for name in header:
+        name = name.strip()
+        key, _, vtype = name.partition(":")
+        vtype = vtype.strip().lower() or "string"
+        if key.lower() == "mac":
+            columns.append(None)
+            continue
+        if vtype not in TYPE_NAMES:
+            raise NvsError(f"Column '{name}': unknown type '{vtype}'")
+        columns.append((key.strip(), vtype))
+    return columns
+
+
+def find_device_row(csv_path, mac):
+    """Return {column name: value} for the row whose `mac` matches."""
+    want = _mac_key(mac)
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            mac_col = next((k for k in row if k and k.strip().lower() == "mac"), None)
+            if mac_col is None:
+                raise NvsError(f"{csv_path}: no 'mac' column")
+            if _mac_key(row[mac_col] or "") == want:
+                return row
+    return None
+
+
+def build_nvs(row, size, namespace="config"):
+    """Build an NVS image of `size` bytes from one CSV row dict."""
+    builder = NvsBuilder(size)
+    names = list(row)
+    for name, column in zip(names, parse_columns(names)):
+        if column is None:
+            continue
+        value = (row[name] or "").strip()
+        if value:
+            key, vtype = column
+            builder.add(namespace, key, vtype, value)
+    return builder.build()
+
+
+def build_device_nvs(csv_path, mac, size, namespace="config"):
+    """Look up `mac` in the CSV and build its NVS image."""
+    row = find_device_row(csv_path, mac)
+    if row is None:
+        raise NvsError(f"{mac} not found in {csv_path}")
+    return build_nvs(row, size, namespace)
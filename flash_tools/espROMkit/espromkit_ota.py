@@ -0,0 +1,221 @@
+"""
+espROMkit OTA slots — write a new app into the inactive ota_N partition.
+
+With an OTA partition layout the bootloader picks the app from `otadata`
+(0xe000, two 4 KB sectors). Each sector holds one select entry:
+
+    uint32 ota_seq | 20 bytes label | uint32 ota_state | uint32 crc32(ota_seq)
+
+The valid entry with the highest sequence wins and boots ota_{(seq-1) % N}.
+With no valid entry the factory app (or ota_0) boots.
+
+An OTA flash writes the image to the slot that is not booting, verifies
+it by device-side MD5, and only then writes a new select entry into the
+older otadata sector. A failed or interrupted write leaves otadata
+untouched, so the device keeps booting the old app. Switching back
+("revert") rewrites one otadata sector instead of re-flashing the app.
+"""
+
+import os
+import struct
+import zlib
+
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_partitions import APP_TYPE, DATA_TYPE, find_partition, read_partition_table
+from espromkit_session import SECTOR_SIZE
+from espromkit_verify import IMAGE_MAGIC, diff_region
+
+
+OTADATA_SUBTYPE = 0x00
+FACTORY_SUBTYPE = 0x00
+OTA_SUBTYPE_MIN = 0x10
+OTA_SUBTYPE_MAX = 0x1F
+ENTRY_FORMAT = "<I20sII"
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+OTA_STATES = {
+    0: "new", 1: "pending_verify", 2: "valid", 3: "invalid", 4: "aborted",
+    0xFFFFFFFF: "undefined",
+}
+STATE_UNDEFINED = 0xFFFFFFFF
+BAD_STATES = (3, 4)     # rolled back or aborted: the bootloader skips these
+
+
+class OtaError(Exception):
+    """The device has no usable OTA layout, or an OTA step failed."""
+
+
+def _crc32(data):
+    return zlib.crc32(data, 0xFFFFFFFF) & 0xFFFFFFFF
+
+
+class OtaEntry:
+    """One otadata select entry."""
+
+    def __init__(self, raw):
+        self.seq, self.label, self.state, self.crc = struct.unpack(ENTRY_FORMAT, raw[:ENTRY_SIZE])
+
+    @property
+    def valid(self):
+        return (self.seq != 0xFFFFFFFF
+                and self.crc == _crc32(struct.pack("<I", self.seq))
+                and self.state not in BAD_STATES)
+
+    @property
+    def state_name(self):
+        return OTA_STATES.get(self.state, f"0x{self.state:X}")
+
+
+def make_entry(seq):
+    """A select entry in the format otatool/esp_ota_set_boot_partition write."""
+    return struct.pack(ENTRY_FORMAT, seq, b"\xff" * 20, STATE_UNDEFINED,
+                       _crc32(struct.pack("<I", seq)))
+
+
+class OtaLayout:
+    """OTA slots, factory app and otadata state of one device."""
+
+    def __init__(self, partitions, otadata_raw):
+        self.otadata = find_partition(partitions, ptype=DATA_TYPE, subtype=OTADATA_SUBTYPE)
+        self.factory = find_partition(partitions, ptype=APP_TYPE, subtype=FACTORY_SUBTYPE)
+        self.slots = sorted(
+            (p for p in partitions
+             if p.type == APP_TYPE and OTA_SUBTYPE_MIN <= p.subtype <= OTA_SUBTYPE_MAX),
+            key=lambda p: p.subtype,
+        )
+        if self.otadata is None or not self.slots:
+            raise OtaError("Partition table has no otadata/ota_N partitions (not an OTA layout)")
+        self.entries = [OtaEntry(otadata_raw[i * SECTOR_SIZE:]) for i in range(2)]
+
+    @property
+    def active_entry(self):
+        """Index (0/1) of the otadata sector the bootloader uses, or None."""
+        valid = [i for i, e in enumerate(self.entries) if e.valid]
+        if not valid:
+            return None
+        return max(valid, key=lambda i: self.entries[i].seq)
+
+    @property
+    def max_seq(self):
+        return max((e.seq for e in self.entries if e.valid), default=0)
+
+    @property
+    def boot_partition(self):
+        index = self.active_entry
+        if index is None:
+            return self.factory or self.slots[0]
+        return self.slots[(self.entries[index].seq - 1) % len(self.slots)]
+
+    def inactive_slot(self):
+        """The OTA slot to write next: any slot that is not booting."""
+        boot = self.boot_partition
+        if boot in self.slots:
+            return self.slots[(self.slots.index(boot) + 1) % len(self.slots)]
+        return self.slots[0]
+
+    def select(self, slot):
+        """(otadata address, sector bytes) that make `slot` boot."""
+        target = self.slots.index(slot)
+        seq = self.max_seq + 1
+        while (seq - 1) % len(self.slots) != target:
+            seq += 1
+        active = self.active_entry
+        sector = 0 if active is None else 1 - active
+        data = make_entry(seq) + b"\xff" * (SECTOR_SIZE - ENTRY_SIZE)
+        return self.otadata.offset + sector * SECTOR_SIZE, data
+
+    def find_slot(self, name):
+        """Slot by label or by "ota_N" / "N"."""
+        for i, slot in enumerate(self.slots):
+            if name in (slot.label, slot.subtype_name, str(i)):
+                return slot
+        raise OtaError(f"No OTA slot '{name}' (have: {', '.join(s.label for s in self.slots)})")
+
+    def describe(self):
+        boot = self.boot_partition
+        lines = []
+        for part in ([self.factory] if self.factory else []) + self.slots:
+            mark = "  <- boots" if part is boot else ""
+            lines.append(f"  {part.label:10s} {part.subtype_name:8s} 0x{part.offset:06X}  "
+                         f"{part.size:>10,} bytes{mark}")
+        for i, e in enumerate(self.entries):
+            status = f"seq {e.seq}, {e.state_name}" if e.valid else "empty/invalid"
+            lines.append(f"  otadata[{i}] 0x{self.otadata.offset + i * SECTOR_SIZE:06X}  {status}")
+        return lines
+
+
+def read_ota_layout(session):
+    partitions = read_partition_table(session)
+    otadata = find_partition(partitions, ptype=DATA_TYPE, subtype=OTADATA_SUBTYPE)
+    if otadata is None:
+        raise OtaError("Partition table has no otadata partition (not an OTA layout)")
+    return OtaLayout(partitions, session.read_flash(otadata.offset, 2 * SECTOR_SIZE))
+
+
+def _has_app(session, partition):
+    return session.read_flash(partition.offset, SECTOR_SIZE)[0] == IMAGE_MAGIC
+
+
+def switch_slot(session, layout, slot, log=print):
+    """Write one otadata sector so `slot` boots next. Returns the new layout."""
+    address, data = layout.select(slot)
+    log(f"  Selecting {slot.label}: otadata sector 0x{address:X}")
+    session.write_flash(address, data)
+    layout = read_ota_layout(session)
+    if layout.boot_partition.offset != slot.offset:
+        raise OtaError(f"otadata write did not select {slot.label}")
+    return layout
+
+
+def boot_factory(session, layout, log=print):
+    """Erase otadata (8 KB) so the factory app boots."""
+    if layout.factory is None:
+        raise OtaError("No factory partition to fall back to")
+    log(f"  Erasing otadata at 0x{layout.otadata.offset:X} -> factory app")
+    session.erase_region(layout.otadata.offset, 2 * SECTOR_SIZE)
+    return read_ota_layout(session)
+
+
+def ota_flash(session, path, slot_name=None, log=print):
+    """Write an app image to the inactive (or named) slot, verify, then select it."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data or data[0] != IMAGE_MAGIC:
+        raise OtaError(f"{os.path.basename(path)} is not an ESP app image (no 0xE9 magic)")
+
+    layout = read_ota_layout(session)
+    slot = layout.find_slot(slot_name) if slot_name else layout.inactive_slot()
+    if slot is layout.boot_partition:
+        raise OtaError(f"{slot.label} is the running app; pick the inactive slot")
+    if len(data) > slot.size:
+        raise OtaError(f"{os.path.basename(path)} ({len(data):,} bytes) does not fit "
+                       f"{slot.label} ({slot.size:,} bytes)")
+
+    log(f"  Running: {layout.boot_partition.label}  ->  writing {slot.label} "
+        f"at 0x{slot.offset:X} ({len(data):,} bytes)")
+    plan = plan_restore(session, slot.offset, data)
+    log(f"  Plan: {plan.summary()}")
+    execute_plan(session, plan, log)
+    bad = diff_region(session, slot.offset, data)
+    if bad:
+        raise OtaError(f"Verify failed at 0x{bad[0][0]:X}; otadata unchanged, "
+                       f"{layout.boot_partition.label} still boots")
+    log(f"  Verified {slot.label}")
+    return switch_slot(session, layout, slot, log)
+
+
+def revert(session, log=print):
+    """Boot the previously used slot again (one otadata sector write)."""
+    layout = read_ota_layout(session)
+    boot = layout.boot_partition
+    if boot not in layout.slots:
+        raise OtaError(f"{boot.label} is booting; there is no previous OTA slot")
+    count = len(layout.slots)
+    index = layout.slots.index(boot)
+    for step in range(1, count):
+        candidate = layout.slots[(index - step) % count]
+        if _has_app(session, candidate):
+            return switch_slot(session, layout, candidate, log)
+    if layout.factory is not None:
+        return boot_factory(session, layout, log)
+    raise OtaError("No other slot holds an app image")
@@ -0,0 +1,117 @@
+"""
+espROMkit partition table — parse the ESP-IDF partition table at 0x8000.
+
+Works on a live device (one 3 KB read) or on a full-ROM backup file, so
+other tools can find a partition such as `nvs`, `otadata`, `spiffs` or
+`coredump` by label or type instead of assuming fixed offsets.
+"""
+
+import hashlib
+import struct
+
+
+PARTITION_TABLE_OFFSET = 0x8000
+PARTITION_TABLE_SIZE = 0xC00
+ENTRY_SIZE = 32
+ENTRY_MAGIC = b"\xAA\x50"
+MD5_MAGIC = b"\xEB\xEB"
+
+APP_TYPE = 0x00
+DATA_TYPE = 0x01
+
+TYPE_NAMES = {APP_TYPE: "app", DATA_TYPE: "data"}
+APP_SUBTYPES = {0x00: "factory", 0x20: "test"}
+APP_SUBTYPES.update({0x10 + n: f"ota_{n}" for n in range(16)})
+DATA_SUBTYPES = {
+    0x00: "ota", 0x01: "phy", 0x02: "nvs", 0x03: "coredump", 0x04: "nvs_keys",
+    0x05: "efuse", 0x06: "undefined", 0x80: "esphttpd", 0x81: "fat",
+    0x82: "spiffs", 0x83: "littlefs",
+}
+
+
+class PartitionTableError(Exception):
+    """The partition table is missing or corrupt."""
+
+
+class Partition:
+    """One partition table entry."""
+
+    def __init__(self, label, ptype, subtype, offset, size, flags=0):
+        self.label = label
+        self.type = ptype
+        self.subtype = subtype
+        self.offset = offset
+        self.size = size
+        self.flags = flags
+
+    @property
+    def type_name(self):
+        return TYPE_NAMES.get(self.type, f"0x{self.type:02x}")
+
+    @property
+    def subtype_name(self):
+        names = APP_SUBTYPES if self.type == APP_TYPE else DATA_SUBTYPES
+        return names.get(self.subtype, f"0x{self.subtype:02x}")
+
+    @property
+    def end(self):
+        return self.offset + self.size
+
+    def __repr__(self):
+        return (f"Partition({self.label!r}, {self.type_name}/{self.subtype_name}, "
+                f"0x{self.offset:X}, 0x{self.size:X})")
+
+
+def parse_partition_table(data):
+    """Parse raw partition table bytes into a list of Partitions."""
+    partitions = []
+    for pos in range(0, len(data) - ENTRY_SIZE + 1, ENTRY_SIZE):
+        entry = data[pos:pos + ENTRY_SIZE]
+        magic = entry[:2]
+        if magic == MD5_MAGIC:
+            if hashlib.md5(data[:pos]).digest() != entry[16:32]:
+                raise PartitionTableError("Partition table MD5 mismatch")
+            break
+        if magic != ENTRY_MAGIC:
+            break
+        ptype, subtype, offset, size = struct.unpack_from("<BBII", entry, 2)
+        label = entry[12:28].split(b"\x00")[0].decode("ascii", "replace")
+        flags = struct.unpack_from("<I", entry, 28)[0]
+        partitions.append(Partition(label, ptype, subtype, offset, size, flags))
+    if not partitions:
+        raise PartitionTableError("No partition table found")
+    return partitions
+
+
+def read_partition_table(session, offset=PARTITION_TABLE_OFFSET):
+    """Read and parse the partition table from a connected device."""
+    return parse_partition_table(session.read_flash(offset, PARTITION_TABLE_SIZE))
+
+
+def load_partition_table(path, offset=PARTITION_TABLE_OFFSET):
+    """Read the partition table out of a full-ROM backup file."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return parse_partition_table(f.read(PARTITION_TABLE_SIZE))
+
+
+def find_partition(partitions, label=None, ptype=None, subtype=None):
+    """First partition matching every given criterion, or None."""
+    for p in partitions:
+        if label is not None and p.label != label:
+            continue
+        if ptype is not None and p.type != ptype:
+            continue
+        if subtype is not None and p.subtype != subtype:
+            continue
+        return p
+    return None
+
+
+def format_partition_table(partitions):
+    """Human-readable table, one partition per line."""
+    lines = []
+    for p in partitions:
+        lines.append(f"  {p.label:16s} {p.type_name:5s} {p.subtype_name:10s} "
+                     f"0x{p.offset:06X}  {p.size:>10,} bytes")
+    return lines
@@ -0,0 +1,273 @@
+"""
+espROMkit backup post-processing — hash, compress and split finished backups.
+
+Once a backup file is complete the serial port is no longer needed for
+it. What is left is CPU work:
+
+  sha256     of the whole image and of every partition in it
+  compress   <backup>.gz next to the image (gzip level 6)
+  split      for backups that include the partition table at 0x8000:
+             each partition as <backup stem>.parts/<label>.bin
+  firmware   the app descriptor of each app partition and of the app
+             that boots (see espromkit_catalog)
+  manifest   <backup>.json with the above, for later lookups
+
+PostProcessor runs process_backup() on a ProcessPoolExecutor so this
+work uses the other cores while the port reads the next device. At most
+`max_pending` backups are queued or running. submit() blocks once that
+many are waiting, so a station that reads faster than it can hash slows
+down instead of queueing without limit. `blocked_seconds` and the
+espromkit_postproc_* metrics show how long readers have waited that way.
+Results come back in the submitting process through `on_done(result)`,
+called from the executor's callback thread, so anything that lives in
+the parent (a job's result, an open database) is updated there.
+
+Workers are started with the "spawn" method on every platform. A forked
+child would inherit the parent's serial ports and threads (the job
+server, the GUI).
+"""
+
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from espromkit_catalog import read_app_desc
+from espromkit_metrics import POSTPROC_BLOCKED, POSTPROC_PENDING
+from espromkit_ota import FACTORY_SUBTYPE, OTADATA_SUBTYPE, OtaError, OtaLayout
+from espromkit_partitions import (
+    APP_TYPE, DATA_TYPE, PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, PartitionTableError,
+    find_partition, parse_partition_table,
+)
+
+GZIP_LEVEL = 6
+READ_SIZE = 0x100000
+
+
+def manifest_path(path):
+    return path + ".json"
+
+
+def parts_dir(path):
+    return os.path.splitext(path)[0] + ".parts"
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _compress(path):
+    out = path + ".gz"
+    with open(path, "rb") as src, gzip.open(out + ".tmp", "wb", compresslevel=GZIP_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, READ_SIZE)
+    os.replace(out + ".tmp", out)
+    return out
+
+
+def _table(data, offset):
+    """The partition table inside the backup, or [] if it is not covered."""
+    start = PARTITION_TABLE_OFFSET - offset
+    if start < 0 or start + PARTITION_TABLE_SIZE > len(data):
+        return []
+    return parse_partition_table(data[start:start + PARTITION_TABLE_SIZE])
+
+
+def _boot_label(partitions, data, offset):
+    """Label of the app the bootloader would pick from this image, or None."""
+    apps = [p for p in partitions if p.type == APP_TYPE]
+    otadata = find_partition(partitions, ptype=DATA_TYPE, subtype=OTADATA_SUBTYPE)
+    fallback = find_partition(apps, subtype=FACTORY_SUBTYPE) or (apps[0] if apps else None)
+    if otadata is None:
+        return fallback.label if fallback else None
+    lo = otadata.offset - offset
+    if lo < 0 or lo + otadata.size > len(data):
+        return None
+    try:
+        return OtaLayout(partitions, data[lo:lo + otadata.size]).boot_partition.label
+    except OtaError:
+        return fallback.label if fallback else None
+
+
+def _part_file(p):
+    """File name for a partition: its label made safe as a name, or its offset."""
+    label = p.label.replace("/", "_").replace("\\", "_").lstrip(".")
+    return f"{label or f'0x{p.offset:X}'}.bin"
+
+
+def _split(path, data, offset, partitions):
+    """Write each partition the backup fully covers; [entries] for the manifest."""
+    folder = parts_dir(path)
+    os.makedirs(folder, exist_ok=True)
+    root = os.path.realpath(folder)
+    entries = []
+    for p in partitions:
+        lo, hi = p.offset - offset, p.end - offset
+        if lo < 0 or hi > len(data):
+            continue
+        piece = data[lo:hi]
+        name = os.path.join(folder, _part_file(p))
+        if os.path.dirname(os.path.realpath(name)) != root:
+            raise ValueError(f"partition {p.label!r} would be written outside {folder}")
+        with open(name, "wb") as f:
+            f.write(piece)
+        entry = {
+            "label": p.label, "type": p.type_name, "subtype": p.subtype_name,
+            "offset": p.offset, "size": p.size, "sha256": _sha256(piece),
+            "blank": piece.count(0xFF) == len(piece),
+            "file": os.path.relpath(name, os.path.dirname(path)),
+        }
+        if p.type == APP_TYPE:
+            entry["app"] = read_app_desc(piece)
+        entries.append(entry)
+    return entries
+
+
+def process_backup(path, offset=0, compress=True, split=True, info=None):
+    """Hash, compress and split one backup file; runs in a worker process.
+
+    Returns the manifest (also saved as <backup>.json). `info` (MAC, chip,
+    port...) is copied into it unchanged. `app` is the descriptor of the
+    firmware the image boots (partition `boot`), or of the image itself
+    when it starts with an app.
+    """
+    t = time.time()
+    with open(path, "rb") as f:
+        data = f.read()
+    result = dict(info or {})
+    result.update({"file": path, "offset": offset, "size": len(data), "sha256": _sha256(data)})
+    result["partitions"] = []
+    result["app"] = read_app_desc(data)
+    result["boot"] = None
+    try:
+        partitions = _table(data, offset)
+    except PartitionTableError as e:
+        result["partition_error"] = str(e)
+        partitions = []
+    if partitions:
+        result["boot"] = _boot_label(partitions, data, offset)
+        boot = next((p for p in partitions if p.label == result["boot"]), None)
+        if boot is not None and boot.offset >= offset and boot.end <= offset + len(data):
+            result["app"] = read_app_desc(data[boot.offset - offset:boot.end - offset])
+    if split and partitions:
+        result["partitions"] = _split(path, data, offset, partitions)
+    if compress:
+        out = _compress(path)
+        result["compressed"] = os.path.basename(out)
+        result["compressed_size"] = os.path.getsize(out)
+    result["seconds"] = round(time.time() - t, 3)
+    with open(manifest_path(path) + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(manifest_path(path) + ".tmp", manifest_path(path))
+    return result
+
+
+class PostProcessor:
+    """A process pool for finished backups, with a bound on pending work."""
+
+    def __init__(self, workers=None, max_pending=None, compress=True, split=True,
+                 on_done=None, log=print):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.compress = compress
+        self.split = split
+        self.on_done = on_done
+        self.blocked_seconds = 0.0
+        self.done = 0
+        self.failed = 0
+        self._log = log
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, path, offset=0, info=None, callback=None):
+        """Queue a finished backup. Blocks while `max_pending` are outstanding.
+
+        `callback(result)` runs after `on_done` for this backup only; on
+        failure `result` is None.
+        """
+        t = time.time()
+        self._slots.acquire()
+        waited = time.time() - t
+        with self._lock:
+            self.blocked_seconds += waited
+        POSTPROC_BLOCKED.inc(waited)
+        try:
+            future = self._executor.submit(
+                process_backup, path, offset, self.compress, self.split, info)
+        except RuntimeError as e:     # BrokenProcessPool, or submit after close()
+            self._slots.release()
+            self._log(f"  ERROR: cannot post-process {os.path.basename(path)}: {e}")
+            with self._lock:
+                self.failed += 1
+            if callback is not None:
+                callback(None)
+            return None
+        with self._lock:
+            self._pending.add(future)
+            POSTPROC_PENDING.set(len(self._pending))
+        future.add_done_callback(lambda f: self._finish(f, path, callback))
+        return future
+
+    def _finish(self, future, path, callback):
+        with self._lock:
+            self._pending.discard(future)
+            POSTPROC_PENDING.set(len(self._pending))
+        self._slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            self._log(f"  ERROR: post-processing {os.path.basename(path)} failed: {e}")
+            result = None
+        else:
+            with self._lock:
+                self.done += 1
+            if self.on_done is not None:
+                self.on_done(result)
+        if callback is not None:
+            callback(result)
+
+    def wait(self, timeout=None):
+        """Wait for everything submitted so far."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout)
+
+    def close(self):
+        """Finish the queued work and stop the worker processes."""
+        self._executor.shutdown(wait=True)
+
+
+def describe(result):
+    """One line about a finished post-processing result."""
+    parts = [f"sha256 {result['sha256'][:16]}"]
+    if result.get("app"):
+        app = result["app"]
+        boot = f" ({result['boot']})" if result.get("boot") else ""
+        parts.append(f"{app['project']} {app['version']}{boot}")
+    if "compressed_size" in result:
+        parts.append(f"{result['compressed']} {result['compressed_size']:,} bytes "
+                     f"({100 * result['compressed_size'] / max(result['size'], 1):.0f}%)")
+    if result["partitions"]:
+        parts.append(f"{len(result['partitions'])} partitions -> "
+                     f"{os.path.basename(parts_dir(result['file']))}/")
+    return ", ".join(parts) + f" in {result['seconds']:.1f}s"
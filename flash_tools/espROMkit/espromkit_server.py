@@ -0,0 +1,614 @@
+"""
+espROMkit job server — a local HTTP/JSON daemon for remote-triggered flashing.
+
+The server keeps one worker per attached port. Each worker has its own
+job queue and runs jobs on a session taken from a SessionPool, so the
+reset and stub upload happen once per port. Later jobs reuse the open,
+stub-loaded connection until it has been idle for `idle_timeout` seconds.
+Jobs on different ports run in parallel; jobs on one port run in order.
+
+  GET    /ports          attached ports: state, queue length, open session,
+                         busy seconds and utilization since the server started
+  GET    /jobs           every job (newest last)
+  POST   /jobs           queue a job: {"type": ..., "port": ..., ...}
+  GET    /jobs/ID        one job with its log
+  DELETE /jobs/ID        cancel a queued job, or stop a running backup
+  GET    /events?since=N events after N as JSON (waits up to `timeout`
+                         seconds for the first one); with
+                         Accept: text/event-stream, a Server-Sent Events stream
+  GET    /metrics        station metrics, Prometheus text format (espromkit_metrics)
+  GET    /backups?mac=&project=&version=&chip=&sha256=&limit=
+                         cataloged backups, newest first (espromkit_catalog)
+
+Job types and their parameters (paths are relative to the server's root
+folder and may not leave it):
+
+  info      -                                    chip, MAC and flash details
+  backup    file, offset (0), size (whole flash) resumable read (espromkit_backup)
+  restore   file, offset (0)                     erase-planned write + verify; .hex
+                                                 and .uf2 files are streamed at
+                                                 their own addresses (espromkit_formats)
+  job       manifest                             a job manifest or
+                                                 multi_download.conf
+
+With a PostProcessor (espromkit_postproc), a finished backup is hashed,
+compressed and split on worker processes while its port takes the next
+job; the job's result gains a "post" entry when that is done, and the
+backup is added to the catalog if the server has one. A manifest
+is preflighted once and cached until its file changes. Events
+are numbered; every job state change, log line and progress step becomes
+one, and the last EVENT_HISTORY are kept for clients that reconnect with
+?since=. The server binds to localhost by default: it has no
+authentication.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from espromkit_backup import BackupCancelled, backup_region
+from espromkit_catalog import backup_info
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_formats import FormatError, ImageFile, detect_format, restore_image
+from espromkit_geometry import check_fits
+from espromkit_job import Job, ManifestError, patch_flash_params
+from espromkit_metrics import CONTENT_TYPE, REGISTRY
+from espromkit_postproc import describe
+from espromkit_session import DEFAULT_IDLE_TIMEOUT, DEVICE_ERRORS, SessionPool
+from espromkit_verify import diff_region
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_HTTP_PORT = 8266
+JOB_TYPES = ("info", "backup", "restore", "job")
+EVENT_HISTORY = 10000
+JOB_LOG_LINES = 200             # log lines kept per job
+KEEPALIVE = 15.0                # seconds between SSE comments on a quiet stream
+MAX_POLL = 60.0
+MAX_BACKUPS = 1000
+
+
+class ServerError(Exception):
+    """A request the server cannot accept; `status` is the HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class EventLog:
+    """Numbered events in a bounded buffer. Readers block until new ones arrive."""
+
+    def __init__(self, size=EVENT_HISTORY):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def emit(self, kind, **fields):
+        with self._cond:
+            self.last_id += 1
+            self.events.append(dict(id=self.last_id, time=round(time.time(), 3), type=kind, **fields))
+            self._cond.notify_all()
+
+    def since(self, last_id, timeout=0.0):
+        """Events with an id above `last_id`, waiting up to `timeout` for one."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_id > last_id or self.closed, timeout)
+            return [e for e in self.events if e["id"] > last_id]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class ServerJob:
+    """One queued request and everything known about it so far."""
+
+    def __init__(self, job_id, kind, port, params, events):
+        self.id = job_id
+        self.type = kind
+        self.port = port
+        self.params = params
+        self.state = "queued"       # queued, running, done, failed, cancelled
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None        # (done, total) bytes
+        self.result = None
+        self.error = None
+        self.lines = deque(maxlen=JOB_LOG_LINES)
+        self.cancel_event = threading.Event()
+        self._events = events
+        self._last_progress = -1
+
+    def log(self, message):
+        line = message.strip()
+        if line:
+            self.lines.append(line)
+            self._events.emit("log", job=self.id, port=self.port, line=line)
+
+    def set_progress(self, done, total):
+        """Record progress; an event is emitted for every whole percent."""
+        self.progress = (done, total)
+        percent = done * 100 // total if total else 100
+        if percent != self._last_progress:
+            self._last_progress = percent
+            self._events.emit("progress", job=self.id, port=self.port, done=done, total=total)
+
+    def set_state(self, state, error=None):
+        self.state = state
+        self.error = error
+        if state == "running":
+            self.started = time.time()
+        elif state != "queued":
+            self.finished = time.time()
+        fields = {"error": error} if error else {}
+        self._events.emit("job", job=self.id, port=self.port, state=state, **fields)
+
+    def to_dict(self, lines=False):
+        info = {
+            "id": self.id, "type": self.type, "port": self.port, "params": self.params,
+            "state": self.state, "created": self.created, "started": self.started,
+            "finished": self.finished, "result": self.result, "error": self.error,
+            "progress": dict(zip(("done", "total"), self.progress)) if self.progress else None,
+        }
+        if lines:
+            info["log"] = list(self.lines)
+        return info
+
+
+class PortWorker:
+    """The job queue of one port, drained by its own thread."""
+
+    def __init__(self, port, description=""):
+        self.port = port
+        self.description = description
+        self.queue = queue.Queue()
+        self.current = None
+        self.t_start = time.time()
+        self.busy_seconds = 0.0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.thread = None
+
+    @property
+    def utilization(self):
+        busy = self.busy_seconds
+        if self.current is not None and self.current.started:
+            busy += time.time() - self.current.started
+        elapsed = time.time() - self.t_start
+        return busy / elapsed if elapsed > 0 else 0.0
+
+
+class JobServer:
+    """Queues jobs per port and runs them on pooled device sessions.
+
+    `discover` returns the attached ports as detect_ports() entries
+    (dicts with "device" and "description"); it is called again whenever
+    the port list is needed, so devices can come and go. `defaults` are
+    the baud and flash parameters for restores and manifests. `post` is
+    an optional PostProcessor for finished backups, and `catalog` an
+    optional Catalog they are registered in.
+    """
+
+    def __init__(self, root, discover, defaults, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 station=None, post=None, catalog=None, log=print):
+        self.root = os.path.realpath(root)
+        self.discover = discover
+        self.defaults = defaults
+        self.baud = defaults["baud"]
+        self.station = station
+        self.post = post
+        self.catalog = catalog
+        self.pool = SessionPool(idle_timeout)
+        self.events = EventLog()
+        self.jobs = {}
+        self.workers = {}
+        self.httpd = None
+        self._manifests = {}        # path -> (mtime, preflighted Job)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._log = log
+
+    # ------------------------------------------------------------- ports
+    def _worker(self, port, description=""):
+        with self._lock:
+            worker = self.workers.get(port)
+            if worker is None:
+                worker = self.workers[port] = PortWorker(port, description)
+                worker.thread = threading.Thread(target=self._drain, args=(worker,), daemon=True)
+                worker.thread.start()
+            elif description:
+                worker.description = description
+        return worker
+
+    def refresh(self):
+        """Start a worker for every newly attached port. Returns the attached ports."""
+        attached = []
+        for entry in self.discover():
+            self._worker(entry["device"], entry.get("description", ""))
+            attached.append(entry["device"])
+        return attached
+
+    def port_status(self):
+        attached = set(self.refresh())
+        open_sessions = set(self.pool.ports())
+        status = []
+        for port, worker in sorted(list(self.workers.items())):
+            current = worker.current
+            status.append({
+                "port": port,
+                "description": worker.description,
+                "attached": port in attached,
+                "state": "busy" if current is not None else "idle",
+                "job": current.id if current is not None else None,
+                "queued": worker.queue.qsize(),
+                "session": port in open_sessions,
+                "busy_seconds": round(worker.busy_seconds, 3),
+                "utilization": round(worker.utilization, 4),
+                "jobs_done": worker.jobs_done,
+                "jobs_failed": worker.jobs_failed,
+            })
+        return status
+
+    # -------------------------------------------------------------- jobs
+    def _path(self, value, what):
+        if not isinstance(value, str) or not value:
+            raise ServerError(f"'{what}' must be a path relative to the server root")
+        path = os.path.realpath(os.path.join(self.root, value))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ServerError(f"'{what}' is outside the server root", 403)
+        return path
+
+    def _int(self, params, name, default=None):
+        value = params.get(name, default)
+        try:
+            return value if value is None or isinstance(value, int) else int(str(value), 0)
+        except ValueError:
+            raise ServerError(f"'{name}': '{value}' is not a number")
+
+    def submit(self, request):
+        """Validate and queue a request. Returns the ServerJob."""
+        if not isinstance(request, dict):
+            raise ServerError("Expected a JSON object")
+        kind, port = request.get("type"), request.get("port")
+        if kind not in JOB_TYPES:
+            raise ServerError(f"'type' must be one of {', '.join(JOB_TYPES)}")
+        if port not in self.workers and port not in self.refresh():
+            raise ServerError(f"Unknown port '{port}'", 404)
+        params = {k: v for k, v in request.items() if k not in ("type", "port")}
+        if kind in ("backup", "restore"):
+            self._path(params.get("file"), "file")
+            self._int(params, "offset", 0)
+            self._int(params, "size")
+        if kind == "restore" and not os.path.isfile(self._path(params["file"], "file")):
+            raise ServerError(f"File not found: {params['file']}", 404)
+        if kind == "job":
+            self._manifest(params.get("manifest"))
+        with self._lock:
+            job = ServerJob(self._next_id, kind, port, params, self.events)
+            self._next_id += 1
+            self.jobs[job.id] = job
+        job.set_state("queued")
+        self._worker(port).queue.put(job)
+        return job
+
+    def job_list(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def backups(self, query):
+        """Catalog lookup for GET /backups; `query` is the parsed query string."""
+        if self.catalog is None:
+            raise ServerError("The server has no backup catalog", 404)
+        filters = {key: query[key][0] for key in ("mac", "project", "version", "chip", "sha256")
+                   if key in query}
+        limit = min(int(query.get("limit", ["20"])[0]), MAX_BACKUPS)
+        rows = self.catalog.find(limit=limit, **filters)
+        return [dict(row, partitions=[dict(p) for p in self.catalog.partitions(row["id"])])
+                for row in rows]
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServerError(f"No job {job_id}", 404)
+        if job.state == "queued":
+            job.set_state("cancelled")
+        elif job.state == "running":
+            job.cancel_event.set()      # honoured by backups between chunks
+        return job
+
+    def _manifest(self, value):
+        """The preflighted Job for a manifest path, reused until the file changes."""
+        path = self._path(value, "manifest")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            raise ServerError(f"File not found: {value}", 404)
+        cached = self._manifests.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            job = Job.from_file(path, self.defaults).preflight(log=lambda message: None)
+        except (ManifestError, OSError) as e:
+            raise ServerError(f"{value}: {e}", 422)
+        self._manifests[path] = (mtime, job)
+        return job
+
+    # ------------------------------------------------------------ running
+    def _drain(self, worker):
+        while not self._stop.is_set():
+            try:
+                job = worker.queue.get(timeout=1.0)
+            except queue.Empty:
+                self.pool.expire_idle()
+                continue
+            if job is None:
+                return
+            if job.state == "cancelled":
+                continue
+            worker.current = job
+            job.set_state("running")
+            try:
+                job.result = self._run(job)
+                ok = job.result is not None
+                job.set_state("done" if ok else "failed", None if ok else "see the job log")
+            except BackupCancelled:
+                job.log("Cancelled; the backup resumes when the same job is queued again.")
+                job.set_state("cancelled")
+                ok = False
+            except (ServerError, ManifestError) as e:
+                job.log(f"ERROR: {e}")
+                job.set_state("failed", str(e))
+                ok = False
+            except DEVICE_ERRORS as e:
+                job.log(f"ERROR: {job.port}: {e}")
+                job.set_state("failed", str(e))
+                ok = False
+            except Exception as e:  # a bad job must not kill the port's worker
+                job.log(f"ERROR: {type(e).__name__}: {e}")
+                job.set_state("failed", f"{type(e).__name__}: {e}")
+                ok = False
+            worker.busy_seconds += job.finished - job.started
+            worker.current = None
+            if ok:
+                worker.jobs_done += 1
+            elif job.state == "failed":
+                worker.jobs_failed += 1
+            self._log(f"  [{job.port}] job {job.id} ({job.type}): {job.state} "
+                      f"in {job.finished - job.started:.1f}s")
+
+    def _run(self, job):
+        """Run one job on the pooled session. Returns its result, or None on failure."""
+        if job.type == "job":
+            manifest = self._manifest(job.params["manifest"])
+            baud = manifest.baud_for(job.port)
+            with self.pool.session(job.port, baud) as session:
+                ok = manifest.run(job.port, log=job.log, session=session, station=self.station)
+            return {"mac": session.mac, "name": manifest.name} if ok else None
+
+        with self.pool.session(job.port, self.baud) as session:
+            job.log(f"Device {session.mac} on {job.port}")
+            if job.type == "info":
+                return session.info()
+            t_start = time.time()
+            ok, written = False, 0
+            try:
+                if job.type == "backup":
+                    result = self._backup(job, session)
+                else:
+                    result = self._restore(job, session)
+                    written = result["written"] if result else 0
+                ok = result is not None
+            finally:
+                if self.station is not None:
+                    self.station.record(job.type, job.port, ok, session, written or None,
+                                        total_seconds=time.time() - t_start, baud=self.baud,
+                                        detail=None if ok else (job.lines or [None])[-1])
+            return result
+
+    def _backup(self, job, session):
+        offset = self._int(job.params, "offset", 0)
+        size = self._int(job.params, "size") or (session.flash_size or 0) - offset
+        if size <= 0:
+            raise ServerError("Flash size unknown: pass 'size'")
+        path = self._path(job.params["file"], "file")
+        error = check_fits(offset, size, session.flash_size)
+        if error:
+            raise ServerError(error)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        job.log(f"Reading 0x{offset:X}..0x{offset + size:X} ({size:,} bytes) -> {job.params['file']}")
+        ok = backup_region(job.port, offset, size, path, self.baud, cancel_event=job.cancel_event,
+                           progress_fn=job.set_progress, log=job.log, session=session)
+        if not ok:
+            return None
+        result = {"mac": session.mac, "file": job.params["file"], "offset": offset, "size": size}
+        if self.post is not None:
+            result["post"] = "queued"
+            info = backup_info(session.info(), job.port)
+            self.post.submit(path, offset, info, callback=lambda post: self._post_done(job, result, post))
+        return result
+
+    def _post_done(self, job, result, post):
+        """A backup's post-processing finished (on the pool's callback thread)."""
+        if post is None:
+            result["post"] = "failed"
+            job.log("Post-processing failed")
+        else:
+            result["post"] = {key: post[key] for key in ("sha256", "compressed", "compressed_size",
+                                                        "partitions") if key in post}
+            job.log(f"Post-processed: {describe(post)}")
+            if self.catalog is not None:
+                try:
+                    result["post"]["catalog_id"] = self.catalog.add(post)
+                except sqlite3.Error as e:
+                    job.log(f"Not cataloged: {e}")
+        self.events.emit("post", job=job.id, port=job.port, ok=post is not None)
+
+    def _restore(self, job, session):
+        offset = self._int(job.params, "offset", 0)
+        path = self._path(job.params["file"], "file")
+        if detect_format(path) != "bin":
+            return self._restore_image(job, session, path)
+        with open(path, "rb") as f:
+            data = f.read()
+        error = check_fits(offset, len(data), session.flash_size)
+        if error:
+            raise ServerError(error)
+        data = patch_flash_params(
+            data, offset, session.bootloader_offset, self.defaults["flash_mode"],
+            self.defaults["flash_freq"], self.defaults["flash_size"], session.flash_size,
+        )
+        job.set_progress(0, len(data))
+        plan = plan_restore(session, offset, data)
+        job.log(f"Plan: {plan.summary()}")
+        execute_plan(session, plan, log=job.log)
+        bad = diff_region(session, offset, data)
+        job.set_progress(len(data), len(data))
+        if bad:
+            job.log("VERIFY FAILED at " + ", ".join(f"0x{s:X}..0x{e:X}" for s, e in bad))
+            return None
+        job.log(f"Verified {len(data):,} bytes at 0x{offset:X}")
+        return {"mac": session.mac, "file": job.params["file"], "offset": offset,
+                "written": plan.write_bytes, "erased": plan.erase_bytes, "skipped": plan.skip_bytes}
+
+    def _restore_image(self, job, session, path):
+        try:
+            source = ImageFile(path)
+            job.log(f"{job.params['file']}: {source.describe()}")
+            result = restore_image(session, source, self.defaults["flash_mode"],
+                                   self.defaults["flash_freq"], self.defaults["flash_size"],
+                                   log=job.log, progress_fn=job.set_progress)
+        except FormatError as e:
+            raise ServerError(str(e)) from None
+        if not result.ok:
+            job.log("VERIFY FAILED at " + ", ".join(f"0x{s:X}..0x{e:X}" for s, e in result.mismatches))
+            return None
+        return {"mac": session.mac, "file": job.params["file"], "offset": source.start,
+                "written": result.written, "erased": result.erased, "skipped": result.skipped}
+
+    # ---------------------------------------------------------------- http
+    def start(self, host=DEFAULT_HOST, port=DEFAULT_HTTP_PORT):
+        """Bind the HTTP server and serve it from a thread. Returns (host, port)."""
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.job_server = self
+        self.refresh()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self.httpd.server_address[:2]
+
+    def close(self):
+        """Stop accepting requests, let running jobs finish and close every session."""
+        self._stop.set()
+        self.events.close()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        for worker in list(self.workers.values()):
+            worker.queue.put(None)
+        for worker in list(self.workers.values()):
+            worker.thread.join()
+        self.pool.close_all()
+        if self.post is not None:
+            self.post.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "espROMkit"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass    # the server logs jobs, not requests
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        server = self.server.job_server
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = parse_qs(url.query)
+        try:
+            if method == "GET" and parts == ["ports"]:
+                return self._send_json(200, server.port_status())
+            if method == "GET" and parts == ["jobs"]:
+                return self._send_json(200, [j.to_dict() for j in server.job_list()])
+            if method == "POST" and parts == ["jobs"]:
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"null")
+                except ValueError as e:
+                    raise ServerError(f"Invalid JSON: {e}")
+                return self._send_json(202, server.submit(request).to_dict())
+            if len(parts) == 2 and parts[0] == "jobs" and method in ("GET", "DELETE"):
+                if not parts[1].isdigit():
+                    raise ServerError(f"No job {parts[1]}", 404)
+                if method == "DELETE":
+                    return self._send_json(200, server.cancel(int(parts[1])).to_dict())
+                job = server.jobs.get(int(parts[1]))
+                if job is None:
+                    raise ServerError(f"No job {parts[1]}", 404)
+                return self._send_json(200, job.to_dict(lines=True))
+            if method == "GET" and parts == ["metrics"]:
+                data = REGISTRY.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                return self.wfile.write(data)
+            if method == "GET" and parts == ["backups"]:
+                return self._send_json(200, server.backups(query))
+            if method == "GET" and parts == ["events"]:
+                since = int(query.get("since", ["0"])[0])
+                if "text/event-stream" in self.headers.get("Accept", ""):
+                    return self._stream(server.events, since)
+                timeout = min(float(query.get("timeout", ["0"])[0]), MAX_POLL)
+                return self._send_json(200, server.events.since(since, timeout))
+            raise ServerError(f"No route for {method} {url.path}", 404)
+        except ServerError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _stream(self, events, since):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while not events.closed:
+                batch = events.since(since, KEEPALIVE)
+                if not batch:
+                    self.wfile.write(b": keepalive\n\n")
+                for event in batch:
+                    since = event["id"]
+                    self.wfile.write(f"id: {since}\nevent: {event['type']}\n"
+                                     f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+        except OSError:
+            pass    # the client went away
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
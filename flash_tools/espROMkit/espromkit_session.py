@@ -0,0 +1,351 @@
+"""
+espROMkit device session — one live esptool connection to a serial port.
+
+Wraps esptool's loader API so a run of flash operations can share a
+single connection (stub loaded, baud raised) instead of calling
+esptool.main and resetting the chip for every step.
+"""
+
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import esptool
+    from esptool.cmds import detect_chip
+    from esptool.loader import DEFAULT_TIMEOUT, ERASE_WRITE_TIMEOUT_PER_MB, timeout_per_mb
+except ImportError:
+    sys.exit("ERROR: esptool is required. Install with: pip install esptool")
+
+from espromkit_compress import measure_round_trip, tune, wire_seconds, wire_size
+from espromkit_geometry import FlashGeometry, resolve_flash_size, size_name
+from espromkit_metrics import PHASE_SECONDS, RETRIES, record_transfer
+from espromkit_transport import port_url
+
+ROM_BAUD = 115200
+SECTOR_SIZE = 0x1000
+DEFAULT_IDLE_TIMEOUT = 60.0     # seconds before a pooled session releases its port
+AUTO = "auto"                   # write_flash level: pick per image (espromkit_compress)
+
+# Anything that means "the link to the device went away": pyserial raises
+# SerialException (an OSError), esptool raises FatalError on timeouts and
+# corrupt frames.
+DEVICE_ERRORS = (OSError, esptool.FatalError)
+
+# esptool 5 spells reset modes with hyphens and treats any other spelling
+# as a reset; esptool 4 only knows the underscored names.
+ESPTOOL_MAJOR = int(esptool.__version__.split(".")[0])
+
+
+def connect_mode(mode):
+    """`mode` ("default_reset", "no_reset", ...) as the installed esptool spells it."""
+    if ESPTOOL_MAJOR >= 5:
+        return mode.replace("_", "-")
+    return mode.replace("-", "_")
+
+
+class DeviceSession:
+    """A connected ESP32 with the flasher stub running at `baud`.
+
+    With before="no_reset" the session re-attaches to a stub that an
+    earlier esptool run left running (e.g. write_flash --after no_reset)
+    instead of resetting the chip.
+    """
+
+    def __init__(self, port, baud, before="default_reset"):
+        self.port = port
+        self.baud = int(baud)
+        self.before = before
+        self.esp = None
+        self.mac = ""
+        self.chip = ""
+        self.features = ""
+        self.crystal = ""
+        self.flash_id = None
+        self.geometry = None
+        self.flash_size = None
+        self.round_trip = None
+        self.send_cost = 0.0
+        self.last_tuning = None
+        self.last_used = time.time()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def connected(self):
+        return self.esp is not None
+
+    def connect(self):
+        """Reset into the bootloader (or attach), load the stub, switch baud."""
+        attach = connect_mode(self.before) == connect_mode("no_reset")
+        t_start = time.time()
+        esp = detect_chip(
+            port=port_url(self.port),
+            baud=self.baud if attach else ROM_BAUD,
+            connect_mode=connect_mode(self.before),
+        )
+        try:
+            if not esp.IS_STUB:
+                esp = esp.run_stub()
+            if not attach and self.baud > ROM_BAUD:
+                esp.change_baud(self.baud)
+            self.mac = ":".join(f"{b:02x}" for b in esp.read_mac())
+            self.chip = esp.get_chip_description()
+            self.features = ", ".join(esp.get_chip_features())
+            self.crystal = f"{esp.get_crystal_freq()}MHz"
+            self.flash_id = esp.flash_id()
+            self.geometry = FlashGeometry(self.flash_id)
+            self.flash_size = resolve_flash_size(self.mac, self.flash_id)
+            if self.flash_size:
+                esp.flash_set_parameters(self.flash_size)
+        except BaseException:
+            esp._port.close()
+            raise
+        self.esp = esp
+        self.round_trip = None
+        self.send_cost = 0.0
+        self.last_used = time.time()
+        PHASE_SECONDS.observe(self.last_used - t_start, phase="connect", port=self.port)
+        return self
+
+    def close(self):
+        """Drop the connection without resetting the chip."""
+        if self.esp is None:
+            return
+        try:
+            self.esp._port.close()
+        except DEVICE_ERRORS:
+            pass
+        self.esp = None
+
+    def reconnect(self):
+        self.close()
+        return self.connect()
+
+    def healthy(self):
+        """Cheap round trip to the stub: is the chip still there and synced?"""
+        if self.esp is None:
+            return False
+        try:
+            self.esp.read_reg(self.esp.CHIP_DETECT_MAGIC_REG_ADDR)
+            return True
+        except DEVICE_ERRORS:
+            self.close()
+            return False
+
+    @property
+    def flash_size_name(self):
+        return size_name(self.flash_size) if self.flash_size else ""
+
+    def info(self):
+        """Chip details in the same shape as the CLI's get_chip_info()."""
+        return {
+            "chip": self.chip,
+            "features": self.features,
+            "mac": self.mac,
+            "crystal": self.crystal,
+            "flash_size": self.flash_size_name,
+            "flash_bytes": self.flash_size,
+            "flash_chip": self.geometry.describe() if self.geometry else "",
+            "flash_id": f"0x{self.flash_id:08x}" if self.flash_id is not None else "",
+        }
+
+    def read_flash(self, offset, size, progress_fn=None):
+        """Read `size` bytes at `offset`. The stub checks an MD5 of the data."""
+        t = time.time()
+        data = self.esp.read_flash(offset, size, progress_fn)
+        record_transfer(self, "read", len(data), time.time() - t)
+        return data
+
+    def flash_md5(self, offset, size):
+        """MD5 hex digest of a flash range, computed on the device."""
+        with PHASE_SECONDS.time(phase="md5", port=self.port):
+            return self.esp.flash_md5sum(offset, size)
+
+    def _round_trip(self):
+        if self.round_trip is None:
+            self.round_trip = measure_round_trip(self.esp)
+        return self.round_trip
+
+    def tune_upload(self, data):
+        """Compression estimates for uploading `data` over this link."""
+        return tune(data, self.baud, self._round_trip(), self.send_cost,
+                    block_size=self.esp.FLASH_WRITE_SIZE)
+
+    def calibrate(self, sent, blocks, seconds):
+        """Learn the host's cost per sent byte from a finished upload."""
+        if blocks < 2:
+            return      # too short to tell from the round trips
+        extra = seconds - wire_seconds(sent, blocks, self.baud, self._round_trip())
+        cost = max(extra, 0.0) / sent
+        self.send_cost = cost if not self.send_cost else (self.send_cost + cost) / 2
+
+    def write_flash(self, offset, data, progress_fn=None, compressed=None, level=AUTO):
+        """Erase and write `data` at `offset`. Returns the zlib level used.
+
+        level is 1-9 (deflate, like `-z`), 0 (raw upload) or AUTO, which
+        picks whichever is fastest for this image and link; the estimate
+        is kept in `last_tuning`. Pass `compressed` (zlib stream of
+        `data`) to skip compressing here.
+        """
+        t_start = time.time()
+        self.last_tuning = None
+        if compressed is None:
+            if level == AUTO:
+                self.last_tuning = self.tune_upload(data)
+                level = self.last_tuning.best.level
+                compressed = self.last_tuning.compressed
+            if level == 0:
+                self._write_raw(offset, data, progress_fn)
+                record_transfer(self, "write", len(data), time.time() - t_start)
+                return 0
+            if compressed is None:
+                compressed = zlib.compress(data, level)
+        elif level == AUTO:
+            level = None    # compressed by the caller, level unknown
+        self._write_deflated(offset, data, compressed, progress_fn)
+        record_transfer(self, "write", len(data), time.time() - t_start)
+        return level
+
+    def _write_timeout(self, unpacked_per_block):
+        # The stub ACKs a block before writing it, so every later ACK also
+        # waits for the previous block's erase+write.
+        return max(
+            DEFAULT_TIMEOUT,
+            timeout_per_mb(ERASE_WRITE_TIMEOUT_PER_MB, unpacked_per_block),
+        )
+
+    def _write_raw(self, offset, data, progress_fn):
+        esp = self.esp
+        t = time.time()
+        esp.flash_begin(len(data), offset, logging=False)
+        block_size = esp.FLASH_WRITE_SIZE
+        blocks = (len(data) + block_size - 1) // block_size
+        write_timeout = self._write_timeout(block_size)
+        timeout = DEFAULT_TIMEOUT
+        for seq, pos in enumerate(range(0, len(data), block_size)):
+            block = data[pos:pos + block_size]
+            esp.flash_block(block + b"\xff" * (block_size - len(block)), seq, timeout=timeout)
+            timeout = write_timeout
+            if progress_fn:
+                progress_fn(min(pos + block_size, len(data)), len(data))
+        esp.flash_finish(False, timeout=timeout)
+        self.calibrate(blocks * block_size + wire_size(data) - len(data), blocks, time.time() - t)
+
+    def _write_deflated(self, offset, data, compressed, progress_fn):
+        esp = self.esp
+        t = time.time()
+        esp.flash_defl_begin(len(data), len(compressed), offset)
+        block_size = esp.FLASH_WRITE_SIZE
+        write_timeout = self._write_timeout(block_size * len(data) // max(len(compressed), 1))
+        timeout = DEFAULT_TIMEOUT
+        for seq, pos in enumerate(range(0, len(compressed), block_size)):
+            block = compressed[pos:pos + block_size]
+            esp.flash_defl_block(block, seq, timeout=timeout)
+            timeout = write_timeout
+            if progress_fn:
+                progress_fn(min(pos + block_size, len(compressed)), len(compressed))
+        esp.flash_defl_finish(False, timeout=timeout)
+        self.calibrate(wire_size(compressed), seq + 1, time.time() - t)
+
+    def erase_region(self, offset, size):
+        """Erase sector-aligned [offset, offset+size) without writing."""
+        with PHASE_SECONDS.time(phase="erase", port=self.port):
+            self.esp.erase_region(offset, size)
+
+    @property
+    def bootloader_offset(self):
+        return self.esp.BOOTLOADER_FLASH_OFFSET
+
+    def hard_reset(self):
+        """Reboot into the application and close the connection."""
+        self.esp.hard_reset()
+        self.close()
+
+
+class SessionPool:
+    """One persistent DeviceSession per port, shared between operations.
+
+    The first operation on a port resets the chip and loads the stub; later
+    ones reuse the connection after a health check. Sessions idle for
+    longer than `idle_timeout` are closed by expire_idle() so the port is
+    free for other tools.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}     # port -> DeviceSession
+        self._locks = {}        # port -> Lock held while a session is in use
+        self._lock = threading.Lock()
+
+    def _port_lock(self, port):
+        with self._lock:
+            return self._locks.setdefault(port, threading.Lock())
+
+    @contextmanager
+    def session(self, port, baud):
+        """Yield a connected session for `port`, reusing it when possible."""
+        with self._port_lock(port):
+            session = self._sessions.get(port)
+            if session is not None and (
+                session.baud != int(baud)
+                or time.time() - session.last_used > self.idle_timeout
+                or not session.healthy()
+            ):
+                if session.connected:
+                    RETRIES.inc(port=port, reason="reconnect")
+                session.close()
+                session = None
+            if session is None:
+                session = DeviceSession(port, baud).connect()
+                self._sessions[port] = session
+            try:
+                yield session
+            except DEVICE_ERRORS:
+                session.close()
+                raise
+            finally:
+                session.last_used = time.time()
+                if not session.connected:
+                    self._sessions.pop(port, None)
+
+    def take(self, port):
+        """Remove and return the open session for `port`, or None."""
+        with self._port_lock(port):
+            session = self._sessions.pop(port, None)
+        if session is not None and session.connected:
+            return session
+        return None
+
+    def close(self, port):
+        session = self.take(port)
+        if session is not None:
+            session.close()
+
+    def expire_idle(self):
+        """Close sessions that have not been used for idle_timeout seconds."""
+        now = time.time()
+        for port, session in list(self._sessions.items()):
+            lock = self._port_lock(port)
+            if not lock.acquire(blocking=False):
+                continue    # in use right now
+            try:
+                if now - session.last_used > self.idle_timeout:
+                    session.close()
+                    self._sessions.pop(port, None)
+            finally:
+                lock.release()
+
+    def close_all(self):
+        for port in list(self._sessions):
+            self.close(port)
+
+    def ports(self):
+        return [p for p, s in self._sessions.items() if s.connected]
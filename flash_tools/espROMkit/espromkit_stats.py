@@ -0,0 +1,317 @@
+"""
+espROMkit station statistics — one SQLite table for every flash run.
+
+Two sources feed the `operations` table:
+
+  fdt        Espressif Flash Download Tool logs (logs/<MAC>.txt). Each run
+             is a START ... END block with the baud, flash ID, "Wrote N
+             bytes (M compressed) ... in S seconds" and the PASS/FAIL
+             result. A block cut off by the next START (the tool lost
+             the device while connecting) is stored as ABORT.
+  espromkit  job and farm runs, recorded as they finish, with the port
+             and its USB adapter.
+
+Logs are tailed: the byte offset after the last complete block is kept
+per file in `ingest_offsets`, so each ingest reads only what was
+appended since the previous one, and a block still being written is
+left for the next pass. A file that shrank was rotated and is read from
+the start again.
+
+The per-slot pass/fail counters in multi_download.conf [STATISTICS] are
+running totals, so they are stored as a snapshot in `slot_counters`.
+
+Throughput (effective kbit/s of uncompressed data) can then be grouped
+by adapter, baud, flash chip, device, source or day.
+"""
+
+import configparser
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from espromkit_geometry import FlashGeometry
+
+
+DB_PATH = os.path.join(os.path.expanduser("~"), ".espromkit", "station.db")
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOGS = os.path.join(TOOLS_DIR, "logs")
+DEFAULT_CONF = os.path.join(TOOLS_DIR, "configure", "esp32", "multi_download.conf")
+
+START_MARK = "*** START ***"
+END_MARK = "*** END ***"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id          INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL,      -- 'fdt' or 'espromkit'
+    kind        TEXT,               -- 'download', 'job', 'farm'
+    started     TEXT,               -- 'YYYY-MM-DD HH:MM[:SS]'
+    mac         TEXT,
+    port        TEXT,
+    adapter     TEXT,
+    baud        INTEGER,
+    flash_id    INTEGER,
+    flash_chip  TEXT,
+    bytes       INTEGER,            -- uncompressed bytes written
+    compressed  INTEGER,
+    seconds     REAL,               -- time spent writing
+    total_seconds REAL,             -- whole run, connect to result
+    result      TEXT,               -- PASS, FAIL, ABORT
+    detail      TEXT,
+    log_path    TEXT,
+    log_offset  INTEGER,
+    UNIQUE (log_path, log_offset, started)
+);
+CREATE TABLE IF NOT EXISTS ingest_offsets (
+    path    TEXT PRIMARY KEY,
+    offset  INTEGER NOT NULL,
+    size    INTEGER NOT NULL,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS slot_counters (
+    conf    TEXT,
+    slot    INTEGER,
+    port    TEXT,
+    baud    INTEGER,
+    passed  INTEGER,
+    failed  INTEGER,
+    updated TEXT,
+    PRIMARY KEY (conf, slot)
+);
+"""
+
+GROUPS = {
+    "adapter": "COALESCE(adapter, '(' || source || ')')",
+    "baud": "baud",
+    "chip": "flash_chip",
+    "mac": "mac",
+    "source": "source",
+    "day": "substr(started, 1, 10)",
+}
+
+WROTE_RE = re.compile(r"Wrote (\d+) bytes(?: \((\d+) compressed\))? at 0x[0-9a-fA-F]+ "
+                      r"in ([\d.]+) seconds")
+FIELDS = (
+    ("started", re.compile(r"START TIME:\s*(\d{12})")),
+    ("connect_baud", re.compile(r"CONNECT BAUD:\s*(\d+)")),
+    ("baud", re.compile(r"=+BAUD\s*:\s*(\d+)=+")),
+    ("flash_id", re.compile(r"get flash id\s*:\s*(0x[0-9a-fA-F]+)")),
+    ("total_seconds", re.compile(r"Use time:\s*([\d.]+)\s*s")),
+    ("result", re.compile(r"Download result:\s*(\w+)")),
+)
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def chip_name(flash_id):
+    """'GigaDevice 4MB' for the throughput reports."""
+    if flash_id is None:
+        return None
+    geometry = FlashGeometry(flash_id)
+    return f"{geometry.manufacturer} {geometry.size_name or '?'}"
+
+
+def parse_fdt_block(lines):
+    """Fields of one START..END block as a dict for the operations table."""
+    found = {}
+    written = compressed = 0
+    seconds = 0.0
+    wrote_any = False
+    for line in lines:
+        match = WROTE_RE.search(line)
+        if match:
+            wrote_any = True
+            written += int(match.group(1))
+            compressed += int(match.group(2) or 0)
+            seconds += float(match.group(3))
+            continue
+        for name, regex in FIELDS:
+            if name not in found or name == "baud":
+                match = regex.search(line)
+                if match:
+                    found[name] = match.group(1)
+    stamp = found.get("started")
+    flash_id = int(found["flash_id"], 16) if "flash_id" in found else None
+    return {
+        "started": f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]} {stamp[8:10]}:{stamp[10:12]}" if stamp else None,
+        "baud": int(found.get("baud") or found.get("connect_baud") or 0) or None,
+        "flash_id": flash_id,
+        "flash_chip": chip_name(flash_id),
+        "bytes": written if wrote_any else None,
+        "compressed": compressed if wrote_any and compressed else None,
+        "seconds": seconds if wrote_any else None,
+        "total_seconds": float(found["total_seconds"]) if "total_seconds" in found else None,
+        "result": found.get("result", "ABORT").upper(),
+    }
+
+
+def iter_fdt_blocks(f, offset):
+    """Yield (block offset, lines, end offset) for complete blocks from `offset`.
+
+    `f` is a binary file. A block ends at its END line, or just before
+    the next START when the run was cut off. The trailing block is not
+    yielded until it is closed.
+    """
+    f.seek(offset)
+    pos = offset
+    start = None
+    lines = []
+    for raw in f:
+        line = raw.decode("utf-8", "replace")
+        if START_MARK in line:
+            if start is not None:
+                yield start, lines, pos
+            start, lines = pos, []
+        elif start is not None:
+            lines.append(line)
+            if END_MARK in line:
+                yield start, lines, pos + len(raw)
+                start, lines = None, []
+        pos += len(raw)
+
+
+class StationDB:
+    """The station statistics database. Safe to share between farm workers."""
+
+    def __init__(self, path=DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.adapters = {}          # port -> USB adapter description, set by the caller
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------- writes
+    def _insert(self, row):
+        columns = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        self.db.execute(f"INSERT OR IGNORE INTO operations ({columns}) VALUES ({marks})",
+                        tuple(row.values()))
+
+    def ingest_log(self, path):
+        """Append new complete blocks of one FDT log. Returns the number of runs added."""
+        size = os.path.getsize(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            row = self.db.execute("SELECT offset FROM ingest_offsets WHERE path = ?", (key,)).fetchone()
+            offset = row[0] if row else 0
+            if offset > size:           # truncated or replaced: read it again
+                offset = 0
+            mac = os.path.splitext(os.path.basename(path))[0].upper()
+            if not re.fullmatch(r"[0-9A-F]{12}", mac):
+                mac = None
+            added = 0
+            with open(path, "rb") as f:
+                for start, lines, end in iter_fdt_blocks(f, offset):
+                    fields = parse_fdt_block(lines)
+                    fields.update(source="fdt", kind="download", mac=mac,
+                                  log_path=key, log_offset=start)
+                    before = self.db.total_changes
+                    self._insert(fields)
+                    added += self.db.total_changes - before
+                    offset = end
+            self.db.execute(
+                "INSERT OR REPLACE INTO ingest_offsets (path, offset, size, updated) VALUES (?, ?, ?, ?)",
+                (key, offset, size, _now()))
+            self.db.commit()
+        return added
+
+    def ingest_conf(self, path):
+        """Snapshot the [STATISTICS] pass/fail counters of multi_download.conf."""
+        conf = configparser.ConfigParser()
+        conf.read(path)
+        if not conf.has_section("STATISTICS"):
+            return 0
+        stats = conf["STATISTICS"]
+        download = conf["DOWNLOAD"] if conf.has_section("DOWNLOAD") else {}
+        rows = []
+        for slot in range(1, 65):
+            if f"pass{slot}" not in stats:
+                break
+            baud = download.get(f"baudrate{slot}", "0")
+            rows.append((os.path.abspath(path), slot, download.get(f"com_port{slot}") or None,
+                         int(baud) if baud.isdigit() and int(baud) else None,
+                         stats.getint(f"pass{slot}", 0), stats.getint(f"fail{slot}", 0), _now()))
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO slot_counters VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        return len(rows)
+
+    def ingest(self, paths):
+        """Ingest log files, log folders and .conf files. Returns {path: count}."""
+        counts = {}
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.lower().endswith(".txt"):
+                        full = os.path.join(path, name)
+                        counts[full] = self.ingest_log(full)
+            elif path.lower().endswith(".conf"):
+                counts[path] = self.ingest_conf(path)
+            else:
+                counts[path] = self.ingest_log(path)
+        return counts
+
+    def record(self, kind, port, ok, session=None, bytes_written=None, seconds=None,
+               total_seconds=None, baud=None, detail=None):
+        """Store one espROMkit run. Never raises: statistics must not fail a flash."""
+        geometry = getattr(session, "geometry", None)
+        flash_id = geometry.flash_id if geometry is not None else None
+        row = {
+            "source": "espromkit", "kind": kind, "started": _now(),
+            "mac": (getattr(session, "mac", None) or "").replace(":", "").upper() or None,
+            "port": port, "adapter": self.adapters.get(port), "baud": baud,
+            "flash_id": flash_id, "flash_chip": chip_name(flash_id),
+            "bytes": bytes_written, "seconds": seconds, "total_seconds": total_seconds,
+            "result": "PASS" if ok else "FAIL", "detail": detail,
+        }
+        try:
+            with self._lock:
+                self._insert(row)
+                self.db.commit()
+        except sqlite3.Error:
+            pass
+
+    # ------------------------------------------------------------ queries
+    def throughput(self, by="adapter"):
+        """Rows of (key, runs, passed, failed, bytes, kbit/s) grouped by `by`."""
+        if by not in GROUPS:
+            raise ValueError(f"Unknown grouping '{by}' (one of {', '.join(GROUPS)})")
+        key = GROUPS[by]
+        return self.db.execute(f"""
+            SELECT {key} AS k, COUNT(*),
+                   SUM(result = 'PASS'), SUM(result != 'PASS'),
+                   COALESCE(SUM(CASE WHEN result = 'PASS' THEN bytes END), 0),
+                   SUM(CASE WHEN result = 'PASS' AND seconds > 0 THEN bytes END) * 8.0 / 1000
+                     / SUM(CASE WHEN result = 'PASS' AND seconds > 0 AND bytes IS NOT NULL
+                                THEN seconds END)
+            FROM operations GROUP BY k ORDER BY COUNT(*) DESC
+        """).fetchall()
+
+    def slot_counters(self):
+        return self.db.execute(
+            "SELECT conf, slot, port, baud, passed, failed FROM slot_counters "
+            "WHERE passed + failed > 0 OR port IS NOT NULL ORDER BY conf, slot").fetchall()
+
+
+def format_throughput(rows, by):
+    lines = [f"  {by:28s} {'runs':>5s} {'pass':>5s} {'fail':>5s} {'MB written':>11s} {'kbit/s':>8s}"]
+    for key, runs, passed, failed, written, kbps in rows:
+        rate = f"{kbps:8.1f}" if kbps else f"{'-':>8s}"
+        lines.append(f"  {str(key if key is not None else '?')[:28]:28s} {runs:5d} {passed or 0:5d} "
+                     f"{failed or 0:5d} {written / 1e6:11.2f} {rate}")
+    return lines
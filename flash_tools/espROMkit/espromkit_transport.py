@@ -0,0 +1,488 @@
+"""
+espROMkit transport — record a serial session and replay it without hardware.
+
+Every port the tool opens (esptool runs, DeviceSession, boot checks) goes
+through pyserial's serial_for_url(), so two URL handlers are enough to
+sit under all of them:
+
+  record://PORT   the real port, with every call logged to a transcript
+  replay://PORT   no device at all: answers come from the transcript
+
+start_recording() / start_replay() select the mode and port_url() turns
+a plain port name into the matching URL; the CLI does both for
+--record FILE / --replay FILE.
+
+The transcript is a compact binary log. After a 13-byte header, each
+event is an 11-byte header (kind, channel, microseconds since the
+previous event, payload length) and its payload:
+
+  OPEN   port name and baud      a channel is one open..close of a port
+  WRITE  length and CRC32        host data is checked, not stored
+  READ   the bytes returned      flagged READY when they were already
+                                 waiting (the host did not wait for them)
+  BAUD / DTR / RTS               control changes, for the record
+  PORTS  the port list (JSON)    so detection works on replay
+
+Replay is driven by the host's writes. Each recorded WRITE must match in
+length and CRC; a mismatch raises SerialException ("diverged"), which is
+the regression signal. Device bytes that followed a write are released
+after it: READY bytes at once, the others after the recorded delay
+divided by `speed` (0 = no delays), so device latency is reproduced or
+compressed while the host's own sleeps and timeouts stay real. Reads
+that found nothing are not logged: a replayed read with nothing due
+simply times out, as it would on the wire.
+"""
+
+import errno
+import json
+import struct
+import sys
+import threading
+import time
+import types
+import zlib
+
+import serial
+import serial.tools.list_ports
+
+
+MAGIC = b"ESRT"
+VERSION = 1
+HEADER = struct.Struct("<4sBd")         # magic, version, start time
+EVENT = struct.Struct("<BHII")          # kind, channel, dt (us), payload length
+
+OPEN, CLOSE, WRITE, READ, BAUD, DTR, RTS, PORTS = range(1, 9)
+READY = 0x80                            # flag on READ: data was already waiting
+KIND_MASK = 0x7F
+
+_lock = threading.Lock()
+_recorder = None
+_transcript = None
+
+
+class TranscriptError(Exception):
+    """A transcript file is missing, truncated or not a transcript."""
+
+
+# ------------------------------------------------------------------ record
+class TranscriptWriter:
+    """Appends events to a transcript file. Shared by every recorded port."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "wb")
+        self.start = time.time()
+        self.last = self.start
+        self.channels = 0
+        self.events = 0
+        self._lock = threading.Lock()
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.start))
+
+    def add(self, kind, channel, payload=b""):
+        with self._lock:
+            if self.f.closed:
+                return
+            now = time.time()
+            dt = min(int((now - self.last) * 1e6), 0xFFFFFFFF)
+            self.last = now
+            self.f.write(EVENT.pack(kind, channel, dt, len(payload)))
+            self.f.write(payload)
+            self.events += 1
+
+    def open_channel(self, port, baud):
+        with self._lock:
+            self.channels += 1
+            channel = self.channels
+        self.add(OPEN, channel, struct.pack("<I", baud) + port.encode())
+        return channel
+
+    def flush(self):
+        with self._lock:
+            if not self.f.closed:
+                self.f.flush()
+
+    def close(self):
+        with self._lock:
+            if not self.f.closed:
+                self.f.close()
+
+
+class RecordingSerial(serial.Serial):
+    """The native port, with every call logged to the active TranscriptWriter."""
+
+    def __init__(self, *args, **kwargs):
+        self._channel = None
+        super().__init__(*args, **kwargs)
+
+    @serial.Serial.port.setter
+    def port(self, value):
+        if value is not None and value.lower().startswith("record://"):
+            value = value[len("record://"):]
+        serial.Serial.port.__set__(self, value)
+
+    def open(self):
+        super().open()
+        if _recorder is not None:
+            self._channel = _recorder.open_channel(self.port, self.baudrate)
+
+    def close(self):
+        if self._channel is not None:
+            _recorder.add(CLOSE, self._channel)
+            _recorder.flush()
+            self._channel = None
+        super().close()
+
+    def write(self, data):
+        data = bytes(data)
+        n = super().write(data)
+        if self._channel is not None:
+            _recorder.add(WRITE, self._channel, struct.pack("<II", len(data), zlib.crc32(data)))
+        return n
+
+    def read(self, size=1):
+        ready = self.is_open and super().in_waiting > 0
+        data = super().read(size)
+        if data and self._channel is not None:
+            _recorder.add(READ | (READY if ready else 0), self._channel, data)
+        return data
+
+    @serial.Serial.baudrate.setter
+    def baudrate(self, value):
+        serial.Serial.baudrate.__set__(self, value)
+        if self._channel is not None:
+            _recorder.add(BAUD, self._channel, struct.pack("<I", value))
+
+    @serial.Serial.dtr.setter
+    def dtr(self, level):
+        serial.Serial.dtr.__set__(self, level)
+        if self._channel is not None:
+            _recorder.add(DTR, self._channel, bytes([bool(level)]))
+
+    @serial.Serial.rts.setter
+    def rts(self, level):
+        serial.Serial.rts.__set__(self, level)
+        if self._channel is not None:
+            _recorder.add(RTS, self._channel, bytes([bool(level)]))
+
+
+# ------------------------------------------------------------------ replay
+class Channel:
+    """One recorded open..close of a port, reduced to its WRITE/READ sequence."""
+
+    def __init__(self, number, port, baud, opened):
+        self.number = number
+        self.port = port
+        self.baud = baud
+        self.opened = opened
+        self.closed = opened
+        self.items = []             # (kind, delay, payload); delay is 0 for READY reads
+        self._last = opened
+
+    def add(self, kind, t, payload, ready):
+        if kind == WRITE:
+            self.items.append((WRITE, 0.0, struct.unpack("<II", payload)))
+        elif kind == READ:
+            self.items.append((READ, 0.0 if ready else t - self._last, payload))
+        else:
+            return
+        self._last = t
+
+    @property
+    def writes(self):
+        return sum(1 for kind, _, _ in self.items if kind == WRITE)
+
+    @property
+    def duration(self):
+        return self.closed - self.opened
+
+
+class Transcript:
+    """A transcript loaded for replay. Channels are handed out per port in order."""
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.channels = []
+        self.port_lists = []
+        self.results = []           # (channel, writes matched, bytes read, seconds)
+        self._unclaimed = {}        # port -> [Channel, ...]
+        self._port_list_index = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise TranscriptError(f"Cannot read {self.path}: {e}")
+        if len(data) < HEADER.size or data[:4] != MAGIC:
+            raise TranscriptError(f"{self.path} is not an espROMkit transcript")
+        _, version, t = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise TranscriptError(f"{self.path}: unsupported transcript version {version}")
+        self.started = t
+        open_channels = {}
+        pos = HEADER.size
+        while pos + EVENT.size <= len(data):
+            kind, number, dt, length = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            payload = data[pos:pos + length]
+            pos += length
+            t += dt / 1e6
+            base = kind & KIND_MASK
+            if base == OPEN:
+                baud, = struct.unpack_from("<I", payload)
+                channel = Channel(number, payload[4:].decode(), baud, t)
+                open_channels[number] = channel
+                self.channels.append(channel)
+                self._unclaimed.setdefault(channel.port, []).append(channel)
+            elif base == PORTS:
+                self.port_lists.append(json.loads(payload))
+            elif number in open_channels:
+                channel = open_channels[number]
+                channel.closed = t
+                channel.add(base, t, payload, kind & READY)
+        # A transcript cut short (tool killed) still replays up to its end.
+
+    def claim(self, port):
+        with self._lock:
+            queue = self._unclaimed.get(port)
+            if not queue:
+                raise serial.SerialException(
+                    f"replay: no recorded session left for {port} in {self.path}")
+            return queue.pop(0)
+
+    def next_port_list(self):
+        with self._lock:
+            if not self.port_lists:
+                return []
+            index = min(self._port_list_index, len(self.port_lists) - 1)
+            self._port_list_index += 1
+            return self.port_lists[index]
+
+    def report(self, channel, matched, received, seconds):
+        with self._lock:
+            self.results.append((channel, matched, received, seconds))
+
+
+class ReplaySerial(serial.SerialBase):
+    """A port with no device behind it, answering from the active Transcript."""
+
+    def __init__(self, *args, **kwargs):
+        self._channel = None
+        super().__init__(*args, **kwargs)
+
+    @serial.SerialBase.port.setter
+    def port(self, value):
+        if value is not None and value.lower().startswith("replay://"):
+            value = value[len("replay://"):]
+        serial.SerialBase.port.__set__(self, value)
+
+    def open(self):
+        if self.is_open:
+            raise serial.SerialException("Port is already open.")
+        if _transcript is None:
+            raise serial.SerialException("replay: no transcript loaded")
+        self._channel = _transcript.claim(self.port)
+        self._index = 0
+        self._matched = 0
+        self._received = 0
+        self._buffer = bytearray()
+        self._opened = self._clock = time.time()
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            _transcript.report(self._channel, self._matched, self._received,
+                               time.time() - self._opened)
+        super().close()
+
+    def _reconfigure_port(self):
+        pass
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def fileno(self):
+        # esptool's tight reset ioctl()s the fd; ENOTTY makes it carry on.
+        raise OSError(errno.ENOTTY, "replayed port has no file descriptor")
+
+    def _due(self):
+        """Time the next READ item is released, or None if a WRITE comes first."""
+        items = self._channel.items
+        if self._index >= len(items) or items[self._index][0] != READ:
+            return None
+        delay = items[self._index][1]
+        return self._clock + (delay / _transcript.speed if _transcript.speed else 0.0)
+
+    def _pump(self, force=False):
+        items = self._channel.items
+        while True:
+            due = self._due()
+            if due is None or (not force and time.time() < due):
+                return
+            _, delay, data = items[self._index]
+            self._buffer += data
+            self._received += len(data)
+            # Gated bytes advance the device clock exactly; the next delay
+            # after bytes that were already waiting counts from now.
+            self._clock = due if delay and not force else time.time()
+            self._index += 1
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        self._pump()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        deadline = None if self._timeout is None else time.time() + self._timeout
+        while True:
+            self._pump()
+            if len(self._buffer) >= size:
+                break
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                break
+            due = self._due()
+            if due is None and deadline is None:
+                raise serial.SerialException(
+                    f"replay: read on {self.port} would block forever "
+                    f"(transcript channel {self._channel.number} has no more data)")
+            wake = min(t for t in (due, deadline) if t is not None)
+            time.sleep(min(max(wake - now, 0.0), 0.05))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        data = bytes(data)
+        self._pump(force=True)      # bytes recorded before this write were read before it
+        items = self._channel.items
+        number = self._matched + 1
+        if self._index >= len(items):
+            raise serial.SerialException(
+                f"replay of {self.port} diverged at write #{number}: "
+                f"{len(data)} bytes sent, the recording had no more writes")
+        length, crc = items[self._index][2]
+        if (length, crc) != (len(data), zlib.crc32(data)):
+            raise serial.SerialException(
+                f"replay of {self.port} diverged at write #{number}: sent {len(data)} bytes "
+                f"(crc {zlib.crc32(data):08x}), recorded {length} bytes (crc {crc:08x})")
+        self._index += 1
+        self._matched += 1
+        self._clock = time.time()
+        return len(data)
+
+    def reset_input_buffer(self):
+        # Bytes flushed while recording never reached a READ, so nothing
+        # in the transcript may be dropped here.
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    @property
+    def out_waiting(self):
+        return 0
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
+
+
+# --------------------------------------------------------------- selection
+def _register():
+    """Make record:// and replay:// known to serial_for_url()."""
+    for scheme, cls in (("record", RecordingSerial), ("replay", ReplaySerial)):
+        module = types.ModuleType(f"{__name__}.protocol_{scheme}")
+        module.Serial = cls
+        sys.modules[module.__name__] = module
+    if __name__ not in serial.protocol_handler_packages:
+        serial.protocol_handler_packages.append(__name__)
+
+
+def start_recording(path):
+    global _recorder
+    _register()
+    _recorder = TranscriptWriter(path)
+    return _recorder
+
+
+def start_replay(path, speed=1.0):
+    global _transcript
+    _register()
+    _transcript = Transcript(path, speed)
+    return _transcript
+
+
+def port_url(port):
+    """`port` as opened under the active mode (unchanged when neither is on)."""
+    if not isinstance(port, str) or "://" in port:
+        return port
+    if _recorder is not None:
+        return "record://" + port
+    if _transcript is not None:
+        return "replay://" + port
+    return port
+
+
+def comports():
+    """serial.tools.list_ports.comports(), recorded or replayed like the ports."""
+    if _transcript is not None:
+        return [types.SimpleNamespace(**entry) for entry in _transcript.next_port_list()]
+    ports = serial.tools.list_ports.comports()
+    if _recorder is not None:
+        listing = [{"device": p.device, "description": p.description, "hwid": p.hwid,
+                    "vid": p.vid, "pid": p.pid} for p in ports]
+        _recorder.add(PORTS, 0, json.dumps(listing).encode())
+    return ports
+
+
+def finish():
+    """Stop recording or replaying. Returns report lines."""
+    global _recorder, _transcript
+    lines = []
+    if _recorder is not None:
+        _recorder.close()
+        lines.append(f"  Recorded {_recorder.channels} port session(s), "
+                     f"{_recorder.events} events to {_recorder.path}")
+        _recorder = None
+    if _transcript is not None:
+        replayed = {id(channel) for channel, _, _, _ in _transcript.results}
+        for channel, matched, received, seconds in _transcript.results:
+            lines.append(f"  Replay {channel.port} #{channel.number}: {matched}/{channel.writes} writes, "
+                         f"{received:,} bytes in {seconds:.2f}s (recorded {channel.duration:.2f}s)")
+        left = [c for c in _transcript.channels if id(c) not in replayed]
+        if left:
+            lines.append(f"  {len(left)} recorded session(s) were not replayed")
+        _transcript = None
+    return lines
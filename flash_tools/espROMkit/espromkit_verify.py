@@ -0,0 +1,197 @@
+"""
+espROMkit post-write verification — compare flash to local images by MD5.
+
+Instead of reading a region back over serial, the device hashes its own
+flash (the stub's SPI_FLASH_MD5 command) and only 16-byte digests cross
+the wire, which keeps a 4 MB check to a few hundred milliseconds. A
+mismatch is narrowed down per 64 KB block and then per 4 KB sector, so the
+report names exact sector ranges and a repair re-writes only those.
+"""
+
+import hashlib
+import time
+
+from espromkit_session import DEVICE_ERRORS, SECTOR_SIZE, DeviceSession
+
+
+BLOCK_SIZE = 0x10000
+IMAGE_MAGIC = 0xE9
+
+
+class RegionCheck:
+    """Verification result for one image written at one offset."""
+
+    def __init__(self, offset, path, data):
+        self.offset = offset
+        self.path = path
+        self.data = data
+        self.mismatches = []    # [(start, end)] absolute flash addresses
+
+    @property
+    def ok(self):
+        return not self.mismatches
+
+    @property
+    def end(self):
+        return self.offset + len(self.data)
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def image_length(data):
+    """Length of an ESP app/bootloader image incl. checksum and digest."""
+    pos = 24
+    for _ in range(data[1]):
+        if pos + 8 > len(data):
+            return None
+        seg_len = int.from_bytes(data[pos + 4:pos + 8], "little")
+        pos += 8 + seg_len
+    pos = (pos + 16) & ~15          # checksum byte sits at the end of 16-byte padding
+    if data[23] == 1:               # hash_appended
+        pos += 32
+    return pos if pos <= len(data) else None
+
+
+def _patched_ranges(offset, data, bootloader_offset):
+    """Byte ranges esptool rewrites when flashing a bootloader image.
+
+    write_flash stamps --flash_mode/--flash_freq/--flash_size into header
+    bytes 2-3 and, if the image carries a SHA-256 digest, recomputes it.
+    """
+    if offset != bootloader_offset or len(data) < 24 or data[0] != IMAGE_MAGIC:
+        return []
+    ranges = [(2, 4)]
+    length = image_length(data)
+    if data[23] == 1 and length:
+        ranges.append((length - 32, length))
+    return ranges
+
+
+def _adopt_patched_bytes(session, offset, data):
+    """Copy esptool-patched header bytes from flash into the local image."""
+    ranges = _patched_ranges(offset, data, session.bootloader_offset)
+    if not ranges:
+        return data
+    data = bytearray(data)
+    for start, end in ranges:
+        sector = start - start % SECTOR_SIZE
+        length = min(SECTOR_SIZE, len(data) - sector)
+        flash = session.read_flash(offset + sector, length)
+        data[start:end] = flash[start - sector:end - sector]
+    return bytes(data)
+
+
+def _windows(start, end, step):
+    """Split [start, end) at absolute flash addresses that are multiples of `step`."""
+    windows = []
+    while start < end:
+        stop = min(end, start - start % step + step)
+        windows.append((start, stop))
+        start = stop
+    return windows
+
+
+def _coalesce(ranges):
+    """Merge sorted, possibly adjacent (start, end) ranges."""
+    merged = []
+    for start, end in ranges:
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def diff_region(session, offset, data):
+    """Return [(start, end)] flash ranges where flash differs from `data`.
+
+    One MD5 covers the whole region when it matches; otherwise only
+    mismatching 64 KB blocks are split into 4 KB sectors. Blocks and
+    sectors are those of the flash, not of `data`, so for an unaligned
+    offset or a partial last sector the first and last ranges are clipped
+    to the image.
+    """
+    if session.flash_md5(offset, len(data)) == _md5(data):
+        return []
+
+    def differs(start, end):
+        return session.flash_md5(start, end - start) != _md5(data[start - offset:end - offset])
+
+    bad = []
+    for block in _windows(offset, offset + len(data), BLOCK_SIZE):
+        if differs(*block):
+            bad.extend(w for w in _windows(*block, SECTOR_SIZE) if differs(*w))
+    return _coalesce(bad)
+
+
+def verify_images(session, images, log=print):
+    """Check each (offset, path) against flash. Returns [RegionCheck]."""
+    checks = []
+    for offset, path in images:
+        with open(path, "rb") as f:
+            data = f.read()
+        check = RegionCheck(offset, path, _adopt_patched_bytes(session, offset, data))
+        t = time.time()
+        check.mismatches = diff_region(session, offset, check.data)
+        ms = (time.time() - t) * 1000
+        if check.ok:
+            log(f"  Verified 0x{offset:X}..0x{check.end:X} ({len(data):,} bytes) "
+                f"in {ms:.0f} ms")
+        else:
+            _log_mismatches(check, log)
+        checks.append(check)
+    return checks
+
+
+def repair_images(session, checks, log=print):
+    """Re-write only the mismatching sectors, then re-check them."""
+    for check in checks:
+        if check.ok:
+            continue
+        still_bad = []
+        for start, end in check.mismatches:
+            piece = check.data[start - check.offset:end - check.offset]
+            log(f"  Re-writing 0x{start:X}..0x{end:X} ({len(piece):,} bytes)")
+            _write_sectors(session, start, piece)
+            still_bad.extend(diff_region(session, start, piece))
+        check.mismatches = still_bad
+        if check.ok:
+            log(f"  Repaired {check.path}")
+        else:
+            _log_mismatches(check, log)
+    return checks
+
+
+def _write_sectors(session, start, piece):
+    """Write `piece` at `start`, keeping the rest of its first and last sectors.
+
+    A flash write erases whole sectors, so the bytes around a range that
+    does not start or end on a sector boundary are read back first.
+    """
+    end = start + len(piece)
+    lo = start - start % SECTOR_SIZE
+    hi = -(-end // SECTOR_SIZE) * SECTOR_SIZE
+    if (lo, hi) != (start, end):
+        sectors = bytearray(session.read_flash(lo, hi - lo))
+        sectors[start - lo:end - lo] = piece
+        piece = bytes(sectors)
+    session.write_flash(lo, piece)
+
+
+def _log_mismatches(check, log):
+    total = sum(end - start for start, end in check.mismatches)
+    log(f"  MISMATCH: {check.path} differs from flash in "
+        f"{len(check.mismatches)} range(s), {total:,} bytes:")
+    for start, end in check.mismatches:
+        sectors = (end - 1) // SECTOR_SIZE - start // SECTOR_SIZE + 1
+        log(f"    0x{start:06X}..0x{end:06X}  ({sectors} sector(s))")
+
+
+def open_verify_session(port, baud):
+    """Attach to the stub a no_reset write left running, else reconnect."""
+    try:
+        return DeviceSession(port, baud, before="no_reset").connect()
+    except DEVICE_ERRORS:
+        return DeviceSession(port, baud).connect()
@@ -0,0 +1,49 @@
+"""
+Shared fixtures. The modules live one folder up and import each other by
+their plain names, as they do when the CLI or GUI is run from there.
+
+Tests that talk to a device use espromkit_fakedevice: a pty that answers
+the ROM and stub protocol, so no hardware is needed.
+"""
+
+import hashlib
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from espromkit_fakedevice import FakeDevice     # noqa: E402
+from espromkit_session import DeviceSession     # noqa: E402
+
+from espromkit_partitions import ENTRY_MAGIC, MD5_MAGIC  # noqa: E402
+
+FLASH_SIZE = 0x200000
+FLASH_ID = 0x1540C8             # GigaDevice 2MB, matching FLASH_SIZE
+BAUD = 921600
+
+
+@pytest.fixture
+def device():
+    """A 2 MB fake ESP32, erased."""
+    dev = FakeDevice(flash_size=FLASH_SIZE, flash_id=FLASH_ID)
+    yield dev
+    dev.close()
+
+
+@pytest.fixture
+def session(device):
+    """A connected DeviceSession on the fake device."""
+    with DeviceSession(device.port, BAUD) as s:
+        yield s
+
+
+def partition_table(*entries):
+    """Raw partition table bytes for (label, type, subtype, offset, size) entries."""
+    data = b"".join(ENTRY_MAGIC + struct.pack("<BBII16sI", ptype, subtype, offset, size,
+                                              label.encode(), 0)
+                    for label, ptype, subtype, offset, size in entries)
+    data += MD5_MAGIC + b"\xff" * 14 + hashlib.md5(data).digest()
+    return data + b"\xff" * (0xC00 - len(data))
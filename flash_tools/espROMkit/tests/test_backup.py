@@ -0,0 +1,197 @@
+"""espromkit_backup: the journal, retries, cancel and resume."""
+
+import hashlib
+import os
+import threading
+
+import pytest
+
+import espromkit_backup
+from espromkit_backup import (
+    BackupCancelled, BackupJournal, backup_region, journal_path, part_path, pending_backup,
+)
+from espromkit_cli import _make_filename, _pending_backups
+
+from conftest import BAUD
+
+CHUNK = 0x1000
+
+
+class FlashReader:
+    """Just enough of a DeviceSession for backup_region: reads of a bytearray.
+
+    `fail_at` lists read offsets that raise once, like a dropped USB link.
+    """
+
+    def __init__(self, data, mac="aa:bb:cc:dd:ee:ff", fail_at=()):
+        self.flash = bytearray(data)
+        self.mac = mac
+        self.fail_at = list(fail_at)
+        self.connected = False
+        self.reads = []
+        self.connects = 0
+
+    def connect(self):
+        self.connected = True
+        self.connects += 1
+        return self
+
+    def close(self):
+        self.connected = False
+
+    def read_flash(self, offset, size):
+        if offset in self.fail_at:
+            self.fail_at.remove(offset)
+            raise OSError("device reports readiness to read but returned no data")
+        self.reads.append(offset)
+        return bytes(self.flash[offset:offset + size])
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(espromkit_backup, "RETRY_DELAY", 0)
+
+
+def _backup(reader, path, offset=0, size=None, **kwargs):
+    size = len(reader.flash) - offset if size is None else size
+    return backup_region(None, offset, size, path, 0, chunk_size=CHUNK,
+                         log=lambda line: None, session=reader, **kwargs)
+
+
+def _pattern(size):
+    return bytes(i * 7 % 251 for i in range(size))
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "full.bin")
+    journal = BackupJournal(path, 0x1000, 0x2800, CHUNK, mac="aa:bb")
+    journal.chunks = ["0" * 32, "1" * 32]
+    journal.save()
+
+    loaded = BackupJournal.load(path)
+    assert (loaded.offset, loaded.size, loaded.chunk_size, loaded.mac) == (0x1000, 0x2800, CHUNK, "aa:bb")
+    assert loaded.chunks == journal.chunks
+    assert loaded.next_chunk() == (0x3000, 0x800)
+    assert not os.path.exists(journal_path(path) + ".tmp")
+
+
+def test_missing_or_corrupt_journal_loads_as_none(tmp_path):
+    path = str(tmp_path / "full.bin")
+    assert BackupJournal.load(path) is None
+    with open(journal_path(path), "w") as f:
+        f.write("{not json")
+    assert BackupJournal.load(path) is None
+
+
+def test_check_part_file_keeps_chunks_up_to_first_bad_one(tmp_path):
+    path = str(tmp_path / "full.bin")
+    chunks = [bytes([i]) * CHUNK for i in range(3)]
+    journal = BackupJournal(path, 0, 3 * CHUNK, CHUNK)
+    journal.chunks = [hashlib.md5(c).hexdigest() for c in chunks]
+    with open(part_path(path), "wb") as f:
+        f.write(chunks[0] + b"\xee" * CHUNK + chunks[2])
+    journal.check_part_file()
+    assert journal.chunks == [hashlib.md5(chunks[0]).hexdigest()]
+
+    os.remove(part_path(path))
+    journal.check_part_file()
+    assert journal.chunks == []
+
+
+def test_pending_backup_only_matches_the_same_region(tmp_path):
+    path = str(tmp_path / "full.bin")
+    BackupJournal(path, 0, 0x4000, CHUNK).save()
+    assert pending_backup(path, 0x1000, 0x4000) is None
+    assert pending_backup(path, 0, 0x4000) is not None
+
+
+def test_backup_writes_file_and_removes_journal(tmp_path):
+    path = str(tmp_path / "full.bin")
+    reader = FlashReader(_pattern(0x3800))
+    progress = []
+    assert _backup(reader, path, progress_fn=lambda done, total: progress.append(done))
+    with open(path, "rb") as f:
+        assert f.read() == bytes(reader.flash)
+    assert progress == [0x1000, 0x2000, 0x3000, 0x3800]
+    assert not os.path.exists(journal_path(path))
+    assert not os.path.exists(part_path(path))
+
+
+def test_dropped_read_reconnects_and_continues(tmp_path):
+    path = str(tmp_path / "full.bin")
+    reader = FlashReader(_pattern(0x4000), fail_at=[0x2000, 0x2000])
+    assert _backup(reader, path)
+    with open(path, "rb") as f:
+        assert f.read() == bytes(reader.flash)
+    assert reader.connects == 3
+    assert reader.reads == [0x0, 0x1000, 0x2000, 0x3000]
+
+
+def test_too_many_retries_keeps_progress(tmp_path):
+    path = str(tmp_path / "full.bin")
+    reader = FlashReader(_pattern(0x4000), fail_at=[0x2000] * 3)
+    assert not _backup(reader, path, retries=2)
+    assert BackupJournal.load(path).done_bytes == 0x2000
+
+
+def test_cancel_keeps_journal_and_resume_reads_only_the_rest(tmp_path):
+    path = str(tmp_path / "full.bin")
+    reader = FlashReader(_pattern(0x5000))
+    cancel = threading.Event()
+
+    def progress(done, total):
+        if done == 0x2000:
+            cancel.set()
+
+    with pytest.raises(BackupCancelled):
+        _backup(reader, path, cancel_event=cancel, progress_fn=progress)
+    assert pending_backup(path, 0, 0x5000).done_bytes == 0x2000
+
+    reader.reads = []
+    assert _backup(reader, path)
+    assert reader.reads == [0x2000, 0x3000, 0x4000]
+    with open(path, "rb") as f:
+        assert f.read() == bytes(reader.flash)
+
+
+def test_resume_refuses_a_different_device(tmp_path):
+    path = str(tmp_path / "full.bin")
+    cancel = threading.Event()
+    with pytest.raises(BackupCancelled):
+        _backup(FlashReader(_pattern(0x3000)), path, cancel_event=cancel,
+                progress_fn=lambda done, total: cancel.set())
+    assert not _backup(FlashReader(_pattern(0x3000), mac="11:22:33:44:55:66"), path)
+    assert BackupJournal.load(path).done_bytes == CHUNK
+
+
+def test_cli_offers_interrupted_backups_by_kind(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    info = {"mac": "aa:bb:cc:dd:ee:ff"}
+    for name in ("aabbccddeeff_20260101_000000_app.bin",
+                 "aabbccddeeff_20260102_000000_app.bin",
+                 "aabbccddeeff_20260101_000000_full.bin",
+                 "112233445566_20260101_000000_full.bin"):
+        BackupJournal(name, 0, CHUNK, CHUNK).save()
+    assert _pending_backups(info) == {
+        "app": "aabbccddeeff_20260102_000000_app.bin",
+        "full": "aabbccddeeff_20260101_000000_full.bin",
+    }
+    assert _make_filename(info, "full").startswith("aabbccddeeff_2")
+    assert _make_filename(info, "full") not in _pending_backups(info).values()
+
+
+def test_resume_on_device(device, tmp_path):
+    path = str(tmp_path / "app.bin")
+    device.flash[0x10000:0x30000] = _pattern(0x20000)
+    cancel = threading.Event()
+    with pytest.raises(BackupCancelled):
+        backup_region(device.port, 0x10000, 0x20000, path, BAUD, chunk_size=0x8000,
+                      cancel_event=cancel, progress_fn=lambda done, total: cancel.set(),
+                      log=lambda line: None)
+
+    log = []
+    assert backup_region(device.port, 0x10000, 0x20000, path, BAUD, chunk_size=0x8000,
+                         log=log.append)
+    assert log[0].strip().startswith("Resuming from 0x18000")
+    with open(path, "rb") as f:
+        assert f.read() == bytes(device.flash[0x10000:0x30000])
@@ -0,0 +1,93 @@
+import pytest
+
+import espromkit_cli
+from espromkit_bootcheck import BootResult, RingBuffer, StreamMatcher
+
+CRASH = BootResult("/dev/null", False, "Guru Meditation Error", 0.4,
+                   b"rst:0x1\r\nGuru Meditation Error: Core 0 panic'ed\r\n")
+BOOTED = BootResult("/dev/null", True, "no crash in 2s", 2.0, b"")
+
+
+def _feed(matcher, *chunks):
+    result = None
+    for chunk in chunks:
+        result = matcher.feed(chunk)
+    return result
+
+
+def test_expected_string_split_across_reads():
+    matcher = StreamMatcher(expect="setup done")
+    assert _feed(matcher, b"rst:0x1 (POWERON)\r\nboot: ", b"se", b"tup d") is None
+    assert matcher.feed(b"one\r\n") == (True, "found 'setup done'")
+
+
+def test_crash_signature_split_across_reads():
+    matcher = StreamMatcher(expect="setup done")
+    assert _feed(matcher, b"Guru Medit", b"ation Error: Core 0") == (False, "Guru Meditation Error")
+    assert matcher.feed(b"setup done") == (False, "Guru Meditation Error")
+
+
+def test_second_reset_is_a_boot_loop():
+    matcher = StreamMatcher()
+    assert matcher.feed(b"rst:0x1\r\n") is None
+    assert matcher.resets == 1
+    assert matcher.feed(b"boot:0x13\r\n") is None
+    assert matcher.resets == 1      # the first banner, still in the tail, is not counted again
+    assert _feed(matcher, b"rs", b"t:0xc (SW_CPU_RESET)") == (False, "boot loop (2 resets)")
+
+
+def test_resets_in_one_read_are_all_counted():
+    matcher = StreamMatcher(max_resets=2)
+    assert matcher.feed(b"rst:0x1\r\nrst:0x3\r\n") is None
+    assert matcher.feed(b"rst:0x3\r\n") == (False, "boot loop (3 resets)")
+
+
+@pytest.mark.parametrize("chunks", [
+    [b"abcdef"],
+    [b"abc", b"def", b"ghij"],
+    [b"0123456789abcdefXYZ"],
+    [b"ab", b"cdefgh", b"i", b"jklmnop"],
+])
+def test_ring_buffer_keeps_the_last_bytes(chunks):
+    ring = RingBuffer(8)
+    for chunk in chunks:
+        ring.write(chunk)
+    assert ring.getvalue() == b"".join(chunks)[-8:]
+
+
+def test_ring_buffer_wraps_in_place():
+    ring = RingBuffer(8)
+    ring.write(b"123456")
+    ring.write(b"abcd")
+    assert ring.pos == 2
+    assert bytes(ring.buf) == b"cd3456ab"
+    assert ring.getvalue() == b"3456abcd"
+
+
+def _reboot(monkeypatch, capsys, result):
+    monkeypatch.setattr(espromkit_cli, "check_boot", lambda port, timeout: result)
+    ok = espromkit_cli.reboot_device("/dev/null")
+    return ok, capsys.readouterr().out
+
+
+def test_reboot_reports_a_crash(monkeypatch, capsys):
+    ok, out = _reboot(monkeypatch, capsys, CRASH)
+    assert not ok
+    assert "rebooted successfully" not in out
+    assert "Guru Meditation" in out
+
+
+def test_reboot_success(monkeypatch, capsys):
+    ok, out = _reboot(monkeypatch, capsys, BOOTED)
+    assert ok
+    assert "rebooted successfully" in out
+
+
+@pytest.mark.parametrize("action, ok", [("backup", True), ("restore", False)])
+def test_crash_after_reset_fails_only_a_restore(monkeypatch, capsys, action, ok):
+    for name, value in [("select_port", "/dev/null"), ("get_chip_info", {}),
+                        ("confirm_device", None), ("choose_action", action),
+                        ("do_backup", True), ("do_restore", True), ("check_boot", CRASH)]:
+        monkeypatch.setattr(espromkit_cli, name, lambda *args, value=value, **kwargs: value)
+    assert espromkit_cli.run_wizard() is ok
+    assert "did not boot cleanly" in capsys.readouterr().out
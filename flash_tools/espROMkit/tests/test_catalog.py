@@ -0,0 +1,102 @@
+import os
+import struct
+
+import pytest
+
+from espromkit_catalog import (
+    APP_DESC_FORMAT, APP_DESC_MAGIC, APP_DESC_OFFSET, Catalog, normalize_mac, read_app_desc,
+)
+
+
+def app_image(project, version, idf="v5.1.2"):
+    """Just the part of an app image read_app_desc looks at."""
+    desc = struct.pack(APP_DESC_FORMAT, APP_DESC_MAGIC, 2, version.encode(), project.encode(),
+                       b"12:00:00", b"Mar  1 2024", idf.encode(), bytes(range(32)))
+    return bytes([0xE9, 4]) + bytes(APP_DESC_OFFSET - 2) + desc + b"\xff" * 64
+
+
+@pytest.fixture
+def catalog():
+    with Catalog(":memory:") as c:
+        yield c
+
+
+def _backup(tmp_path, name, mac, project, version, age, chip="ESP32-D0WD-V3", partitions=()):
+    path = tmp_path / name
+    path.write_bytes(b"backup")
+    t = 1700000000 - age
+    os.utime(path, (t, t))
+    return {
+        "file": str(path), "mac": mac, "chip": chip, "offset": 0, "size": 0x400000,
+        "sha256": name.encode().hex().ljust(64, "0"),
+        "app": {"project": project, "version": version, "idf_version": "v5.1.2"},
+        "partitions": [
+            {"label": label, "type": "app", "subtype": "factory", "offset": offset,
+             "size": 0x100000, "sha256": sha256, "blank": False, "file": f"{label}.bin",
+             "app": {"project": project, "version": version}}
+            for label, offset, sha256 in partitions
+        ],
+    }
+
+
+def test_read_app_desc():
+    desc = read_app_desc(app_image("blink", "1.2.0"))
+    assert desc["project"] == "blink" and desc["version"] == "1.2.0"
+    assert desc["idf_version"] == "v5.1.2"
+    assert desc["date"] == "Mar  1 2024 12:00:00"
+    assert desc["secure_version"] == 2
+    assert desc["elf_sha256"] == bytes(range(32)).hex()
+
+
+def test_read_app_desc_rejects_non_apps():
+    image = app_image("blink", "1.2.0")
+    assert read_app_desc(b"\xff" + image[1:]) is None
+    assert read_app_desc(image[:APP_DESC_OFFSET] + b"\x00" * 4 + image[APP_DESC_OFFSET + 4:]) is None
+    assert read_app_desc(image[:0x40]) is None
+
+
+@pytest.mark.parametrize("mac", ["D4D4DA9866D0", "d4-d4-da-98-66-d0", "D4:D4:DA:98:66:D0"])
+def test_normalize_mac(mac):
+    assert normalize_mac(mac) == "d4:d4:da:98:66:d0"
+
+
+def test_find_by_mac_firmware_and_wildcards(catalog, tmp_path):
+    catalog.add(_backup(tmp_path, "a.bin", "D4D4DA9866D0", "blink", "1.0.0", age=300))
+    catalog.add(_backup(tmp_path, "b.bin", "d4:d4:da:98:66:d0", "blink", "1.1.0", age=200))
+    catalog.add(_backup(tmp_path, "c.bin", "AA-BB-CC-DD-EE-FF", "radio", "2.0.0", age=100,
+                        chip="ESP32-S3"))
+
+    def names(**filters):
+        return [os.path.basename(r["path"]) for r in catalog.find(**filters)]
+
+    assert names() == ["c.bin", "b.bin", "a.bin"]
+    assert names(mac="d4-d4-da-98-66-d0") == ["b.bin", "a.bin"]
+    assert names(mac="D4D4DA9866D0", version="1.0.0") == ["a.bin"]
+    assert names(project="bl*") == ["b.bin", "a.bin"]
+    assert names(version="?.?.0", project="radio") == ["c.bin"]
+    assert names(chip="ESP32-S*") == ["c.bin"]
+    assert names(project="bl") == []
+    assert names(limit=1) == ["c.bin"]
+
+
+def test_find_by_hashes_and_replace(catalog, tmp_path):
+    result = _backup(tmp_path, "a.bin", "D4D4DA9866D0", "blink", "1.0.0", age=0,
+                     partitions=[("factory", 0x10000, "ab" * 32)])
+    first = catalog.add(result)
+    assert [r["id"] for r in catalog.find(sha256=result["sha256"].upper())] == [first]
+    assert [r["id"] for r in catalog.find(partition_sha256="AB" * 32)] == [first]
+    assert catalog.partitions(first)[0]["project"] == "blink"
+
+    result["app"]["version"] = "1.0.1"
+    second = catalog.add(result)
+    assert catalog.count() == 1
+    assert catalog.get(second)["version"] == "1.0.1"
+    assert len(catalog.partitions(second)) == 1
+
+
+def test_prune_drops_missing_files(catalog, tmp_path):
+    catalog.add(_backup(tmp_path, "a.bin", "D4D4DA9866D0", "blink", "1.0.0", age=0))
+    catalog.add(_backup(tmp_path, "b.bin", "D4D4DA9866D0", "blink", "1.0.0", age=0))
+    os.remove(tmp_path / "a.bin")
+    assert catalog.prune() == [str(tmp_path / "a.bin")]
+    assert catalog.count() == 1
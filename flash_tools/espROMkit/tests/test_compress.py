@@ -0,0 +1,80 @@
+import random
+import zlib
+
+import pytest
+
+import espromkit_compress
+from espromkit_compress import FLASH_WRITE_SIZE, tune, wire_size
+
+BAUDS = (115200, 460800, 921600, 2000000)
+
+
+class SlowHost:
+    """A deterministic host: zlib level N costs N x `ns_per_byte` per input byte."""
+
+    def __init__(self, ns_per_byte):
+        self.ns_per_byte = ns_per_byte
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def compress(self, data, level):
+        self.now += len(data) * level * self.ns_per_byte * 1e-9
+        return zlib.compress(data, level)
+
+
+@pytest.fixture
+def host(monkeypatch):
+    def install(ns_per_byte):
+        fake = SlowHost(ns_per_byte)
+        monkeypatch.setattr(espromkit_compress, "time", fake)
+        monkeypatch.setattr(espromkit_compress, "zlib", fake)
+        return fake
+    return install
+
+
+def _log_text():
+    rng = random.Random(1)
+    return b"".join(b"%08d log line %s\n" % (i, bytes(rng.choice(b"abcdef") for _ in range(20)))
+                    for i in range(30000))
+
+
+def test_faster_links_pick_lower_levels(host):
+    host(40)
+    data = _log_text()
+    levels = [tune(data, baud, round_trip=0.0).best.level for baud in BAUDS]
+    assert levels == sorted(levels, reverse=True)
+    assert levels[0] >= 6
+    assert 1 <= levels[-1] <= 2
+
+
+def test_free_compression_picks_the_smallest_upload(host):
+    host(0)
+    data = _log_text()
+    for baud in BAUDS:
+        tuning = tune(data, baud, round_trip=0.0)
+        assert tuning.best.sent == min(e.sent for e in tuning.estimates)
+
+
+def test_incompressible_data_goes_raw(host):
+    host(40)
+    data = random.Random(2).randbytes(0x100000)
+    for baud in BAUDS:
+        assert tune(data, baud, round_trip=0.0).best.level == 0
+
+
+def test_raw_upload_is_padded_to_whole_blocks(host):
+    host(40)
+    raw = tune(b"\x00" * (FLASH_WRITE_SIZE + 1), 921600).estimate(0)
+    assert raw.blocks == 2
+    assert raw.sent == 2 * FLASH_WRITE_SIZE
+    assert wire_size(b"\xc0\x01\xdb") == 5
+
+
+def test_small_image_reuses_the_compressed_output(host):
+    host(40)
+    data = _log_text()[:0x8000]
+    tuning = tune(data, 115200)
+    assert tuning.best.level > 0
+    assert tuning.compressed == zlib.compress(data, tuning.best.level)
@@ -0,0 +1,125 @@
+import hashlib
+import struct
+import zlib
+
+import pytest
+
+from espromkit_coredump import (
+    COREDUMP_SUBTYPE, TCB_NAME_OFFSET, CoreDump, CoreDumpError, NoCoreDump, load_backup_dump,
+)
+from espromkit_partitions import DATA_TYPE, PARTITION_TABLE_OFFSET
+
+from conftest import partition_table
+
+TCB = 0x3FFB1000
+STACK_TOP, STACK_END = 0x3FFB2000, 0x3FFB2100
+TCB_SIZE = 0x60
+
+
+def binary_dump():
+    """A v0.3 (binary, CRC32) ESP32 dump: one task that crashed with LoadProhibited."""
+    tcb = bytearray(TCB_SIZE)
+    tcb[TCB_NAME_OFFSET:TCB_NAME_OFFSET + 5] = b"loop\x00"
+    frame = [0] * 64
+    frame[0], frame[1], frame[4] = 1, 0x400D1234, 0x3FFB20A0    # exception frame: PC, a1
+    frame[20], frame[21] = 28, 0x00000004                         # exccause, excvaddr
+    stack = struct.pack("<64I", *frame)
+    body = struct.pack("<3I", TCB, STACK_TOP, STACK_END) + bytes(tcb) + stack
+    body += struct.pack("<II", 0x3FFB5000, 8) + b"segment!"
+    words = 6
+    size = words * 4 + len(body) + 4
+    header = struct.pack("<6I", size, 0x0003, 1, TCB_SIZE, 1, 3)
+    return header + body + struct.pack("<I", zlib.crc32(header + body))
+
+
+def _pad4(data):
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def note(name, kind, desc):
+    name += b"\x00"
+    return struct.pack("<3I", len(name), len(desc), kind) + _pad4(name) + _pad4(desc)
+
+
+def elf_dump():
+    """A v1.1 (ELF, SHA-256) ESP32-C3 dump with task, panic and app notes."""
+    prstatus = bytearray(72 + 32 * 4)
+    struct.pack_into("<I", prstatus, 24, TCB)
+    struct.pack_into("<3I", prstatus, 72, 0x42001234, 0, 0x3FC8F000)   # pc, ra, sp
+    notes = (note(b"CORE", 1, bytes(prstatus))
+             + note(b"TASK_INFO", 678, struct.pack("<5I", 0, 0, TCB, STACK_TOP, 0x100)
+                    + b"main".ljust(16, b"\x00"))
+             + note(b"EXTRA_INFO", 7, struct.pack("<2I", TCB, 0))
+             + note(b"ESP_PANIC_DETAILS", 1, b"Stack protection fault\x00")
+             + note(b"ESP_CORE_DUMP_INFO", 8677, struct.pack("<I", 0x0101) + b"ab" * 32))
+    load = b"\xaa" * 16
+    phoff = 52
+    data_off = phoff + 2 * 32
+    elf = bytearray(52)
+    elf[:4] = b"\x7fELF"
+    struct.pack_into("<H", elf, 18, 0xF3)
+    struct.pack_into("<I", elf, 28, phoff)
+    struct.pack_into("<HH", elf, 42, 32, 2)
+    elf += struct.pack("<8I", 4, data_off, 0, 0, len(notes), len(notes), 0, 0)
+    elf += struct.pack("<8I", 1, data_off + len(notes), 0x3FC90000, 0, 16, 16, 0, 0)
+    elf += notes + load
+    header_len = 5 * 4
+    size = header_len + len(elf) + 32
+    header = struct.pack("<5I", size, (5 << 16) | 0x0101, 1, 0, 2)
+    return header + bytes(elf) + hashlib.sha256(header + bytes(elf)).digest()
+
+
+def test_binary_dump():
+    dump = CoreDump(binary_dump())
+    assert (dump.format, dump.chip, dump.checksum_ok) == ("bin", "ESP32", True)
+    task, = dump.tasks
+    assert (task.name, task.pc, task.sp) == ("loop", 0x400D1234, 0x3FFB20A0)
+    assert (task.stack_start, task.stack_len) == (STACK_TOP, 0x100)
+    assert dump.crashed == TCB
+    assert dump.exception == {"exccause": 28, "excvaddr": 4}
+    assert dump.read(0x3FFB5002, 4) == b"gmen"
+    assert "exccause 28 (LoadProhibited)" in "\n".join(dump.describe())
+
+
+def test_elf_dump():
+    dump = CoreDump(elf_dump())
+    assert (dump.format, dump.chip, dump.checksum_type, dump.checksum_ok) == \
+        ("elf", "ESP32-C3", "sha256", True)
+    task, = dump.tasks
+    assert (task.name, task.pc, task.sp, task.stack_start) == ("main", 0x42001234, 0x3FC8F000, STACK_TOP)
+    assert dump.crashed == TCB and dump.isr is False
+    assert dump.panic == "Stack protection fault"
+    assert dump.app_sha256 == "ab" * 32
+    assert dump.read(0x3FC90004, 2) == b"\xaa\xaa"
+    assert dump.elf.startswith(b"\x7fELF")
+
+
+def test_checksum_mismatch_is_reported():
+    data = bytearray(binary_dump())
+    data[-8] ^= 1
+    assert not CoreDump(bytes(data)).checksum_ok
+
+
+def test_erased_and_truncated():
+    with pytest.raises(NoCoreDump):
+        CoreDump(b"\xff" * 64)
+    with pytest.raises(CoreDumpError, match="only"):
+        CoreDump(binary_dump()[:100])
+    with pytest.raises(CoreDumpError, match="version"):
+        CoreDump(struct.pack("<3I", 64, 0x0999, 0) + bytes(52))
+
+
+def test_load_from_backup(tmp_path):
+    table = partition_table(("coredump", DATA_TYPE, COREDUMP_SUBTYPE, 0xA000, 0x1000))
+    image = bytearray(b"\xff" * 0xB000)
+    image[PARTITION_TABLE_OFFSET:PARTITION_TABLE_OFFSET + len(table)] = table
+    dump = binary_dump()
+    image[0xA000:0xA000 + len(dump)] = dump
+    path = tmp_path / "full.bin"
+    path.write_bytes(bytes(image))
+    loaded, partition = load_backup_dump(str(path))
+    assert partition.offset == 0xA000
+    assert loaded.tasks[0].name == "loop"
+    bare = tmp_path / "coredump.bin"
+    bare.write_bytes(dump)
+    assert load_backup_dump(str(bare))[1] is None
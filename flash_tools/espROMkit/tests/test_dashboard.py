@@ -0,0 +1,100 @@
+import io
+import sys
+import threading
+import time
+
+from espromkit_backup import BackupCancelled
+from espromkit_dashboard import Dashboard, PortTask, ThreadOutput
+
+
+def test_writes_go_to_the_writing_threads_sink():
+    fallback = io.StringIO()
+    out = ThreadOutput(fallback)
+    sinks = {name: [] for name in ("a", "b")}
+    barrier = threading.Barrier(2)
+
+    def worker(name):
+        with out.route(sinks[name].append):
+            barrier.wait()
+            for i in range(100):
+                out.write(f"{name}{i} ")
+        out.write(f"{name} after ")
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in sinks]
+    for t in threads:
+        t.start()
+    out.write("main ")
+    for t in threads:
+        t.join()
+    for name, chunks in sinks.items():
+        assert chunks == [f"{name}{i} " for i in range(100)]
+    assert sorted(fallback.getvalue().split()) == ["a", "after", "after", "b", "main"]
+
+
+def test_no_fallback_under_pythonw():
+    out = ThreadOutput(None)
+    assert out.write("lost") == 4
+    out.flush()
+    assert not out.isatty()
+
+
+def test_port_task_keeps_complete_lines_and_final_progress():
+    task = PortTask("/dev/ttyUSB0")
+    task.write("Connecting")
+    task.write("...\r\n  10%\r  55%\r 100%\nDone\n")
+    task.write("partial")
+    assert list(task.lines) == ["Connecting...", " 100%", "Done"]
+    assert task.message == "Done"
+    lines, count = task.new_lines(1)
+    assert (lines, count) == ([" 100%", "Done"], 3)
+
+
+def _dashboard(monkeypatch):
+    # Not a fixture: pytest swaps sys.stdout back in between setup and the test
+    monkeypatch.setattr(sys, "stdout", io.StringIO())
+    monkeypatch.setattr(sys, "stderr", io.StringIO())
+    board = Dashboard()
+    board.sync_ports([(f"/dev/ttyUSB{i}", "CP2102") for i in range(3)])
+    return board
+
+
+def _wait(board):
+    deadline = time.time() + 5
+    while board.running and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_each_port_logs_its_own_output(monkeypatch):
+    dashboard = _dashboard(monkeypatch)
+
+    def work(task):
+        for i in range(20):
+            print(f"{task.port} line {i}")
+        if task.port.endswith("1"):
+            raise OSError("port vanished")
+        if task.port.endswith("2"):
+            raise BackupCancelled()
+        return True
+
+    started = dashboard.start(list(dashboard.tasks), "backup", work)
+    assert len(started) == 3
+    _wait(dashboard)
+    states = {t.port: t.state for t in dashboard.tasks.values()}
+    assert states == {"/dev/ttyUSB0": "done", "/dev/ttyUSB1": "failed", "/dev/ttyUSB2": "cancelled"}
+    for task in dashboard.tasks.values():
+        body = [line for line in task.lines if not line.startswith("---")]
+        assert all(line.startswith(task.port) or line.startswith("ERROR") for line in body)
+        assert len([line for line in body if line.startswith(task.port)]) == 20
+    assert "ERROR: port vanished" in dashboard.task("/dev/ttyUSB1").lines
+    assert sys.stdout.fallback.getvalue() == ""
+
+
+def test_busy_rows_survive_unplugging(monkeypatch):
+    dashboard = _dashboard(monkeypatch)
+    release = threading.Event()
+    dashboard.start(["/dev/ttyUSB0"], "restore", lambda task: release.wait(5))
+    assert dashboard.start(["/dev/ttyUSB0"], "restore", lambda task: True) == []
+    assert [t.port for t in dashboard.sync_ports([])] == ["/dev/ttyUSB0"]
+    release.set()
+    _wait(dashboard)
+    assert dashboard.sync_ports([]) == []
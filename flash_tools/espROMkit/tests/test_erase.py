@@ -0,0 +1,61 @@
+import hashlib
+
+from espromkit_erase import execute_plan, plan_restore
+from espromkit_session import SECTOR_SIZE
+
+
+class FlashImage:
+    """Just enough of a DeviceSession for plan_restore: MD5s of a bytearray."""
+
+    def __init__(self, data):
+        self.flash = bytearray(data)
+
+    def flash_md5(self, offset, size):
+        return hashlib.md5(self.flash[offset:offset + size]).hexdigest()
+
+
+def _aligned(ranges):
+    return all(s % SECTOR_SIZE == 0 and e % SECTOR_SIZE == 0 for s, e in ranges)
+
+
+def test_identical_image_is_skipped():
+    data = bytes(range(256)) * 64
+    plan = plan_restore(FlashImage(data + b"\xff" * 0x1000), 0, data)
+    assert plan.writes == [] and plan.erases == []
+    assert plan.skip_bytes == len(data)
+
+
+def test_blank_sectors_become_block_erases():
+    flash = FlashImage(b"\x00" * 0x10000 + b"\x11" * SECTOR_SIZE + b"\x00" * 0x1F000)
+    data = b"\x11" * SECTOR_SIZE + b"\xff" * (0x20000 - SECTOR_SIZE)
+    plan = plan_restore(flash, 0x10000, data)
+    assert plan.writes == []
+    assert plan.erases == [(0x11000, 0x20000), (0x20000, 0x30000)]
+    assert plan.write_bytes + plan.erase_bytes + plan.skip_bytes == len(data)
+
+
+def test_partial_blank_tail_is_not_an_unaligned_erase():
+    # The image ends mid-sector in 0xFF where the device holds data
+    flash = FlashImage(b"\x00" * 0x4000)
+    data = b"\x00" * 0x2000 + b"\xff" * 0x500
+    plan = plan_restore(flash, 0, data)
+    assert _aligned(plan.erases)
+    assert plan.writes == [(0x2000, 0x2500)]
+
+
+def test_unaligned_offset_keeps_erases_aligned():
+    flash = FlashImage(b"\x00" * 0x8000)
+    data = b"\xff" * 0x3000
+    plan = plan_restore(flash, 0x1800, data)
+    assert _aligned(plan.erases)
+    assert plan.erases == [(0x2000, 0x4000)]
+    assert plan.writes == [(0x1800, 0x2000), (0x4000, 0x4800)]
+
+
+def test_partial_blank_tail_on_device(device, session):
+    device.flash[:0x3000] = b"\x5a" * 0x3000
+    data = b"\x5a" * 0x1000 + b"\xff" * 0x1500
+    plan = plan_restore(session, 0, data)
+    execute_plan(session, plan, log=lambda line: None)
+    assert bytes(device.flash[:0x2500]) == data
+    assert session.flash_md5(0, len(data)) == hashlib.md5(data).hexdigest()
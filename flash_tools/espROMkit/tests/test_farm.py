@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+import espromkit_farm
+from espromkit_farm import STAGES, Farm, format_stage_report, parse_workers
+from espromkit_job import Job
+
+WRITE_SECONDS = 0.05
+DEFAULTS = {"baud": 921600, "flash_mode": "keep", "flash_freq": "keep", "flash_size": "keep"}
+
+
+class FakeSession:
+    """Stands in for DeviceSession: a bytearray per port and a shared timeline.
+
+    Writes take WRITE_SECONDS so stages of different devices can overlap;
+    writing to a port in `broken` raises like a dropped USB link.
+    """
+
+    flashes = {}
+    events = []         # (port, what, t_start, t_end)
+    broken = set()
+    lock = threading.Lock()
+
+    def __init__(self, port, baud):
+        self.port = port
+        self.mac = "aa:bb:cc:00:00:%02x" % (len(self.flashes) + 1)
+        self.chip = "ESP32"
+        self.bootloader_offset = 0x1000
+        self.flash_size = 0x100000
+        self.flash_size_name = "1MB"
+        self.flash = self.flashes.setdefault(port, bytearray(b"\x00" * self.flash_size))
+
+    def _event(self, what, t_start):
+        with self.lock:
+            self.events.append((self.port, what, t_start, time.time()))
+
+    def connect(self):
+        self._event("connect", time.time())
+        return self
+
+    def flash_md5(self, offset, size):
+        return hashlib.md5(self.flash[offset:offset + size]).hexdigest()
+
+    def erase_region(self, offset, size):
+        self._event("erase", time.time())
+        self.flash[offset:offset + size] = b"\xff" * size
+
+    def write_flash(self, offset, data, progress_fn=None, compressed=None):
+        t = time.time()
+        if self.port in self.broken:
+            raise OSError("Write timeout")
+        time.sleep(WRITE_SECONDS)
+        self.flash[offset:offset + len(data)] = data
+        self._event("write", t)
+
+    def hard_reset(self):
+        self._event("reboot", time.time())
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    monkeypatch.setattr(espromkit_farm, "DeviceSession", FakeSession)
+    FakeSession.flashes = {}
+    FakeSession.events = []
+    FakeSession.broken = set()
+    return FakeSession
+
+
+@pytest.fixture
+def job(tmp_path):
+    app = tmp_path / "app.bin"
+    app.write_bytes(bytes(range(256)) * 96 + b"\xff" * 0x2000)
+    manifest = {
+        "images": [{"offset": "0x10000", "file": "app.bin"}],
+        "pre": [{"erase": {"offset": "0x9000", "size": "0x1000"}}],
+        "post": ["verify", "reboot"],
+    }
+    return Job(manifest, str(tmp_path), DEFAULTS).preflight(log=lambda line: None)
+
+
+def _run(job, ports, **workers):
+    return Farm(job, workers, log=lambda line: None).run(ports)
+
+
+def test_every_device_is_flashed(fake_sessions, job):
+    ports = [f"/dev/ttyUSB{i}" for i in range(5)]
+    stats = _run(job, ports)
+    assert (stats.passed, stats.failed) == (5, 0)
+    image = job.images[0]
+    for port in ports:
+        assert bytes(fake_sessions.flashes[port][image.offset:image.end]) == image.data
+
+
+def test_stages_run_in_order_per_device(fake_sessions, job):
+    _run(job, ["/dev/ttyUSB0", "/dev/ttyUSB1"])
+    for port in ("/dev/ttyUSB0", "/dev/ttyUSB1"):
+        steps = [what for p, what, _, _ in sorted(fake_sessions.events, key=lambda e: e[2])
+                 if p == port]
+        assert steps == ["connect", "erase", "write", "reboot"]
+
+
+def test_write_pool_caps_concurrent_writes_and_pipelines_the_rest(fake_sessions, job):
+    ports = [f"/dev/ttyUSB{i}" for i in range(4)]
+    _run(job, ports, write=1)
+    writes = sorted((s, e) for _, what, s, e in fake_sessions.events if what == "write")
+    assert len(writes) == 4
+    assert all(a[1] <= b[0] for a, b in zip(writes, writes[1:]))
+    # Other devices connected and erased while the first one was written
+    first_write_end = writes[0][1]
+    erased_meanwhile = [p for p, what, s, _ in fake_sessions.events
+                        if what == "erase" and s < first_write_end]
+    assert len(erased_meanwhile) > 1
+
+
+def test_a_failing_device_does_not_stop_the_others(fake_sessions, job):
+    fake_sessions.broken = {"/dev/ttyUSB1"}
+    stats = _run(job, ["/dev/ttyUSB0", "/dev/ttyUSB1", "/dev/ttyUSB2"], write=1)
+    assert (stats.passed, stats.failed) == (2, 1)
+    assert not any(p == "/dev/ttyUSB1" and what == "reboot"
+                   for p, what, _, _ in fake_sessions.events)
+
+
+def test_stage_report_covers_every_stage(fake_sessions, job):
+    stats = _run(job, ["/dev/ttyUSB0"])
+    lines = format_stage_report(stats)
+    assert [line.split()[0] for line in lines] == list(STAGES)
+    assert stats.busy["write"] >= WRITE_SECONDS
+
+
+def test_parse_workers():
+    assert parse_workers(["write=1", "verify=6"]) == {"write": 1, "verify": 6}
+    assert parse_workers(None) == {}
+    for spec in ("write", "flash=2", "write=0", "write=x"):
+        with pytest.raises(ValueError):
+            parse_workers([spec])
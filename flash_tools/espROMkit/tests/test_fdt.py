@@ -0,0 +1,34 @@
+"""Flash Download Tool config import (espromkit_fdt)."""
+
+from espromkit_fdt import load_fdt_conf
+
+CONF = """\
+[DOWNLOAD PATH]
+file_sel0 = 1
+file_path0 = app.bin
+file_offset0 = 0x10000
+
+[ESPTOOL_PARAM]
+after = hard_reset
+
+[LOG_CHECK]
+log_check_enable = {enable}
+log_check_str = setup done
+"""
+
+
+def _post(tmp_path, enable):
+    path = tmp_path / "multi_download.conf"
+    path.write_text(CONF.format(enable=enable))
+    manifest, _ = load_fdt_conf(str(path))
+    return manifest["post"]
+
+
+def test_hard_reset_without_log_check_reboots(tmp_path):
+    assert _post(tmp_path, "False") == ["verify", "reboot"]
+
+
+def test_log_check_replaces_the_reboot(tmp_path):
+    post = _post(tmp_path, "True")
+    assert post[:-1] == ["verify"]
+    assert post[-1]["bootcheck"]["expect"] == "setup done"
@@ -0,0 +1,86 @@
+import pytest
+
+from espromkit_formats import (
+    UF2_BLOCK, UF2_FAMILIES, FormatError, ImageFile, convert, detect_format, uf2_family,
+)
+
+OFFSET = 0x10000
+
+
+def hex_record(kind, address, data=b""):
+    record = bytes((len(data), address >> 8, address & 0xFF, kind)) + data
+    return f":{record.hex().upper()}{-sum(record) & 0xFF:02X}\n"
+
+
+@pytest.fixture
+def backup(tmp_path):
+    """A 64 KB raw image at OFFSET: data, a blank middle, data at the very end."""
+    data = bytearray(b"\xff" * 0x10000)
+    data[:0x1234] = bytes(range(256)) * 18 + bytes(range(0x34))
+    data[-3:] = b"end"
+    path = tmp_path / "app.bin"
+    path.write_bytes(bytes(data))
+    return path, bytes(data)
+
+
+@pytest.mark.parametrize("fmt", ["hex", "uf2"])
+def test_round_trip(backup, tmp_path, fmt):
+    path, data = backup
+    out = tmp_path / f"app.{fmt}"
+    assert convert(ImageFile(str(path), offset=OFFSET), str(out), family=UF2_FAMILIES["esp32"]) == fmt
+    image = ImageFile(str(out))
+    assert (image.format, image.start, image.end) == (fmt, OFFSET, OFFSET + len(data))
+    assert image.data_bytes < len(data) // 2        # the blank middle was left out
+    back = tmp_path / "back.bin"
+    convert(image, str(back))
+    assert back.read_bytes() == data
+
+
+def test_hex_checksum_error(tmp_path):
+    path = tmp_path / "bad.hex"
+    path.write_text(":0400000001020304F1\n:00000001FF\n")
+    with pytest.raises(FormatError, match="checksum"):
+        ImageFile(str(path))
+
+
+def test_uf2_family_filter(backup, tmp_path):
+    path, _ = backup
+    out = tmp_path / "app.uf2"
+    convert(ImageFile(str(path), offset=OFFSET), str(out), family=UF2_FAMILIES["esp32s3"])
+    assert out.stat().st_size % UF2_BLOCK == 0
+    assert ImageFile(str(out), family=UF2_FAMILIES["esp32s3"]).families == {UF2_FAMILIES["esp32s3"]}
+    with pytest.raises(FormatError, match="ESP32S3"):
+        ImageFile(str(out), family=UF2_FAMILIES["esp32c3"])
+
+
+def test_uf2_needs_a_family(backup, tmp_path):
+    path, _ = backup
+    with pytest.raises(FormatError, match="family"):
+        convert(ImageFile(str(path)), str(tmp_path / "app.uf2"))
+
+
+def test_unordered_hex_windows(tmp_path):
+    # A later record at a lower address: windows() must still see both
+    path = tmp_path / "two.hex"
+    path.write_text(hex_record(0, 0x10, b"\x11\x22") + hex_record(0, 0, b"\x33\x44") + hex_record(1, 0))
+    image = ImageFile(str(path))
+    assert not image.ordered
+    assert b"".join(w for _, w in image.windows()) == b"\x33\x44" + b"\xff" * 14 + b"\x11\x22"
+
+
+def test_detect_format(backup, tmp_path):
+    path, _ = backup
+    out = tmp_path / "app.uf2"
+    convert(ImageFile(str(path)), str(out), family=UF2_FAMILIES["esp32"])
+    renamed = tmp_path / "firmware.img"
+    out.rename(renamed)
+    assert detect_format(str(renamed)) == "uf2"
+    assert detect_format(str(path)) == "bin"
+
+
+def test_uf2_family_names():
+    assert uf2_family("ESP32-S3 (QFN56) (revision v0.2)") == UF2_FAMILIES["esp32s3"]
+    assert uf2_family("ESP32-D0WD-V3 (revision v3.1)") == UF2_FAMILIES["esp32"]
+    assert uf2_family("esp32c61") == UF2_FAMILIES["esp32c61"]
+    assert uf2_family("0x1c5f21b0") == UF2_FAMILIES["esp32"]
+    assert uf2_family("RP2040") is None
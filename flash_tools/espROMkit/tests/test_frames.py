@@ -0,0 +1,76 @@
+import os
+import struct
+
+import pytest
+
+import espromkit_frames
+from espromkit_frames import FramesError, GifDecoder, encode_stream, read_stream, rgb565
+
+# 8x6, three frames: all red; then green in the top-right 4x2 corner; then
+# blue in the bottom-left 2x2 as well. Frames 2 and 3 only carry the
+# changed sub-rectangle. Delays 100, 50, 0 ms; loops 3 times.
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "tiny_8x6.gif")
+RED, GREEN, BLUE = rgb565(255, 0, 0), rgb565(0, 255, 0), rgb565(0, 0, 255)
+
+
+def _expected(number):
+    pixels = []
+    for y in range(6):
+        for x in range(8):
+            if number >= 2 and x < 2 and y >= 4:
+                pixels.append(BLUE)
+            elif number >= 1 and x >= 4 and y < 2:
+                pixels.append(GREEN)
+            else:
+                pixels.append(RED)
+    return pixels
+
+
+def _flat(canvas):
+    return [int(p) for p in (canvas.flatten() if hasattr(canvas, "flatten") else canvas)]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def gif(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(espromkit_frames, "np", None)
+    elif espromkit_frames.np is None:
+        pytest.skip("NumPy is not installed")
+    with open(FIXTURE, "rb") as f:
+        return f.read()
+
+
+def test_decode_composites_every_frame(gif):
+    decoder = GifDecoder(gif)
+    assert (decoder.width, decoder.height) == (8, 6)
+    frames = [(delay, _flat(canvas)) for delay, canvas in decoder.frames()]
+    assert [delay for delay, _ in frames] == [100, 50, espromkit_frames.MIN_DELAY_MS]
+    for number, (_, pixels) in enumerate(frames):
+        assert pixels == _expected(number)
+    assert decoder.loop == 3
+    assert decoder.decoded_pixels == 8 * 6 + 4 * 2 + 2 * 2
+
+
+def test_stream_keeps_only_dirty_tiles(gif):
+    stream, stats = encode_stream(GifDecoder(gif), tile=2)
+    width, height, loop, frames = read_stream(stream)
+    assert (width, height, loop) == (8, 6, 3)
+    rects = [[(x, y, w, h) for x, y, w, h, _ in r] for _, r in frames]
+    assert rects == [[(0, 0, 8, 6)], [(4, 0, 4, 2)], [(0, 4, 2, 2)]]
+    x, y, w, h, pixels = frames[1][1][0]
+    assert list(struct.unpack(f"<{w * h}H", pixels)) == [GREEN] * (w * h)
+    assert (stats.frames, stats.key_frames, stats.rects) == (3, 1, 3)
+
+
+def test_resize_centres_on_black(gif):
+    stream, _ = encode_stream(GifDecoder(gif), size=(16, 16), tile=4)
+    _, _, _, frames = read_stream(stream)
+    (x, y, w, h, pixels), = frames[0][1]
+    rows = [struct.unpack_from("<16H", pixels, 32 * row) for row in range(16)]
+    assert rows[0] == (0,) * 16 and rows[15] == (0,) * 16     # 16x12 picture, bars of 2
+    assert rows[2] == (RED,) * 16
+
+
+def test_not_a_gif():
+    with pytest.raises(FramesError):
+        GifDecoder(b"\x89PNG\r\n\x1a\n" + bytes(16))
@@ -0,0 +1,40 @@
+import os
+
+from espromkit_fsimage import FsArchive, SpiffsBuilder, build_image
+
+
+def _image(tmp_path, files, size=0x20000):
+    builder = SpiffsBuilder(size)
+    for name, data in files.items():
+        builder.add(name, data)
+    path = tmp_path / "spiffs.bin"
+    path.write_bytes(builder.build())
+    return str(path)
+
+
+def test_spiffs_round_trip(tmp_path):
+    src = tmp_path / "data"
+    (src / "img").mkdir(parents=True)
+    (src / "index.html").write_bytes(b"<html></html>")
+    (src / "img" / "eye.bin").write_bytes(bytes(range(256)) * 20)
+    path = tmp_path / "fs.bin"
+    path.write_bytes(build_image(str(src), 0x20000))
+    with FsArchive(str(path)) as fs:
+        assert fs.fs_type == "spiffs"
+        assert fs.files() == [("/img/eye.bin", 5120), ("/index.html", 13)]
+        assert fs.extract(str(tmp_path / "out"), log=lambda line: None) == 2
+    assert (tmp_path / "out" / "img" / "eye.bin").read_bytes() == bytes(range(256)) * 20
+
+
+def test_extract_skips_names_outside_dest(tmp_path):
+    path = _image(tmp_path, {"/ok.txt": b"ok", "/../../evil.txt": b"x", "/a/../../b.txt": b"y"})
+    dest = tmp_path / "deep" / "out"
+    lines = []
+    with FsArchive(path) as fs:
+        assert fs.extract(str(dest), log=lines.append) == 1
+    assert (dest / "ok.txt").read_bytes() == b"ok"
+    assert not (tmp_path / "evil.txt").exists()
+    assert not (tmp_path / "deep" / "evil.txt").exists()
+    assert not (tmp_path / "deep" / "b.txt").exists()
+    assert sum("skipped" in line for line in lines) == 2
+    assert sorted(os.listdir(tmp_path / "deep")) == ["out"]
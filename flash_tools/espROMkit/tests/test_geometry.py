@@ -0,0 +1,59 @@
+import pytest
+
+from espromkit_geometry import (
+    FlashGeometry, GeometryCache, check_fits, geometry_from_esptool, resolve_flash_size,
+)
+
+
+@pytest.mark.parametrize("flash_id, size, name, manufacturer", [
+    (0x001640C8, 0x400000, "4MB", "GigaDevice"),
+    (0x001540C8, 0x200000, "2MB", "GigaDevice"),
+    (0x001840EF, 0x1000000, "16MB", "Winbond"),
+    (0x0019BA20, 0x2000000, "32MB", "XMC/Micron"),
+    (0x00203BC2, 0x4000000, "64MB", "Macronix"),
+])
+def test_jedec_id_gives_size(flash_id, size, name, manufacturer):
+    geometry = FlashGeometry(flash_id)
+    assert geometry.size == size
+    assert geometry.size_name == name
+    assert geometry.manufacturer == manufacturer
+
+
+def test_unknown_capacity_has_no_size():
+    geometry = FlashGeometry(0x00FF40C8)
+    assert geometry.size is None
+    assert geometry.size_name == ""
+    assert "unknown capacity 0xFF" in geometry.describe()
+    assert FlashGeometry(0x001640AB).manufacturer == "0xAB"
+
+
+@pytest.mark.parametrize("manufacturer, device, flash_id", [
+    ("c8", "4016", 0x001640C8),
+    ("ef", "4018", 0x001840EF),
+    ("20", "ba19", 0x0019BA20),
+])
+def test_geometry_from_esptool_output(manufacturer, device, flash_id):
+    geometry = geometry_from_esptool(manufacturer, device)
+    assert geometry.flash_id == flash_id
+    assert geometry.device_id == int(device, 16)
+
+
+def test_geometry_from_unparsable_esptool_output():
+    assert geometry_from_esptool("??", "4016") is None
+
+
+def test_unknown_id_falls_back_to_the_mac_cache(tmp_path):
+    cache = GeometryCache(str(tmp_path / "geometry.json"))
+    assert resolve_flash_size("aa:bb:cc:dd:ee:ff", 0x00FF40C8, cache) is None
+    cache.put("aa:bb:cc:dd:ee:ff", 0x800000)
+    assert resolve_flash_size("AA:BB:CC:DD:EE:FF", 0x00FF40C8, cache) == 0x800000
+
+    assert resolve_flash_size("11:22:33:44:55:66", 0x001640C8, cache) == 0x400000
+    reloaded = GeometryCache(cache.path)
+    assert reloaded.get("112233445566") == 0x400000
+
+
+def test_check_fits():
+    assert check_fits(0x10000, 0x3F0000, 0x400000) is None
+    assert "beyond the end of the 4MB flash" in check_fits(0x10000, 0x3F0001, 0x400000)
+    assert check_fits(0x10000, 0x800000, None) is None
@@ -0,0 +1,71 @@
+import hashlib
+import struct
+
+import pytest
+
+from espromkit_job import Job, ManifestError, patch_flash_params
+
+DEFAULTS = {"baud": 921600, "flash_mode": "keep", "flash_freq": "keep", "flash_size": "keep"}
+IMAGES = [{"offset": "0x10000", "file": "app.bin"}]
+
+
+def _job(**manifest):
+    manifest.setdefault("images", IMAGES)
+    return Job(manifest, "/tmp", DEFAULTS)
+
+
+def _bootloader(hash_appended=True):
+    """A one-segment ESP image: dio, 40m, 1MB, optionally with a SHA-256 digest."""
+    segment = bytes(range(64))
+    header = bytes([0xE9, 1, 2, 0x00]) + struct.pack("<I", 0x40080000)
+    header += bytes(15) + bytes([1 if hash_appended else 0])
+    body = header + struct.pack("<II", 0x3FFF0000, len(segment)) + segment
+    body += b"\x00" * (15 - len(body) % 16) + b"\xef"     # padding + checksum
+    if hash_appended:
+        body += hashlib.sha256(body).digest()
+    return body + b"\xff" * 0x40
+
+
+@pytest.mark.parametrize("step, message", [
+    ("format", "Unknown step 'format'"),
+    ({"erase": "0x1000"}, "expected a mapping of arguments"),
+    ({"erase": {"offset": 0x1000}, "verify": {}}, "Invalid step"),
+    ({"erase": {"offset": 0x1800, "size": 0x1000}}, "4 KB aligned"),
+])
+def test_bad_steps_are_rejected(step, message):
+    with pytest.raises(ManifestError, match=message):
+        _job(post=[step])
+
+
+def test_only_erase_runs_before_writing():
+    job = _job(pre=[{"erase": {"offset": "0x9000", "size": "0x2000"}}])
+    assert job.pre == [("erase", {"offset": 0x9000, "size": 0x2000})]
+    for step in ("verify", "reboot"):
+        with pytest.raises(ManifestError, match="not allowed in pre"):
+            _job(pre=[step])
+
+
+def test_reboot_must_come_last():
+    assert [name for name, _ in _job(post=["verify", "reboot"]).post] == ["verify", "reboot"]
+    with pytest.raises(ManifestError, match="last post step"):
+        _job(post=["reboot", "verify"])
+
+
+def test_patch_flash_params_stamps_header_and_digest():
+    data = _bootloader()
+    patched = patch_flash_params(data, 0x1000, 0x1000, "qio", "80m", "4MB")
+    assert patched[2] == 0x00                   # qio
+    assert patched[3] == 0x2F                   # 4MB << 4 | 80m
+    length = len(data) - 0x40
+    assert patched[length - 32:length] == hashlib.sha256(patched[:length - 32]).digest()
+    assert patched[4:length - 32] == data[4:length - 32]
+    assert patched[length:] == data[length:]
+
+
+def test_patch_flash_params_keep_and_detect():
+    data = _bootloader(hash_appended=False)
+    assert patch_flash_params(data, 0x1000, 0x1000, "keep", "keep", "keep") == data
+    assert patch_flash_params(data, 0x10000, 0x1000, "qio", "80m", "4MB") == data
+    patched = patch_flash_params(data, 0x1000, 0x1000, "keep", "keep", "detect", 0x1000000)
+    assert patched[3] == 0x40                   # 16MB, frequency kept
+    assert patched[:3] + patched[4:] == data[:3] + data[4:]
@@ -0,0 +1,94 @@
+import struct
+import zlib
+
+import pytest
+
+from espromkit_nvs import (
+    ENTRIES_PER_PAGE, ENTRY_SIZE, FIRST_ENTRY, PAGE_ACTIVE, PAGE_FULL, PAGE_SIZE, NvsBuilder,
+    NvsError, build_device_nvs, build_nvs, parse_columns,
+)
+
+
+def crc32(data):
+    return zlib.crc32(data, 0xFFFFFFFF) & 0xFFFFFFFF
+
+
+def read_nvs(image):
+    """Page states and {(ns index, key, chunk): (type, data)}, checking every CRC."""
+    states, items = [], {}
+    for base in range(0, len(image), PAGE_SIZE):
+        page = image[base:base + PAGE_SIZE]
+        state, = struct.unpack_from("<I", page)
+        if state == 0xFFFFFFFF:
+            break
+        assert struct.unpack_from("<I", page, 28)[0] == crc32(page[4:28])
+        states.append(state)
+        i = 0
+        while i < ENTRIES_PER_PAGE:
+            if (page[32 + i * 2 // 8] >> (i * 2 % 8)) & 3 != 2:     # not "written"
+                i += 1
+                continue
+            entry = page[FIRST_ENTRY + i * ENTRY_SIZE:][:ENTRY_SIZE]
+            ns, etype, span, chunk = entry[:4]
+            assert struct.unpack_from("<I", entry, 4)[0] == crc32(entry[:4] + entry[8:])
+            key = entry[8:24].rstrip(b"\x00").decode()
+            data = entry[24:32]
+            if span > 1:
+                size, _, data_crc = struct.unpack_from("<HHI", data)
+                start = FIRST_ENTRY + (i + 1) * ENTRY_SIZE
+                data = page[start:start + size]
+                assert crc32(data) == data_crc
+            items[(ns, key, chunk)] = (etype, data)
+            i += span
+    return states, items
+
+
+def test_values_round_trip():
+    row = {"mac": "D4:D4:DA:98:66:D0", "ssid": "Line-3", "device_id:u32": "1001",
+           "level:i8": "-5", "key:hex2bin": "00ff10", "empty": ""}
+    states, items = read_nvs(build_nvs(row, 0x3000))
+    assert states == [PAGE_ACTIVE]
+    assert items[(0, "config", 0xFF)][1][0] == 1        # namespace "config" is index 1
+    assert items[(1, "ssid", 0xFF)] == (0x21, b"Line-3\x00")
+    assert struct.unpack("<I", items[(1, "device_id", 0xFF)][1][:4]) == (1001,)
+    assert struct.unpack("<b", items[(1, "level", 0xFF)][1][:1]) == (-5,)
+    assert items[(1, "key", 0)] == (0x42, b"\x00\xff\x10")
+    assert not any(key == "empty" for _, key, _ in items)
+
+
+def test_large_blob_spans_pages():
+    builder = NvsBuilder(0x5000)
+    blob = bytes(range(256)) * 20
+    builder.add("config", "cert", "hex2bin", blob.hex())
+    states, items = read_nvs(builder.build())
+    assert states[:-1] == [PAGE_FULL] * (len(states) - 1) and states[-1] == PAGE_ACTIVE
+    chunks = sorted((chunk, data) for (_, key, chunk), (etype, data) in items.items()
+                    if key == "cert" and etype == 0x42)
+    assert len(chunks) > 1
+    assert b"".join(data for _, data in chunks) == blob
+    index = next(data for (_, key, _), (etype, data) in items.items() if etype == 0x48)
+    assert struct.unpack_from("<IB", index) == (len(blob), len(chunks))
+
+
+def test_errors():
+    with pytest.raises(NvsError):
+        NvsBuilder(0x2000)
+    builder = NvsBuilder(0x3000)
+    with pytest.raises(NvsError, match="1-15 characters"):
+        builder.add("config", "a_key_that_is_too_long", "u8", "1")
+    with pytest.raises(NvsError, match="not a valid u8"):
+        builder.add("config", "n", "u8", "300")
+    with pytest.raises(NvsError, match="do not fit"):
+        for n in range(300):
+            builder.add("config", f"k{n}", "u32", str(n))
+    with pytest.raises(NvsError, match="unknown type"):
+        parse_columns(["mac", "x:float"])
+
+
+def test_device_row_by_mac(tmp_path):
+    path = tmp_path / "devices.csv"
+    path.write_text("mac,ssid\nd4:d4:da:98:66:d0,A\nd4-d4-da-98-66-d1,B\n")
+    _, items = read_nvs(build_device_nvs(str(path), "D4D4DA9866D1", 0x3000))
+    assert items[(1, "ssid", 0xFF)][1] == b"B\x00"
+    with pytest.raises(NvsError, match="not found"):
+        build_device_nvs(str(path), "00:00:00:00:00:00", 0x3000)
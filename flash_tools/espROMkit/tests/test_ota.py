@@ -0,0 +1,69 @@
+import pytest
+
+from espromkit_ota import OtaEntry, OtaError, OtaLayout, make_entry
+from espromkit_partitions import APP_TYPE, DATA_TYPE, parse_partition_table
+from espromkit_session import SECTOR_SIZE
+
+from conftest import partition_table
+
+PARTITIONS = parse_partition_table(partition_table(
+    ("otadata", DATA_TYPE, 0x00, 0xE000, 0x2000),
+    ("factory", APP_TYPE, 0x00, 0x10000, 0x100000),
+    ("app0", APP_TYPE, 0x10, 0x110000, 0x100000),
+    ("app1", APP_TYPE, 0x11, 0x210000, 0x100000),
+))
+ERASED = b"\xff" * (2 * SECTOR_SIZE)
+
+
+def otadata(*entries):
+    """Two otadata sectors holding `entries` (raw select entries or None)."""
+    return b"".join((entry or b"").ljust(SECTOR_SIZE, b"\xff") for entry in entries)
+
+
+def test_erased_otadata_boots_factory():
+    layout = OtaLayout(PARTITIONS, ERASED)
+    assert layout.active_entry is None
+    assert layout.boot_partition.label == "factory"
+    assert layout.inactive_slot().label == "app0"
+
+
+def test_highest_valid_sequence_wins():
+    layout = OtaLayout(PARTITIONS, otadata(make_entry(4), make_entry(5)))
+    assert layout.active_entry == 1
+    assert layout.boot_partition.label == "app0"      # (5 - 1) % 2
+    assert layout.inactive_slot().label == "app1"
+
+
+def test_bad_crc_and_aborted_entries_are_ignored():
+    corrupt = bytearray(make_entry(7))
+    corrupt[-1] ^= 0xFF
+    aborted = make_entry(9)[:24] + (4).to_bytes(4, "little") + make_entry(9)[28:]
+    assert not OtaEntry(bytes(corrupt)).valid
+    assert OtaEntry(aborted).state_name == "aborted"
+    layout = OtaLayout(PARTITIONS, otadata(bytes(corrupt), aborted))
+    assert layout.boot_partition.label == "factory"
+
+
+def test_select_writes_the_other_sector():
+    layout = OtaLayout(PARTITIONS, otadata(make_entry(1), None))
+    address, data = layout.select(layout.find_slot("app1"))
+    assert address == 0xE000 + SECTOR_SIZE
+    assert len(data) == SECTOR_SIZE
+    entry = OtaEntry(data)
+    assert entry.valid and entry.seq == 2
+    after = OtaLayout(PARTITIONS, otadata(make_entry(1), data))
+    assert after.boot_partition.label == "app1"
+
+
+def test_find_slot():
+    layout = OtaLayout(PARTITIONS, ERASED)
+    assert layout.find_slot("ota_1").label == "app1"
+    assert layout.find_slot("0").label == "app0"
+    with pytest.raises(OtaError):
+        layout.find_slot("app7")
+
+
+def test_not_an_ota_layout():
+    plain = parse_partition_table(partition_table(("factory", APP_TYPE, 0x00, 0x10000, 0x100000)))
+    with pytest.raises(OtaError, match="not an OTA layout"):
+        OtaLayout(plain, ERASED)
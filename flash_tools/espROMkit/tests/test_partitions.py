@@ -0,0 +1,50 @@
+import pytest
+
+from espromkit_partitions import (
+    APP_TYPE, DATA_TYPE, PARTITION_TABLE_OFFSET, PartitionTableError, find_partition,
+    format_partition_table, load_partition_table, parse_partition_table,
+)
+
+from conftest import partition_table
+
+TABLE = partition_table(
+    ("nvs", DATA_TYPE, 0x02, 0x9000, 0x5000),
+    ("otadata", DATA_TYPE, 0x00, 0xE000, 0x2000),
+    ("app0", APP_TYPE, 0x10, 0x10000, 0x140000),
+    ("spiffs", DATA_TYPE, 0x82, 0x290000, 0x160000),
+)
+
+
+def test_parse():
+    parts = parse_partition_table(TABLE)
+    assert [p.label for p in parts] == ["nvs", "otadata", "app0", "spiffs"]
+    app = parts[2]
+    assert (app.type_name, app.subtype_name, app.offset, app.end) == ("app", "ota_0", 0x10000, 0x150000)
+    assert parts[3].subtype_name == "spiffs"
+
+
+def test_find_partition():
+    parts = parse_partition_table(TABLE)
+    assert find_partition(parts, label="nvs").offset == 0x9000
+    assert find_partition(parts, ptype=DATA_TYPE, subtype=0x82).label == "spiffs"
+    assert find_partition(parts, ptype=APP_TYPE, subtype=0x00) is None
+
+
+def test_md5_mismatch():
+    data = bytearray(TABLE)
+    data[5] ^= 1
+    with pytest.raises(PartitionTableError, match="MD5"):
+        parse_partition_table(bytes(data))
+
+
+def test_erased_flash_has_no_table():
+    with pytest.raises(PartitionTableError):
+        parse_partition_table(b"\xff" * 0xC00)
+
+
+def test_load_from_backup(tmp_path):
+    path = tmp_path / "full.bin"
+    path.write_bytes(b"\xff" * PARTITION_TABLE_OFFSET + TABLE)
+    parts = load_partition_table(str(path))
+    assert len(parts) == 4
+    assert format_partition_table(parts)[0].split() == ["nvs", "data", "nvs", "0x009000", "20,480", "bytes"]
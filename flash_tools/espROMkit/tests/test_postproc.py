@@ -0,0 +1,27 @@
+import os
+
+from espromkit_partitions import DATA_TYPE, PARTITION_TABLE_OFFSET
+from espromkit_postproc import parts_dir, process_backup
+
+from conftest import partition_table
+
+
+def test_split_keeps_partitions_inside_the_parts_folder(tmp_path):
+    table = partition_table(
+        ("nvs", DATA_TYPE, 0x02, 0x9000, 0x1000),
+        ("../../evil", DATA_TYPE, 0x81, 0xA000, 0x1000),
+        ("a\\b/c", DATA_TYPE, 0x81, 0xB000, 0x1000),
+        ("..", DATA_TYPE, 0x81, 0xC000, 0x1000),
+    )
+    image = bytearray(b"\xff" * 0xD000)
+    image[PARTITION_TABLE_OFFSET:PARTITION_TABLE_OFFSET + len(table)] = table
+    backup = tmp_path / "dev" / "backup.bin"
+    backup.parent.mkdir()
+    backup.write_bytes(bytes(image))
+    result = process_backup(str(backup), compress=False)
+    folder = parts_dir(str(backup))
+    assert sorted(os.listdir(folder)) == ["0xC000.bin", "_.._evil.bin", "a_b_c.bin", "nvs.bin"]
+    assert [p["file"] for p in result["partitions"]] == [
+        os.path.join("backup.parts", name) for name in ("nvs.bin", "_.._evil.bin", "a_b_c.bin", "0xC000.bin")]
+    assert sorted(os.listdir(tmp_path)) == ["dev"]
+    assert sorted(os.listdir(tmp_path / "dev")) == ["backup.bin", "backup.bin.json", "backup.parts"]
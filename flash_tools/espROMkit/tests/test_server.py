@@ -0,0 +1,123 @@
+"""espromkit_server: the HTTP job API, run against a FakeDevice."""
+
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from espromkit_fakedevice import FakeDevice
+from espromkit_server import JobServer
+
+from conftest import FLASH_ID, FLASH_SIZE
+
+DEFAULTS = {"baud": 921600, "flash_mode": "keep", "flash_freq": "keep", "flash_size": "keep"}
+DONE = ("done", "failed", "cancelled")
+
+
+@pytest.fixture
+def slow_device():
+    """A fake ESP32 that reads 256 KB/s: one backup chunk per second."""
+    dev = FakeDevice(flash_size=FLASH_SIZE, flash_id=FLASH_ID, flash_rate=256 * 1024)
+    yield dev
+    dev.close()
+
+
+@pytest.fixture
+def server(device, tmp_path):
+    srv = JobServer(str(tmp_path), lambda: [{"device": device.port, "description": "fake"}],
+                    DEFAULTS, log=lambda line: None)
+    host, port = srv.start("127.0.0.1", 0)
+    srv.url = f"http://{host}:{port}"
+    yield srv
+    srv.close()
+
+
+def call(server, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(server.url + path, data=data, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def wait(server, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        _, job = call(server, "GET", f"/jobs/{job_id}")
+        if job["state"] in DONE:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['state']}")
+
+
+def submit(server, device, kind, **params):
+    status, job = call(server, "POST", "/jobs", dict(params, type=kind, port=device.port))
+    assert status == 202, job
+    return job
+
+
+def test_ports(server, device):
+    status, ports = call(server, "GET", "/ports")
+    assert status == 200
+    assert [(p["port"], p["attached"], p["state"]) for p in ports] == [(device.port, True, "idle")]
+
+
+def test_info(server, device):
+    job = wait(server, submit(server, device, "info")["id"])
+    assert job["state"] == "done"
+    assert job["result"]["flash_bytes"] == FLASH_SIZE
+    _, ports = call(server, "GET", "/ports")
+    assert ports[0]["jobs_done"] == 1 and ports[0]["session"]
+
+
+def test_backup(server, device, tmp_path):
+    device.flash[0x1000:0x3000] = bytes(range(256)) * 32
+    job = wait(server, submit(server, device, "backup", file="out/b.bin", offset=0x1000,
+                              size=0x2000)["id"])
+    assert job["state"] == "done", job["log"]
+    assert (tmp_path / "out" / "b.bin").read_bytes() == bytes(device.flash[0x1000:0x3000])
+
+
+def test_restore_unaligned_tail(server, device, tmp_path):
+    # Device data under an image that ends mid-sector in 0xFF
+    device.flash[0x10000:0x14000] = b"\x5a" * 0x4000
+    data = b"\x5a" * 0x1000 + b"\xff" * 0x1234
+    (tmp_path / "app.bin").write_bytes(data)
+    job = wait(server, submit(server, device, "restore", file="app.bin", offset=0x10000)["id"])
+    assert job["state"] == "done", job["log"]
+    assert bytes(device.flash[0x10000:0x10000 + len(data)]) == data
+    assert job["result"]["skipped"] == 0x1000
+
+
+def test_restore_outside_root_is_refused(server, device):
+    status, body = call(server, "POST", "/jobs",
+                        {"type": "restore", "port": device.port, "file": "../x.bin"})
+    assert status == 403, body
+
+
+def test_cancel(slow_device, tmp_path):
+    srv = JobServer(str(tmp_path), lambda: [{"device": slow_device.port}], DEFAULTS,
+                    log=lambda line: None)
+    host, port = srv.start("127.0.0.1", 0)
+    srv.url = f"http://{host}:{port}"
+    try:
+        running = submit(srv, slow_device, "backup", file="full.bin")
+        queued = submit(srv, slow_device, "info")
+        status, job = call(srv, "DELETE", f"/jobs/{queued['id']}")
+        assert (status, job["state"]) == (200, "cancelled")
+        deadline = time.time() + 30
+        while call(srv, "GET", f"/jobs/{running['id']}")[1]["progress"] is None:
+            assert time.time() < deadline
+            time.sleep(0.05)
+        call(srv, "DELETE", f"/jobs/{running['id']}")
+        job = wait(srv, running["id"])
+        assert job["state"] == "cancelled"
+        assert job["progress"]["done"] < FLASH_SIZE
+        _, ports = call(srv, "GET", "/ports")
+        assert ports[0]["jobs_done"] == 0 and ports[0]["jobs_failed"] == 0
+    finally:
+        srv.close()
@@ -0,0 +1,91 @@
+import pytest
+
+from espromkit_stats import StationDB, format_throughput
+
+MAC = "D8A01D496918"
+START = "*************************** START ****************************\n"
+END = "*************************** END ****************************\n\n"
+
+
+def _block(stamp, baud=115200, wrote="Wrote 373760 bytes (171133 compressed) at 0x00010000 "
+           "in 15.7 seconds (effective 190.1 kbit/s)...", result="PASS", end=True):
+    text = (f"{START}START TIME: {stamp}\nCONNECT BAUD: 115200\n"
+            f"===============BAUD : {baud}===============CALL DEVICE SYNC\n"
+            "get flash id : 0x001640c8\n")
+    if wrote:
+        text += wrote + "\nHash of data verified.\n"
+    if end:
+        text += f"Use time: 18 s\nDownload result: {result}\n{END}"
+    return text
+
+
+@pytest.fixture
+def db():
+    with StationDB(":memory:") as station:
+        yield station
+
+
+@pytest.fixture
+def log(tmp_path):
+    return tmp_path / f"{MAC}.txt"
+
+
+def _rows(db):
+    return db.db.execute(
+        "SELECT started, mac, baud, flash_chip, bytes, compressed, seconds, total_seconds, result "
+        "FROM operations ORDER BY started").fetchall()
+
+
+def test_ingest_parses_each_run(db, log):
+    log.write_text(_block("202309232324") + _block("202309232332", baud=921600, result="FAIL",
+                                                  wrote=None))
+    assert db.ingest_log(str(log)) == 2
+    assert _rows(db) == [
+        ("2023-09-23 23:24", MAC, 115200, "GigaDevice 4MB", 373760, 171133, 15.7, 18.0, "PASS"),
+        ("2023-09-23 23:32", MAC, 921600, "GigaDevice 4MB", None, None, None, 18.0, "FAIL"),
+    ]
+
+
+def test_ingest_tails_the_log(db, log):
+    text = _block("202309232324") + _block("202309232332")
+    log.write_text(text[:-40])          # second block still being written
+    assert db.ingest_log(str(log)) == 1
+    log.write_text(text)
+    assert db.ingest_log(str(log)) == 1
+    assert db.ingest_log(str(log)) == 0
+    assert len(_rows(db)) == 2
+
+
+def test_block_cut_off_by_the_next_start_is_an_abort(db, log):
+    log.write_text(_block("202309232324", wrote=None, end=False) + _block("202309232332"))
+    assert db.ingest_log(str(log)) == 2
+    assert [row[-1] for row in _rows(db)] == ["ABORT", "PASS"]
+
+
+def test_rotated_log_is_read_from_the_start(db, log):
+    log.write_text(_block("202309232324") + _block("202309232332"))
+    db.ingest_log(str(log))
+    log.write_text(_block("202309240901"))
+    assert db.ingest_log(str(log)) == 1
+    assert len(_rows(db)) == 3
+
+
+def test_throughput_by_baud(db, log):
+    log.write_text(_block("202309232324") + _block("202309232332", result="FAIL"))
+    db.ingest_log(str(log))
+    db.record("job", "/dev/ttyUSB0", True, bytes_written=1_000_000, seconds=10.0, baud=921600)
+    rows = {row[0]: row for row in db.throughput("baud")}
+    assert rows[115200][1:5] == (2, 1, 1, 373760)
+    assert rows[115200][5] == pytest.approx(373760 * 8 / 1000 / 15.7)
+    assert rows[921600][5] == pytest.approx(800.0)
+    assert format_throughput(db.throughput("source"), "source")[0].split()[0] == "source"
+    with pytest.raises(ValueError):
+        db.throughput("colour")
+
+
+def test_slot_counters_from_conf(db, tmp_path):
+    conf = tmp_path / "multi_download.conf"
+    conf.write_text("[DOWNLOAD]\ncom_port1 = COM3\nbaudrate1 = 921600\ncom_port2 = \nbaudrate2 = 0\n"
+                    "[STATISTICS]\npass1 = 7\nfail1 = 1\npass2 = 0\nfail2 = 0\n")
+    assert db.ingest_conf(str(conf)) == 2
+    assert [row[1:] for row in db.slot_counters()] == [(1, "COM3", 921600, 7, 1)]
@@ -0,0 +1,70 @@
+"""Replay of a checked-in transcript (espromkit_transport).
+
+tests/data/connect_read.esrt is a DeviceSession on a FakeDevice: connect,
+then read 4 KB at 0x1000. Replaying it needs no device; the host's writes
+must match the recording, so a change in what the tool sends shows up as
+a "diverged" SerialException. If an esptool upgrade changes the
+bytes on the wire, re-record it with:
+
+  python tests/test_transport.py
+"""
+
+import os
+import sys
+
+import pytest
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import espromkit_transport as transport                # noqa: E402
+from espromkit_session import DeviceSession            # noqa: E402
+
+TRANSCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "connect_read.esrt")
+OFFSET, SIZE = 0x1000, 0x1000
+PATTERN = bytes(range(256)) * (SIZE // 256)
+BAUD = 921600
+FLASH_SIZE, FLASH_ID = 0x200000, 0x1540C8
+
+
+@pytest.fixture
+def replay():
+    transcript = transport.start_replay(TRANSCRIPT, speed=0)
+    yield transcript
+    transport.finish()
+
+
+def test_replay_connect_and_read(replay):
+    port = replay.channels[0].port
+    with DeviceSession(port, BAUD) as session:
+        assert session.flash_size == FLASH_SIZE
+        assert session.read_flash(OFFSET, SIZE) == PATTERN
+    (channel, matched, received, _), = replay.results
+    assert matched == channel.writes
+    assert received > SIZE
+
+
+def test_replay_detects_divergence(replay):
+    port = replay.channels[0].port
+    with DeviceSession(port, BAUD) as session:
+        with pytest.raises(serial.SerialException, match="diverged"):
+            session.read_flash(OFFSET + 0x1000, SIZE)
+
+
+def record():
+    from espromkit_fakedevice import FakeDevice
+
+    device = FakeDevice(flash_size=FLASH_SIZE, flash_id=FLASH_ID)
+    device.flash[OFFSET:OFFSET + SIZE] = PATTERN
+    try:
+        transport.start_recording(TRANSCRIPT)
+        with DeviceSession(device.port, BAUD) as session:
+            session.read_flash(OFFSET, SIZE)
+        for line in transport.finish():
+            print(line)
+    finally:
+        device.close()
+
+
+if __name__ == "__main__":
+    record()
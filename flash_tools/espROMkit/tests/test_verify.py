@@ -0,0 +1,81 @@
+import hashlib
+
+from espromkit_session import SECTOR_SIZE
+from espromkit_verify import RegionCheck, diff_region, repair_images
+
+
+class Flash:
+    """Just enough of a DeviceSession for verify: MD5s, reads and writes of a bytearray.
+
+    Writes erase every sector they touch first, as FLASH_BEGIN does.
+    """
+
+    def __init__(self, size):
+        self.flash = bytearray(b"\xff" * size)
+        self.bootloader_offset = 0x1000
+        self.md5_calls = []
+        self.writes = []
+
+    def flash_md5(self, offset, size):
+        self.md5_calls.append((offset, size))
+        return hashlib.md5(self.flash[offset:offset + size]).hexdigest()
+
+    def read_flash(self, offset, size):
+        return bytes(self.flash[offset:offset + size])
+
+    def write_flash(self, offset, data):
+        self.writes.append((offset, len(data)))
+        lo = offset - offset % SECTOR_SIZE
+        hi = -(-(offset + len(data)) // SECTOR_SIZE) * SECTOR_SIZE
+        self.flash[lo:hi] = b"\xff" * (hi - lo)
+        self.flash[offset:offset + len(data)] = data
+
+
+def _pattern(size, seed=0):
+    return bytes((i * 13 + seed) % 256 for i in range(size))
+
+
+def test_matching_image_costs_one_md5():
+    flash = Flash(0x40000)
+    data = _pattern(0x23456)
+    flash.flash[0x10000:0x10000 + len(data)] = data
+    assert diff_region(flash, 0x10000, data) == []
+    assert flash.md5_calls == [(0x10000, len(data))]
+
+
+def test_mismatch_is_narrowed_to_sectors():
+    flash = Flash(0x40000)
+    data = _pattern(0x30000)
+    flash.flash[:len(data)] = data
+    flash.flash[0x12345] ^= 1
+    flash.flash[0x13000] ^= 1
+    assert diff_region(flash, 0, data) == [(0x12000, 0x14000)]
+
+
+def test_unaligned_offset_uses_flash_sectors():
+    flash = Flash(0x40000)
+    data = _pattern(0x3000)
+    flash.flash[0x1800:0x4800] = data
+    flash.flash[0x2100] ^= 1
+    flash.flash[0x4700] ^= 1
+    # The image's first and last sectors are partial: ranges are clipped to it
+    assert diff_region(flash, 0x1800, data) == [(0x2000, 0x3000), (0x4000, 0x4800)]
+    assert all(start % SECTOR_SIZE == 0 or start == 0x1800
+               for start, size in flash.md5_calls)
+
+
+def test_repair_keeps_flash_around_a_ragged_image():
+    flash = Flash(0x10000)
+    flash.flash[:] = _pattern(0x10000, seed=7)
+    before = bytes(flash.flash)
+    data = _pattern(0x2400, seed=1)
+    check = RegionCheck(0x1800, "app.bin", data)
+    check.mismatches = diff_region(flash, 0x1800, data)
+    assert check.mismatches == [(0x1800, 0x3C00)]
+
+    repair_images(flash, [check], log=lambda line: None)
+    assert check.ok
+    assert all(offset % SECTOR_SIZE == 0 for offset, size in flash.writes)
+    assert bytes(flash.flash[0x1800:0x3C00]) == data
+    assert flash.flash[:0x1800] == before[:0x1800]
+    assert flash.flash[0x3C00:] == before[0x3C00:]
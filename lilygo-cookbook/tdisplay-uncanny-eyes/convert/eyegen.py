@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+eyegen — generate the graphics/*.h eye headers from PNG sources.
+
+Each eye is a folder under convert/eyes/ holding:
+
+  sclera.png   RGB, any size (SCLERA_WIDTH x SCLERA_HEIGHT)
+  iris.png     RGB, angle across x, distance from the edge down y
+  upper.png    8-bit grey, 128x128: eyelid threshold per screen pixel
+  lower.png    8-bit grey, 128x128
+  polar.npy    optional (N, N) int32 angle/distance map of the iris square
+  eye.json     {"iris_size": 80}  diameter of the polar table in pixels
+  header.tmpl  optional: the header text around the tables
+
+  sclera, iris   RGB565 (5/6/5 bits of the PNG's R/G/B)
+  upper, lower   grey value = blink level at which the pixel is covered
+  polar          (angle << 7) | distance for every pixel of the iris
+                 square: angle 0..511 around the centre, distance 127 at
+                 the centre down to 0 at the rim, 127 outside the circle
+
+Without header.tmpl an eye becomes a header in the flat PROGMEM layout
+the sketch reads with pgm_read_word(sclera + y * SCLERA_WIDTH + x), or
+in the 2-D `sclera[SCLERA_HEIGHT][SCLERA_WIDTH]` layout with
+"layout": "2d" in eye.json. "iris_min"/"iris_max" add IRIS_MIN/IRIS_MAX
+defines. The polar table is computed from iris_size unless polar.npy
+exists.
+
+`extract` recovers the sources from an existing header. It keeps the
+polar table as polar.npy and everything between the tables (defines,
+comments, the #ifdef SYMMETRICAL_EYELID variants, either array layout)
+as header.tmpl, with each table's formatting in eye.json, so extract +
+build gives back the same bytes. An extracted eye's tables keep their
+sizes; delete header.tmpl to build it in the default layout instead.
+
+Every eye's source files and this script are hashed into
+convert/.eyegen-cache.json, and an eye is only rewritten when its hash
+or its header changed, so rebuilding all eyes after editing one touches
+one file. The output is a pure function of the inputs.
+
+  python convert/eyegen.py extract graphics/*.h            # headers -> sources
+  python convert/eyegen.py build --out graphics            # changed eyes only
+  python convert/eyegen.py build catEye --out graphics --force
+
+Needs NumPy and Pillow.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("ERROR: NumPy is required. Install with: pip install numpy")
+
+try:
+    from PIL import Image
+except ImportError:
+    sys.exit("ERROR: Pillow is required. Install with: pip install pillow")
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EYES_DIR = os.path.join(HERE, "eyes")
+CACHE_PATH = os.path.join(HERE, ".eyegen-cache.json")
+TEMPLATE = "header.tmpl"
+EYE_TABLES = ("sclera", "iris", "upper", "lower", "polar")
+SCREEN_SIZE = 128
+WIDTHS = {"uint8_t": 2, "uint16_t": 4}
+DEFAULT_STYLE = {"per_line": 8, "indent": "  ", "sep": ", ", "prefix": "0X", "digits": "X"}
+
+# `const uint16_t sclera[...] PROGMEM= {` up to the `};` closing it
+ARRAY_RE = re.compile(r"^const\s+(uint8_t|uint16_t)\s+(\w+)\s*((?:\[[^\]\n]*\])+)[^{\n]*\{\n(.*?)\};",
+                      re.S | re.M)
+VALUE_RE = re.compile(r"-?0[xX][0-9A-Fa-f]+")
+
+
+class EyeError(Exception):
+    """An eye's sources are missing or malformed."""
+
+
+# ----------------------------------------------------------------- tables
+def rgb565(image):
+    """(H, W, 3) uint8 -> (H, W) uint16, 5/6/5 bits."""
+    rgb = image.astype(np.uint16)
+    return ((rgb[..., 0] & 0xF8) << 8) | ((rgb[..., 1] & 0xFC) << 3) | (rgb[..., 2] >> 3)
+
+
+def rgb888(values):
+    """Inverse of rgb565(): repeat the high bits so 565 -> 888 -> 565 is exact."""
+    v = values.astype(np.uint16)
+    r, g, b = (v >> 11) & 0x1F, (v >> 5) & 0x3F, v & 0x1F
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)],
+                    axis=-1).astype(np.uint8)
+
+
+def polar_table(size):
+    """(size, size) uint16 angle/distance map of the iris square."""
+    radius = size / 2
+    d = np.arange(size) - radius + 0.5
+    dx, dy = np.meshgrid(d, d)
+    distance = np.sqrt(dx * dx + dy * dy)
+    angle = (np.arctan2(dy, dx) + np.pi) / (np.pi * 2.0)
+    dist = np.minimum(distance / radius * 128.0, 127).astype(np.uint16)
+    table = ((angle * 512.0).astype(np.uint16) << 7) | (127 - dist)
+    table[distance >= radius] = 127
+    return table
+
+
+# ------------------------------------------------------------------ output
+def format_body(values, width, style):
+    """Array initialiser text between `{\\n` and `};`, `style` as in DEFAULT_STYLE."""
+    prefix = style["prefix"]
+    pos = "%s%%0%d%s" % (prefix, width, style["digits"])
+    neg = "-%s%%0%d%s" % (prefix, width - 1, style["digits"])
+    words = [pos % v if v >= 0 else neg % -v for v in values.ravel().tolist()]
+    per = style["per_line"]
+    lines = [style["sep"].join(words[i:i + per]) for i in range(0, len(words), per)]
+    indent = style["indent"]
+    return indent + (style["sep"].rstrip() + "\n" + indent).join(lines) + " "
+
+
+def c_array(ctype, name, dims, values, layout):
+    if layout == "2d":
+        decl = f"const {ctype} {name}[{dims[0]}][{dims[1]}] = {{\n"
+    else:
+        decl = f"const {ctype} {name}[{dims[0]} * {dims[1]}] PROGMEM= {{\n"
+    return decl + format_body(values, WIDTHS[ctype], DEFAULT_STYLE) + "};\n"
+
+
+def render_header(sclera, iris, upper, lower, polar, layout="flat", iris_range=None):
+    sh, sw = sclera.shape
+    ih, iw = iris.shape
+    n = polar.shape[0]
+    return "\n".join(([f"#define IRIS_MIN {iris_range[0]}\n#define IRIS_MAX {iris_range[1]}\n"]
+                      if iris_range else []) + [
+        f"#define SCLERA_WIDTH  {sw}\n#define SCLERA_HEIGHT {sh}\n",
+    ] + (["#include <pgmspace.h>\n"] if layout == "flat" else []) + [
+        c_array("uint16_t", "sclera", ("SCLERA_HEIGHT", "SCLERA_WIDTH"), sclera, layout),
+        f"#define IRIS_MAP_WIDTH  {iw}\n#define IRIS_MAP_HEIGHT {ih}\n",
+        c_array("uint16_t", "iris", ("IRIS_MAP_HEIGHT", "IRIS_MAP_WIDTH"), iris, layout),
+        f"#define SCREEN_WIDTH  {SCREEN_SIZE}\n#define SCREEN_HEIGHT {SCREEN_SIZE}\n",
+        c_array("uint8_t", "upper", ("SCREEN_HEIGHT", "SCREEN_WIDTH"), upper, layout),
+        c_array("uint8_t", "lower", ("SCREEN_HEIGHT", "SCREEN_WIDTH"), lower, layout),
+        f"#define IRIS_WIDTH  {n}\n#define IRIS_HEIGHT {n}\n",
+        c_array("uint16_t", "polar", (n, n), polar, layout),
+    ])
+
+
+# ------------------------------------------------------------------- build
+def _load(folder, name, mode):
+    path = os.path.join(folder, name)
+    try:
+        with Image.open(path) as im:
+            return np.asarray(im.convert(mode))
+    except OSError as e:
+        raise EyeError(f"{path}: {e}")
+
+
+def load_table(folder, ctype, name):
+    """Values of one table file: .npy as stored, grey PNG for uint8_t, RGB565 otherwise."""
+    if name.endswith(".npy"):
+        path = os.path.join(folder, name)
+        try:
+            return np.load(path).astype(np.int64)
+        except (OSError, ValueError) as e:
+            raise EyeError(f"{path}: {e}")
+    if ctype == "uint8_t":
+        return _load(folder, name, "L").astype(np.int64)
+    return rgb565(_load(folder, name, "RGB")).astype(np.int64)
+
+
+def fill_template(folder, tables):
+    """Header text from header.tmpl and the tables listed in eye.json."""
+    with open(os.path.join(folder, TEMPLATE)) as f:
+        text = f.read()
+    for i, table in enumerate(tables):
+        values = load_table(folder, table["type"], table["file"])
+        if values.size != table["count"]:
+            raise EyeError(f"{folder}/{table['file']} has {values.size} values, "
+                           f"{TEMPLATE} declares {table['count']} "
+                           f"(delete {TEMPLATE} to build the default layout)")
+        text = text.replace(f"@@{i}@@", format_body(values, WIDTHS[table["type"]], table), 1)
+    return text
+
+
+def build_eye(folder):
+    """Header text for one eye folder."""
+    try:
+        with open(os.path.join(folder, "eye.json")) as f:
+            spec = json.load(f)
+        iris_size = int(spec["iris_size"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise EyeError(f"{folder}/eye.json: needs {{\"iris_size\": N}} ({e})")
+    if os.path.exists(os.path.join(folder, TEMPLATE)):
+        if "tables" not in spec:
+            raise EyeError(f"{folder}/eye.json: {TEMPLATE} needs the \"tables\" list written by extract")
+        return fill_template(folder, spec["tables"])
+    layout = spec.get("layout", "flat")
+    if layout not in ("flat", "2d"):
+        raise EyeError(f"{folder}/eye.json: layout must be \"flat\" or \"2d\", not {layout!r}")
+    iris_range = None
+    if "iris_min" in spec or "iris_max" in spec:
+        try:
+            iris_range = (int(spec["iris_min"]), int(spec["iris_max"]))
+        except (KeyError, ValueError, TypeError) as e:
+            raise EyeError(f"{folder}/eye.json: iris_min and iris_max go together ({e})")
+    sclera = load_table(folder, "uint16_t", "sclera.png")
+    iris = load_table(folder, "uint16_t", "iris.png")
+    upper = load_table(folder, "uint8_t", "upper.png")
+    lower = load_table(folder, "uint8_t", "lower.png")
+    for name, lid in (("upper", upper), ("lower", lower)):
+        if lid.shape != (SCREEN_SIZE, SCREEN_SIZE):
+            raise EyeError(f"{folder}/{name}.png is {lid.shape[1]}x{lid.shape[0]}, "
+                           f"expected {SCREEN_SIZE}x{SCREEN_SIZE}")
+    if os.path.exists(os.path.join(folder, "polar.npy")):
+        polar = load_table(folder, "uint16_t", "polar.npy")
+        if polar.ndim != 2 or polar.shape[0] != polar.shape[1]:
+            raise EyeError(f"{folder}/polar.npy: expected a square table, got {polar.shape}")
+    else:
+        polar = polar_table(iris_size)
+    if polar.shape[0] > min(sclera.shape):
+        raise EyeError(f"{folder}: iris_size {polar.shape[0]} is larger than the sclera")
+    return render_header(sclera, iris, upper, lower, polar, layout, iris_range)
+
+
+def input_hash(folder):
+    h = hashlib.sha256()
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            continue
+        h.update(name.encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def load_cache():
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    tmp = CACHE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, CACHE_PATH)
+
+
+def run_build(args):
+    names = args.eyes or sorted(n for n in os.listdir(args.src)
+                                if os.path.isdir(os.path.join(args.src, n)))
+    if not names:
+        print(f"  No eye folders in {args.src} (use 'extract' to create them from headers)")
+        return False
+    cache = load_cache()
+    t = time.time()
+    built = skipped = 0
+    ok = True
+    for name in names:
+        folder = os.path.join(args.src, name)
+        out = os.path.join(args.out, name + ".h")
+        try:
+            key = input_hash(folder)
+            entry = cache.get(name, {})
+            if (not args.force and entry.get("input") == key
+                    and entry.get("output") == _file_hash(out)):
+                skipped += 1
+                continue
+            text = build_eye(folder)
+        except (EyeError, OSError) as e:
+            print(f"  ERROR: {name}: {e}")
+            ok = False
+            continue
+        data = text.encode("ascii")
+        with open(out, "wb") as f:
+            f.write(data)
+        cache[name] = {"input": key, "output": hashlib.sha256(data).hexdigest()}
+        built += 1
+        print(f"  {name}.h  ({len(data):,} bytes)")
+    save_cache(cache)
+    print(f"  {built} built, {skipped} unchanged in {time.time() - t:.1f}s")
+    return ok
+
+
+# ----------------------------------------------------------------- extract
+def _defines(text):
+    defines = {}
+    for k, v in re.findall(r"^#define\s+(\w+)\s+(\d+)", text, re.M):
+        defines.setdefault(k, int(v))
+    return defines
+
+
+def _style(body):
+    """DEFAULT_STYLE-like formatting of one initialiser, None if its first line has no values."""
+    first = body.split("\n", 1)[0]
+    words = VALUE_RE.findall(first)
+    if not words:
+        return None
+    digits = "".join(VALUE_RE.findall(body)).replace("0x", "").replace("0X", "")
+    return {
+        "per_line": len(words),
+        "indent": first[:len(first) - len(first.lstrip())],
+        "sep": ", " if ", " in first else ",",
+        "prefix": words[0].lstrip("-")[:2],
+        "digits": "x" if re.search(r"[a-f]", digits) else "X",
+    }
+
+
+def parse_header(text):
+    """(template, tables, values) of an eye header; raises EyeError otherwise."""
+    arrays = list(ARRAY_RE.finditer(text))
+    names = [m.group(2) for m in arrays]
+    if not arrays:
+        raise EyeError("not an eye header: no C arrays")
+    missing = [n for n in EYE_TABLES if n not in names]
+    if missing:
+        raise EyeError(f"not an eye header: has {', '.join(names)}, no {', '.join(missing)}")
+    if "@@" in text:
+        raise EyeError("contains '@@', which header.tmpl uses for table slots")
+    d = _defines(text)
+    shapes = {
+        "sclera": ("SCLERA_HEIGHT", "SCLERA_WIDTH"),
+        "iris": ("IRIS_MAP_HEIGHT", "IRIS_MAP_WIDTH"),
+        "upper": ("SCREEN_HEIGHT", "SCREEN_WIDTH"),
+        "lower": ("SCREEN_HEIGHT", "SCREEN_WIDTH"),
+    }
+    template, tables, values = [], [], []
+    seen = {}
+    last = 0
+    for m in arrays:
+        ctype, name, body = m.group(1), m.group(2), m.group(4)
+        data = np.array([int(v, 16) for v in VALUE_RE.findall(body)], dtype=np.int64)
+        if name == "polar":
+            side = int(round(data.size ** 0.5))
+            shape = (side, side)
+        elif name in shapes:
+            try:
+                shape = tuple(d[k] for k in shapes[name])
+            except KeyError as e:
+                raise EyeError(f"{name}: no #define {e.args[0]}")
+        else:
+            raise EyeError(f"unexpected array '{name}'")
+        if data.size != shape[0] * shape[1]:
+            raise EyeError(f"{name}: {data.size} values, expected {shape[1]}x{shape[0]}")
+        style = _style(body)
+        if style is None or format_body(data, WIDTHS[ctype], style) != body:
+            raise EyeError(f"{name}: unsupported initialiser formatting")
+        seen[name] = seen.get(name, 0) + 1
+        suffix = "" if seen[name] == 1 else f"-{seen[name]}"
+        ext = ".npy" if name == "polar" else ".png"
+        tables.append(dict(style, type=ctype, file=name + suffix + ext, count=int(data.size)))
+        values.append(data.reshape(shape))
+        template.append(text[last:m.start(4)] + f"@@{len(tables) - 1}@@")
+        last = m.end(4)
+    template.append(text[last:])
+    return "".join(template), tables, values
+
+
+def run_extract(args):
+    ok = True
+    for header in args.headers:
+        name = os.path.splitext(os.path.basename(header))[0]
+        folder = os.path.join(args.src, name)
+        try:
+            with open(header) as f:
+                text = f.read()
+            template, tables, values = parse_header(text)
+        except UnicodeDecodeError as e:
+            print(f"  skipped {header}: not an eye header ({e.reason})")
+            continue
+        except EyeError as e:
+            if str(e).startswith("not an eye header"):
+                print(f"  skipped {header}: {e}")
+            else:
+                print(f"  ERROR: {header}: {e}")
+                ok = False
+            continue
+        except OSError as e:
+            print(f"  ERROR: {header}: {e}")
+            ok = False
+            continue
+        os.makedirs(folder, exist_ok=True)
+        for table, data in zip(tables, values):
+            path = os.path.join(folder, table["file"])
+            if path.endswith(".npy"):
+                np.save(path, data.astype(np.int32))
+            elif table["type"] == "uint8_t":
+                Image.fromarray(data.astype(np.uint8)).save(path)
+            else:
+                Image.fromarray(rgb888(data)).save(path)
+        with open(os.path.join(folder, TEMPLATE), "w") as f:
+            f.write(template)
+        polar = values[[t["file"] for t in tables].index("polar.npy")]
+        with open(os.path.join(folder, "eye.json"), "w") as f:
+            json.dump({"iris_size": polar.shape[0], "tables": tables}, f, indent=1)
+            f.write("\n")
+        print(f"  {header} -> {folder}/")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate uncanny-eyes graphics headers from PNGs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write <out>/<eye>.h for changed eye folders")
+    build.add_argument("eyes", nargs="*", help="eye folder names (default: all)")
+    build.add_argument("--src", default=EYES_DIR, help="eye source folders (default: convert/eyes)")
+    build.add_argument("--out", required=True,
+                       help="header folder, e.g. graphics (overwrites <eye>.h there)")
+    build.add_argument("--force", action="store_true", help="ignore the cache")
+    extract = sub.add_parser("extract", help="turn existing headers back into PNG sources")
+    extract.add_argument("headers", nargs="+", help="graphics/*.h files")
+    extract.add_argument("--src", default=EYES_DIR, help="where to create eye folders")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    ok = run_build(args) if args.command == "build" else run_extract(args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()